@@ -24,6 +24,17 @@ def invalidate_cached_providers():
         usecase,
     ]
 
+    # キャッシュを捨てる前に書き込みを待っている結果を書き込む
+    if repository.get_student_stage_path_result_repository.cache_info().currsize > 0:
+        repository.get_student_stage_path_result_repository().flush()
+
+    # キャッシュを捨てる前にワーカースレッドとワーカープロセスを終了する
+    task.shutdown_workers()
+
+    # キャッシュを捨てる前に開いたままのデータベースへの接続を閉じる
+    if external_io.get_project_database_io.cache_info().currsize > 0:
+        external_io.get_project_database_io().close_all()
+
     cached_providers = []
     for module in modules:
         for name in dir(module):
@@ -1,5 +1,13 @@
+import functools
+
+from infra.cache.compiled_pattern import CompiledPatternListCache
 from infra.cache.lru import LRUCache
 
 
 def get_lru_cache():
     return LRUCache(max_size=1 << 12, reduced_size=1 << 11)
+
+
+@functools.cache
+def get_compiled_pattern_list_cache():
+    return CompiledPatternListCache(max_size=1 << 8, reduced_size=1 << 7)
@@ -1,4 +1,7 @@
+import functools
+
 from application.dependency.path_provider import *
+from infra.event.student_change import StudentChangeEventBus
 from infra.io.compile_tool import CompileToolIO
 from infra.io.executable import ExecutableIO
 from infra.io.project_base_folder_show_in_explorer import ProjectFolderShowInExplorerIO
@@ -41,11 +44,17 @@ def get_project_folder_show_in_explorer_io():
     )
 
 
+@functools.cache  # スレッドごとの接続を持つのでプロジェクト内ステートフル
 def get_project_database_io():
     return ProjectDatabaseIO(
         database_path_provider=get_database_path_provider(),
     )
 
 
+@functools.cache  # 購読者を持つのでプロジェクト内ステートフル
+def get_student_change_event_bus():
+    return StudentChangeEventBus()
+
+
 def get_resource_usage_io():
     return ResourceUsageIO()
@@ -1,7 +1,7 @@
 from functools import cache
 
 from application.dependency.core_io import *
-from application.dependency.external_io import get_project_database_io
+from application.dependency.external_io import get_project_database_io, get_student_change_event_bus
 from application.dependency.path_provider import *
 from infra.repository.app_version import AppVersionRepository
 from infra.repository.current_project import CurrentProjectRepository
@@ -64,6 +64,7 @@ def get_student_repository():
 def get_student_stage_path_result_repository():
     return StudentStagePathResultRepository(
         project_database_io=get_project_database_io(),
+        student_change_event_bus=get_student_change_event_bus(),
     )
 
 
@@ -106,4 +107,5 @@ def get_test_source_repository():
 def get_student_mark_repository():
     return StudentMarkRepository(
         project_database_io=get_project_database_io(),
+        student_change_event_bus=get_student_change_event_bus(),
     )
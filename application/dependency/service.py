@@ -1,6 +1,8 @@
+from application.dependency.cache import get_compiled_pattern_list_cache
 from application.dependency.external_io import *
 from application.dependency.external_io import get_student_folder_show_in_explorer_io
 from application.dependency.repository import *
+from application.dependency.task import get_isolated_process_runner
 from service.app_version import AppVersionGetService
 from service.current_project import CurrentProjectGetService, CurrentProjectSetInitializedService
 from service.global_settings import GlobalSettingsGetService, GlobalSettingsPutService
@@ -20,13 +22,14 @@ from service.storage_run_executable import StorageRunExecutableService
 from service.student import StudentGetService, StudentListSubService
 from service.student_dynamic import StudentDynamicClearService, \
     StudentDynamicSetSourceContentService, StudentDynamicGetSourceContentService
-from service.student_mark import StudentMarkGetSubService, StudentMarkPutService, \
+from service.student_mark import StudentMarkGetSubService, StudentMarkGetAllService, StudentMarkPutService, \
     StudentMarkCheckTimestampQueryService, StudentMarkListService
 from service.student_master_create import StudentMasterCreateService
 from service.student_stage_path_result import StudentStagePathResultGetService, \
+    StudentStagePathResultGetAllService, StudentStagePathResultGetAllSummaryService, \
     StudentStagePathResultCheckRollbackService, StudentStageResultCheckTimestampQueryService, \
     StudentStageResultRollbackService, StudentStageResultClearService, StudentPutStageResultService, \
-    StudentGetStageResultService
+    StudentGetStageResultService, StudentStageResultFlushService
 from service.student_submission import StudentSubmissionExistService, \
     StudentSubmissionExtractService, StudentSubmissionFolderShowService, \
     StudentSubmissionGetChecksumService, StudentSubmissionListSourceRelativePathQueryService, \
@@ -204,6 +207,22 @@ def get_student_stage_path_result_get_service():
     )
 
 
+# StudentStagePathResultGetAllService
+def get_student_stage_path_result_get_all_service():
+    return StudentStagePathResultGetAllService(
+        stage_path_list_sub_service=get_stage_path_list_sub_service(),
+        student_stage_path_result_repo=get_student_stage_path_result_repository(),
+    )
+
+
+# StudentStagePathResultGetAllSummaryService
+def get_student_stage_path_result_get_all_summary_service():
+    return StudentStagePathResultGetAllSummaryService(
+        stage_path_list_sub_service=get_stage_path_list_sub_service(),
+        student_stage_path_result_repo=get_student_stage_path_result_repository(),
+    )
+
+
 # StudentStagePathResultCheckRollbackService
 def get_student_stage_path_result_check_rollback_service():
     return StudentStagePathResultCheckRollbackService(
@@ -326,7 +345,13 @@ def get_student_stage_result_rollback_service():
 # StudentStageResultClearService
 def get_student_stage_result_clear_service():
     return StudentStageResultClearService(
-        stage_path_list_sub_service=get_stage_path_list_sub_service(),
+        student_stage_path_result_repo=get_student_stage_path_result_repository(),
+    )
+
+
+# StudentStageResultFlushService
+def get_student_stage_result_flush_service():
+    return StudentStageResultFlushService(
         student_stage_path_result_repo=get_student_stage_path_result_repository(),
     )
 
@@ -443,6 +468,13 @@ def get_student_mark_get_sub_service():
     )
 
 
+# StudentMarkGetAllService
+def get_student_mark_get_all_service():
+    return StudentMarkGetAllService(
+        student_mark_repo=get_student_mark_repository(),
+    )
+
+
 # StudentMarkPutService
 def get_student_mark_put_service():
     return StudentMarkPutService(
@@ -466,4 +498,7 @@ def get_student_mark_list_service():
 
 
 def get_match_get_best_service():
-    return MatchGetBestService()
+    return MatchGetBestService(
+        compiled_pattern_list_cache=get_compiled_pattern_list_cache(),
+        isolated_process_runner=get_isolated_process_runner(),
+    )
@@ -1,11 +1,74 @@
 import functools
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor
 
+from application.dependency.external_io import get_resource_usage_io
 from application.dependency.repository import get_global_settings_repository
+from application.state.current_project import get_current_project_id, set_current_project_id
+from application.state.debug import is_debug, set_debug
+from domain.model.value import ProjectID
+from infra.task.isolated_process import IsolatedProcessRunner
 from infra.task.manager import TaskManager
+from infra.task.process_pool import ProcessPoolTaskRunner
+from util import app_logging
 
 
 @functools.cache  # プロジェクト内共通インスタンス
 def get_task_manager() -> TaskManager:
     return TaskManager(
         global_settings_repo=get_global_settings_repository(),
+        resource_usage_io=get_resource_usage_io(),
     )
+
+
+def _initialize_worker_process(project_id: ProjectID, debug: bool, log_level: int | None) -> None:
+    # ワーカープロセスで呼ばれる
+    # 状態を親プロセスと揃えれば依存関係（SQLiteへの接続を含む）はワーカープロセス内で構築される
+    set_debug(debug)
+    if log_level is not None:
+        app_logging.set_level(log_level)
+    set_current_project_id(project_id)
+
+
+@functools.cache  # プロジェクト内共通インスタンス
+def get_process_pool_task_runner() -> ProcessPoolTaskRunner:
+    return ProcessPoolTaskRunner(
+        max_workers=get_global_settings_repository().get().max_workers,
+        initializer=_initialize_worker_process,
+        initargs=(get_current_project_id(), is_debug(), app_logging.get_level()),
+    )
+
+
+@functools.cache  # プロジェクト内共通インスタンス
+def get_isolated_process_runner() -> IsolatedProcessRunner:
+    if multiprocessing.parent_process() is None:
+        max_workers = get_global_settings_repository().get().max_workers
+    else:
+        # ProcessPoolTaskRunnerのワーカープロセスは1つずつしかステージを実行しないので，
+        # マッチング用のワーカープロセスも1つに制限してプロセスの数がmax_workersの2乗に増えないようにする
+        max_workers = 1
+    return IsolatedProcessRunner(
+        max_workers=max_workers,
+    )
+
+
+@functools.cache  # プロジェクト内共通インスタンス
+def get_testcase_stage_executor() -> ThreadPoolExecutor:
+    # 生徒のテストケースのステージを並行して実行するスレッドのプール
+    # スレッドは必要になったときに起動して使い回すので，スレッドごとのデータベースへの接続も使い回される
+    global_settings = get_global_settings_repository().get()
+    return ThreadPoolExecutor(
+        max_workers=global_settings.max_workers * global_settings.max_testcase_workers,
+        thread_name_prefix="TestCaseStage",
+    )
+
+
+def shutdown_workers() -> None:
+    # 起動済みのワーカースレッドとワーカープロセスを終了する（プロバイダのキャッシュを捨てるときとアプリケーションの終了時に呼ぶ）
+    # ステージ実行用のワーカープロセスはプロジェクトと生徒のキャッシュを持っているので使い回さない
+    if get_process_pool_task_runner.cache_info().currsize > 0:
+        get_process_pool_task_runner().shutdown()
+    if get_isolated_process_runner.cache_info().currsize > 0:
+        get_isolated_process_runner().shutdown()
+    if get_testcase_stage_executor.cache_info().currsize > 0:
+        get_testcase_stage_executor().shutdown()
@@ -1,4 +1,5 @@
 from application.dependency.service import *
+from application.dependency.task import get_testcase_stage_executor
 from usecase.app_version import AppVersionGetTextUseCase, AppVersionCheckIsStableUseCase
 from usecase.compiler import CompilerSearchUseCase
 from usecase.current_project import CurrentProjectSummaryGetUseCase, \
@@ -9,7 +10,6 @@ from usecase.project import ProjectCheckExistByNameUseCase, ProjectCreateUseCase
     ProjectFolderShowUseCase, ProjectDeleteUseCase, ProjectGetSizeQueryUseCase, ProjectOpenUseCase
 from usecase.resource_usage import ResourceUsageGetUseCase
 from usecase.student import StudentListIDUseCase
-from usecase.student_dynamic import StudentDynamicTakeDiffSnapshotUseCase
 from usecase.student_mark import StudentMarkGetUseCase, StudentMarkPutUseCase, \
     StudentMarkListUseCase
 from usecase.student_mark_view_data import StudentMarkViewDataGetTestResultUseCase, \
@@ -20,11 +20,10 @@ from usecase.student_run_execute import StudentRunExecuteStageUseCase
 from usecase.student_run_next_stage import StudentRunNextStageUseCase
 from usecase.student_run_test import StudentRunTestStageUseCase
 from usecase.student_source_code import StudentSourceCodeGetUseCase
-from usecase.student_stage_result import StudentStageResultClearUseCase
+from usecase.student_stage_result import StudentStageResultClearUseCase, \
+    StudentStageResultFlushUseCase
 from usecase.student_submission_folder_show import StudentSubmissionFolderShowUseCase
-from usecase.student_table_cell_data import StudentTableGetStudentIDCellDataUseCase, \
-    StudentTableGetStudentNameCellDataUseCase, StudentTableGetStudentStageStateCellDataUseCase, \
-    StudentTableGetStudentErrorCellDataUseCase
+from usecase.student_table_cell_data import StudentTableGetRowSnapshotsUseCase
 from usecase.test_compile_stage import TestCompileStageUseCase
 from usecase.test_test_stage import TestTestStageUseCase
 from usecase.testcase_config import TestCaseConfigGetUseCase, TestCaseConfigPutUseCase, \
@@ -145,29 +144,12 @@ def get_student_submission_folder_show_usecase():
     )
 
 
-def get_student_table_get_student_id_cell_data_usecase():
-    return StudentTableGetStudentIDCellDataUseCase(
-        student_submission_exist_service=get_student_submission_exist_service(),
-    )
-
-
-def get_student_table_get_student_name_cell_data_usecase():
-    return StudentTableGetStudentNameCellDataUseCase(
+def get_student_table_get_row_snapshots_usecase():
+    return StudentTableGetRowSnapshotsUseCase(
         student_get_service=get_student_get_service(),
-    )
-
-
-def get_student_table_get_student_stage_state_cell_data_usecase():
-    return StudentTableGetStudentStageStateCellDataUseCase(
-        stage_path_list_sub_service=get_stage_path_list_sub_service(),
-        student_stage_path_result_get_service=get_student_stage_path_result_get_service(),
-    )
-
-
-def get_student_table_get_student_error_cell_data_usecase():
-    return StudentTableGetStudentErrorCellDataUseCase(
-        stage_path_list_sub_service=get_stage_path_list_sub_service(),
-        student_stage_path_result_get_service=get_student_stage_path_result_get_service(),
+        student_submission_exist_service=get_student_submission_exist_service(),
+        student_stage_path_result_get_all_summary_service=get_student_stage_path_result_get_all_summary_service(),
+        student_mark_get_all_service=get_student_mark_get_all_service(),
     )
 
 
@@ -251,6 +233,8 @@ def get_student_run_next_stage_usecase():
         student_run_execute_stage_usecase=get_student_run_execute_stage_usecase(),
         student_run_test_stage_usecase=get_student_run_test_stage_usecase(),
         student_stage_path_result_check_rollback_service=get_student_stage_path_result_check_rollback_service(),
+        global_settings_get_service=get_global_settings_get_service(),
+        testcase_stage_executor=get_testcase_stage_executor(),
     )
 
 
@@ -282,14 +266,6 @@ def get_testcase_list_edit_copy_testcase_usecase():
     )
 
 
-# StudentStageResultTakeDiffSnapshotUseCase
-def get_student_dynamic_take_diff_snapshot_usecase():
-    return StudentDynamicTakeDiffSnapshotUseCase(
-        student_stage_result_check_timestamp_query_service=get_student_stage_result_check_timestamp_query_service(),
-        student_mark_check_timestamp_query_service=get_student_mark_check_timestamp_query_service(),
-    )
-
-
 # StudentStageResultClearUseCase
 def get_student_stage_result_clear_usecase():
     return StudentStageResultClearUseCase(
@@ -297,6 +273,13 @@ def get_student_stage_result_clear_usecase():
     )
 
 
+# StudentStageResultFlushUseCase
+def get_student_stage_result_flush_usecase():
+    return StudentStageResultFlushUseCase(
+        student_stage_result_flush_service=get_student_stage_result_flush_service(),
+    )
+
+
 # TestCaseConfigGetUseCase
 def get_testcase_config_get_usecase():
     return TestCaseConfigGetUseCase(
@@ -0,0 +1,48 @@
+from PyQt5.QtCore import QObject
+
+from application.dependency.usecase import get_student_list_id_usecase, \
+    get_student_stage_result_clear_usecase
+from control.dialog_progress import AbstractProgressDialogWorker, AbstractProgressDialog
+from domain.error import StopTask
+from util.app_logging import create_logger
+
+
+class _ClearStageResultsWorker(AbstractProgressDialogWorker):
+    _logger = create_logger()
+
+    def __init__(self, parent: QObject = None):
+        super().__init__(parent)
+
+        self._student_list_id_usecase = get_student_list_id_usecase()
+        self._student_stage_result_clear_usecase = get_student_stage_result_clear_usecase()
+
+    def __on_progress(self, n_cleared: int, n_students: int) -> None:
+        self._callback(f"{n_students}人中{n_cleared}人の結果を削除しました")
+        self._progress_callback(n_cleared, n_students)
+
+    def run(self):
+        student_ids = self._student_list_id_usecase.execute()
+        try:
+            self._student_stage_result_clear_usecase.execute(
+                student_ids=student_ids,
+                stop_producer=self._is_cancel_requested,
+                progress_callback=self.__on_progress,
+            )
+        except StopTask:
+            self._logger.info("Clearing stage results cancelled")
+        else:
+            self._logger.info(f"Stage results cleared: {len(student_ids)} students")
+
+
+class ClearStageResultsDialog(AbstractProgressDialog):
+    # すべての生徒の結果データを削除しプログレスを表示するダイアログ
+
+    def __init__(self, parent: QObject = None):
+        super().__init__(
+            parent,
+            title="結果のクリア",
+            cancellable=True,
+            worker_producer=lambda: _ClearStageResultsWorker(
+                self,
+            ),
+        )
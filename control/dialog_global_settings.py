@@ -7,7 +7,8 @@ from PyQt5.QtWidgets import *
 from application.dependency.usecase import get_global_settings_get_usecase, \
     get_global_settings_put_usecase, get_test_compile_stage_usecase
 from control.dialog_compiler_search import CompilerSearchDialog
-from domain.model.global_settings import GlobalSettings
+from domain.model.global_settings import GlobalSettings, TaskSchedulingPolicy
+from domain.model.stage import BuildStage, CompileStage, ExecuteStage, TestStage
 from infra.io.compiler_location import is_compiler_location
 from res.icon import get_icon
 from util.app_logging import create_logger
@@ -163,6 +164,94 @@ class MaxWorkersWidget(QWidget):
         return None
 
 
+class StageConcurrencyLimitsWidget(QWidget):
+    _STAGE_TEXTS = {
+        BuildStage.get_name(): "ビルド",
+        CompileStage.get_name(): "コンパイル",
+        ExecuteStage.get_name(): "実行",
+        TestStage.get_name(): "テスト",
+    }
+
+    def __init__(self, parent: QObject = None):
+        super().__init__(parent)
+
+        self._init_ui()
+        self._init_signals()
+
+    def _init_ui(self):
+        layout = QHBoxLayout()
+        self.setLayout(layout)
+
+        self._sb_values: dict[str, QSpinBox] = {}
+        for stage_name, text in self._STAGE_TEXTS.items():
+            layout.addWidget(QLabel(text, self))
+            sb_value = QSpinBox(self)
+            sb_value.setMinimum(1)
+            sb_value.setMaximum(32)
+            sb_value.setSingleStep(1)
+            sb_value.setFixedWidth(60)
+            layout.addWidget(sb_value)
+            self._sb_values[stage_name] = sb_value
+
+        layout.addStretch(1)
+
+    def _init_signals(self):
+        pass
+
+    def set_value(self, limits: dict[str, int]) -> None:
+        for stage_name, sb_value in self._sb_values.items():
+            sb_value.setValue(limits[stage_name])
+
+    def get_value(self) -> dict[str, int]:
+        return {
+            stage_name: sb_value.value()
+            for stage_name, sb_value in self._sb_values.items()
+        }
+
+    # noinspection PyMethodMayBeStatic
+    def validate_and_get_reason(self) -> str | None:
+        return None
+
+
+class TaskSchedulingPolicyWidget(QWidget):
+    _POLICY_TEXTS = {
+        TaskSchedulingPolicy.FIFO: "追加された順",
+        TaskSchedulingPolicy.FOCUSED_FIRST: "テーブルで選択している生徒を優先",
+        TaskSchedulingPolicy.SHORTEST_EXPECTED_FIRST: "前回の実行時間が短い生徒を優先",
+        TaskSchedulingPolicy.FAILED_FIRST: "前回エラーになった生徒を優先",
+    }
+
+    def __init__(self, parent: QObject = None):
+        super().__init__(parent)
+
+        self._init_ui()
+        self._init_signals()
+
+    def _init_ui(self):
+        layout = QHBoxLayout()
+        self.setLayout(layout)
+
+        self._cb_value = QComboBox(self)
+        for policy, text in self._POLICY_TEXTS.items():
+            self._cb_value.addItem(text, policy)
+        layout.addWidget(self._cb_value)
+
+        layout.addStretch(1)
+
+    def _init_signals(self):
+        pass
+
+    def set_value(self, policy: TaskSchedulingPolicy) -> None:
+        self._cb_value.setCurrentIndex(list(self._POLICY_TEXTS).index(policy))
+
+    def get_value(self) -> TaskSchedulingPolicy:
+        return list(self._POLICY_TEXTS)[self._cb_value.currentIndex()]
+
+    # noinspection PyMethodMayBeStatic
+    def validate_and_get_reason(self) -> str | None:
+        return None
+
+
 class GlobalSettingsEditWidget(QWidget):
     _logger = create_logger()
 
@@ -217,6 +306,40 @@ class GlobalSettingsEditWidget(QWidget):
             widget=self._w_max_workers,
         )
 
+        # GlobalSettings::adaptive_workers: bool
+        self._w_adaptive_workers = QCheckBox(
+            "CPUとメモリの使用率やステージの所要時間に応じて並列タスク実行数を自動で増減する",
+            self,
+        )
+        add_item(
+            title=None,
+            widget=self._w_adaptive_workers,
+        )
+
+        # GlobalSettings::stage_concurrency_limits: dict[str, int]
+        # noinspection PyTypeChecker
+        self._w_stage_concurrency_limits = StageConcurrencyLimitsWidget(self)
+        add_item(
+            title="ステージごとの並列実行数の上限（並列タスク実行数を超える分は無視されます）",
+            widget=self._w_stage_concurrency_limits,
+        )
+
+        # GlobalSettings::max_testcase_workers: int
+        # noinspection PyTypeChecker
+        self._w_max_testcase_workers = MaxWorkersWidget(self)
+        add_item(
+            title="ひとりの生徒のテストケースを並列に実行する数",
+            widget=self._w_max_testcase_workers,
+        )
+
+        # GlobalSettings::task_scheduling_policy: TaskSchedulingPolicy
+        # noinspection PyTypeChecker
+        self._w_task_scheduling_policy = TaskSchedulingPolicyWidget(self)
+        add_item(
+            title="タスクを開始する順番（選択中の生徒はいつでも最優先で実行されます）",
+            widget=self._w_task_scheduling_policy,
+        )
+
         # GlobalSettings::backup_before_export: bool
         self._w_backup_before_export = QCheckBox(
             "成績記録用のExcelに点数をエクスポートする前に同じフォルダにコピーをとる",
@@ -267,6 +390,16 @@ class GlobalSettingsEditWidget(QWidget):
             widget=self._w_enable_line_wrap_in_source_code,
         )
 
+        # GlobalSettings::use_process_pool: bool
+        self._w_use_process_pool = QCheckBox(
+            "学生のステージを別のプロセスで実行する（反映するには再起動が必要です）",
+            self,
+        )
+        add_item(
+            title="ステージの実行方式",
+            widget=self._w_use_process_pool,
+        )
+
         layout_root.addStretch(1)
 
     def _init_signals(self):
@@ -304,6 +437,18 @@ class GlobalSettingsEditWidget(QWidget):
         self._w_max_workers.set_value(
             settings.max_workers,
         )
+        self._w_adaptive_workers.setChecked(
+            settings.adaptive_workers,
+        )
+        self._w_stage_concurrency_limits.set_value(
+            settings.stage_concurrency_limits,
+        )
+        self._w_max_testcase_workers.set_value(
+            settings.max_testcase_workers,
+        )
+        self._w_task_scheduling_policy.set_value(
+            settings.task_scheduling_policy,
+        )
         self._w_backup_before_export.setChecked(
             settings.backup_before_export,
         )
@@ -319,6 +464,9 @@ class GlobalSettingsEditWidget(QWidget):
         self._w_enable_line_wrap_in_source_code.setChecked(
             settings.enable_line_wrap_in_source_code,
         )
+        self._w_use_process_pool.setChecked(
+            settings.use_process_pool,
+        )
 
     def get_value(self) -> GlobalSettings:
         return GlobalSettings(
@@ -331,6 +479,18 @@ class GlobalSettingsEditWidget(QWidget):
             max_workers=(
                 self._w_max_workers.get_value()
             ),
+            adaptive_workers=(
+                self._w_adaptive_workers.isChecked()
+            ),
+            stage_concurrency_limits=(
+                self._w_stage_concurrency_limits.get_value()
+            ),
+            max_testcase_workers=(
+                self._w_max_testcase_workers.get_value()
+            ),
+            task_scheduling_policy=(
+                self._w_task_scheduling_policy.get_value()
+            ),
             backup_before_export=(
                 self._w_backup_before_export.isChecked()
             ),
@@ -345,7 +505,10 @@ class GlobalSettingsEditWidget(QWidget):
             ),
             enable_line_wrap_in_source_code=(
                 self._w_enable_line_wrap_in_source_code.isChecked()
-            )
+            ),
+            use_process_pool=(
+                self._w_use_process_pool.isChecked()
+            ),
         )
 
     # noinspection PyMethodMayBeStatic
@@ -354,6 +517,9 @@ class GlobalSettingsEditWidget(QWidget):
             self._w_compiler_tool_path.validate_and_get_reason(),
             self._w_compiler_timeout.validate_and_get_reason(),
             self._w_max_workers.validate_and_get_reason(),
+            self._w_stage_concurrency_limits.validate_and_get_reason(),
+            self._w_max_testcase_workers.validate_and_get_reason(),
+            self._w_task_scheduling_policy.validate_and_get_reason(),
         ]
         is_ok = all(validation_result is None for validation_result in validation_results)
         if is_ok:
@@ -2,7 +2,7 @@ from typing import Callable, TypeVar, Generic
 
 from PyQt5.QtCore import QThread, pyqtSignal, QObject, Qt, pyqtSlot
 from PyQt5.QtGui import QShowEvent
-from PyQt5.QtWidgets import QDialog, QHBoxLayout, QLabel, QVBoxLayout
+from PyQt5.QtWidgets import QDialog, QHBoxLayout, QLabel, QVBoxLayout, QProgressBar, QPushButton
 
 from control.widget_progress_icon import ProgressIconWidget
 from res.font import get_font
@@ -12,16 +12,29 @@ _EO = TypeVar("_EO")  # error object
 
 class AbstractProgressDialogWorker(QThread, Generic[_EO]):
     message_update_requested = pyqtSignal(str, name="message_updated")  # message: str
+    progress_update_requested = pyqtSignal(int, int, name="progress_updated")  # value: int, maximum: int
 
     def __init__(self, parent: QObject = None):
         super().__init__(parent)
 
         self._error_object: _EO | None = None
+        self.__is_cancel_requested = False
 
     def _callback(self, message: str) -> None:
         # noinspection PyUnresolvedReferences
         self.message_update_requested.emit(message)
 
+    def _progress_callback(self, value: int, maximum: int) -> None:
+        # noinspection PyUnresolvedReferences
+        self.progress_update_requested.emit(value, maximum)
+
+    def request_cancel(self) -> None:
+        # ダイアログのスレッドから呼ばれる
+        self.__is_cancel_requested = True
+
+    def _is_cancel_requested(self) -> bool:
+        return self.__is_cancel_requested
+
     def set_rejected(self, error_object: _EO):
         self._error_object = error_object
 
@@ -43,12 +56,14 @@ class AbstractProgressDialog(QDialog, Generic[_EO]):
             parent: QObject = None,
             *,
             title: str = None,
+            cancellable: bool = False,  # 中止ボタンを表示してworkerのrequest_cancelを呼べるようにする
             worker_producer: Callable[[], AbstractProgressDialogWorker[_EO]],
             # ^ parentに渡すインスタンスの親の初期化が終わる前にworkerを作ることができないので遅延評価
     ):
         super().__init__(parent)
 
         self.__title = title
+        self.__cancellable = cancellable
         self.__worker: AbstractProgressDialogWorker[_EO] = worker_producer()
 
         self._init_ui()
@@ -79,12 +94,24 @@ class AbstractProgressDialog(QDialog, Generic[_EO]):
         self._l_message.setWordWrap(True)
         layout_message.addWidget(self._l_message)
 
+        self._w_progress_bar = QProgressBar(self)
+        self._w_progress_bar.setVisible(False)  # 進捗が届いたら表示する
+        layout_message.addWidget(self._w_progress_bar)
+
         layout_message.addStretch(1)
 
+        self._b_cancel = QPushButton("中止", self)
+        self._b_cancel.setVisible(self.__cancellable)
+        layout_message.addWidget(self._b_cancel, alignment=Qt.AlignRight)
+
     def _init_signals(self):
         # noinspection PyUnresolvedReferences
         self.__worker.message_update_requested.connect(self.__worker_message_update_requested)
         # noinspection PyUnresolvedReferences
+        self.__worker.progress_update_requested.connect(self.__worker_progress_update_requested)
+        # noinspection PyUnresolvedReferences
+        self._b_cancel.clicked.connect(self.__b_cancel_clicked)
+        # noinspection PyUnresolvedReferences
         self.__worker.finished.connect(self.__worker_progress_finished)
 
     def showEvent(self, evt: QShowEvent):
@@ -95,6 +122,18 @@ class AbstractProgressDialog(QDialog, Generic[_EO]):
     def __worker_message_update_requested(self, message: str):
         self._l_message.setText(message)
 
+    @pyqtSlot(int, int)
+    def __worker_progress_update_requested(self, value: int, maximum: int):
+        self._w_progress_bar.setVisible(True)
+        self._w_progress_bar.setMaximum(maximum)
+        self._w_progress_bar.setValue(value)
+
+    @pyqtSlot()
+    def __b_cancel_clicked(self):
+        self._b_cancel.setEnabled(False)
+        self._b_cancel.setText("中止しています・・・")
+        self.__worker.request_cancel()
+
     @pyqtSlot()
     def __worker_progress_finished(self):
         if self.__worker.is_rejected():
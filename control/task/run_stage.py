@@ -1,21 +1,118 @@
-from application.dependency.usecase import get_student_run_next_stage_usecase
+from typing import Callable
+
+from application.dependency.external_io import get_student_change_event_bus
+from application.dependency.task import get_process_pool_task_runner
+from application.dependency.usecase import get_student_run_next_stage_usecase, \
+    get_global_settings_get_usecase, get_student_stage_result_flush_usecase
 from domain.error import StopTask
+from domain.model.value import StudentID
+from infra.event.student_change import StudentChangeKind
 from infra.task.task import AbstractStudentTask
+from usecase.dto.student_run_next_stage import StudentRunNextStageState
+from util.app_logging import create_logger
+
+
+def _run_next_stage_in_worker_process(
+        student_id: StudentID,
+        state: StudentRunNextStageState,
+        max_parallel_stages: int,
+        *,
+        stop_producer: Callable[[], bool],
+        report_progress: Callable[[str], None],
+) -> StudentRunNextStageState:
+    # ProcessPoolTaskRunnerのワーカープロセスで実行される
+    try:
+        return get_student_run_next_stage_usecase().execute(
+            student_id=student_id,
+            state=state,
+            stop_producer=stop_producer,
+            progress_callback=report_progress,
+            max_parallel_stages=max_parallel_stages,
+        )
+    finally:
+        # 書き込みを待っている結果はこのプロセスからしか見えないので親プロセスに戻る前に書き込む
+        get_student_stage_result_flush_usecase().execute()
 
 
 class RunStagesStudentTask(AbstractStudentTask):
+    # 1回のrunで生徒のステージを1ステージだけ実行する
+    # TaskManagerは次のステージの種類ごとに同時実行数を制限しながらすべてのステージが終わるまでrunを繰り返す
+
+    _logger = create_logger()
+
+    def __init__(self, student_id: StudentID):
+        super().__init__(student_id)
+        self.__state = StudentRunNextStageState()
+
+    def get_concurrency_group(self) -> str | None:
+        next_stages = self.__state.next_stages
+        if not next_stages:  # 次に実行するステージを調べるだけ
+            return None
+        # 並行して実行するステージは同じ種類
+        return next_stages[0].stage.get_name()
+
+    def get_requested_concurrency(self) -> int:
+        return max(
+            1,
+            min(
+                len(self.__state.next_stages),
+                get_global_settings_get_usecase().execute().max_testcase_workers,
+            ),
+        )
+
+    def has_remaining_work(self) -> bool:
+        return not self.__state.is_finished
+
     def run(self):
-        self._logger.info(f"Task started [{self.student_id}]")
         try:
-            get_student_run_next_stage_usecase().execute(
-                student_id=self._student_id,
-                stop_producer=self.is_stop_received,
-            )
+            if get_global_settings_get_usecase().execute().use_process_pool:
+                # GILを共有しないワーカープロセスでステージを実行する
+                try:
+                    self.__state = get_process_pool_task_runner().run(
+                        _run_next_stage_in_worker_process,
+                        self._student_id,
+                        self.__state,
+                        self.get_granted_concurrency(),
+                        stop_producer=self.is_stop_received,
+                        progress_callback=self.__on_progress,
+                    )
+                finally:
+                    # ワーカープロセスのイベントバスには購読者がいないので，書き込まれた結果をこのプロセスで知らせる
+                    get_student_change_event_bus().publish_all([self._student_id], StudentChangeKind.STAGE_RESULT)
+            else:
+                self.__state = get_student_run_next_stage_usecase().execute(
+                    student_id=self._student_id,
+                    state=self.__state,
+                    stop_producer=self.is_stop_received,
+                    max_parallel_stages=self.get_granted_concurrency(),
+                )
         except StopTask:
             self._logger.info(f"Task stopped [{self.student_id}]")
+            self.__flush_stage_results()
+        except Exception:
+            self.__flush_stage_results()
+            raise
+        else:
+            if self.__state.is_finished:
+                self._logger.info(f"Task finished [{self.student_id}]")
+                if self.__state.is_failed:
+                    self.set_failed()
+            if self.__state.is_finished or self.is_stop_received():
+                self.__flush_stage_results()
+
+    @staticmethod
+    def __flush_stage_results() -> None:
+        # 結果はまとめて書き込まれるのでタスクが終わるときに書き込みを待っている結果を書き込む
+        get_student_stage_result_flush_usecase().execute()
+
+    def __on_progress(self, message: str) -> None:
+        self._logger.info(f"Task progress [{self.student_id}] {message}")
 
     def __repr__(self):
         return f"RunStagesStudentTask(student_id={self.student_id!r})"
 
     def __str__(self):
-        return f"実行 {self.student_id}"
+        next_stages = self.__state.next_stages
+        if not next_stages:
+            return f"実行 {self.student_id}"
+        return f"実行 {self.student_id} {next_stages[0].stage.get_name()}"
@@ -58,12 +58,23 @@ class TaskStateStatusBarWidget(QWidget):
             self._l_message.setText(
                 "実行中のタスクはありません"
             )
+            self._l_message.setToolTip("")
             color = "black"
             background_color = "none"
         else:
-            self._l_message.setText(
-                f"実行中のタスク: {task_manager.count_active()}/{task_manager.count()}"
-            )
+            status = task_manager.get_worker_limit_status()
+            if status.reason is None:
+                self._l_message.setText(
+                    f"実行中のタスク: {task_manager.count_active()}/{task_manager.count()}"
+                )
+                self._l_message.setToolTip("")
+            else:
+                # 並列タスク実行数を自動で調整しているときはその判断を示す
+                self._l_message.setText(
+                    f"実行中のタスク: {task_manager.count_active()}/{task_manager.count()}"
+                    f" 並列数: {status.worker_limit}/{status.max_workers}"
+                )
+                self._l_message.setToolTip(status.reason)
             color = "white"
             background_color = "#cc3300"
         # noinspection PyUnresolvedReferences
@@ -1,24 +1,21 @@
-from collections import defaultdict
+from collections import deque
 from contextlib import contextmanager
 from functools import cache
 from typing import Any, Callable, Iterable
 
 from PyQt5.QtCore import *
-from PyQt5.QtGui import QColor, QFont, QMouseEvent
+from PyQt5.QtGui import QColor, QFont, QMouseEvent, QResizeEvent
 from PyQt5.QtWidgets import *
 
+from application.dependency.external_io import get_student_change_event_bus
 from application.dependency.usecase import get_student_list_id_usecase, \
-    get_student_table_get_student_id_cell_data_usecase, \
-    get_student_table_get_student_name_cell_data_usecase, \
-    get_student_table_get_student_stage_state_cell_data_usecase, \
-    get_student_table_get_student_error_cell_data_usecase, \
-    get_student_dynamic_take_diff_snapshot_usecase, get_student_mark_get_usecase
+    get_student_table_get_row_snapshots_usecase
 from control.mixin_shift_horizontal_scroll import HorizontalScrollWithShiftAndWheelMixin
 from domain.model.stage import BuildStage, CompileStage, ExecuteStage, TestStage
 from domain.model.value import StudentID
+from infra.event.student_change import StudentChangeEvent, StudentChangeEventBus
 from res.font import get_font
-from usecase.dto.student_stage_result_diff_snapshot import StudentStageResultDiffSnapshot
-from usecase.dto.student_table_cell_data import StudentStageStateCellDataStageState
+from usecase.dto.student_table_cell_data import StudentStageStateCellDataStageState, StudentTableRowSnapshot
 from util.app_logging import create_logger
 
 
@@ -47,7 +44,7 @@ QtRoleType = int
 
 
 def data_provider(*, column: int):
-    def decorator(f: Callable[[StudentID, QtRoleType], Any]):
+    def decorator(f: Callable[[StudentTableRowSnapshot, QtRoleType], Any]):
         setattr(f, "_cell_provider_column", column)
         return f
 
@@ -57,32 +54,118 @@ def data_provider(*, column: int):
 class AbstractStudentTableModelDataProvider:
     def __init__(self, student_ids: list[StudentID]):
         self._student_ids = student_ids
+        # 列ごとのdata_providerは呼ばれるたびに探さずに最初に一度だけ探す
+        self._cell_providers: dict[int, Callable] = {}
+        for name in dir(type(self)):
+            obj = getattr(type(self), name)
+            if callable(obj) and hasattr(obj, "_cell_provider_column"):
+                self._cell_providers[getattr(obj, "_cell_provider_column")] = getattr(self, name)
 
     @property
     def student_ids(self) -> list[StudentID]:
         return self._student_ids
 
     def _find_cell_provider(self, column: int):
-        for name in dir(self):
-            obj = getattr(self, name)
-            if callable(obj) and hasattr(obj, "_cell_provider_column"):
-                provider = obj
-                provider_column = getattr(obj, "_cell_provider_column")
-                if provider_column == column:
-                    return provider
-        raise ValueError(f"Provider for {column=} not defined")
+        provider = self._cell_providers.get(column)
+        if provider is None:
+            raise ValueError(f"Provider for {column=} not defined")
+        return provider
+
+    def invalidate_cache(self, row: int):
+        # キャッシュを持たないプロバイダでは何もしない
+        pass
 
     def get_data(self, row: int, column: int, role: QtRoleType):
-        provider = self._find_cell_provider(column)
-        if provider is not None:
-            return provider(student_id=self._student_ids[row], role=role)
-        else:
-            return None
+        raise NotImplementedError()
 
 
 class StudentTableModelDataProvider(AbstractStudentTableModelDataProvider):
+    """
+    行ごとにすべての列のデータをまとめたスナップショットを作り，すべての列・ロールのデータをスナップショットから返す
+    スナップショットはload_rowsでまとめて作る（GUIスレッドを止めないように_StudentTableRowSnapshotLoaderのスレッドから呼ぶ）
+    get_dataは作り終わったスナップショットだけを読み，スナップショットがない行にはプレースホルダーを返して行の読み込みを要求する
+    invalidate_cacheされた行は新しいスナップショットができるまで古いスナップショットを返す（更新のたびに表示がちらつかないようにする）
+    """
+
     _logger = create_logger()
 
+    # 1回でまとめてスナップショットを作る行の数
+    ROW_BLOCK_SIZE = 64
+
+    # スナップショットから返すロール（これ以外のロールでは行の読み込みを要求しない）
+    _SUPPORTED_ROLES = frozenset({Qt.DisplayRole, Qt.FontRole, Qt.ForegroundRole, Qt.ToolTipRole})
+
+    # スナップショットがまだない行に表示する文字列
+    _PLACEHOLDER_TEXT = "…"
+
+    def __init__(self, student_ids: list[StudentID]):
+        super().__init__(student_ids)
+        self._lock = QMutex()
+        self._row_snapshots: dict[int, StudentTableRowSnapshot] = {}
+        # 最新のスナップショットがある行
+        self._fresh_rows: set[int] = set()
+        # invalidate_cacheされるたびに増やし，読み込んでいる間に古くなったスナップショットを最新として保存しないようにする
+        self._row_versions: dict[int, int] = {}
+        # 最新のスナップショットがない行がget_dataで要求されたときに呼ぶ
+        self._row_request_listener: Callable[[int], None] | None = None
+
+    @contextmanager
+    def __lock(self):
+        self._lock.lock()
+        try:
+            yield
+        finally:
+            self._lock.unlock()
+
+    def set_row_request_listener(self, listener: Callable[[int], None] | None) -> None:
+        self._row_request_listener = listener
+
+    def get_row_block(self, row: int) -> range:
+        block_begin = row // self.ROW_BLOCK_SIZE * self.ROW_BLOCK_SIZE
+        return range(block_begin, min(block_begin + self.ROW_BLOCK_SIZE, len(self._student_ids)))
+
+    def invalidate_cache(self, row: int):
+        with self.__lock():
+            self._fresh_rows.discard(row)
+            self._row_versions[row] = self._row_versions.get(row, 0) + 1
+
+    def list_rows_to_load(self, rows: Iterable[int]) -> list[int]:
+        with self.__lock():
+            return [i_row for i_row in rows if i_row not in self._fresh_rows]
+
+    def load_rows(self, rows: list[int]) -> list[int]:
+        # 行のスナップショットをまとめて作り，最新のスナップショットを保存できた行を返す
+        # データベースを読んでいる間はロックを取らないので，その間もGUIスレッドは作り終わったスナップショットを読める
+        with self.__lock():
+            row_versions = {i_row: self._row_versions.get(i_row, 0) for i_row in rows}
+        self._logger.debug(f"Creating row snapshots {rows[0]}-{rows[-1]}")
+        row_snapshots = get_student_table_get_row_snapshots_usecase().execute(
+            [self._student_ids[i_row] for i_row in rows],
+        )
+        loaded_rows = []
+        with self.__lock():
+            for i_row in rows:
+                if self._row_versions.get(i_row, 0) != row_versions[i_row]:
+                    # 読んでいる間に変更された行はもう一度読む
+                    continue
+                self._row_snapshots[i_row] = row_snapshots[self._student_ids[i_row]]
+                self._fresh_rows.add(i_row)
+                loaded_rows.append(i_row)
+        return loaded_rows
+
+    def get_data(self, row: int, column: int, role: QtRoleType):
+        if role not in self._SUPPORTED_ROLES:
+            return None
+        with self.__lock():
+            row_snapshot = self._row_snapshots.get(row)
+            is_fresh = row in self._fresh_rows
+        if not is_fresh and self._row_request_listener is not None:
+            self._row_request_listener(row)
+        if row_snapshot is None:
+            return self._PLACEHOLDER_TEXT if role == Qt.DisplayRole else None
+        provider = self._find_cell_provider(column)
+        return provider(row_snapshot=row_snapshot, role=role)
+
     @classmethod
     @cache
     def _font_link_text(cls, *, monospace: bool) -> QFont:
@@ -109,18 +192,16 @@ class StudentTableModelDataProvider(AbstractStudentTableModelDataProvider):
     @data_provider(
         column=StudentTableColumns.COL_STUDENT_ID,
     )
-    def get_data_of_student_id_cell(self, student_id: StudentID, role: QtRoleType):
+    def get_data_of_student_id_cell(self, row_snapshot: StudentTableRowSnapshot, role: QtRoleType):
+        cell_data = row_snapshot.student_id_cell
         if role == Qt.DisplayRole:
-            cell_data = get_student_table_get_student_id_cell_data_usecase().execute(student_id)
             return cell_data.student_number
         elif role == Qt.FontRole:
-            cell_data = get_student_table_get_student_id_cell_data_usecase().execute(student_id)
             if cell_data.is_submission_folder_link_alive:
                 return self._font_link_text(monospace=True)
             else:
                 return self._font_dead_link_text(monospace=True)
         elif role == Qt.ForegroundRole:
-            cell_data = get_student_table_get_student_id_cell_data_usecase().execute(student_id)
             if cell_data.is_submission_folder_link_alive:
                 return self._foreground_link_text()
             else:
@@ -131,10 +212,9 @@ class StudentTableModelDataProvider(AbstractStudentTableModelDataProvider):
     @data_provider(
         column=StudentTableColumns.COL_NAME,
     )
-    def get_data_of_student_name_cell(self, student_id: StudentID, role: QtRoleType):
+    def get_data_of_student_name_cell(self, row_snapshot: StudentTableRowSnapshot, role: QtRoleType):
         if role == Qt.DisplayRole:
-            cell_data = get_student_table_get_student_name_cell_data_usecase().execute(student_id)
-            return cell_data.student_name
+            return row_snapshot.student_name_cell.student_name
         else:
             return None
 
@@ -161,18 +241,15 @@ class StudentTableModelDataProvider(AbstractStudentTableModelDataProvider):
     @data_provider(
         column=StudentTableColumns.COL_STAGE_BUILD,
     )
-    def get_data_of_stage_build_cell(self, student_id: StudentID, role: QtRoleType):
+    def get_data_of_stage_build_cell(self, row_snapshot: StudentTableRowSnapshot, role: QtRoleType):
         if role == Qt.DisplayRole:
-            cell_data = get_student_table_get_student_stage_state_cell_data_usecase().execute(
-                student_id=student_id,
-                stage_type=BuildStage,
-            )
+            cell_data = row_snapshot.stage_state_cells[BuildStage]
             for target_state, text in self._STAGE_STATE_TEXT_MAPPING.items():
                 if all(state == target_state for state in cell_data.states.values()):
                     return text
             return "？"
         elif role == Qt.ForegroundRole:
-            text = self.get_data_of_stage_build_cell(student_id, Qt.DisplayRole)
+            text = self.get_data_of_stage_build_cell(row_snapshot, Qt.DisplayRole)
             return self._foreground_status_text(text)
         else:
             return None
@@ -180,18 +257,15 @@ class StudentTableModelDataProvider(AbstractStudentTableModelDataProvider):
     @data_provider(
         column=StudentTableColumns.COL_STAGE_COMPILE,
     )
-    def get_data_of_stage_compile_cell(self, student_id: StudentID, role: QtRoleType):
+    def get_data_of_stage_compile_cell(self, row_snapshot: StudentTableRowSnapshot, role: QtRoleType):
         if role == Qt.DisplayRole:
-            cell_data = get_student_table_get_student_stage_state_cell_data_usecase().execute(
-                student_id=student_id,
-                stage_type=CompileStage,
-            )
+            cell_data = row_snapshot.stage_state_cells[CompileStage]
             for target_state, text in self._STAGE_STATE_TEXT_MAPPING.items():
                 if all(state == target_state for state in cell_data.states.values()):
                     return text
             return "？"
         elif role == Qt.ForegroundRole:
-            text = self.get_data_of_stage_compile_cell(student_id, Qt.DisplayRole)
+            text = self.get_data_of_stage_compile_cell(row_snapshot, Qt.DisplayRole)
             return self._foreground_status_text(text)
         else:
             return None
@@ -199,18 +273,15 @@ class StudentTableModelDataProvider(AbstractStudentTableModelDataProvider):
     @data_provider(
         column=StudentTableColumns.COL_STAGE_EXECUTE,
     )
-    def get_data_of_stage_execute_cell(self, student_id: StudentID, role: QtRoleType):
+    def get_data_of_stage_execute_cell(self, row_snapshot: StudentTableRowSnapshot, role: QtRoleType):
         if role == Qt.DisplayRole:
-            cell_data = get_student_table_get_student_stage_state_cell_data_usecase().execute(
-                student_id=student_id,
-                stage_type=ExecuteStage,
-            )
+            cell_data = row_snapshot.stage_state_cells[ExecuteStage]
             return " ".join(
                 self._STAGE_STATE_TEXT_MAPPING[state]
                 for state in cell_data.states.values()
             )
         elif role == Qt.ForegroundRole:
-            text = self.get_data_of_stage_execute_cell(student_id, Qt.DisplayRole)
+            text = self.get_data_of_stage_execute_cell(row_snapshot, Qt.DisplayRole)
             return self._foreground_status_text(text)
         else:
             return None
@@ -218,18 +289,15 @@ class StudentTableModelDataProvider(AbstractStudentTableModelDataProvider):
     @data_provider(
         column=StudentTableColumns.COL_STAGE_TEST,
     )
-    def get_data_of_stage_test_cell(self, student_id: StudentID, role: QtRoleType):
+    def get_data_of_stage_test_cell(self, row_snapshot: StudentTableRowSnapshot, role: QtRoleType):
         if role == Qt.DisplayRole:
-            cell_data = get_student_table_get_student_stage_state_cell_data_usecase().execute(
-                student_id=student_id,
-                stage_type=TestStage,
-            )
+            cell_data = row_snapshot.stage_state_cells[TestStage]
             return " ".join(
                 self._STAGE_STATE_TEXT_MAPPING[state]
                 for state in cell_data.states.values()
             )
         elif role == Qt.ForegroundRole:
-            text = self.get_data_of_stage_test_cell(student_id, Qt.DisplayRole)
+            text = self.get_data_of_stage_test_cell(row_snapshot, Qt.DisplayRole)
             return self._foreground_status_text(text)
         else:
             return None
@@ -237,12 +305,9 @@ class StudentTableModelDataProvider(AbstractStudentTableModelDataProvider):
     @data_provider(
         column=StudentTableColumns.COL_ERROR,
     )
-    def get_data_of_error_cell(self, student_id: StudentID, role: QtRoleType):
+    def get_data_of_error_cell(self, row_snapshot: StudentTableRowSnapshot, role: QtRoleType):
         if role == Qt.DisplayRole:
-            cell_data = get_student_table_get_student_error_cell_data_usecase().execute(
-                student_id=student_id,
-            )
-            aggregated_text_entries = cell_data.aggregate_text_entries()
+            aggregated_text_entries = row_snapshot.error_cell.aggregate_text_entries()
             if len(aggregated_text_entries) == 0:
                 return ""
             elif len(aggregated_text_entries) == 1:
@@ -251,10 +316,7 @@ class StudentTableModelDataProvider(AbstractStudentTableModelDataProvider):
                 return aggregated_text_entries[0].summary_text \
                     + f"（他{len(aggregated_text_entries) - 1}件のエラー）"
         elif role == Qt.ToolTipRole:
-            cell_data = get_student_table_get_student_error_cell_data_usecase().execute(
-                student_id=student_id,
-            )
-            aggregated_text_entries = cell_data.aggregate_text_entries()
+            aggregated_text_entries = row_snapshot.error_cell.aggregate_text_entries()
             if len(aggregated_text_entries) == 0:
                 return ""
             else:
@@ -268,11 +330,9 @@ class StudentTableModelDataProvider(AbstractStudentTableModelDataProvider):
     @data_provider(
         column=StudentTableColumns.COL_SCORE,
     )
-    def get_data_of_mark_result_cell(self, student_id: StudentID, role: QtRoleType):
+    def get_data_of_mark_result_cell(self, row_snapshot: StudentTableRowSnapshot, role: QtRoleType):
         if role == Qt.DisplayRole:
-            student_mark = get_student_mark_get_usecase().execute(
-                student_id=student_id,
-            )
+            student_mark = row_snapshot.mark
             if student_mark.is_marked:
                 return str(student_mark.score)
             else:
@@ -285,22 +345,39 @@ class StudentTableModelDataProvider(AbstractStudentTableModelDataProvider):
             return None
 
 
-class CachedStudentTableModelDataProvider(AbstractStudentTableModelDataProvider):
-    __CACHE_VALUE_UNSET = object()
+def _list_prefetch_rows(first_visible_row: int, last_visible_row: int, direction: int, n_rows: int) -> list[int]:
+    # 読み込む行を表示されている行，スクロールしている方向の先の2画面分，反対方向の1画面分の順に並べる
+    page_size = last_visible_row - first_visible_row + 1
+    rows_above = range(first_visible_row - 1, -1, -1)
+    rows_below = range(last_visible_row + 1, n_rows)
+    if direction >= 0:
+        rows_ahead, rows_behind = rows_below, rows_above
+    else:
+        rows_ahead, rows_behind = rows_above, rows_below
+    return [
+        *range(first_visible_row, last_visible_row + 1),
+        *rows_ahead[:page_size * 2],
+        *rows_behind[:page_size],
+    ]
 
-    def __init__(
-            self,
-            *,
-            student_ids: list[StudentID],
-            provider: AbstractStudentTableModelDataProvider,
-    ):
-        super().__init__(student_ids)
+
+class _StudentTableRowSnapshotLoader(QThread):
+    # 要求された行のスナップショットをGUIスレッドの外で作るワーカースレッド
+    # 要求はプロバイダの行のブロック単位でまとめ，キューの先頭のブロックから作る
+
+    _logger = create_logger()
+
+    rows_loaded = pyqtSignal(list, name="rows_loaded")
+
+    def __init__(self, parent: QObject = None, *, provider: StudentTableModelDataProvider):
+        super().__init__(parent)
         self._provider = provider
 
+        self.__stop = False
         self._lock = QMutex()
-        self._cache: dict[int, dict[tuple[int, QtRoleType], Any]] \
-            = defaultdict(lambda: defaultdict(lambda: self.__CACHE_VALUE_UNSET))
-        # self._cache: row, (column, role) -> value
+        self._condition = QWaitCondition()
+        # 読み込むブロックの先頭の行
+        self._q: deque[int] = deque()
 
     @contextmanager
     def __lock(self):
@@ -310,39 +387,151 @@ class CachedStudentTableModelDataProvider(AbstractStudentTableModelDataProvider)
         finally:
             self._lock.unlock()
 
-    @classmethod
-    def from_provider(cls, provider: AbstractStudentTableModelDataProvider):
-        return cls(
-            student_ids=provider._student_ids,
-            provider=provider,
-        )
-
-    def invalidate_cache(self, row: int):
+    def stop(self) -> None:
         with self.__lock():
-            if row in self._cache:
-                del self._cache[row]
+            self.__stop = True
+            self._condition.wakeAll()
 
-    def get_data(self, row: int, column: int, role: QtRoleType):
+    def request_rows(self, rows: Iterable[int], *, is_prefetch: bool = False) -> None:
+        # 先読みの要求はキューを置き換える（スクロールして離れた範囲の先読みは捨てる）
+        # それ以外の要求は今すぐ表示する行なのでキューの先頭に入れる
+        blocks = list(dict.fromkeys(self._provider.get_row_block(i_row).start for i_row in rows))
         with self.__lock():
-            if self._cache[row][(column, role)] is self.__CACHE_VALUE_UNSET:
-                self._cache[row][(column, role)] = self._provider.get_data(row, column, role)
-            return self._cache[row][(column, role)]
+            if is_prefetch:
+                self._q = deque(blocks)
+            else:
+                for block in reversed(blocks):
+                    if block in self._q:
+                        self._q.remove(block)
+                    self._q.appendleft(block)
+            self._condition.wakeAll()
+
+    def run(self):
+        while True:
+            with self.__lock():
+                while not self._q and not self.__stop:
+                    self._condition.wait(self._lock)
+                if self.__stop:
+                    break
+                block_begin = self._q.popleft()
+            rows = self._provider.list_rows_to_load(self._provider.get_row_block(block_begin))
+            if not rows:
+                continue
+            try:
+                loaded_rows = self._provider.load_rows(rows)
+            except Exception:
+                self._logger.exception(f"Failed to load row snapshots {rows[0]}-{rows[-1]}")
+                continue
+            if loaded_rows:
+                self.rows_loaded.emit(loaded_rows)
+
+
+def _iter_row_ranges(rows: Iterable[int]) -> Iterable[tuple[int, int]]:
+    # 行番号を連続する範囲(first, last)にまとめる
+    first, last = None, None
+    for row in sorted(rows):
+        if last is not None and row == last + 1:
+            last = row
+            continue
+        if first is not None:
+            yield first, last
+        first, last = row, row
+    if first is not None:
+        yield first, last
 
 
 class StudentTableModel(QAbstractTableModel):
+    _logger = create_logger()
+
+    # 最初の変更イベントからこの時間の間に届いたイベントをまとめて，連続する行ごとに1回のdataChangedにする（1フレーム分）
+    _COALESCE_INTERVAL_MSEC = 16
+
+    _changed_rows_queued = pyqtSignal(name="_changed_rows_queued")
+
     def __init__(
             self,
             parent: QObject = None,
             *,
             provider: AbstractStudentTableModelDataProvider,
+            student_change_event_bus: StudentChangeEventBus,
     ):
         super().__init__(parent)
 
         self._student_ids: list[StudentID] = provider.student_ids
+        self._row_of_student: dict[StudentID, int] = {
+            student_id: i_row for i_row, student_id in enumerate(self._student_ids)
+        }
         self._data_provider = provider
 
+        # 変更された行（イベントバスのpublishはどのスレッドからも呼ばれるのでロックして触る）
+        self.__changed_rows_lock = QMutex()
+        self._changed_rows: set[int] = set()
+
+        self._coalesce_timer = QTimer(self)
+        self._coalesce_timer.setSingleShot(True)
+        self._coalesce_timer.setInterval(self._COALESCE_INTERVAL_MSEC)
+        self._coalesce_timer.timeout.connect(self._on_coalesce_timer_timeout)  # type: ignore
+
+        # publishしたスレッドからGUIスレッドにキューで渡す
+        # noinspection PyUnresolvedReferences
+        self._changed_rows_queued.connect(self._on_changed_rows_queued, Qt.QueuedConnection)
+
+        subscriber = self.__on_student_changed
+        student_change_event_bus.subscribe(subscriber)
+        # noinspection PyUnresolvedReferences
+        self.destroyed.connect(lambda: student_change_event_bus.unsubscribe(subscriber))
+
+    @contextmanager
+    def _lock_changed_rows(self):
+        self.__changed_rows_lock.lock()
+        try:
+            yield
+        finally:
+            self.__changed_rows_lock.unlock()
+
+    def __on_student_changed(self, events: list[StudentChangeEvent]) -> None:
+        # イベントバスからpublishしたスレッドで呼ばれる
+        rows = {
+            self._row_of_student[event.student_id]
+            for event in events
+            if event.student_id in self._row_of_student
+        }
+        if not rows:
+            return
+        with self._lock_changed_rows():
+            # まだGUIスレッドに渡していない行があればそれと一緒に処理される
+            is_queued = bool(self._changed_rows)
+            self._changed_rows.update(rows)
+        if not is_queued:
+            self._changed_rows_queued.emit()
+
+    @pyqtSlot()
+    def _on_changed_rows_queued(self):
+        if not self._coalesce_timer.isActive():
+            self._coalesce_timer.start()
+
+    @pyqtSlot()
+    def _on_coalesce_timer_timeout(self):
+        with self._lock_changed_rows():
+            rows = self._changed_rows
+            self._changed_rows = set()
+        for i_row in rows:
+            self._data_provider.invalidate_cache(i_row)
+        self._emit_rows_changed(rows)
+
+    @pyqtSlot(list)
+    def notify_rows_loaded(self, rows: list[int]):
+        # 行のスナップショットが作られたら表示し直す
+        self._emit_rows_changed(rows)
+
+    def _emit_rows_changed(self, rows: Iterable[int]) -> None:
+        for first, last in _iter_row_ranges(rows):
+            self._logger.debug(f"Updating rows {first}-{last}")
+            # noinspection PyUnresolvedReferences
+            self.dataChanged.emit(self.index(first, 0), self.index(last, self.columnCount() - 1))
+
     def get_row_of_student(self, student_id: StudentID) -> int:
-        return self._student_ids.index(student_id)
+        return self._row_of_student[student_id]
 
     COLS_STATE = (
         StudentTableColumns.COL_STAGE_BUILD,
@@ -382,81 +571,47 @@ class StudentTableModel(QAbstractTableModel):
         return self._student_ids[i_row]
 
 
-class _StudentObserver(QObject):
-    _logger = create_logger()
-
-    student_modified = pyqtSignal(StudentID, name="student_modified")
-
-    @staticmethod
-    def __student_id_cyclic_iterator(student_ids: list[StudentID]) -> Iterable[StudentID]:
-        while True:
-            for student_id in student_ids:
-                yield student_id
-
-    def __init__(self, parent: QObject):
-        super().__init__(parent)
-
-        self._student_id_iter = iter(
-            self.__student_id_cyclic_iterator(get_student_list_id_usecase().execute())
-        )
-
-        self._timer = QTimer(self)
-        self._timer.setInterval(20)
-        self._timer.timeout.connect(self._on_timer_timeout)  # type: ignore
-        self._timer.start()
-
-        self._student_id_mtime_mapping: dict[StudentID, StudentStageResultDiffSnapshot] = {}
-        self._current_student_index = 0
-
-    @pyqtSlot()
-    def _on_timer_timeout(self):
-        # 学籍番号の取得
-        student_id = next(self._student_id_iter)
-
-        # スナップショットを取得
-        new_snapshot = get_student_dynamic_take_diff_snapshot_usecase().execute(student_id)
-
-        # 初めて巡回したとき以外は更新を確認してシグナルを送出
-        if student_id in self._student_id_mtime_mapping:
-            old_snapshot = self._student_id_mtime_mapping.get(student_id)
-            if new_snapshot.is_modified_from(old_snapshot):
-                # noinspection PyUnresolvedReferences
-                self._logger.debug(
-                    f"Student {student_id} has been modified\n{old_snapshot}\n{new_snapshot}")
-                self.student_modified.emit(student_id)
-
-        self._student_id_mtime_mapping[student_id] = new_snapshot
-
-
 class StudentTableWidget(QTableView, HorizontalScrollWithShiftAndWheelMixin):
     _logger = create_logger()
 
     student_id_cell_triggered = pyqtSignal(StudentID, name="student_id_cell_triggered")
     mark_result_cell_triggered = pyqtSignal(StudentID, name="mark_result_cell_triggered")
+    student_selection_changed = pyqtSignal(name="student_selection_changed")
 
     def __init__(self, parent: QObject = None):
         super().__init__(parent)
 
-        # noinspection PyTypeChecker
-        self._student_observer = _StudentObserver(self)
-        # noinspection PyUnresolvedReferences
-        self._student_observer.student_modified.connect(self._on_student_modification_observed)
-
-        self._model_data_provider = CachedStudentTableModelDataProvider.from_provider(
-            provider=StudentTableModelDataProvider(
-                student_ids=get_student_list_id_usecase().execute(),
-            ),
+        self._model_data_provider = StudentTableModelDataProvider(
+            student_ids=get_student_list_id_usecase().execute(),
         )
         # noinspection PyTypeChecker
         self._model = StudentTableModel(
             self,
             provider=self._model_data_provider,
+            student_change_event_bus=get_student_change_event_bus(),
         )  # type: ignore
         self.setModel(self._model)
 
+        # 行のスナップショットはワーカースレッドで作る
+        # noinspection PyTypeChecker
+        self._row_snapshot_loader = _StudentTableRowSnapshotLoader(self, provider=self._model_data_provider)
+        self._model_data_provider.set_row_request_listener(
+            lambda i_row: self._row_snapshot_loader.request_rows([i_row])
+        )
+        # 最後に先読みしたときに表示されていた先頭の行（スクロールの方向を調べるため）
+        self._last_first_visible_row = 0
+
         self._init_ui()
         self.__init_signals()
 
+        self._row_snapshot_loader.start()
+
+    def shutdown(self) -> None:
+        # データベースへの接続を閉じる前に呼ぶ
+        self._model_data_provider.set_row_request_listener(None)
+        self._row_snapshot_loader.stop()
+        self._row_snapshot_loader.wait()
+
     def _init_ui(self):
         # self.horizontalHeader().setStretchLastSection(True)
         self.horizontalHeader().setDefaultSectionSize(100)
@@ -473,6 +628,46 @@ class StudentTableWidget(QTableView, HorizontalScrollWithShiftAndWheelMixin):
 
     def __init_signals(self):
         self.clicked.connect(self._on_cell_triggered)  # type: ignore
+        # noinspection PyUnresolvedReferences
+        self.selectionModel().selectionChanged.connect(self._on_selection_changed)
+        # noinspection PyUnresolvedReferences
+        self._row_snapshot_loader.rows_loaded.connect(self._model.notify_rows_loaded)
+        # noinspection PyUnresolvedReferences
+        self.verticalScrollBar().valueChanged.connect(self._on_viewport_changed)
+
+    def get_current_student_id(self) -> StudentID | None:
+        index = self.currentIndex()
+        if not index.isValid():
+            return None
+        return self._model.get_student_id_of_row(index.row())
+
+    def get_selected_student_ids(self) -> list[StudentID]:
+        i_rows = sorted({index.row() for index in self.selectedIndexes()})
+        return [self._model.get_student_id_of_row(i_row) for i_row in i_rows]
+
+    @pyqtSlot()
+    def _on_viewport_changed(self):
+        # 表示されている行とスクロールしている方向の先の行を先読みする
+        first_visible_row = self.rowAt(0)
+        if first_visible_row < 0:
+            return
+        last_visible_row = self.rowAt(self.viewport().height() - 1)
+        if last_visible_row < 0:
+            last_visible_row = self._model.rowCount() - 1
+        direction = first_visible_row - self._last_first_visible_row
+        self._last_first_visible_row = first_visible_row
+        self._row_snapshot_loader.request_rows(
+            _list_prefetch_rows(first_visible_row, last_visible_row, direction, self._model.rowCount()),
+            is_prefetch=True,
+        )
+
+    def resizeEvent(self, evt: QResizeEvent):
+        super().resizeEvent(evt)
+        self._on_viewport_changed()
+
+    @pyqtSlot()
+    def _on_selection_changed(self):
+        self.student_selection_changed.emit()
 
     @pyqtSlot()
     def _on_cell_triggered(self):
@@ -485,15 +680,6 @@ class StudentTableWidget(QTableView, HorizontalScrollWithShiftAndWheelMixin):
         elif i_col == StudentTableColumns.COL_SCORE:
             self.mark_result_cell_triggered.emit(self._model.get_student_id_of_row(i_row))
 
-    @pyqtSlot(StudentID)
-    def _on_student_modification_observed(self, student_id):
-        i_row = self._model.get_row_of_student(student_id)
-        self._logger.debug(f"Updating row {i_row} {student_id}")
-        self._model_data_provider.invalidate_cache(i_row)
-        index_begin = self._model.createIndex(i_row, 0)
-        index_end = self._model.createIndex(i_row, self._model.columnCount() - 1)
-        self.dataChanged(index_begin, index_end)
-
     def mouseMoveEvent(self, evt: QMouseEvent):
         # 特定のセルに来たらマウスカーソルの形を変える
         index = self.indexAt(evt.pos())
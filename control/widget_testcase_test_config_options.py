@@ -1,7 +1,7 @@
 from PyQt5.QtCore import QObject, pyqtSlot
-from PyQt5.QtWidgets import QVBoxLayout, QGridLayout, QGroupBox, QCheckBox
+from PyQt5.QtWidgets import QVBoxLayout, QGridLayout, QGroupBox, QCheckBox, QLabel, QDoubleSpinBox
 
-from domain.model.test_config_options import TestConfigOptions
+from domain.model.test_config_options import TestConfigOptions, MatchMode
 
 
 class TestCaseTestConfigOptionsEditWidget(QGroupBox):
@@ -18,20 +18,42 @@ class TestCaseTestConfigOptionsEditWidget(QGroupBox):
         layout_content = QGridLayout()
         layout_root.addLayout(layout_content)
 
+        layout_content.addWidget(QLabel("マッチングのタイムアウト（秒）", self), 0, 0)
+
+        self._sb_match_timeout = QDoubleSpinBox(self)
+        self._sb_match_timeout.setMinimum(0.1)
+        self._sb_match_timeout.setMaximum(300.0)
+        self._sb_match_timeout.setSingleStep(0.1)
+        self._sb_match_timeout.setDecimals(1)
+        layout_content.addWidget(self._sb_match_timeout, 0, 1)
+
         self._cb_ignore_case = QCheckBox(self)
         self._cb_ignore_case.setText("大文字・小文字の違いを無視する")
         layout_content.addWidget(self._cb_ignore_case, 1, 1)
 
+        self._cb_linear_match = QCheckBox(self)
+        self._cb_linear_match.setText("パターンを前から順に探す（長い出力でもテストが止まらない）")
+        self._cb_linear_match.setToolTip(
+            "オフにするとパターン全体を1つの正規表現でマッチングします。\n"
+            "空白や改行のパターンが続く場合に見つかるトークンが増えることがありますが，"
+            "長い出力では非常に時間がかかることがあります。"
+        )
+        layout_content.addWidget(self._cb_linear_match, 2, 1)
+
     def _init_signals(self):
         pass
 
     @pyqtSlot()
     def set_data(self, options: TestConfigOptions):
+        self._sb_match_timeout.setValue(options.match_timeout)
         self._cb_ignore_case.setChecked(options.ignore_case)
+        self._cb_linear_match.setChecked(options.match_mode == MatchMode.LINEAR)
 
     @pyqtSlot()
     def get_data(self) -> TestConfigOptions:
         options = TestConfigOptions(
             ignore_case=self._cb_ignore_case.isChecked(),
+            match_mode=MatchMode.LINEAR if self._cb_linear_match.isChecked() else MatchMode.BACKTRACKING,
+            match_timeout=self._sb_match_timeout.value(),
         )
         return options
@@ -7,12 +7,12 @@ from application.dependency.task import get_task_manager
 from application.dependency.usecase import get_current_project_summary_get_usecase, \
     get_student_list_id_usecase, get_student_submission_folder_show_usecase
 from control.dialog_about import AboutDialog
+from control.dialog_clear_stage_results import ClearStageResultsDialog
 from control.dialog_global_settings import GlobalSettingsEditDialog
 from control.dialog_mark import MarkDialog
 from control.dialog_score_export import ScoreExportDialog
 from control.dialog_stop_tasks import StopTasksDialog
 from control.dialog_testcase_list_edit import TestCaseListEditDialog
-from control.task.clean_all_stage import CleanAllStagesStudentTask
 from control.task.run_stage import RunStagesStudentTask
 from control.widget_status_process_resource_usage import ProcessResourceUsageStatusBarWidget
 from control.widget_status_task_state import TaskStateStatusBarWidget
@@ -80,6 +80,9 @@ class MainWindow(QMainWindow):
         self._w_student_table.mark_result_cell_triggered.connect(
             self.__w_student_table_mark_result_cell_triggered
         )
+        self._w_student_table.student_selection_changed.connect(
+            self.__w_student_table_student_selection_changed
+        )
 
     @pyqtSlot(StudentID)
     def __w_student_table_student_id_cell_triggered(self, student_id: StudentID):
@@ -106,6 +109,15 @@ class MainWindow(QMainWindow):
         dialog.set_state(dialog.states.create_state_by_student_id(student_id))
         dialog.exec_()
 
+    @pyqtSlot()
+    def __w_student_table_student_selection_changed(self):
+        # テーブルで選択されている生徒のタスクを他の生徒より先に実行する
+        task_manager = get_task_manager()
+        task_manager.set_focused_student_ids(self._w_student_table.get_selected_student_ids())
+        student_id = self._w_student_table.get_current_student_id()
+        if student_id is not None:
+            task_manager.bump_student(student_id)
+
     @classmethod
     def __perform_stop_tasks(cls):
         if not get_task_manager().is_empty():
@@ -113,17 +125,23 @@ class MainWindow(QMainWindow):
             dialog.exec_()
 
     @classmethod
-    def __enqueue_student_tasks_if_not_run(cls, parent, task_cls: type[AbstractStudentTask]):
+    def __enqueue_student_tasks_if_not_run(cls, task_cls: type[AbstractStudentTask]):
         if not get_task_manager().is_empty():
             return
         for student_id in get_student_list_id_usecase().execute():
             get_task_manager().enqueue(
                 task_cls(
-                    parent=parent,
                     student_id=student_id,
                 )
             )
 
+    def __perform_clear_stage_results(self) -> None:
+        # 実行中のタスクが結果を書き込むのでタスクがないときだけ削除する
+        if not get_task_manager().is_empty():
+            return
+        dialog = ClearStageResultsDialog(self)
+        dialog.exec_()
+
     def __perform_reopen_project(self) -> None:
         # noinspection PyTypeChecker
         if QMessageBox.question(
@@ -144,16 +162,12 @@ class MainWindow(QMainWindow):
             self.__perform_reopen_project()
         elif name == "run":
             self.__enqueue_student_tasks_if_not_run(
-                parent=self,
                 task_cls=RunStagesStudentTask,
             )
         elif name == "stop":
             self.__perform_stop_tasks()
         elif name == "clear":
-            self.__enqueue_student_tasks_if_not_run(
-                parent=self,
-                task_cls=CleanAllStagesStudentTask,
-            )
+            self.__perform_clear_stage_results()
         elif name == "edit-settings":
             dialog = GlobalSettingsEditDialog()
             dialog.exec_()
@@ -176,3 +190,4 @@ class MainWindow(QMainWindow):
 
     def closeEvent(self, evt, **kwargs):
         self.__perform_stop_tasks()
+        self._w_student_table.shutdown()
@@ -1,7 +1,27 @@
 from dataclasses import dataclass
+from enum import Enum
 from pathlib import Path
 
 from application.state.debug import is_debug
+from domain.model.stage import BuildStage, CompileStage, ExecuteStage, TestStage
+
+
+class TaskSchedulingPolicy(Enum):
+    # 未開始のタスクのうち次に開始するものの選び方
+    FIFO = "fifo"  # 追加された順
+    FOCUSED_FIRST = "focused_first"  # テーブルで選択している生徒を優先
+    SHORTEST_EXPECTED_FIRST = "shortest_expected_first"  # 前回の所要時間が短い生徒を優先
+    FAILED_FIRST = "failed_first"  # 前回失敗した生徒を優先
+
+
+def _create_default_stage_concurrency_limits() -> dict[str, int]:
+    # コンパイルは生徒ごとに開発者ツールのシェルを起動するので重い
+    return {
+        BuildStage.get_name(): 32,
+        CompileStage.get_name(): 2,
+        ExecuteStage.get_name(): 32,
+        TestStage.get_name(): 32,
+    }
 
 
 @dataclass
@@ -14,6 +34,11 @@ class GlobalSettings:
     show_editing_symbols_in_source_code: bool
     enable_line_wrap_in_stream_content: bool
     enable_line_wrap_in_source_code: bool
+    use_process_pool: bool
+    task_scheduling_policy: TaskSchedulingPolicy
+    stage_concurrency_limits: dict[str, int]  # ステージの名前 -> そのステージを同時に実行する数の上限
+    max_testcase_workers: int  # ひとりの生徒のテストケースを並行して実行する数
+    adaptive_workers: bool  # 負荷に応じてmax_workersを上限に並列タスク実行数を増減する
 
     @classmethod
     def create_default(cls) -> "GlobalSettings":
@@ -28,6 +53,11 @@ class GlobalSettings:
             show_editing_symbols_in_source_code=False,
             enable_line_wrap_in_stream_content=False,
             enable_line_wrap_in_source_code=False,
+            use_process_pool=False,
+            task_scheduling_policy=TaskSchedulingPolicy.FIFO,
+            stage_concurrency_limits=_create_default_stage_concurrency_limits(),
+            max_testcase_workers=2,
+            adaptive_workers=False,
         )
 
     def to_json(self):
@@ -40,6 +70,11 @@ class GlobalSettings:
             show_editing_symbols_in_source_code=self.show_editing_symbols_in_source_code,
             enable_line_wrap_in_stream_content=self.enable_line_wrap_in_stream_content,
             enable_line_wrap_in_source_code=self.enable_line_wrap_in_source_code,
+            use_process_pool=self.use_process_pool,
+            task_scheduling_policy=self.task_scheduling_policy.value,
+            stage_concurrency_limits=self.stage_concurrency_limits,
+            max_testcase_workers=self.max_testcase_workers,
+            adaptive_workers=self.adaptive_workers,
         )
 
     @classmethod
@@ -53,4 +88,15 @@ class GlobalSettings:
             show_editing_symbols_in_source_code=body["show_editing_symbols_in_source_code"],
             enable_line_wrap_in_stream_content=body["enable_line_wrap_in_stream_content"],
             enable_line_wrap_in_source_code=body["enable_line_wrap_in_source_code"],
+            # この項目がない古い設定ファイルも読めるようにする
+            use_process_pool=body.get("use_process_pool", False),
+            task_scheduling_policy=TaskSchedulingPolicy(
+                body.get("task_scheduling_policy", TaskSchedulingPolicy.FIFO.value),
+            ),
+            stage_concurrency_limits={
+                **_create_default_stage_concurrency_limits(),
+                **body.get("stage_concurrency_limits", {}),
+            },
+            max_testcase_workers=body.get("max_testcase_workers", 2),
+            adaptive_workers=body.get("adaptive_workers", False),
         )
@@ -1,5 +1,6 @@
+import codecs
 from collections import OrderedDict
-from typing import Iterable
+from typing import Iterable, Iterator
 
 from domain.model.value import FileID
 from util.json_util import bytes_to_jsonable, jsonable_to_bytes
@@ -51,6 +52,18 @@ class OutputFile:
         except UnicodeDecodeError:
             return None
 
+    def iter_content_string_chunks(self, chunk_size: int) -> Iterator[str]:
+        # 全体の文字列を作らずにchunk_sizeバイトずつデコードする（UnicodeDecodeErrorを送出することがある）
+        decoder = codecs.getincrementaldecoder("utf-8")()
+        content_view = memoryview(self._content)
+        for i in range(0, len(content_view), chunk_size):
+            chunk = decoder.decode(content_view[i:i + chunk_size])
+            if chunk:
+                yield chunk
+        chunk = decoder.decode(b"", final=True)
+        if chunk:
+            yield chunk
+
 
 class OutputFileCollection:
     def __init__(self, it: Iterable[OutputFile] = ()):
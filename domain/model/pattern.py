@@ -1,8 +1,7 @@
-import copy
 import itertools
 import re
 from abc import ABC, abstractmethod
-from dataclasses import dataclass
+from dataclasses import dataclass, fields
 from typing import NamedTuple, Iterable
 
 
@@ -42,10 +41,24 @@ class PatternMatchOptions:
 @dataclass(frozen=True)
 class AbstractPattern(ABC):
     # 出力ストリームの内容に期待されるトークンのパターン
+    # 不変なのでコピーせずに共有する
+    # dataclassのslots=Trueはクラスを作り直してsuper()と__subclasses__()が壊れるので__slots__を直接書く
+
+    __slots__ = ("index", "is_expected")
 
     index: int  # パターンリスト内の位置
     is_expected: bool  # このパターンが出力に出現するor出現しない
 
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        return self
+
+    def __reduce__(self):
+        # frozenなので__setstate__で復元できない（コンストラクタで作り直す）
+        return type(self), tuple(getattr(self, f.name) for f in fields(self))
+
     @classmethod
     @abstractmethod
     def create_default(cls, index: int) -> "AbstractPattern":
@@ -96,6 +109,8 @@ class AbstractPattern(ABC):
 
 @dataclass(frozen=True)
 class RegexPattern(AbstractPattern):
+    __slots__ = ("regex",)
+
     regex: str
 
     def __post_init__(self):
@@ -134,6 +149,8 @@ class RegexPattern(AbstractPattern):
 
 @dataclass(frozen=True)
 class TextPattern(AbstractPattern):
+    __slots__ = ("text", "is_multiple_space_ignored", "is_word")
+
     text: str
     is_multiple_space_ignored: bool
     is_word: bool
@@ -189,6 +206,8 @@ class TextPattern(AbstractPattern):
 
 @dataclass(frozen=True)
 class SpacePattern(AbstractPattern):
+    __slots__ = ()
+
     def _fields_to_json(self) -> dict:
         return dict(
             **super()._fields_to_json(),
@@ -216,6 +235,8 @@ class SpacePattern(AbstractPattern):
 
 @dataclass(frozen=True)
 class EOLPattern(AbstractPattern):
+    __slots__ = ()
+
     def _fields_to_json(self) -> dict:
         return dict(
             **super()._fields_to_json(),
@@ -242,6 +263,9 @@ class EOLPattern(AbstractPattern):
 
 
 class AbstractPatternList(ABC):
+    # 不変なのでコピーせずに共有する
+    __slots__ = ("_patterns",)
+
     def __init__(self, patterns: tuple[AbstractPattern, ...]):
         self._patterns: tuple[AbstractPattern, ...] = patterns
 
@@ -263,11 +287,25 @@ class AbstractPatternList(ABC):
         return len(self._patterns)
 
     def __iter__(self):
-        for pattern in self._patterns:
-            yield copy.deepcopy(pattern)
+        return iter(self._patterns)
+
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        return self
+
+    def __reduce__(self):
+        return type(self), (self._patterns,)
+
+    def __eq__(self, other) -> bool:
+        # 設定の読み込みごとに別のインスタンスになるので値で比較する
+        if type(self) is not type(other):
+            return NotImplemented
+        return self._patterns == other._patterns
 
     def __hash__(self) -> int:
-        return hash((type(self), *self))
+        return hash((type(self), *self._patterns))
 
     def to_regex_pattern(self, *, ignore_case: bool) -> tuple[str, int]:  # pattern and flags
         pattern_regex_lst = []
@@ -280,14 +318,19 @@ class AbstractPatternList(ABC):
         else:
             total_regex = r".*?"
 
+        return total_regex, self.get_regex_flags(ignore_case=ignore_case)
+
+    @staticmethod
+    def get_regex_flags(*, ignore_case: bool) -> int:
         flags = re.DOTALL | re.MULTILINE
         if ignore_case:
             flags |= re.IGNORECASE
-
-        return total_regex, flags
+        return flags
 
 
 class PatternList(AbstractPatternList):  # immutable
+    __slots__ = ("_expected_patterns", "_unexpected_pattern_groups")
+
     def __init__(self, it: Iterable[AbstractPattern] = ()):
         super().__init__(tuple(it))
 
@@ -295,6 +338,16 @@ class PatternList(AbstractPatternList):  # immutable
             for i, pattern in enumerate(self._patterns):
                 assert pattern.index == i, (pattern.index, i)
 
+        # 期待されるパターンと期待されないパターンの連番のグループへの分割は作成時に1回だけ行う
+        self._expected_patterns = DiscontinuousSubPatternList(
+            p for p in self._patterns if p.is_expected
+        )
+        self._unexpected_pattern_groups = tuple(
+            ContinuousSubPatternList(tuple(group))
+            for is_expected, group in itertools.groupby(self._patterns, key=lambda p: p.is_expected)
+            if not is_expected
+        )
+
     def to_json(self):
         return dict(
             patterns=[pattern.to_json() for pattern in self._patterns]
@@ -307,28 +360,36 @@ class PatternList(AbstractPatternList):  # immutable
     @property
     def expected_patterns(self) -> "DiscontinuousSubPatternList":
         """期待されるパターンで構成されるPatternListを取得"""
-        return DiscontinuousSubPatternList([p for p in self if p.is_expected])
+        return self._expected_patterns
 
     def iter_unexpected_patterns(self) -> "Iterable[ContinuousSubPatternList]":
         """期待されないパターンで構成されるPatternListを連番を1グループとしてグループごとに順番に返す"""
-        if not self._patterns:
-            return
-
-        slice_lst = []
-        if self.expected_patterns._patterns[0].index != 0:
-            slice_lst.append(slice(0, self.expected_patterns._patterns[0].index))
-        for p in itertools.pairwise(self.expected_patterns):
-            slice_lst.append(slice(p[0].index + 1, p[1].index))
-        if self.expected_patterns._patterns[-1].index != len(self) - 1:
-            slice_lst.append(slice(self.expected_patterns._patterns[-1].index + 1, len(self)))
-
-        for s in slice_lst:
-            if s.start == s.stop:
-                continue
-            yield ContinuousSubPatternList(self._patterns[s])
+        return iter(self._unexpected_pattern_groups)
+
+    def compile(self, *, ignore_case: bool) -> "CompiledPatternList":
+        """期待されるパターンと期待されないパターンのグループごとの正規表現をコンパイルする"""
+        expected_patterns = self.expected_patterns
+        regex_pattern, flags = expected_patterns.to_regex_pattern(ignore_case=ignore_case)
+        unexpected_regexes = []
+        for unexpected_patterns in self.iter_unexpected_patterns():
+            unexpected_regex_pattern, unexpected_flags = unexpected_patterns.to_regex_pattern(
+                ignore_case=ignore_case,
+            )
+            unexpected_regexes.append(
+                (unexpected_patterns, re.compile(unexpected_regex_pattern, unexpected_flags))
+            )
+        return CompiledPatternList(
+            patterns=self,
+            expected_patterns=expected_patterns,
+            expected_regex=re.compile(regex_pattern, flags),
+            unexpected_regexes=tuple(unexpected_regexes),
+            pattern_regexes=tuple(re.compile(pattern.to_regex(), flags) for pattern in self._patterns),
+        )
 
 
 class DiscontinuousSubPatternList(AbstractPatternList):  # immutable
+    __slots__ = ()
+
     def __init__(self, it: Iterable[AbstractPattern]):
         super().__init__(tuple(it))
 
@@ -338,9 +399,25 @@ class DiscontinuousSubPatternList(AbstractPatternList):  # immutable
 
 
 class ContinuousSubPatternList(AbstractPatternList):
+    __slots__ = ()
+
     def __init__(self, it: tuple[AbstractPattern, ...]):
         super().__init__(tuple(it))
 
         if self._patterns:
             for p_1, p_2 in itertools.pairwise(self._patterns):
                 assert p_1.index + 1 == p_2.index, (p_1, p_2)
+
+
+@dataclass(frozen=True)
+class CompiledPatternList:
+    # PatternListのマッチングに使う正規表現をコンパイルしたもの
+    # 同じPatternListに対して生徒ごとにコンパイルし直さないように使い回す
+
+    patterns: PatternList
+    expected_patterns: DiscontinuousSubPatternList
+    expected_regex: re.Pattern
+    # 期待されないパターンの連番のグループとその正規表現
+    unexpected_regexes: tuple[tuple[ContinuousSubPatternList, re.Pattern], ...]
+    # パターンごとの正規表現（パターンの位置をそのまま添字にする）
+    pattern_regexes: tuple[re.Pattern, ...]
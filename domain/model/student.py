@@ -4,7 +4,7 @@ from datetime import datetime
 from domain.model.value import StudentID
 
 
-@dataclass(slots=True)
+@dataclass(frozen=True, slots=True)
 class Student:
     student_id: StudentID
     name: str
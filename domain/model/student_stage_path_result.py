@@ -5,7 +5,7 @@ from typing import Iterable
 from domain.model.stage_path import StagePath
 from domain.model.stage import AbstractStage
 from domain.model.student_stage_result import AbstractStudentStageResult, \
-    AbstractFailureStudentStageResult
+    AbstractFailureStudentStageResult, StudentStageResultSummary
 from domain.model.value import StudentID
 
 
@@ -192,3 +192,64 @@ class StudentStagePathResult:
             f"reason={self.last_stage_main_reason}"
             f")"
         )
+
+
+class StudentStagePathResultSummary:
+    # ステージとその結果の要約を管理するクラス
+    # 出力ファイルなどを読まずに結果の状態だけを扱うときにStudentStagePathResultの代わりに使う
+
+    def __init__(
+            self,
+            *,
+            student_id: StudentID,
+            stage_summaries: OrderedDict[AbstractStage, StudentStageResultSummary | None],
+            # ^ None if unprocessed
+    ):
+        if len(stage_summaries) == 0:
+            raise ValueError("stage_summaries must not be empty")
+
+        self._student_id = student_id
+        self._stage_summaries = stage_summaries
+
+    @property
+    def student_id(self) -> StudentID:
+        return self._student_id
+
+    @property
+    def stage_path(self) -> StagePath:
+        # ステージのパスを取得する
+        return StagePath(self._stage_summaries.keys())
+
+    def get_summary_by_stage_type(self, stage_type: type[AbstractStage]) \
+            -> StudentStageResultSummary | None:  # None if unfinished or stage does not exist
+        # 指定されたステージタイプのステージの結果の要約を取得する．未処理またはステージが存在しない場合はNoneを返す
+        for stage, summary in self._stage_summaries.items():
+            if isinstance(stage, stage_type):
+                return summary
+        return None
+
+    @property
+    def _last_stage_summary(self) -> StudentStageResultSummary | None:  # None if unstarted
+        # 最後に処理されたステージの結果の要約を取得する．まだ開始されていない場合はNoneを返す
+        last_summary = None
+        for summary in self._stage_summaries.values():
+            if summary is None:
+                break
+            last_summary = summary
+        return last_summary
+
+    @property
+    def last_stage_main_reason(self) -> str | None:  # None if unstarted or no error occurred
+        # 主な理由を取得する．まだ開始されていない場合，またはエラーが発生していない場合はNoneを返す
+        last_summary = self._last_stage_summary
+        if last_summary is None:
+            return None
+        return last_summary.reason
+
+    @property
+    def last_stage_detailed_reason(self) -> str | None:  # None if unstarted or no error occurred
+        # 詳細な理由を取得する．まだ開始されていない場合，またはエラーが発生していない場合はNoneを返す
+        last_summary = self._last_stage_summary
+        if last_summary is None:
+            return None
+        return last_summary.detailed_text
@@ -495,3 +495,35 @@ TestStageResultType = TypeVar(
     "TestStageResultType",
     bound=TestSuccessStudentStageResult | TestFailureStudentStageResult,
 )
+
+
+@dataclass(frozen=True, slots=True)
+class StudentStageResultSummary:
+    # 出力ファイルなどの大きなデータを持たないステージの結果の要約
+    # テーブル表示のように結果の状態だけが必要なときに使う
+    is_success: bool
+    reason: str | None  # None if success
+    detailed_text: str | None  # None if success
+    is_accepted: bool | None = None  # テストステージが成功したときだけ正解かどうかを持つ
+
+    @classmethod
+    def create_success(cls, *, is_accepted: bool | None = None) -> "StudentStageResultSummary":
+        return cls(
+            is_success=True,
+            reason=None,
+            detailed_text=None,
+            is_accepted=is_accepted,
+        )
+
+    @classmethod
+    def from_result(cls, result: AbstractStudentStageResult) -> "StudentStageResultSummary":
+        if result.is_success:
+            if isinstance(result, TestSuccessStudentStageResult):
+                return cls.create_success(is_accepted=result.is_accepted)
+            return cls.create_success()
+        assert isinstance(result, AbstractFailureStudentStageResult), result
+        return cls(
+            is_success=False,
+            reason=result.reason,
+            detailed_text=result.detailed_text,
+        )
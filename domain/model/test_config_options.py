@@ -1,17 +1,34 @@
 from dataclasses import dataclass
+from enum import Enum
+
+
+class MatchMode(Enum):
+    # 出力とパターンのマッチングの方式
+    # 方式によって見つかるトークンが変わることがあるので，既存のテストケースの採点が変わらないようにBACKTRACKINGを既定にする
+    # パターン全体を1つの正規表現にしてfullmatchする（長い出力で指数的にバックトラックすることがある）
+    BACKTRACKING = "backtracking"
+    # パターンごとに前のパターンの終わりから左から順にsearchする（よくある設定ではBACKTRACKINGと同じ結果になる）
+    LINEAR = "linear"
 
 
 @dataclass(frozen=True)
 class TestConfigOptions:
     ignore_case: bool
+    match_mode: MatchMode = MatchMode.BACKTRACKING  # LINEARはテストケースごとに選ぶ
+    match_timeout: float = 10.0  # 出力ファイル1つのマッチングにかけられる時間（秒）
 
     def to_json(self):
         return dict(
             ignore_case=self.ignore_case,
+            match_mode=self.match_mode.value,
+            match_timeout=self.match_timeout,
         )
 
     @classmethod
     def from_json(cls, body):
         return cls(
             ignore_case=body["ignore_case"],
+            # この項目がない古い設定ファイルも読めるようにする
+            match_mode=MatchMode(body.get("match_mode", MatchMode.BACKTRACKING.value)),
+            match_timeout=body.get("match_timeout", 10.0),
         )
@@ -0,0 +1,37 @@
+from contextlib import contextmanager
+
+from PyQt5.QtCore import QMutex
+
+from domain.model.pattern import PatternList, CompiledPatternList
+from infra.cache.lru import LRUCache
+
+
+class CompiledPatternListCache:
+    """
+    PatternListとignore_caseの組ごとにコンパイルした正規表現を保持するキャッシュ
+    PatternListは値で比較するので，テストケースの設定が変わらなければ読み込み直しても同じエントリを使う
+    """
+
+    def __init__(self, *, max_size: int, reduced_size: int):
+        self._lock = QMutex()
+        self._cache: LRUCache[tuple[PatternList, bool], CompiledPatternList] \
+            = LRUCache(max_size=max_size, reduced_size=reduced_size)
+
+    @contextmanager
+    def __lock(self):
+        self._lock.lock()
+        try:
+            yield
+        finally:
+            self._lock.unlock()
+
+    def get(self, patterns: PatternList, *, ignore_case: bool) -> CompiledPatternList:
+        key = patterns, ignore_case
+        with self.__lock():
+            if key in self._cache:
+                return self._cache[key]
+        # コンパイル中はロックを持たない（同時に同じパターンをコンパイルしても結果は同じ）
+        compiled_patterns = patterns.compile(ignore_case=ignore_case)
+        with self.__lock():
+            self._cache[key] = compiled_patterns
+        return compiled_patterns
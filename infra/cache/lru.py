@@ -42,11 +42,13 @@ class LRUCache(Generic[K, V]):
         return k in self.__cache
 
     def __getitem__(self, k: K) -> V:
-        return self.__cache[k].v
+        entry = self.__cache[k]
+        entry.age = self.__get_next_age()
+        return entry.v
 
     def __setitem__(self, k: K, v: V) -> None:
         # noinspection PyArgumentList
-        self.__cache[k] = LRUCacheEntry[V](v=v, age=self.__next_age)
+        self.__cache[k] = LRUCacheEntry[V](v=v, age=self.__get_next_age())
         self.__reduce_if_needed()
 
     def __delitem__(self, k: K) -> None:
@@ -6,3 +6,4 @@ class ResourceUsage(NamedTuple):
     disk_write_count: int
     cpu_percent: int
     memory: int
+    system_memory_percent: int
@@ -0,0 +1,72 @@
+from contextlib import contextmanager
+from dataclasses import dataclass
+from enum import Enum
+from typing import Callable, Iterable
+
+from PyQt5.QtCore import QMutex
+
+from domain.model.value import StudentID
+from util.app_logging import create_logger
+
+
+class StudentChangeKind(Enum):
+    STAGE_RESULT = "stage_result"
+    MARK = "mark"
+
+
+@dataclass(frozen=True, slots=True)
+class StudentChangeEvent:
+    student_id: StudentID
+    kind: StudentChangeKind
+
+
+StudentChangeEventSubscriber = Callable[[list[StudentChangeEvent]], None]
+
+
+# プロジェクト内ステートフル:
+#  - 購読者を保持するため
+class StudentChangeEventBus:
+    """
+    生徒の結果や採点が変更されたことをプロセス内の購読者に知らせるイベントバス
+    購読者はpublishしたスレッドでまとめて呼ばれるので，受け取ったイベントを自分のスレッドに渡して処理する
+    別のプロセスで書き込まれた変更はこのバスには流れない
+    """
+
+    _logger = create_logger()
+
+    def __init__(self):
+        self.__lock = QMutex()
+        self.__subscribers: list[StudentChangeEventSubscriber] = []
+
+    @contextmanager
+    def _lock(self):
+        self.__lock.lock()
+        try:
+            yield
+        finally:
+            self.__lock.unlock()
+
+    def subscribe(self, subscriber: StudentChangeEventSubscriber) -> None:
+        with self._lock():
+            self.__subscribers.append(subscriber)
+
+    def unsubscribe(self, subscriber: StudentChangeEventSubscriber) -> None:
+        with self._lock():
+            if subscriber in self.__subscribers:
+                self.__subscribers.remove(subscriber)
+
+    def publish(self, events: Iterable[StudentChangeEvent]) -> None:
+        events = list(events)
+        if not events:
+            return
+        with self._lock():
+            subscribers = list(self.__subscribers)
+        for subscriber in subscribers:
+            # 購読者の例外で書き込み側の処理を止めない
+            try:
+                subscriber(events)
+            except Exception:
+                self._logger.exception(f"Failed to deliver student change events to {subscriber!r}")
+
+    def publish_all(self, student_ids: Iterable[StudentID], kind: StudentChangeKind) -> None:
+        self.publish(StudentChangeEvent(student_id=student_id, kind=kind) for student_id in student_ids)
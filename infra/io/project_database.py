@@ -1,8 +1,14 @@
 import datetime
+import random
 import sqlite3
+import threading
+import time
+import weakref
 from contextlib import contextmanager
 from pathlib import Path
-from typing import Any, Generator
+from typing import Any, Generator, Callable, NamedTuple
+
+from PyQt5.QtCore import QMutex
 
 from infra.path_provider.current_project import DatabasePathProvider
 from util.app_logging import create_logger
@@ -23,9 +29,59 @@ def convert_datetime(val):
 sqlite3.register_converter("DATETIME", convert_datetime)
 
 
+def get_column_names(cursor: sqlite3.Cursor, table_name: str) -> set[str]:
+    # テーブルの列名を取得する（テーブルが存在しない場合は空）
+    # 古いスキーマから移行するかどうかを判定するために使う
+    cursor.execute(f"PRAGMA table_info({table_name})")
+    return {row["name"] for row in cursor.fetchall()}
+
+
+class _PooledConnection(sqlite3.Connection):
+    # WeakSetで追跡できるようにするためのサブクラス
+    pass
+
+
+class DatabaseLockWaitStats(NamedTuple):
+    n_transactions: int  # 書き込みのトランザクションの数
+    n_retries: int  # データベースがロックされていたためにBEGIN IMMEDIATEをやり直した回数
+    n_failures: int  # 待っても書き込みのロックが取れなかったトランザクションの数
+    total_wait_seconds: float  # 書き込みのロックを待った時間の合計
+    max_wait_seconds: float  # 書き込みのロックを待った時間の最大
+
+
+def _is_busy_error(e: sqlite3.OperationalError) -> bool:
+    # SQLITE_BUSYとSQLITE_LOCKEDはどちらも"database is locked"などのメッセージのOperationalErrorになる
+    message = str(e)
+    return "locked" in message or "busy" in message
+
+
+# プロジェクト内ステートフル:
+#  - スレッドごとの接続を保持するため
+#  - 作成済みのスキーマを記録するため
 class ProjectDatabaseIO:
+    # スレッドごとに1つの接続を開いたまま使い回す
+    # 接続はスレッドが終了すると破棄され，close_allですべて閉じる
+    # 書き込みはtransactionで行う（ワーカープロセスを含む他の接続と書き込みが重なっても失敗しない）
+
     _logger = create_logger()
 
+    # SQLiteが自身でロックの解放を待つ時間（これを過ぎたらtransactionが間隔を空けてやり直す）
+    _BUSY_TIMEOUT_SECONDS = 1.0
+    # BEGIN IMMEDIATEをやり直す間隔（指数的に伸ばす）と書き込みのロックを待つ時間の上限
+    _BUSY_RETRY_INITIAL_DELAY_SECONDS = 0.01
+    _BUSY_RETRY_MAX_DELAY_SECONDS = 1.0
+    _BUSY_RETRY_DEADLINE_SECONDS = 60.0
+    # 書き込みのロックをこれ以上待ったら警告を記録する
+    _SLOW_LOCK_WAIT_SECONDS = 1.0
+    # 書き込みのロックを待った時間の集計を記録する間隔
+    _LOCK_WAIT_STATS_LOG_INTERVAL_SECONDS = 60.0
+    # チェックポイントのあとにWALのファイルをこの大きさまで切り詰める
+    _JOURNAL_SIZE_LIMIT_BYTES = 64 * 1024 * 1024
+    # 書き込みのあとにWALのファイルがこの大きさを超えていたらチェックポイントで空にする
+    # （読み込みが絶えず続くと自動のチェックポイントはWALを先頭に戻せずWALが大きくなり続ける）
+    _WAL_CHECKPOINT_THRESHOLD_BYTES = 16 * 1024 * 1024
+    _WAL_SIZE_CHECK_INTERVAL_SECONDS = 5.0
+
     def __init__(
             self,
             *,
@@ -33,33 +89,204 @@ class ProjectDatabaseIO:
     ):
         self._database_path_provider = database_path_provider
 
+        self.__lock = QMutex()
+        self.__local = threading.local()
+        self.__connections: weakref.WeakSet[_PooledConnection] = weakref.WeakSet()
+        # close_allのたびに増やし，古い接続を使わないようにする
+        self.__generation = 0
+        self.__executed_schema_keys: set[str] = set()
+
+        self.__lock_wait_stats = DatabaseLockWaitStats(0, 0, 0, 0.0, 0.0)
+        self.__lock_wait_stats_logged_at = time.monotonic()
+        self.__wal_size_checked_at = time.monotonic()
+
+    @contextmanager
+    def _lock(self):
+        self.__lock.lock()
+        try:
+            yield
+        finally:
+            self.__lock.unlock()
+
     @property
     def _database_fullpath(self) -> Path:
         return self._database_path_provider.fullpath()
 
-    def _create_connection(self):
+    def _create_connection(self) -> _PooledConnection:
         con = sqlite3.connect(
             self._database_fullpath,
             detect_types=sqlite3.PARSE_DECLTYPES,
-            timeout=10,
+            timeout=self._BUSY_TIMEOUT_SECONDS,
+            factory=_PooledConnection,
+            # 接続は作成したスレッドでしか使わないが，close_allは別のスレッドから閉じる
+            check_same_thread=False,
         )
         con.row_factory = sqlite3.Row
         con.execute("PRAGMA foreign_keys=ON;")
+        # 読み込みが書き込みを待たないようにする
+        con.execute("PRAGMA journal_mode=WAL;")
+        # WALではNORMALでもデータベースは壊れない（電源断で直前のコミットが失われることはある）
+        con.execute("PRAGMA synchronous=NORMAL;")
+        # 大きなトランザクションのあとにWALのファイルが大きいまま残らないようにする
+        con.execute(f"PRAGMA journal_size_limit={self._JOURNAL_SIZE_LIMIT_BYTES};")
+        con.execute("PRAGMA cache_size=-16384;")  # 16MiB
+        con.execute("PRAGMA mmap_size=268435456;")  # 256MiB
+        return con
+
+    def __get_thread_connection(self) -> _PooledConnection:
+        with self._lock():
+            generation = self.__generation
+        con = getattr(self.__local, "connection", None)
+        if con is None or self.__local.generation != generation:
+            self._logger.debug("Connecting to database: " + str(self._database_fullpath))
+            self._database_fullpath.parent.mkdir(parents=True, exist_ok=True)
+            con = self._create_connection()
+            self._logger.debug(f"Connection to database established ({id(con)=})")
+            self.__local.connection = con
+            self.__local.generation = generation
+            self.__local.depth = 0
+            with self._lock():
+                self.__connections.add(con)
         return con
 
     @contextmanager
     def connect(self) -> Generator[sqlite3.Connection, Any, None]:
-        self._logger.debug("Connecting to database: " + str(self._database_fullpath))
-        self._database_fullpath.parent.mkdir(parents=True, exist_ok=True)
-
-        con = self._create_connection()
-        self._logger.debug(f"Connection to database established ({id(con)=})")
+        # 入れ子で呼ばれたときは同じ接続を返し，一番外側で後始末する
+        con = self.__get_thread_connection()
+        self.__local.depth += 1
         try:
             yield con
         except Exception as e:
-            con.rollback()
-            self._logger.debug(f"Connection rolled back due to exception ({id(con)=})\n{e}")
+            if self.__local.depth == 1:
+                con.rollback()
+                self._logger.debug(f"Connection rolled back due to exception ({id(con)=})\n{e}")
             raise
         finally:
+            self.__local.depth -= 1
+            if self.__local.depth == 0 and con.in_transaction:
+                # コミットされなかった変更は接続を閉じていたときと同じように破棄する
+                con.rollback()
+
+    @contextmanager
+    def transaction(self) -> Generator[sqlite3.Connection, Any, None]:
+        # 書き込みのトランザクションを開始して接続を返し，抜けるときにコミットする（例外のときはロールバックする）
+        # 最初に書き込みのロックを取るので，途中で他の接続の書き込みと衝突して失敗することがない
+        # ロックが取れなければ間隔を指数的に伸ばしながらやり直し，_BUSY_RETRY_DEADLINE_SECONDSを過ぎたら諦める
+        # すでにトランザクションの中で呼ばれたときはそのトランザクションに含める（コミットは外側で行う）
+        with self.connect() as con:
+            if con.in_transaction:
+                yield con
+                return
+            self.__begin_immediate(con)
+            yield con
+            con.commit()
+        self.__checkpoint_if_wal_too_large()
+
+    def __begin_immediate(self, con: sqlite3.Connection) -> None:
+        time_start = time.monotonic()
+        delay_seconds = self._BUSY_RETRY_INITIAL_DELAY_SECONDS
+        n_retries = 0
+        while True:
+            try:
+                con.execute("BEGIN IMMEDIATE")
+                break
+            except sqlite3.OperationalError as e:
+                wait_seconds = time.monotonic() - time_start
+                if not _is_busy_error(e) or wait_seconds >= self._BUSY_RETRY_DEADLINE_SECONDS:
+                    if _is_busy_error(e):
+                        self.__record_lock_wait(wait_seconds, n_retries, is_failed=True)
+                    raise
+            # 同時に待っている接続が同じ時刻にやり直さないように間隔をずらす
+            time.sleep(delay_seconds * random.uniform(0.5, 1.0))
+            delay_seconds = min(delay_seconds * 2, self._BUSY_RETRY_MAX_DELAY_SECONDS)
+            n_retries += 1
+        self.__record_lock_wait(time.monotonic() - time_start, n_retries, is_failed=False)
+
+    def __record_lock_wait(self, wait_seconds: float, n_retries: int, *, is_failed: bool) -> None:
+        if is_failed:
+            self._logger.error(
+                f"Failed to lock database for writing: waited {wait_seconds:.3f}s, {n_retries} retries"
+            )
+        elif wait_seconds >= self._SLOW_LOCK_WAIT_SECONDS:
+            self._logger.warning(
+                f"Waited {wait_seconds:.3f}s to lock database for writing ({n_retries} retries)"
+            )
+        with self._lock():
+            stats = self.__lock_wait_stats
+            self.__lock_wait_stats = stats = DatabaseLockWaitStats(
+                n_transactions=stats.n_transactions + 1,
+                n_retries=stats.n_retries + n_retries,
+                n_failures=stats.n_failures + int(is_failed),
+                total_wait_seconds=stats.total_wait_seconds + wait_seconds,
+                max_wait_seconds=max(stats.max_wait_seconds, wait_seconds),
+            )
+            now = time.monotonic()
+            is_log_required = now - self.__lock_wait_stats_logged_at >= self._LOCK_WAIT_STATS_LOG_INTERVAL_SECONDS
+            if is_log_required:
+                self.__lock_wait_stats_logged_at = now
+        if is_log_required:
+            self.__log_lock_wait_stats(stats)
+
+    def __log_lock_wait_stats(self, stats: DatabaseLockWaitStats) -> None:
+        if stats.n_transactions == 0:
+            return
+        self._logger.info(
+            f"Database lock wait: {stats.n_transactions} transactions, {stats.n_retries} retries, "
+            f"{stats.n_failures} failures, "
+            f"average {stats.total_wait_seconds / stats.n_transactions * 1000:.1f}ms, "
+            f"max {stats.max_wait_seconds * 1000:.1f}ms"
+        )
+
+    def get_lock_wait_stats(self) -> DatabaseLockWaitStats:
+        # このインスタンスで書き込みのロックを待った時間の集計
+        with self._lock():
+            return self.__lock_wait_stats
+
+    def checkpoint(self) -> None:
+        # WALの内容をデータベースに書き戻してWALのファイルを空にする
+        # 他の接続が読んでいる間は書き戻せるところまで書き戻す
+        with self.connect() as con:
+            row = con.execute("PRAGMA wal_checkpoint(TRUNCATE)").fetchone()
+        self._logger.info(f"WAL checkpoint: busy={row[0]}, log={row[1]}, checkpointed={row[2]}")
+
+    def __checkpoint_if_wal_too_large(self) -> None:
+        with self._lock():
+            now = time.monotonic()
+            if now - self.__wal_size_checked_at < self._WAL_SIZE_CHECK_INTERVAL_SECONDS:
+                return
+            self.__wal_size_checked_at = now
+        wal_fullpath = self._database_fullpath.with_name(self._database_fullpath.name + "-wal")
+        try:
+            wal_size = wal_fullpath.stat().st_size
+        except FileNotFoundError:
+            return
+        if wal_size > self._WAL_CHECKPOINT_THRESHOLD_BYTES:
+            self.checkpoint()
+
+    def execute_schema_once(self, sql: str) -> None:
+        # CREATE TABLE IF NOT EXISTSなどをこのインスタンスで最初に呼ばれたときだけ実行する
+        self.setup_schema_once(sql, lambda cur: cur.execute(sql))
+
+    def setup_schema_once(self, key: str, setup: Callable[[sqlite3.Cursor], Any]) -> None:
+        # 古いスキーマからの移行などを含むスキーマの準備を，keyごとにこのインスタンスで最初に呼ばれたときだけ行う
+        # 途中で失敗しても元に戻るように1つのトランザクションで行う
+        with self._lock():
+            if key in self.__executed_schema_keys:
+                return
+        with self.transaction() as con:
+            setup(con.cursor())
+        with self._lock():
+            self.__executed_schema_keys.add(key)
+
+    def close_all(self) -> None:
+        # すべてのスレッドの接続を閉じる（プロジェクトを閉じるときに呼ぶ）
+        # 最後の接続が閉じるときにSQLiteがWALを書き戻してWALのファイルを消す
+        self.__log_lock_wait_stats(self.get_lock_wait_stats())
+        with self._lock():
+            self.__generation += 1
+            connections = list(self.__connections)
+            self.__connections.clear()
+            self.__executed_schema_keys.clear()
+        for con in connections:
             con.close()
-            self._logger.debug(f"Connection closed ({id(con)=})")
+        self._logger.debug(f"{len(connections)} connections closed")
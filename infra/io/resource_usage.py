@@ -16,4 +16,5 @@ class ResourceUsageIO:
             disk_write_count=io_count.write_count,
             cpu_percent=int(psutil.cpu_percent()),
             memory=int(process.memory_info().rss),
+            system_memory_percent=int(psutil.virtual_memory().percent),
         )
@@ -0,0 +1,142 @@
+import hashlib
+import zlib
+from typing import Iterable
+
+try:
+    # zstdは任意の依存（入っていなければzlibで圧縮する）
+    import zstandard
+except ImportError:
+    zstandard = None
+
+CODEC_RAW = "raw"
+CODEC_ZLIB = "zlib"
+CODEC_ZSTD = "zstd"
+
+
+def get_available_codecs() -> list[str]:
+    codecs = [CODEC_RAW, CODEC_ZLIB]
+    if zstandard is not None:
+        codecs.append(CODEC_ZSTD)
+    return codecs
+
+
+def get_default_codec() -> str:
+    return CODEC_ZSTD if zstandard is not None else CODEC_ZLIB
+
+
+class ContentBlobHelper:
+    """
+    内容のハッシュをキーにしてバイト列を1つだけ保存するヘルパー
+    同じ内容を参照する行がいくつあっても1回だけ保存し，参照数が0になったら削除する
+    compress_threshold以上の大きさの内容だけを圧縮し，どの方式で圧縮したかを行ごとにcodecとして保存する
+    参照する側は自分のトランザクションのカーソルを渡して使う
+    """
+
+    # 1回のクエリで扱うハッシュの数（SQLiteのパラメータ数の上限を超えないようにする）
+    _CHUNK_SIZE = 500
+
+    def __init__(self, *, compress_threshold: int, codec: str | None = None):
+        codec = codec or get_default_codec()
+        if codec not in get_available_codecs():
+            raise ValueError(f"Unavailable codec: {codec}")
+        self._compress_threshold = compress_threshold
+        self._codec = codec
+
+    def create_table_if_not_exists(self, cursor) -> None:
+        cursor.execute(
+            """
+            CREATE TABLE IF NOT EXISTS content_blob
+            (
+                blob_hash TEXT PRIMARY KEY,
+                codec     TEXT    NOT NULL,
+                size      INTEGER NOT NULL,
+                ref_count INTEGER NOT NULL,
+                content   BLOB    NOT NULL
+            )
+            """
+        )
+
+    @staticmethod
+    def compute_hash(content: bytes) -> str:
+        return hashlib.sha256(content).hexdigest()
+
+    def acquire(self, cursor, content: bytes) -> str:
+        """内容を保存して参照数を1つ増やし，参照に使うハッシュを返す"""
+        blob_hash = self.compute_hash(content)
+        cursor.execute(
+            "UPDATE content_blob SET ref_count = ref_count + 1 WHERE blob_hash = ?",
+            (blob_hash,)
+        )
+        if cursor.rowcount == 0:
+            # まだ保存されていない内容だけを圧縮する
+            codec, encoded = self._encode(content)
+            cursor.execute(
+                "INSERT INTO content_blob(blob_hash, codec, size, ref_count, content)"
+                "VALUES (?, ?, ?, 1, ?)",
+                (blob_hash, codec, len(content), encoded)
+            )
+        return blob_hash
+
+    def release(self, cursor, blob_hashes: Iterable[str]) -> None:
+        """参照数を1つずつ減らし，どこからも参照されなくなった内容を削除する（同じハッシュは出現した数だけ減らす）"""
+        params = [(blob_hash,) for blob_hash in blob_hashes]
+        if not params:
+            return
+        cursor.executemany(
+            "UPDATE content_blob SET ref_count = ref_count - 1 WHERE blob_hash = ?",
+            params
+        )
+        cursor.executemany(
+            "DELETE FROM content_blob WHERE blob_hash = ? AND ref_count <= 0",
+            params
+        )
+
+    def get(self, cursor, blob_hash: str) -> bytes:
+        cursor.execute(
+            "SELECT codec, content FROM content_blob WHERE blob_hash = ?",
+            (blob_hash,)
+        )
+        row = cursor.fetchone()
+        assert row is not None, blob_hash
+        return self._decode(row["codec"], row["content"])
+
+    def get_all(self, cursor, blob_hashes: Iterable[str]) -> dict[str, bytes]:
+        """複数の内容をまとめて取得する"""
+        blob_hashes = list(set(blob_hashes))
+        contents = {}
+        for i in range(0, len(blob_hashes), self._CHUNK_SIZE):
+            chunk = blob_hashes[i:i + self._CHUNK_SIZE]
+            placeholders = ", ".join("?" * len(chunk))
+            cursor.execute(
+                f"SELECT blob_hash, codec, content FROM content_blob "
+                f"WHERE blob_hash IN ({placeholders})",
+                chunk
+            )
+            for row in cursor.fetchall():
+                contents[row["blob_hash"]] = self._decode(row["codec"], row["content"])
+        assert len(contents) == len(blob_hashes), set(blob_hashes) - set(contents)
+        return contents
+
+    def _encode(self, content: bytes) -> tuple[str, bytes]:
+        if self._codec == CODEC_RAW or len(content) < self._compress_threshold:
+            return CODEC_RAW, content
+        if self._codec == CODEC_ZSTD:
+            encoded = zstandard.ZstdCompressor().compress(content)
+        else:
+            encoded = zlib.compress(content)
+        # 圧縮しても小さくならない内容（圧縮済みのデータなど）はそのまま保存する
+        if len(encoded) >= len(content):
+            return CODEC_RAW, content
+        return self._codec, encoded
+
+    @staticmethod
+    def _decode(codec: str, content: bytes) -> bytes:
+        if codec == CODEC_RAW:
+            return content
+        if codec == CODEC_ZLIB:
+            return zlib.decompress(content)
+        if codec == CODEC_ZSTD:
+            if zstandard is None:
+                raise ValueError("The content is compressed with zstd but zstandard is not installed")
+            return zstandard.ZstdDecompressor().decompress(content)
+        raise ValueError(f"Unknown codec: {codec}")
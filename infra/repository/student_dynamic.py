@@ -1,65 +1,94 @@
 from domain.model.file_item import SourceFileItem, ExecutableFileItem
 from domain.model.value import StudentID
-from infra.io.project_database import ProjectDatabaseIO
+from infra.io.project_database import ProjectDatabaseIO, get_column_names
+from infra.repository.content_blob import ContentBlobHelper
 
 
 class StudentExecutableRepository:
+    # 実行ファイルの中身はcontent_blobに保存し，同じ内容の実行ファイルは1つだけ保存する
+
+    # 実行ファイルはどれも大きくよく縮むので常に圧縮する
+    _COMPRESS_THRESHOLD = 0
+
     def __init__(
             self,
             *,
             project_database_io: ProjectDatabaseIO,
     ):
         self._project_database_io = project_database_io
+        self._content_blob_helper = ContentBlobHelper(compress_threshold=self._COMPRESS_THRESHOLD)
 
     def _create_database_if_not_exists(self):
-        with self._project_database_io.connect() as con:
-            cur = con.cursor()
-            cur.execute(
-                """
-                CREATE TABLE IF NOT EXISTS student_executable
-                (
-                    student_id    TEXT NOT NULL PRIMARY KEY,
-                    content_bytes BLOB NOT NULL,
-                    FOREIGN KEY (student_id) REFERENCES student (student_id)
-                )
-                """
+        self._project_database_io.setup_schema_once("student_executable", self.__setup_schema)
+
+    def __setup_schema(self, cur) -> None:
+        self._content_blob_helper.create_table_if_not_exists(cur)
+        # 中身をそのまま持っていた古いテーブルは退避して中身をcontent_blobに移す
+        is_migration_required = "content_bytes" in get_column_names(cur, "student_executable")
+        if is_migration_required:
+            cur.execute("ALTER TABLE student_executable RENAME TO student_executable_bytes")
+        cur.execute(
+            """
+            CREATE TABLE IF NOT EXISTS student_executable
+            (
+                student_id TEXT NOT NULL PRIMARY KEY,
+                blob_hash  TEXT NOT NULL,
+                FOREIGN KEY (student_id) REFERENCES student (student_id)
             )
-            con.commit()
+            """
+        )
+        if is_migration_required:
+            read_cur = cur.connection.cursor()
+            read_cur.execute("SELECT student_id, content_bytes FROM student_executable_bytes")
+            for row in read_cur:
+                cur.execute(
+                    "INSERT INTO student_executable(student_id, blob_hash) VALUES (?, ?)",
+                    (row["student_id"],
+                     self._content_blob_helper.acquire(cur, row["content_bytes"])),
+                )
+            cur.execute("DROP TABLE student_executable_bytes")
+
+    def __get_blob_hash(self, cur, student_id: StudentID) -> str | None:
+        cur.execute(
+            """
+            SELECT blob_hash
+            FROM student_executable
+            WHERE student_id = ?
+            """,
+            (str(student_id),),
+        )
+        row = cur.fetchone()
+        return None if row is None else row["blob_hash"]
 
     def put(self, student_id: StudentID, file_item: ExecutableFileItem) -> None:
         self._create_database_if_not_exists()
-        with self._project_database_io.connect() as con:
+        with self._project_database_io.transaction() as con:
             cur = con.cursor()
+            old_blob_hash = self.__get_blob_hash(cur, student_id)
             cur.execute(
                 """
                 INSERT OR REPLACE INTO student_executable
                 (
                     student_id,
-                    content_bytes
+                    blob_hash
                 )
                 VALUES (?, ?)
                 """,
-                (str(student_id), file_item.content_bytes),
+                (str(student_id), self._content_blob_helper.acquire(cur, file_item.content_bytes)),
             )
-            con.commit()
+            if old_blob_hash is not None:
+                self._content_blob_helper.release(cur, [old_blob_hash])
 
     def get(self, student_id: StudentID) -> ExecutableFileItem:
         self._create_database_if_not_exists()
         with self._project_database_io.connect() as con:
             cur = con.cursor()
-            cur.execute(
-                """
-                SELECT content_bytes
-                FROM student_executable
-                WHERE student_id = ?
-                """,
-                (str(student_id),),
-            )
-            row = cur.fetchone()
-        if row is None:
-            raise FileNotFoundError()
+            blob_hash = self.__get_blob_hash(cur, student_id)
+            if blob_hash is None:
+                raise FileNotFoundError()
+            content_bytes = self._content_blob_helper.get(cur, blob_hash)
         return ExecutableFileItem(
-            content_bytes=row["content_bytes"],
+            content_bytes=content_bytes,
         )
 
     def exists(self, student_id: StudentID) -> bool:
@@ -78,8 +107,11 @@ class StudentExecutableRepository:
 
     def delete(self, student_id: StudentID) -> None:
         self._create_database_if_not_exists()
-        with self._project_database_io.connect() as con:
+        with self._project_database_io.transaction() as con:
             cur = con.cursor()
+            blob_hash = self.__get_blob_hash(cur, student_id)
+            if blob_hash is None:
+                raise FileNotFoundError()
             cur.execute(
                 """
                 DELETE
@@ -88,70 +120,100 @@ class StudentExecutableRepository:
                 """,
                 (str(student_id),),
             )
-            if cur.rowcount == 0:
-                raise FileNotFoundError()
-            con.commit()
+            self._content_blob_helper.release(cur, [blob_hash])
 
 
 class StudentSourceRepository:
+    # ソースコードの中身はcontent_blobに保存し，同じ内容のソースコードは1つだけ保存する
+
+    # この大きさ以上のソースコードを圧縮する（ほとんどの提出物は数KB以下なのでそのまま保存する）
+    _COMPRESS_THRESHOLD = 4096
+
     def __init__(
             self,
             *,
             project_database_io: ProjectDatabaseIO,
     ):
         self._project_database_io = project_database_io
+        self._content_blob_helper = ContentBlobHelper(compress_threshold=self._COMPRESS_THRESHOLD)
 
     def _create_database_if_not_exists(self):
-        with self._project_database_io.connect() as con:
-            cur = con.cursor()
-            cur.execute(
-                """
-                CREATE TABLE IF NOT EXISTS student_source
-                (
-                    student_id    TEXT PRIMARY KEY,
-                    content_bytes BLOB,
-                    encoding TEXT,
-                    FOREIGN KEY (student_id) REFERENCES student (student_id)
-                )
-                """
+        self._project_database_io.setup_schema_once("student_source", self.__setup_schema)
+
+    def __setup_schema(self, cur) -> None:
+        self._content_blob_helper.create_table_if_not_exists(cur)
+        # 中身をそのまま持っていた古いテーブルは退避して中身をcontent_blobに移す
+        is_migration_required = "content_bytes" in get_column_names(cur, "student_source")
+        if is_migration_required:
+            cur.execute("ALTER TABLE student_source RENAME TO student_source_bytes")
+        cur.execute(
+            """
+            CREATE TABLE IF NOT EXISTS student_source
+            (
+                student_id TEXT PRIMARY KEY,
+                blob_hash  TEXT,
+                encoding   TEXT,
+                FOREIGN KEY (student_id) REFERENCES student (student_id)
             )
-            con.commit()
+            """
+        )
+        if is_migration_required:
+            read_cur = cur.connection.cursor()
+            read_cur.execute("SELECT student_id, content_bytes, encoding FROM student_source_bytes")
+            for row in read_cur:
+                blob_hash = None
+                if row["content_bytes"] is not None:
+                    blob_hash = self._content_blob_helper.acquire(cur, row["content_bytes"])
+                cur.execute(
+                    "INSERT INTO student_source(student_id, blob_hash, encoding) VALUES (?, ?, ?)",
+                    (row["student_id"], blob_hash, row["encoding"]),
+                )
+            cur.execute("DROP TABLE student_source_bytes")
+
+    def __get_row(self, cur, student_id: StudentID):
+        cur.execute(
+            """
+            SELECT blob_hash, encoding
+            FROM student_source
+            WHERE student_id = ?
+            """,
+            (str(student_id),),
+        )
+        return cur.fetchone()
 
     def put(self, student_id: StudentID, file_item: SourceFileItem) -> None:
         self._create_database_if_not_exists()
-        with self._project_database_io.connect() as con:
+        with self._project_database_io.transaction() as con:
             cur = con.cursor()
+            old_row = self.__get_row(cur, student_id)
             cur.execute(
                 """
                 INSERT OR REPLACE INTO student_source
                 (
                     student_id,
-                    content_bytes,
+                    blob_hash,
                     encoding
                 )
                 VALUES (?, ?, ?)
                 """,
-                (str(student_id), file_item.content_bytes, file_item.encoding),
+                (str(student_id), self._content_blob_helper.acquire(cur, file_item.content_bytes),
+                 file_item.encoding),
             )
-            con.commit()
+            if old_row is not None and old_row["blob_hash"] is not None:
+                self._content_blob_helper.release(cur, [old_row["blob_hash"]])
 
     def get(self, student_id: StudentID) -> SourceFileItem:
         self._create_database_if_not_exists()
         with self._project_database_io.connect() as con:
             cur = con.cursor()
-            cur.execute(
-                """
-                SELECT content_bytes, encoding
-                FROM student_source
-                WHERE student_id = ?
-                """,
-                (str(student_id),),
-            )
-            row = cur.fetchone()
-        if row is None:
-            raise FileNotFoundError()
+            row = self.__get_row(cur, student_id)
+            if row is None:
+                raise FileNotFoundError()
+            content_bytes = None
+            if row["blob_hash"] is not None:
+                content_bytes = self._content_blob_helper.get(cur, row["blob_hash"])
         return SourceFileItem(
-            content_bytes=row["content_bytes"],
+            content_bytes=content_bytes,
             encoding=row["encoding"],
         )
 
@@ -171,8 +233,11 @@ class StudentSourceRepository:
 
     def delete(self, student_id: StudentID) -> None:
         self._create_database_if_not_exists()
-        with self._project_database_io.connect() as con:
+        with self._project_database_io.transaction() as con:
             cur = con.cursor()
+            row = self.__get_row(cur, student_id)
+            if row is None:
+                raise FileNotFoundError()
             cur.execute(
                 """
                 DELETE
@@ -181,9 +246,8 @@ class StudentSourceRepository:
                 """,
                 (str(student_id),),
             )
-            if cur.rowcount == 0:
-                raise FileNotFoundError()
-            con.commit()
+            if row["blob_hash"] is not None:
+                self._content_blob_helper.release(cur, [row["blob_hash"]])
 
 # class StudentSourceRepository:
 #     def __init__(
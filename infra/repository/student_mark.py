@@ -6,16 +6,22 @@ from PyQt5.QtCore import QMutex
 from domain.error import RepositoryItemNotFoundError
 from domain.model.student_mark import StudentMark
 from domain.model.value import StudentID
+from infra.event.student_change import StudentChangeEventBus, StudentChangeKind
 from infra.io.project_database import ProjectDatabaseIO
 
 
 class StudentMarkRepository:
+    # 1回のクエリで取得する生徒の数（SQLiteのパラメータ数の上限を超えないようにする）
+    _GET_ALL_CHUNK_SIZE = 500
+
     def __init__(
             self,
             *,
             project_database_io: ProjectDatabaseIO,
+            student_change_event_bus: StudentChangeEventBus,
     ):
         self._project_database_io = project_database_io
+        self._student_change_event_bus = student_change_event_bus
         self._lock = QMutex()
 
     @contextmanager
@@ -27,20 +33,17 @@ class StudentMarkRepository:
             self._lock.unlock()
 
     def _create_database_if_not_exists(self):
-        with self._project_database_io.connect() as con:
-            cur = con.cursor()
-            cur.execute(
-                """
-                CREATE TABLE IF NOT EXISTS student_mark
-                (
-                    student_id TEXT NOT NULL PRIMARY KEY,
-                    score      INTEGER,
-                    updated_at DATETIME,
-                    FOREIGN KEY (student_id) REFERENCES student (student_id)
-                )
-                """
+        self._project_database_io.execute_schema_once(
+            """
+            CREATE TABLE IF NOT EXISTS student_mark
+            (
+                student_id TEXT NOT NULL PRIMARY KEY,
+                score      INTEGER,
+                updated_at DATETIME,
+                FOREIGN KEY (student_id) REFERENCES student (student_id)
             )
-            con.commit()
+            """
+        )
 
     def create(self, student_id: StudentID) -> StudentMark:
         mark = StudentMark(
@@ -53,7 +56,7 @@ class StudentMarkRepository:
     def put(self, mark: StudentMark) -> StudentMark:
         with self.__lock():
             self._create_database_if_not_exists()
-            with self._project_database_io.connect() as con:
+            with self._project_database_io.transaction() as con:
                 cur = con.cursor()
                 cur.execute(
                     """
@@ -67,7 +70,8 @@ class StudentMarkRepository:
                     """,
                     (str(mark.student_id), mark.score if mark.is_marked else None, datetime.now()),
                 )
-                con.commit()
+        # 書き込みを確定してから知らせる
+        self._student_change_event_bus.publish_all([mark.student_id], StudentChangeKind.MARK)
         return mark
 
     def exists(self, student_id: StudentID) -> bool:
@@ -106,6 +110,32 @@ class StudentMarkRepository:
                 score=row["score"],
             )
 
+    def get_all(self, student_ids: list[StudentID]) -> dict[StudentID, StudentMark]:
+        # 複数の生徒の採点データをまとめて取得する（採点データがない生徒は含まない）
+        with self.__lock():
+            self._create_database_if_not_exists()
+            marks = {}
+            with self._project_database_io.connect() as con:
+                cur = con.cursor()
+                for i in range(0, len(student_ids), self._GET_ALL_CHUNK_SIZE):
+                    chunk = student_ids[i:i + self._GET_ALL_CHUNK_SIZE]
+                    placeholders = ", ".join("?" * len(chunk))
+                    cur.execute(
+                        f"""
+                        SELECT student_id, score
+                        FROM student_mark
+                        WHERE student_id IN ({placeholders})
+                        """,
+                        [str(student_id) for student_id in chunk],
+                    )
+                    for row in cur:
+                        student_id = StudentID(row["student_id"])
+                        marks[student_id] = StudentMark(
+                            student_id=student_id,
+                            score=row["score"],
+                        )
+            return marks
+
     def get_timestamp(self, student_id: StudentID) -> datetime | None:
         with self.__lock():
             self._create_database_if_not_exists()
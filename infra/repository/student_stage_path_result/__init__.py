@@ -1,14 +1,21 @@
+import time
 from collections import OrderedDict
-from contextlib import contextmanager
+from contextlib import contextmanager, ExitStack
 from datetime import datetime
+from typing import Callable
+
+from PyQt5.QtCore import QMutex
 
 from domain.model.stage_path import StagePath
 from domain.model.stage import AbstractStage, BuildStage, CompileStage, ExecuteStage, TestStage
-from domain.model.student_stage_path_result import StudentStagePathResult
+from domain.model.student_stage_path_result import StudentStagePathResult, \
+    StudentStagePathResultSummary
 from domain.model.student_stage_result import (
     AbstractStudentStageResult,
+    StudentStageResultSummary,
 )
 from domain.model.value import StudentID
+from infra.event.student_change import StudentChangeEventBus, StudentChangeKind
 from infra.io.project_database import ProjectDatabaseIO
 from infra.lock.student import StudentLockServer
 from util.app_logging import create_logger
@@ -24,23 +31,49 @@ from ._test_result_helper import _TestResultHelper
 #  - 各Helperが_create_table_if_not_existsをインスタンス生成時に実行するため
 #  - student_lock_serverを保持するため
 #  - timestamp_repo_helperがキャッシュを持つため
+#  - 書き込みを待っている結果を保持するため
 class StudentStagePathResultRepository:
     """
     StudentStagePathResultを集約単位として管理するリポジトリ
     既存の4つのテーブルを使用して、集約の一貫性を保証する
+
+    putした結果はすぐには書き込まず，生徒・ステージごとに最後の結果だけを保持してflushでまとめて1つのトランザクションで書き込む
+    書き込みを待っている結果はget系のメソッドで読んだ結果に反映されるので，このインスタンスからは常に最新の結果が見える
+    別のプロセスや別のインスタンスから結果を見せるにはflushを呼ぶ
+    putとdelete_allで結果が変わった生徒をイベントバスで知らせる（このインスタンスから見える結果が変わったときに知らせる）
     """
 
+    # 1回のクエリで取得する生徒の数（SQLiteのパラメータ数の上限を超えないようにする）
+    _GET_ALL_CHUNK_SIZE = 500
+
+    # 書き込みを待っている生徒がこの人数に達するか，最初の書き込みからこの時間が経ったらputの中でflushする
+    _WRITE_BEHIND_MAX_STUDENTS = 20
+    _WRITE_BEHIND_MAX_DELAY_SECONDS = 2.0
+
     def __init__(
             self,
             *,
             project_database_io: ProjectDatabaseIO,
+            student_change_event_bus: StudentChangeEventBus,
     ):
         self._project_database_io = project_database_io
+        self._student_change_event_bus = student_change_event_bus
 
         self._logger = create_logger()
 
         self._student_lock_server = StudentLockServer()
 
+        self.__pending_lock = QMutex()
+        # 書き込みを待っている結果（Noneは削除）と更新日時
+        self.__pending_results: dict[StudentID, dict[AbstractStage, AbstractStudentStageResult | None]] = {}
+        self.__pending_timestamps: dict[StudentID, datetime] = {}
+        # 生徒の結果がputされるたびに増やし，flushの間にputされた結果を書き込み済みとして消さないようにする
+        self.__pending_versions: dict[StudentID, int] = {}
+        # 最も古い書き込み待ちの結果がputされた時刻（time.monotonic）
+        self.__pending_since: float | None = None
+        # flushとdelete_allを同時に行わない（書き込み済みの結果が後から書き戻されないようにする）
+        self.__flush_lock = QMutex()
+
         # 各ステージタイプに対応するヘルパーを初期化
         self._helpers = {
             BuildStage: _BuildResultHelper(),
@@ -58,15 +91,14 @@ class StudentStagePathResultRepository:
 
     def _create_tables_if_not_exists(self):
         """既存の4つのテーブルが存在することを確認"""
-        with self._project_database_io.connect() as con:
+        # 古いスキーマからの移行が途中で失敗しても元に戻るように1つのトランザクションで行う
+        with self._project_database_io.transaction() as con:
             cur = con.cursor()
 
             # 各ヘルパーにテーブル作成を委譲
             for helper in self._helpers.values():
                 helper.create_table_if_not_exists(cur)
 
-            con.commit()
-
     def _find_helper(self, stage: AbstractStage) -> _AbstractStageResultHelper:
         """ステージに対応するヘルパーを取得"""
         for stage_type, helper in self._helpers.items():
@@ -83,6 +115,33 @@ class StudentStagePathResultRepository:
         finally:
             self._student_lock_server[student_id].unlock()
 
+    @contextmanager
+    def _lock_pending(self):
+        self.__pending_lock.lock()
+        try:
+            yield
+        finally:
+            self.__pending_lock.unlock()
+
+    @contextmanager
+    def _lock_flush(self):
+        self.__flush_lock.lock()
+        try:
+            yield
+        finally:
+            self.__flush_lock.unlock()
+
+    def __get_pending_results(self, student_ids: list[StudentID]) \
+            -> dict[StudentID, dict[AbstractStage, AbstractStudentStageResult | None]]:
+        # データベースを読む前に書き込み待ちの結果の写しを取る
+        # （読んでいる間にflushされても写しの結果で上書きするので古い結果が見えない）
+        with self._lock_pending():
+            return {
+                student_id: dict(self.__pending_results[student_id])
+                for student_id in student_ids
+                if student_id in self.__pending_results
+            }
+
     def get(self, student_id: StudentID, stage_path: StagePath) -> StudentStagePathResult:
         """
         指定されたステージパスの結果を集約単位で取得
@@ -90,12 +149,17 @@ class StudentStagePathResultRepository:
         """
         with self.__lock(student_id):
             self._logger.debug(f"get: {student_id}, {stage_path}")
+            pending = self.__get_pending_results([student_id]).get(student_id, {})
             with self._project_database_io.connect() as con:
                 cur = con.cursor()
                 stage_results: OrderedDict[AbstractStage, AbstractStudentStageResult | None] \
                     = OrderedDict()
 
                 for stage in stage_path:
+                    if stage in pending:
+                        # 書き込み待ちの結果はデータベースから読まない
+                        stage_results[stage] = pending[stage]
+                        continue
                     helper = self._find_helper(stage)
                     stage_result = helper.get_stage_result(cur, student_id, stage)
                     stage_results[stage] = stage_result
@@ -105,27 +169,179 @@ class StudentStagePathResultRepository:
                     stage_results=stage_results,
                 )
 
+    def get_all(self, student_ids: list[StudentID], stage_paths: list[StagePath]) \
+            -> dict[StudentID, dict[StagePath, StudentStagePathResult]]:
+        """
+        複数の生徒の複数のステージパスの結果をまとめて取得
+        テーブルごとに1回のクエリで取得し，集約はメモリ上で組み立てる
+        """
+        self._logger.debug(f"get_all: {len(student_ids)} students, {len(stage_paths)} stage paths")
+        pending_results = self.__get_pending_results(student_ids)
+        stage_results: dict[tuple[StudentID, AbstractStage], AbstractStudentStageResult | None] \
+            = self.__fetch_all(
+                student_ids,
+                lambda helper, cur, chunk: helper.get_stage_results(cur, chunk),
+            )
+        for student_id, pending in pending_results.items():
+            for stage, stage_result in pending.items():
+                stage_results[student_id, stage] = stage_result
+
+        return {
+            student_id: {
+                stage_path: StudentStagePathResult(
+                    student_id=student_id,
+                    stage_results=OrderedDict(
+                        (stage, stage_results.get((student_id, stage)))
+                        for stage in stage_path
+                    ),
+                )
+                for stage_path in stage_paths
+            }
+            for student_id in student_ids
+        }
+
+    def get_all_summaries(self, student_ids: list[StudentID], stage_paths: list[StagePath]) \
+            -> dict[StudentID, dict[StagePath, StudentStagePathResultSummary]]:
+        """
+        複数の生徒の複数のステージパスの結果の要約をまとめて取得
+        出力ファイルやテスト結果のトークンのテーブルは読まない
+        """
+        self._logger.debug(
+            f"get_all_summaries: {len(student_ids)} students, {len(stage_paths)} stage paths"
+        )
+        pending_results = self.__get_pending_results(student_ids)
+        stage_summaries: dict[tuple[StudentID, AbstractStage], StudentStageResultSummary | None] \
+            = self.__fetch_all(
+                student_ids,
+                lambda helper, cur, chunk: helper.get_stage_result_summaries(cur, chunk),
+            )
+        for student_id, pending in pending_results.items():
+            for stage, stage_result in pending.items():
+                stage_summaries[student_id, stage] = (
+                    None if stage_result is None else StudentStageResultSummary.from_result(stage_result)
+                )
+
+        return {
+            student_id: {
+                stage_path: StudentStagePathResultSummary(
+                    student_id=student_id,
+                    stage_summaries=OrderedDict(
+                        (stage, stage_summaries.get((student_id, stage)))
+                        for stage in stage_path
+                    ),
+                )
+                for stage_path in stage_paths
+            }
+            for student_id in student_ids
+        }
+
+    def __fetch_all(
+            self,
+            student_ids: list[StudentID],
+            fetch: Callable[[_AbstractStageResultHelper, object, list[StudentID]], dict],
+    ) -> dict:
+        """生徒をチャンクに分けて各ヘルパーのfetch(helper, cursor, chunk)の結果を集める"""
+        fetched = {}
+        with self._project_database_io.connect() as con:
+            cur = con.cursor()
+            # すべてのテーブルを同じ時点の内容で読むために1つのトランザクションで読む
+            # すでにトランザクションの中で呼ばれたときはそのトランザクションで読む（コミットは外側で行う）
+            is_read_transaction = not con.in_transaction
+            if is_read_transaction:
+                cur.execute("BEGIN")
+            for i in range(0, len(student_ids), self._GET_ALL_CHUNK_SIZE):
+                chunk = student_ids[i:i + self._GET_ALL_CHUNK_SIZE]
+                for helper in self._helpers.values():
+                    fetched.update(fetch(helper, cur, chunk))
+            if is_read_transaction:
+                con.commit()
+        return fetched
+
     def put(self, stage_path_result: StudentStagePathResult) -> None:
         """
         ステージパスの結果を集約単位で保存
-        既存の4つのテーブルに統合的に保存
+        書き込みを待つ結果として保持し，たまったらflushする
         """
-        with self.__lock(stage_path_result.student_id):
-            self._logger.debug(
-                f"put: {stage_path_result.student_id}, {stage_path_result.stage_path}"
-            )
-            with self._project_database_io.connect() as con:
-                cur = con.cursor()
+        student_id = stage_path_result.student_id
+        with self.__lock(student_id):
+            self._logger.debug(f"put: {student_id}, {stage_path_result.stage_path}")
+            with self._lock_pending():
+                pending = self.__pending_results.setdefault(student_id, {})
                 for stage, stage_result in stage_path_result.iter_stage_results():
-                    helper = self._find_helper(stage)
-                    if stage_result is None:
-                        helper.delete_stage_result(cur, stage_path_result.student_id, stage)
-                    else:
-                        helper.put_stage_result(cur, stage_result)
+                    pending[stage] = stage_result
+                self.__pending_timestamps[student_id] = datetime.now()
+                self.__pending_versions[student_id] = self.__pending_versions.get(student_id, 0) + 1
+                if self.__pending_since is None:
+                    self.__pending_since = time.monotonic()
+                is_flush_required = (
+                        len(self.__pending_results) >= self._WRITE_BEHIND_MAX_STUDENTS
+                        or time.monotonic() - self.__pending_since >= self._WRITE_BEHIND_MAX_DELAY_SECONDS
+                )
+        self._student_change_event_bus.publish_all([student_id], StudentChangeKind.STAGE_RESULT)
+        if is_flush_required:
+            self.flush()
 
-                # Update timestamp using the same cursor
-                self._result_timestamp_helper.update(stage_path_result.student_id, cur)
-                con.commit()
+    def flush(self) -> None:
+        """
+        書き込みを待っている結果を1つのトランザクションで既存の4つのテーブルに書き込む
+        """
+        with self._lock_flush():
+            with self._lock_pending():
+                if not self.__pending_results:
+                    return
+                pending_results = {
+                    student_id: dict(pending)
+                    for student_id, pending in self.__pending_results.items()
+                }
+                pending_timestamps = dict(self.__pending_timestamps)
+                pending_versions = dict(self.__pending_versions)
+            self._logger.debug(f"flush: {len(pending_results)} students")
+            with self._project_database_io.transaction() as con:
+                cur = con.cursor()
+                for student_id, pending in pending_results.items():
+                    for stage, stage_result in pending.items():
+                        helper = self._find_helper(stage)
+                        if stage_result is None:
+                            helper.delete_stage_result(cur, student_id, stage)
+                        else:
+                            helper.put_stage_result(cur, stage_result)
+                self._result_timestamp_helper.put_all(pending_timestamps, cur)
+            with self._lock_pending():
+                # 書き込んでいる間に新たにputされた生徒の結果は次のflushまで残す
+                for student_id, version in pending_versions.items():
+                    if self.__pending_versions[student_id] == version:
+                        del self.__pending_results[student_id]
+                        del self.__pending_timestamps[student_id]
+                        del self.__pending_versions[student_id]
+                self.__pending_since = time.monotonic() if self.__pending_results else None
+
+    def delete_all(self, student_ids: list[StudentID]) -> None:
+        """
+        複数の生徒のすべてのステージ結果を削除
+        テーブルごとに1回のDELETEで削除し，すべてのテーブルの削除を1つのトランザクションで確定する
+        """
+        if not student_ids:
+            return
+        with ExitStack() as stack:
+            # 他のスレッドと同じ順番でロックを取らないとデッドロックするので学籍番号の順に取る
+            for student_id in sorted(set(student_ids)):
+                stack.enter_context(self.__lock(student_id))
+            self._logger.debug(f"delete_all: {len(student_ids)} students")
+            with self._lock_flush():
+                with self._project_database_io.transaction() as con:
+                    cur = con.cursor()
+                    for helper in self._helpers.values():
+                        helper.delete_all_stage_results(cur, student_ids)
+                    self._result_timestamp_helper.update_all(student_ids, cur)
+                # 書き込みを待っている結果は削除を確定してから捨てる（削除に失敗したら次のflushで書き込む）
+                with self._lock_pending():
+                    for student_id in student_ids:
+                        self.__pending_results.pop(student_id, None)
+                        self.__pending_timestamps.pop(student_id, None)
+                        self.__pending_versions.pop(student_id, None)
+                    if not self.__pending_results:
+                        self.__pending_since = None
+        self._student_change_event_bus.publish_all(student_ids, StudentChangeKind.STAGE_RESULT)
 
     def get_timestamp(self, student_id: StudentID) -> datetime | None:
         """
@@ -133,6 +349,9 @@ class StudentStagePathResultRepository:
         記録がない場合は None を返します。
         """
         with self.__lock(student_id):
+            with self._lock_pending():
+                if student_id in self.__pending_timestamps:
+                    return self.__pending_timestamps[student_id]
             # キャッシュにない場合のみデータベースにアクセス
             with self._project_database_io.connect() as con:
                 cur = con.cursor()
@@ -1,7 +1,8 @@
 from abc import ABC, abstractmethod
 
 from domain.model.stage import AbstractStage
-from domain.model.student_stage_result import AbstractStudentStageResult
+from domain.model.student_stage_result import AbstractStudentStageResult, \
+    StudentStageResultSummary
 from domain.model.value import StudentID
 
 
@@ -19,6 +20,21 @@ class _AbstractStageResultHelper(ABC):
         """ステージ結果を取得"""
         raise NotImplementedError()
 
+    @abstractmethod
+    def get_stage_results(self, cursor, student_ids: list[StudentID]) \
+            -> dict[tuple[StudentID, AbstractStage], AbstractStudentStageResult]:
+        """複数の生徒のステージ結果を1回のクエリで取得（結果がないステージは含まない）"""
+        raise NotImplementedError()
+
+    def get_stage_result_summaries(self, cursor, student_ids: list[StudentID]) \
+            -> dict[tuple[StudentID, AbstractStage], StudentStageResultSummary]:
+        """複数の生徒のステージ結果の要約を1回のクエリで取得（結果がないステージは含まない）"""
+        # 大きなデータを持たないステージは結果をそのまま要約する
+        return {
+            key: StudentStageResultSummary.from_result(result)
+            for key, result in self.get_stage_results(cursor, student_ids).items()
+        }
+
     @abstractmethod
     def put_stage_result(self, cursor, result: AbstractStudentStageResult) -> None:
         """ステージ結果を保存"""
@@ -29,6 +45,11 @@ class _AbstractStageResultHelper(ABC):
         """ステージ結果を削除"""
         raise NotImplementedError()
 
+    @abstractmethod
+    def delete_all_stage_results(self, cursor, student_ids: list[StudentID]) -> None:
+        """複数の生徒のステージ結果をすべて削除"""
+        raise NotImplementedError()
+
     @abstractmethod
     def exists_stage_result(self, cursor, student_id: StudentID, stage: AbstractStage) -> bool:
         """ステージ結果の存在チェック"""
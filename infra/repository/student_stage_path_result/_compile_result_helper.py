@@ -33,6 +33,23 @@ class _CompileResultHelper(_AbstractStageResultHelper):
         if row is None:
             return None
 
+        return self._create_stage_result(student_id, row)
+
+    def get_stage_results(self, cursor, student_ids: list[StudentID]) \
+            -> dict[tuple[StudentID, AbstractStage], AbstractStudentStageResult]:
+        placeholders = ", ".join("?" * len(student_ids))
+        cursor.execute(
+            f"SELECT * FROM student_compile_result WHERE student_id IN ({placeholders})",
+            [str(student_id) for student_id in student_ids]
+        )
+        results = {}
+        for row in cursor.fetchall():
+            student_id = StudentID(row["student_id"])
+            results[student_id, CompileStage()] = self._create_stage_result(student_id, row)
+        return results
+
+    @staticmethod
+    def _create_stage_result(student_id: StudentID, row) -> AbstractStudentStageResult:
         if row["reason"] is None:
             return CompileSuccessStudentStageResult.create_instance(
                 student_id=student_id,
@@ -66,6 +83,13 @@ class _CompileResultHelper(_AbstractStageResultHelper):
             (str(student_id),)
         )
 
+    def delete_all_stage_results(self, cursor, student_ids: list[StudentID]) -> None:
+        placeholders = ", ".join("?" * len(student_ids))
+        cursor.execute(
+            f"DELETE FROM student_compile_result WHERE student_id IN ({placeholders})",
+            [str(student_id) for student_id in student_ids]
+        )
+
     def exists_stage_result(self, cursor, student_id: StudentID, stage: AbstractStage) -> bool:
         assert isinstance(stage, CompileStage), stage
         cursor.execute(
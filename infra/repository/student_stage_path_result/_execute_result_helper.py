@@ -1,32 +1,90 @@
 import json
 
-from domain.model.output_file import OutputFileCollection
+from domain.model.output_file import OutputFileCollection, OutputFile
 from domain.model.stage import AbstractStage, ExecuteStage
 from domain.model.student_stage_result import AbstractStudentStageResult, \
-    ExecuteSuccessStudentStageResult, ExecuteFailureStudentStageResult
-from domain.model.value import StudentID
+    ExecuteSuccessStudentStageResult, ExecuteFailureStudentStageResult, StudentStageResultSummary
+from domain.model.value import StudentID, TestCaseID, FileID
+from infra.io.project_database import get_column_names
+from infra.repository.content_blob import ContentBlobHelper
 from infra.repository.student_stage_path_result import _AbstractStageResultHelper
 
 
 class _ExecuteResultHelper(_AbstractStageResultHelper):
     """Execute結果処理ヘルパー"""
 
+    # この大きさ以上の出力ファイルを圧縮する（小さな出力は圧縮しても縮まらず展開の手間だけかかる）
+    _COMPRESS_THRESHOLD = 512
+
+    def __init__(self):
+        self._content_blob_helper = ContentBlobHelper(compress_threshold=self._COMPRESS_THRESHOLD)
+
     def create_table_if_not_exists(self, cursor) -> None:
+        self._content_blob_helper.create_table_if_not_exists(cursor)
+
+        # 出力ファイルをbase64のJSONで1つの列に持っていた古いテーブルは退避して新しいテーブルに移行する
+        is_migration_required = "output_file_collection_json" in get_column_names(
+            cursor, "student_execute_result",
+        )
+        if is_migration_required:
+            cursor.execute(
+                "ALTER TABLE student_execute_result RENAME TO student_execute_result_json"
+            )
+
         cursor.execute(
             """
             CREATE TABLE IF NOT EXISTS student_execute_result
             (
-                student_id                  TEXT,
-                testcase_id                 TEXT,
-                execute_config_mtime        DATETIME,
-                output_file_collection_json TEXT,
-                reason                      TEXT,
+                student_id           TEXT,
+                testcase_id          TEXT,
+                execute_config_mtime DATETIME,
+                reason               TEXT,
                 PRIMARY KEY (student_id, testcase_id),
                 FOREIGN KEY (student_id) REFERENCES student (student_id)
             )
             """
         )
-        # TODO: column depending on json
+        # 出力ファイルは1ファイル1行で持ち，中身はcontent_blobに保存してハッシュで参照する
+        # 同じ出力は1つだけ保存され，ハッシュを比べれば中身を読まずに同じ出力かどうか分かる
+        # 結果の状態だけを問い合わせるときはこのテーブルを読まない
+        cursor.execute(
+            """
+            CREATE TABLE IF NOT EXISTS student_execute_output_file
+            (
+                student_id  TEXT,
+                testcase_id TEXT,
+                position    INTEGER,
+                file_id     TEXT NOT NULL,
+                blob_hash   TEXT NOT NULL,
+                PRIMARY KEY (student_id, testcase_id, position),
+                FOREIGN KEY (student_id) REFERENCES student (student_id)
+            )
+            """
+        )
+
+        if is_migration_required:
+            self._migrate_from_json_table(cursor)
+            cursor.execute("DROP TABLE student_execute_result_json")
+
+    def _migrate_from_json_table(self, cursor) -> None:
+        # 読みながら書くので読み出しには別のカーソルを使う
+        read_cursor = cursor.connection.cursor()
+        read_cursor.execute("SELECT * FROM student_execute_result_json")
+        for row in read_cursor:
+            student_id = StudentID(row["student_id"])
+            stage = ExecuteStage(TestCaseID(row["testcase_id"]))
+            if row["reason"] is None:
+                result = ExecuteSuccessStudentStageResult.create_instance(
+                    student_id=student_id,
+                    testcase_id=stage.testcase_id,
+                    execute_config_mtime=row["execute_config_mtime"],  # 既にdatetimeオブジェクト
+                    output_file_collection=OutputFileCollection.from_json(
+                        json.loads(row["output_file_collection_json"])
+                    ),
+                )
+            else:
+                result = self._create_stage_result(student_id, stage, row, None)
+            self.put_stage_result(cursor, result)
 
     def get_stage_result(self, cursor, student_id: StudentID,
                          stage: AbstractStage) -> AbstractStudentStageResult | None:
@@ -40,9 +98,96 @@ class _ExecuteResultHelper(_AbstractStageResultHelper):
         if row is None:
             return None
 
+        output_file_collection = None
         if row["reason"] is None:
-            output_file_collection = OutputFileCollection.from_json(
-                json.loads(row["output_file_collection_json"]))
+            cursor.execute(
+                "SELECT * FROM student_execute_output_file "
+                "WHERE student_id = ? AND testcase_id = ? ORDER BY position",
+                (str(student_id), str(stage.testcase_id))
+            )
+            file_rows = cursor.fetchall()
+            contents = self._content_blob_helper.get_all(
+                cursor, (file_row["blob_hash"] for file_row in file_rows)
+            )
+            output_file_collection = OutputFileCollection(
+                self._create_output_file(file_row, contents) for file_row in file_rows
+            )
+
+        return self._create_stage_result(student_id, stage, row, output_file_collection)
+
+    def get_stage_results(self, cursor, student_ids: list[StudentID]) \
+            -> dict[tuple[StudentID, AbstractStage], AbstractStudentStageResult]:
+        placeholders = ", ".join("?" * len(student_ids))
+        params = [str(student_id) for student_id in student_ids]
+        cursor.execute(
+            f"SELECT * FROM student_execute_output_file WHERE student_id IN ({placeholders}) "
+            f"ORDER BY student_id, testcase_id, position",
+            params
+        )
+        file_rows = cursor.fetchall()
+        contents = self._content_blob_helper.get_all(
+            cursor, (file_row["blob_hash"] for file_row in file_rows)
+        )
+        output_file_collections: dict[tuple[str, str], OutputFileCollection] = {}
+        for file_row in file_rows:
+            key = file_row["student_id"], file_row["testcase_id"]
+            output_file_collections.setdefault(key, OutputFileCollection()).put(
+                self._create_output_file(file_row, contents)
+            )
+
+        cursor.execute(
+            f"SELECT * FROM student_execute_result WHERE student_id IN ({placeholders})",
+            params
+        )
+        results = {}
+        for row in cursor.fetchall():
+            student_id = StudentID(row["student_id"])
+            stage = ExecuteStage(TestCaseID(row["testcase_id"]))
+            output_file_collection = None
+            if row["reason"] is None:
+                output_file_collection = output_file_collections.get(
+                    (row["student_id"], row["testcase_id"]), OutputFileCollection()
+                )
+            results[student_id, stage] = self._create_stage_result(
+                student_id, stage, row, output_file_collection
+            )
+        return results
+
+    def get_stage_result_summaries(self, cursor, student_ids: list[StudentID]) \
+            -> dict[tuple[StudentID, AbstractStage], StudentStageResultSummary]:
+        # 出力ファイルのテーブルは読まない
+        placeholders = ", ".join("?" * len(student_ids))
+        cursor.execute(
+            f"SELECT student_id, testcase_id, reason FROM student_execute_result "
+            f"WHERE student_id IN ({placeholders})",
+            [str(student_id) for student_id in student_ids]
+        )
+        summaries = {}
+        for row in cursor.fetchall():
+            student_id = StudentID(row["student_id"])
+            stage = ExecuteStage(TestCaseID(row["testcase_id"]))
+            if row["reason"] is None:
+                summary = StudentStageResultSummary.create_success()
+            else:
+                summary = StudentStageResultSummary.from_result(
+                    self._create_stage_result(student_id, stage, row, None)
+                )
+            summaries[student_id, stage] = summary
+        return summaries
+
+    @staticmethod
+    def _create_output_file(file_row, contents: dict[str, bytes]) -> OutputFile:
+        return OutputFile(
+            file_id=FileID.from_json(file_row["file_id"]),
+            content=contents[file_row["blob_hash"]],
+        )
+
+    @staticmethod
+    def _create_stage_result(student_id: StudentID, stage: ExecuteStage, row,
+                             output_file_collection: OutputFileCollection | None) \
+            -> AbstractStudentStageResult:
+        if row["reason"] is None:
+            assert output_file_collection is not None
             return ExecuteSuccessStudentStageResult.create_instance(
                 student_id=student_id,
                 testcase_id=stage.testcase_id,
@@ -57,32 +202,82 @@ class _ExecuteResultHelper(_AbstractStageResultHelper):
             )
 
     def put_stage_result(self, cursor, result: AbstractStudentStageResult) -> None:
+        # 同じ出力で上書きするときに中身を消してから保存し直さないように，古い出力の参照は最後に外す
+        old_blob_hashes = self._delete_output_files(cursor, result.student_id, result.testcase_id)
         if isinstance(result, ExecuteSuccessStudentStageResult):
             cursor.execute(
                 "INSERT OR REPLACE INTO student_execute_result"
-                "(student_id, testcase_id, execute_config_mtime, output_file_collection_json, reason)"
-                "VALUES (?, ?, ?, ?, NULL)",
+                "(student_id, testcase_id, execute_config_mtime, reason)"
+                "VALUES (?, ?, ?, NULL)",
                 (str(result.student_id), str(result.testcase_id),
-                 result.execute_config_mtime.isoformat(),
-                 json.dumps(result.output_file_collection.to_json()))
+                 result.execute_config_mtime.isoformat())
+            )
+            cursor.executemany(
+                "INSERT INTO student_execute_output_file"
+                "(student_id, testcase_id, position, file_id, blob_hash)"
+                "VALUES (?, ?, ?, ?, ?)",
+                [
+                    (str(result.student_id), str(result.testcase_id), position,
+                     file_id.to_json(),
+                     self._content_blob_helper.acquire(cursor, output_file.content_bytes))
+                    for position, (file_id, output_file)
+                    in enumerate(result.output_file_collection.items())
+                ]
             )
         elif isinstance(result, ExecuteFailureStudentStageResult):
             cursor.execute(
                 "INSERT OR REPLACE INTO student_execute_result"
-                "(student_id, testcase_id, execute_config_mtime, output_file_collection_json, reason)"
-                "VALUES (?, ?, NULL, NULL, ?)",
+                "(student_id, testcase_id, execute_config_mtime, reason)"
+                "VALUES (?, ?, NULL, ?)",
                 (str(result.student_id), str(result.testcase_id), result.reason)
             )
         else:
             raise ValueError(f"Unexpected result type: {type(result)}")
+        self._content_blob_helper.release(cursor, old_blob_hashes)
+
+    @staticmethod
+    def _delete_output_files(cursor, student_id: StudentID, testcase_id: TestCaseID) -> list[str]:
+        # 出力ファイルの行を削除し，参照を外すべき中身のハッシュを返す
+        params = (str(student_id), str(testcase_id))
+        cursor.execute(
+            "SELECT blob_hash FROM student_execute_output_file WHERE student_id = ? AND testcase_id = ?",
+            params
+        )
+        blob_hashes = [row["blob_hash"] for row in cursor.fetchall()]
+        cursor.execute(
+            "DELETE FROM student_execute_output_file WHERE student_id = ? AND testcase_id = ?",
+            params
+        )
+        return blob_hashes
 
     def delete_stage_result(self, cursor, student_id: StudentID, stage: AbstractStage) -> None:
         assert isinstance(stage, ExecuteStage), stage
+        self._content_blob_helper.release(
+            cursor, self._delete_output_files(cursor, student_id, stage.testcase_id)
+        )
         cursor.execute(
             "DELETE FROM student_execute_result WHERE student_id = ? AND testcase_id = ?",
             (str(student_id), str(stage.testcase_id))
         )
 
+    def delete_all_stage_results(self, cursor, student_ids: list[StudentID]) -> None:
+        placeholders = ", ".join("?" * len(student_ids))
+        params = [str(student_id) for student_id in student_ids]
+        cursor.execute(
+            f"SELECT blob_hash FROM student_execute_output_file WHERE student_id IN ({placeholders})",
+            params
+        )
+        blob_hashes = [row["blob_hash"] for row in cursor.fetchall()]
+        cursor.execute(
+            f"DELETE FROM student_execute_output_file WHERE student_id IN ({placeholders})",
+            params
+        )
+        self._content_blob_helper.release(cursor, blob_hashes)
+        cursor.execute(
+            f"DELETE FROM student_execute_result WHERE student_id IN ({placeholders})",
+            params
+        )
+
     def exists_stage_result(self, cursor, student_id: StudentID, stage: AbstractStage) -> bool:
         assert isinstance(stage, ExecuteStage), stage
         cursor.execute(
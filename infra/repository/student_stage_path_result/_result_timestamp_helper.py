@@ -14,7 +14,7 @@ class _ResultTimestampHelper:
 
     def _create_table_if_not_exists(self):
         """タイムスタンプテーブルが存在しない場合に作成"""
-        with self._project_database_io.connect() as con:
+        with self._project_database_io.transaction() as con:
             cur = con.cursor()
             cur.execute(
                 """
@@ -26,7 +26,6 @@ class _ResultTimestampHelper:
                 )
                 """
             )
-            con.commit()
 
     def update(self, student_id: StudentID, cursor) -> None:
         """
@@ -43,6 +42,36 @@ class _ResultTimestampHelper:
             (str(student_id), timestamp),
         )
 
+    def update_all(self, student_ids: list[StudentID], cursor) -> None:
+        """
+        複数の生徒IDの現在の時刻をまとめて記録（または更新）します。
+        """
+        timestamp = datetime.now()
+        for student_id in student_ids:
+            self._cache[student_id] = timestamp
+
+        cursor.executemany(
+            """
+            INSERT OR REPLACE INTO student_stage_path_result_timestamp (student_id, timestamp)
+            VALUES (?, ?)
+            """,
+            [(str(student_id), timestamp) for student_id in student_ids],
+        )
+
+    def put_all(self, timestamps: dict[StudentID, datetime], cursor) -> None:
+        """
+        複数の生徒IDの与えられた時刻をまとめて記録（または更新）します。
+        """
+        self._cache.update(timestamps)
+
+        cursor.executemany(
+            """
+            INSERT OR REPLACE INTO student_stage_path_result_timestamp (student_id, timestamp)
+            VALUES (?, ?)
+            """,
+            [(str(student_id), timestamp) for student_id, timestamp in timestamps.items()],
+        )
+
     def get(self, student_id: StudentID, cursor) -> datetime | None:
         """
         指定された生徒IDの記録された時刻を取得します。
@@ -1,31 +1,126 @@
 import json
+from datetime import timedelta
 
+from domain.model.expected_output_file import ExpectedOutputFile
+from domain.model.output_file import OutputFile
+from domain.model.output_file_test_result import MatchResult, MatchedToken, NonmatchedToken
+from domain.model.pattern import PatternList
 from domain.model.stage import AbstractStage, TestStage
 from domain.model.student_stage_result import AbstractStudentStageResult, \
-    TestSuccessStudentStageResult, TestFailureStudentStageResult
-from domain.model.value import StudentID
+    TestSuccessStudentStageResult, TestFailureStudentStageResult, TestResultOutputFileCollection, \
+    StudentStageResultSummary
+from domain.model.test_result_output_file_entry import AbstractTestResultOutputFileEntry, \
+    TestResultAbsentOutputFileEntry, TestResultUnexpectedOutputFileEntry, \
+    TestResultTestedOutputFileEntry
+from domain.model.value import StudentID, TestCaseID, FileID
+from infra.io.project_database import get_column_names
+from infra.repository.content_blob import ContentBlobHelper
 from infra.repository.student_stage_path_result import _AbstractStageResultHelper
 
 
 class _TestResultHelper(_AbstractStageResultHelper):
     """Test結果処理ヘルパー"""
 
+    # student_test_output_file.entry_typeの値
+    _ENTRY_TYPE_ABSENT = "absent"
+    _ENTRY_TYPE_UNEXPECTED = "unexpected"
+    _ENTRY_TYPE_TESTED = "tested"
+
+    # この大きさ以上の実際の出力を圧縮する（Executeの出力と同じ内容を共有するので同じ閾値にする）
+    _COMPRESS_THRESHOLD = 512
+
+    def __init__(self):
+        self._content_blob_helper = ContentBlobHelper(compress_threshold=self._COMPRESS_THRESHOLD)
+
     def create_table_if_not_exists(self, cursor) -> None:
+        self._content_blob_helper.create_table_if_not_exists(cursor)
+
+        # テスト結果をbase64のJSONで1つの列に持っていた古いテーブルは退避して新しいテーブルに移行する
+        is_migration_required = "test_result_output_file_collection" in get_column_names(
+            cursor, "student_test_result",
+        )
+        if is_migration_required:
+            cursor.execute(
+                "ALTER TABLE student_test_result RENAME TO student_test_result_json"
+            )
+
+        # is_acceptedは成功したときだけ値を持ち，正解かどうかを出力ファイルを読まずに判定できるようにする
         cursor.execute(
             """
             CREATE TABLE IF NOT EXISTS student_test_result
             (
-                student_id                         TEXT,
-                testcase_id                        TEXT,
-                test_config_mtime                  DATETIME,
-                test_result_output_file_collection TEXT,
-                reason                             TEXT,
+                student_id        TEXT,
+                testcase_id       TEXT,
+                test_config_mtime DATETIME,
+                is_accepted       INTEGER,
+                reason            TEXT,
                 PRIMARY KEY (student_id, testcase_id),
                 FOREIGN KEY (student_id) REFERENCES student (student_id)
             )
             """
         )
-        # TODO: column depending on json
+        # 出力ファイルごとのテスト結果は1ファイル1行で持ち，実際の出力の中身はcontent_blobに保存してハッシュで参照する
+        # （実行結果の出力と同じ中身なので実行結果と同じ行を参照する）
+        cursor.execute(
+            """
+            CREATE TABLE IF NOT EXISTS student_test_output_file
+            (
+                student_id             TEXT,
+                testcase_id            TEXT,
+                position               INTEGER,
+                file_id                TEXT NOT NULL,
+                entry_type             TEXT NOT NULL,
+                actual_blob_hash       TEXT,
+                expected_patterns_json TEXT,
+                regex_pattern          TEXT,
+                test_execution_seconds REAL,
+                PRIMARY KEY (student_id, testcase_id, position),
+                FOREIGN KEY (student_id) REFERENCES student (student_id)
+            )
+            """
+        )
+        # マッチしたトークンとマッチしなかったトークンは1トークン1行で持つ
+        # パターンは同じ出力ファイルの期待されるパターンをpattern_indexで参照する
+        cursor.execute(
+            """
+            CREATE TABLE IF NOT EXISTS student_test_token
+            (
+                student_id    TEXT,
+                testcase_id   TEXT,
+                position      INTEGER,
+                pattern_index INTEGER,
+                is_matched    INTEGER NOT NULL,
+                match_begin   INTEGER,
+                match_end     INTEGER,
+                PRIMARY KEY (student_id, testcase_id, position, pattern_index),
+                FOREIGN KEY (student_id) REFERENCES student (student_id)
+            )
+            """
+        )
+
+        if is_migration_required:
+            self._migrate_from_json_table(cursor)
+            cursor.execute("DROP TABLE student_test_result_json")
+
+    def _migrate_from_json_table(self, cursor) -> None:
+        # 読みながら書くので読み出しには別のカーソルを使う
+        read_cursor = cursor.connection.cursor()
+        read_cursor.execute("SELECT * FROM student_test_result_json")
+        for row in read_cursor:
+            student_id = StudentID(row["student_id"])
+            stage = TestStage(TestCaseID(row["testcase_id"]))
+            if row["reason"] is None:
+                result = TestSuccessStudentStageResult.create_instance(
+                    student_id=student_id,
+                    testcase_id=stage.testcase_id,
+                    test_config_mtime=row["test_config_mtime"],  # 既にdatetimeオブジェクト
+                    test_result_output_file_collection=TestResultOutputFileCollection.from_json(
+                        json.loads(row["test_result_output_file_collection"])
+                    ),
+                )
+            else:
+                result = self._create_stage_result(student_id, stage, row, None)
+            self.put_stage_result(cursor, result)
 
     def get_stage_result(self, cursor, student_id: StudentID,
                          stage: AbstractStage) -> AbstractStudentStageResult | None:
@@ -39,11 +134,167 @@ class _TestResultHelper(_AbstractStageResultHelper):
         if row is None:
             return None
 
+        test_result_output_file_collection = None
         if row["reason"] is None:
-            from domain.model.student_stage_result import TestResultOutputFileCollection
-            test_result_output_file_collection = TestResultOutputFileCollection.from_json(
-                json.loads(row["test_result_output_file_collection"])
+            params = (str(student_id), str(stage.testcase_id))
+            cursor.execute(
+                "SELECT * FROM student_test_token "
+                "WHERE student_id = ? AND testcase_id = ? ORDER BY position, pattern_index",
+                params
+            )
+            token_rows = {}
+            for token_row in cursor.fetchall():
+                token_rows.setdefault(token_row["position"], []).append(token_row)
+            cursor.execute(
+                "SELECT * FROM student_test_output_file "
+                "WHERE student_id = ? AND testcase_id = ? ORDER BY position",
+                params
             )
+            file_rows = cursor.fetchall()
+            contents = self._get_actual_contents(cursor, file_rows)
+            test_result_output_file_collection = TestResultOutputFileCollection(
+                self._create_output_file_entry(
+                    file_row, token_rows.get(file_row["position"], []), contents,
+                )
+                for file_row in file_rows
+            )
+
+        return self._create_stage_result(student_id, stage, row, test_result_output_file_collection)
+
+    def get_stage_results(self, cursor, student_ids: list[StudentID]) \
+            -> dict[tuple[StudentID, AbstractStage], AbstractStudentStageResult]:
+        placeholders = ", ".join("?" * len(student_ids))
+        params = [str(student_id) for student_id in student_ids]
+        cursor.execute(
+            f"SELECT * FROM student_test_token WHERE student_id IN ({placeholders}) "
+            f"ORDER BY student_id, testcase_id, position, pattern_index",
+            params
+        )
+        token_rows: dict[tuple[str, str, int], list] = {}
+        for token_row in cursor.fetchall():
+            key = token_row["student_id"], token_row["testcase_id"], token_row["position"]
+            token_rows.setdefault(key, []).append(token_row)
+
+        cursor.execute(
+            f"SELECT * FROM student_test_output_file WHERE student_id IN ({placeholders}) "
+            f"ORDER BY student_id, testcase_id, position",
+            params
+        )
+        file_rows = cursor.fetchall()
+        contents = self._get_actual_contents(cursor, file_rows)
+        test_result_output_file_collections: dict[tuple[str, str], TestResultOutputFileCollection] = {}
+        for file_row in file_rows:
+            key = file_row["student_id"], file_row["testcase_id"]
+            test_result_output_file_collections.setdefault(key, TestResultOutputFileCollection()).put(
+                self._create_output_file_entry(
+                    file_row, token_rows.get((*key, file_row["position"]), []), contents,
+                )
+            )
+
+        cursor.execute(
+            f"SELECT * FROM student_test_result WHERE student_id IN ({placeholders})",
+            params
+        )
+        results = {}
+        for row in cursor.fetchall():
+            student_id = StudentID(row["student_id"])
+            stage = TestStage(TestCaseID(row["testcase_id"]))
+            test_result_output_file_collection = None
+            if row["reason"] is None:
+                test_result_output_file_collection = test_result_output_file_collections.get(
+                    (row["student_id"], row["testcase_id"]), TestResultOutputFileCollection()
+                )
+            results[student_id, stage] = self._create_stage_result(
+                student_id, stage, row, test_result_output_file_collection
+            )
+        return results
+
+    def get_stage_result_summaries(self, cursor, student_ids: list[StudentID]) \
+            -> dict[tuple[StudentID, AbstractStage], StudentStageResultSummary]:
+        # 出力ファイルとトークンのテーブルは読まない
+        placeholders = ", ".join("?" * len(student_ids))
+        cursor.execute(
+            f"SELECT student_id, testcase_id, is_accepted, reason FROM student_test_result "
+            f"WHERE student_id IN ({placeholders})",
+            [str(student_id) for student_id in student_ids]
+        )
+        summaries = {}
+        for row in cursor.fetchall():
+            student_id = StudentID(row["student_id"])
+            stage = TestStage(TestCaseID(row["testcase_id"]))
+            if row["reason"] is None:
+                summary = StudentStageResultSummary.create_success(
+                    is_accepted=bool(row["is_accepted"]),
+                )
+            else:
+                summary = StudentStageResultSummary.from_result(
+                    self._create_stage_result(student_id, stage, row, None)
+                )
+            summaries[student_id, stage] = summary
+        return summaries
+
+    def _get_actual_contents(self, cursor, file_rows: list) -> dict[str, bytes]:
+        return self._content_blob_helper.get_all(
+            cursor,
+            (
+                file_row["actual_blob_hash"]
+                for file_row in file_rows
+                if file_row["actual_blob_hash"] is not None
+            ),
+        )
+
+    def _create_output_file_entry(self, file_row, token_rows: list, contents: dict[str, bytes]) \
+            -> AbstractTestResultOutputFileEntry:
+        file_id = FileID.from_json(file_row["file_id"])
+        entry_type = file_row["entry_type"]
+        if entry_type == self._ENTRY_TYPE_UNEXPECTED:
+            return TestResultUnexpectedOutputFileEntry(
+                file_id=file_id,
+                actual=OutputFile(file_id=file_id, content=contents[file_row["actual_blob_hash"]]),
+            )
+
+        patterns = PatternList.from_json(json.loads(file_row["expected_patterns_json"]))
+        expected = ExpectedOutputFile(file_id=file_id, patterns=patterns)
+        if entry_type == self._ENTRY_TYPE_ABSENT:
+            return TestResultAbsentOutputFileEntry(
+                file_id=file_id,
+                expected=expected,
+            )
+
+        assert entry_type == self._ENTRY_TYPE_TESTED, entry_type
+        patterns_by_index = {pattern.index: pattern for pattern in patterns}
+        matched_tokens = []
+        nonmatched_tokens = []
+        for token_row in token_rows:
+            pattern = patterns_by_index[token_row["pattern_index"]]
+            if token_row["is_matched"]:
+                matched_tokens.append(MatchedToken(
+                    pattern=pattern,
+                    begin=token_row["match_begin"],
+                    end=token_row["match_end"],
+                ))
+            else:
+                nonmatched_tokens.append(NonmatchedToken(
+                    pattern=pattern,
+                ))
+        return TestResultTestedOutputFileEntry(
+            file_id=file_id,
+            actual=OutputFile(file_id=file_id, content=contents[file_row["actual_blob_hash"]]),
+            expected=expected,
+            test_result=MatchResult(
+                regex_pattern=file_row["regex_pattern"],
+                matched_tokens=matched_tokens,
+                nonmatched_tokens=nonmatched_tokens,
+                test_execution_timedelta=timedelta(seconds=file_row["test_execution_seconds"]),
+            ),
+        )
+
+    @staticmethod
+    def _create_stage_result(student_id: StudentID, stage: TestStage, row,
+                             test_result_output_file_collection: TestResultOutputFileCollection | None) \
+            -> AbstractStudentStageResult:
+        if row["reason"] is None:
+            assert test_result_output_file_collection is not None
             return TestSuccessStudentStageResult.create_instance(
                 student_id=student_id,
                 testcase_id=stage.testcase_id,
@@ -57,33 +308,122 @@ class _TestResultHelper(_AbstractStageResultHelper):
                 reason=row["reason"],
             )
 
+    def _put_output_file_entries(self, cursor, result: TestSuccessStudentStageResult) -> None:
+        file_params = []
+        token_params = []
+        for position, (file_id, entry) in enumerate(
+                result.test_result_output_file_collection.items()
+        ):
+            key = str(result.student_id), str(result.testcase_id), position
+            actual_blob_hash = None
+            if entry.has_actual:
+                actual_blob_hash = self._content_blob_helper.acquire(cursor, entry.actual.content_bytes)
+            expected_patterns_json \
+                = json.dumps(entry.expected.patterns.to_json()) if entry.has_expected else None
+            if isinstance(entry, TestResultAbsentOutputFileEntry):
+                file_params.append(
+                    (*key, file_id.to_json(), self._ENTRY_TYPE_ABSENT,
+                     actual_blob_hash, expected_patterns_json, None, None)
+                )
+            elif isinstance(entry, TestResultUnexpectedOutputFileEntry):
+                file_params.append(
+                    (*key, file_id.to_json(), self._ENTRY_TYPE_UNEXPECTED,
+                     actual_blob_hash, expected_patterns_json, None, None)
+                )
+            elif isinstance(entry, TestResultTestedOutputFileEntry):
+                test_result = entry.test_result
+                file_params.append(
+                    (*key, file_id.to_json(), self._ENTRY_TYPE_TESTED,
+                     actual_blob_hash, expected_patterns_json, test_result.regex_pattern,
+                     test_result.test_execution_timedelta.total_seconds())
+                )
+                for token in test_result.matched_tokens:
+                    token_params.append((*key, token.pattern.index, 1, token.begin, token.end))
+                for token in test_result.nonmatched_tokens:
+                    token_params.append((*key, token.pattern.index, 0, None, None))
+            else:
+                raise ValueError(f"Unexpected entry type: {type(entry)}")
+
+        cursor.executemany(
+            "INSERT INTO student_test_output_file"
+            "(student_id, testcase_id, position, file_id, entry_type, "
+            "actual_blob_hash, expected_patterns_json, regex_pattern, test_execution_seconds)"
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            file_params
+        )
+        cursor.executemany(
+            "INSERT INTO student_test_token"
+            "(student_id, testcase_id, position, pattern_index, is_matched, match_begin, match_end)"
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            token_params
+        )
+
     def put_stage_result(self, cursor, result: AbstractStudentStageResult) -> None:
+        # 同じ出力で上書きするときに中身を消してから保存し直さないように，古い出力の参照は最後に外す
+        old_blob_hashes = self._delete_output_file_entries(cursor, result.student_id, result.testcase_id)
         if isinstance(result, TestSuccessStudentStageResult):
             cursor.execute(
                 "INSERT OR REPLACE INTO student_test_result"
-                "(student_id, testcase_id, test_config_mtime, test_result_output_file_collection, reason)"
+                "(student_id, testcase_id, test_config_mtime, is_accepted, reason)"
                 "VALUES (?, ?, ?, ?, NULL)",
                 (str(result.student_id), str(result.testcase_id),
-                 result.test_config_mtime.isoformat(),
-                 json.dumps(result.test_result_output_file_collection.to_json()))
+                 result.test_config_mtime.isoformat(), int(result.is_accepted))
             )
+            self._put_output_file_entries(cursor, result)
         elif isinstance(result, TestFailureStudentStageResult):
             cursor.execute(
                 "INSERT OR REPLACE INTO student_test_result"
-                "(student_id, testcase_id, test_config_mtime, test_result_output_file_collection, reason)"
+                "(student_id, testcase_id, test_config_mtime, is_accepted, reason)"
                 "VALUES (?, ?, NULL, NULL, ?)",
                 (str(result.student_id), str(result.testcase_id), result.reason)
             )
         else:
             raise ValueError(f"Unexpected result type: {type(result)}")
+        self._content_blob_helper.release(cursor, old_blob_hashes)
+
+    @staticmethod
+    def _delete_output_file_entries(cursor, student_id: StudentID, testcase_id: TestCaseID) -> list[str]:
+        # 出力ファイルごとのテスト結果の行を削除し，参照を外すべき中身のハッシュを返す
+        params = (str(student_id), str(testcase_id))
+        cursor.execute(
+            "SELECT actual_blob_hash FROM student_test_output_file "
+            "WHERE student_id = ? AND testcase_id = ? AND actual_blob_hash IS NOT NULL",
+            params
+        )
+        blob_hashes = [row["actual_blob_hash"] for row in cursor.fetchall()]
+        for table_name in ("student_test_token", "student_test_output_file"):
+            cursor.execute(
+                f"DELETE FROM {table_name} WHERE student_id = ? AND testcase_id = ?",
+                params
+            )
+        return blob_hashes
 
     def delete_stage_result(self, cursor, student_id: StudentID, stage: AbstractStage) -> None:
         assert isinstance(stage, TestStage), stage
+        self._content_blob_helper.release(
+            cursor, self._delete_output_file_entries(cursor, student_id, stage.testcase_id)
+        )
         cursor.execute(
             "DELETE FROM student_test_result WHERE student_id = ? AND testcase_id = ?",
             (str(student_id), str(stage.testcase_id))
         )
 
+    def delete_all_stage_results(self, cursor, student_ids: list[StudentID]) -> None:
+        placeholders = ", ".join("?" * len(student_ids))
+        params = [str(student_id) for student_id in student_ids]
+        cursor.execute(
+            f"SELECT actual_blob_hash FROM student_test_output_file "
+            f"WHERE student_id IN ({placeholders}) AND actual_blob_hash IS NOT NULL",
+            params
+        )
+        blob_hashes = [row["actual_blob_hash"] for row in cursor.fetchall()]
+        for table_name in ("student_test_token", "student_test_output_file", "student_test_result"):
+            cursor.execute(
+                f"DELETE FROM {table_name} WHERE student_id IN ({placeholders})",
+                params
+            )
+        self._content_blob_helper.release(cursor, blob_hashes)
+
     def exists_stage_result(self, cursor, student_id: StudentID, stage: AbstractStage) -> bool:
         assert isinstance(stage, TestStage), stage
         cursor.execute(
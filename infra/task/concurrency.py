@@ -0,0 +1,110 @@
+from typing import NamedTuple
+
+from infra.dto.resource_usage import ResourceUsage
+
+
+class WorkerLimitDecision(NamedTuple):
+    worker_limit: int
+    reason: str
+
+
+class WorkerLimitStatus(NamedTuple):
+    worker_limit: int  # 現在の並列タスク実行数
+    max_workers: int  # 並列タスク実行数の上限
+    reason: str | None  # 自動調整の直近の判断の理由（自動調整が無効ならNone）
+
+
+class AdaptiveWorkerLimitController:
+    # thread-unsafe
+    # 同時に実行するタスクの数（ワーカーの上限）を負荷に応じて1からmax_workersの間で増減する
+    #  - メモリが逼迫しているか，前回の変更から処理の所要時間が大きく伸びたら減らす
+    #  - 開始を待っているタスクがあり，CPUに余裕があるなら増やす
+    #  - 変更の効果を見るため，変更のあとは各処理の所要時間がいくつか集まるまで判断を保留する
+    # メモリはワーカープロセスの分も含めるためにこのプロセスのRSSではなくシステム全体の使用率で判断する
+    # ディスクI/Oの回数は処理の量に比例して増えるだけで過負荷かどうかは分からないので使わない
+    # （ディスクが詰まって遅くなったことは処理の所要時間の伸びとして表れる）
+
+    _MEMORY_PERCENT_HIGH = 90
+    _CPU_PERCENT_LOW = 75
+    _LATENCY_DEGRADATION_RATIO = 1.5
+    _MIN_SAMPLES_AFTER_CHANGE = 3
+    _LATENCY_EWMA_ALPHA = 0.3
+
+    def __init__(self, *, max_workers: int, initial_worker_limit: int):
+        self._max_workers = max_workers
+        self._worker_limit = max(1, min(max_workers, initial_worker_limit))
+        self._reason = "開始"
+        # 処理の種類ごとの所要時間の指数移動平均
+        self._latency_ewma: dict[str, float] = {}
+        # 前回ワーカーの上限を変更したときの所要時間の指数移動平均
+        self._reference_latency: dict[str, float] = {}
+        # 前回ワーカーの上限を変更してから記録した処理の数
+        self._samples_after_change: dict[str, int] = {}
+
+    @property
+    def worker_limit(self) -> int:
+        return self._worker_limit
+
+    @property
+    def reason(self) -> str:
+        return self._reason
+
+    def record_latency(self, group: str, elapsed_seconds: float) -> None:
+        ewma = self._latency_ewma.get(group)
+        if ewma is None:
+            ewma = elapsed_seconds
+        else:
+            ewma += self._LATENCY_EWMA_ALPHA * (elapsed_seconds - ewma)
+        self._latency_ewma[group] = ewma
+        self._samples_after_change[group] = self._samples_after_change.get(group, 0) + 1
+
+    def __find_degraded_group(self) -> str | None:
+        for group, reference_latency in self._reference_latency.items():
+            if self._samples_after_change.get(group, 0) < self._MIN_SAMPLES_AFTER_CHANGE:
+                continue
+            if self._latency_ewma[group] > reference_latency * self._LATENCY_DEGRADATION_RATIO:
+                return group
+        return None
+
+    def __is_waiting_for_samples(self) -> bool:
+        # 前回の変更のあとに所要時間がまだ十分に集まっていない処理がある
+        return any(
+            self._samples_after_change.get(group, 0) < self._MIN_SAMPLES_AFTER_CHANGE
+            for group in self._reference_latency
+        )
+
+    def __change(self, worker_limit: int, reason: str) -> None:
+        self._worker_limit = worker_limit
+        self._reason = reason
+        self._reference_latency = dict(self._latency_ewma)
+        self._samples_after_change = {}
+
+    def update(self, usage: ResourceUsage, *, n_waiting_tasks: int) -> WorkerLimitDecision:
+        # n_waiting_tasks: ワーカーの上限のために開始を待っているタスクの数
+        degraded_group = self.__find_degraded_group()
+        if usage.system_memory_percent >= self._MEMORY_PERCENT_HIGH:
+            if self._worker_limit > 1:
+                self.__change(
+                    self._worker_limit - 1,
+                    f"メモリ使用率{usage.system_memory_percent}%のため減少",
+                )
+        elif degraded_group is not None:
+            if self._worker_limit > 1:
+                self.__change(
+                    self._worker_limit - 1,
+                    f"{degraded_group}の所要時間が"
+                    f"{self._reference_latency[degraded_group]:.1f}秒から"
+                    f"{self._latency_ewma[degraded_group]:.1f}秒に増えたため減少",
+                )
+        elif self.__is_waiting_for_samples():
+            pass
+        elif n_waiting_tasks > 0 and usage.cpu_percent < self._CPU_PERCENT_LOW:
+            if self._worker_limit < self._max_workers:
+                self.__change(
+                    self._worker_limit + 1,
+                    f"CPU使用率{usage.cpu_percent}%で待機中のタスクがあるため増加",
+                )
+        return WorkerLimitDecision(
+            worker_limit=self._worker_limit,
+            reason=self._reason,
+        )
@@ -0,0 +1,160 @@
+import multiprocessing
+from contextlib import contextmanager
+from typing import Callable, Any
+
+from PyQt5.QtCore import QMutex, QWaitCondition
+
+from util.app_logging import create_logger
+
+_STARTED = "started"
+
+
+class IsolatedProcessRunnerShutdownError(RuntimeError):
+    pass
+
+
+def _serve_in_worker_process(connection) -> None:
+    # ワーカープロセスで実行される
+    # 関数を受け取ってpickleから戻せたら開始を知らせ，関数を実行して結果を返すことを繰り返す
+    while True:
+        try:
+            fn, args = connection.recv()
+        except EOFError:
+            return
+        connection.send(_STARTED)
+        try:
+            response = True, fn(*args)
+        except Exception as e:
+            response = False, e
+        try:
+            connection.send(response)
+        except Exception as e:
+            # pickleできない結果や例外
+            connection.send((False, RuntimeError(f"Failed to send result: {e!r}")))
+
+
+class _WorkerProcess:
+    def __init__(self, context):
+        self.connection, child_connection = context.Pipe()
+        self.process = context.Process(
+            target=_serve_in_worker_process,
+            args=(child_connection,),
+            # アプリケーションが終了したら一緒に終了する
+            daemon=True,
+        )
+        self.process.start()
+        child_connection.close()
+
+    def kill(self) -> None:
+        self.connection.close()
+        self.process.kill()
+        self.process.join()
+
+    def close(self) -> None:
+        # ワーカープロセスは接続が閉じられると終了する
+        self.connection.close()
+        self.process.join()
+
+
+class IsolatedProcessRunner:
+    # thread-safe
+    # 関数をワーカープロセスで実行し，制限時間内に終わらなければワーカープロセスごと止める
+    # reのマッチングのように途中で止められない処理の時間を制限するために使う
+    # ワーカープロセスは使い回し，止めたものは捨てて次に必要になったときに起動し直す
+    # 関数はモジュールのトップレベルに定義されpickleできなければならない
+
+    _logger = create_logger()
+
+    def __init__(self, *, max_workers: int):
+        self._max_workers = max_workers
+
+        # Windowsでの起動方式に揃える
+        self._context = multiprocessing.get_context("spawn")
+
+        self.__lock = QMutex()
+        self.__worker_released = QWaitCondition()
+        self.__idle_workers: list[_WorkerProcess] = []
+        self.__n_workers = 0
+        self.__is_shutdown = False
+
+    @contextmanager
+    def _lock(self):
+        self.__lock.lock()
+        try:
+            yield
+        finally:
+            self.__lock.unlock()
+
+    def __acquire_worker(self) -> _WorkerProcess:
+        with self._lock():
+            while not self.__is_shutdown \
+                    and not self.__idle_workers and self.__n_workers >= self._max_workers:
+                self.__worker_released.wait(self.__lock)
+            if self.__is_shutdown:
+                raise IsolatedProcessRunnerShutdownError("IsolatedProcessRunner has been shut down")
+            if self.__idle_workers:
+                return self.__idle_workers.pop()
+            self.__n_workers += 1
+        # ワーカープロセスの起動には時間がかかるのでロックの外で起動する
+        try:
+            return _WorkerProcess(self._context)
+        except BaseException:
+            self.__release_worker(None)
+            raise
+
+    def __release_worker(self, worker: _WorkerProcess | None) -> None:
+        # 使えなくなったワーカープロセスはNoneとして返す
+        with self._lock():
+            if worker is None:
+                self.__n_workers -= 1
+            elif self.__is_shutdown:
+                self.__n_workers -= 1
+                worker.close()
+            else:
+                self.__idle_workers.append(worker)
+            self.__worker_released.wakeOne()
+
+    def run(self, fn: Callable[..., Any], *args, timeout: float) -> Any:
+        # fn(*args)をワーカープロセスで実行して結果を返す
+        # fnがワーカープロセスで開始してからtimeout秒以内に終わらなければワーカープロセスを止めてTimeoutErrorを送出する
+        # ワーカープロセスが異常終了したらChildProcessErrorを送出する
+        # shutdownの後に呼ばれたり，ワーカープロセスを待っている間にshutdownされたりしたら
+        # IsolatedProcessRunnerShutdownErrorを送出する
+        # fnが送出した例外はこのスレッドで送出される
+        worker = self.__acquire_worker()
+        try:
+            worker.connection.send((fn, args))
+            # 関数と引数をpickleから戻す時間（モジュールの読み込みを含む）は制限時間に含めない
+            started = worker.connection.recv()
+            assert started == _STARTED, started
+            is_timed_out = not worker.connection.poll(timeout)
+            if is_timed_out:
+                self._logger.info(f"Function in worker process timed out after {timeout}s, killing the process")
+                worker.kill()
+                worker = None
+            else:
+                is_success, value = worker.connection.recv()
+        except (EOFError, OSError) as e:
+            if worker is not None:
+                worker.kill()
+                worker = None
+            raise ChildProcessError("Worker process terminated abruptly") from e
+        finally:
+            self.__release_worker(worker)
+        if is_timed_out:
+            raise TimeoutError()
+        if not is_success:
+            raise value
+        return value
+
+    def shutdown(self) -> None:
+        # 待機中のワーカープロセスを終了する（実行中のワーカープロセスは実行が終わったときに終了する）
+        # ワーカープロセスが空くのを待っているスレッドは起こしてIsolatedProcessRunnerShutdownErrorを送出させる
+        with self._lock():
+            self.__is_shutdown = True
+            idle_workers = self.__idle_workers
+            self.__idle_workers = []
+            self.__n_workers -= len(idle_workers)
+            self.__worker_released.wakeAll()
+        for worker in idle_workers:
+            worker.close()
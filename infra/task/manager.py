@@ -1,11 +1,14 @@
 import time
 from contextlib import contextmanager
-from typing import Callable
+from typing import Callable, Iterable
 
-from PyQt5.QtCore import QObject, QTimer, QMutex, pyqtSlot
+from PyQt5.QtCore import QObject, QMutex, QThread, QWaitCondition, QTimer, QMetaObject
 from PyQt5.QtWidgets import qApp
 
+from domain.model.value import StudentID
+from infra.io.resource_usage import ResourceUsageIO
 from infra.repository.global_settings import GlobalSettingsRepository
+from infra.task.concurrency import AdaptiveWorkerLimitController, WorkerLimitStatus
 from infra.task.queue import AbstractTaskQueue, StudentTaskQueue
 from infra.task.task import AbstractTask, AbstractStudentTask
 from util.app_logging import create_logger
@@ -27,6 +30,12 @@ class _TaskStack:
             count += task_queue.count()
         return count
 
+    def count_unstarted(self) -> int:
+        count = 0
+        for task_queue in self._task_queues.values():
+            count += task_queue.count_unstarted()
+        return count
+
     def count_active(self) -> int:
         count = 0
         for task_queue in self._task_queues.values():
@@ -35,21 +44,27 @@ class _TaskStack:
 
     def is_empty(self) -> bool:
         for task_queue in self._task_queues.values():
-            if task_queue.is_empty():
-                return True
-        return False
+            if not task_queue.is_empty():
+                return False
+        return True
 
     def enqueue(self, name: str, task: AbstractTask) -> None:
         self._task_queues[name].enqueue(task)
 
-    def list_unstarted_tasks(self, n_max: int) -> list[AbstractTask]:
-        unstarted_tasks: list[AbstractTask] = []
+    def activate_next_task(self, is_startable: Callable[[AbstractTask], bool]) -> AbstractTask | None:
+        # is_startableを満たす未開始のタスクをひとつ実行中にして返す（なければNone）
         for task_queue in self._task_queues.values():
-            for task in task_queue.iter_unstarted():
-                if len(unstarted_tasks) >= n_max:
-                    return unstarted_tasks
-                unstarted_tasks.append(task)
-        return unstarted_tasks
+            task = task_queue.peek_unstarted(is_startable)
+            if task is not None:
+                task_queue.set_active(task)
+                return task
+        return None
+
+    def set_unstarted(self, name: str, task: AbstractTask, *, elapsed_seconds: float) -> None:
+        self._task_queues[name].set_unstarted(task, elapsed_seconds=elapsed_seconds)
+
+    def set_finished(self, name: str, task: AbstractTask, *, elapsed_seconds: float) -> None:
+        self._task_queues[name].set_finished(task, elapsed_seconds=elapsed_seconds)
 
     def list_active_tasks(self) -> list[AbstractTask]:
         active_tasks: list[AbstractTask] = []
@@ -60,17 +75,13 @@ class _TaskStack:
 
     def dequeue_finished_tasks(self) -> None:
         for task_queue in self._task_queues.values():
-            tasks_to_dequeue = []
-            for task in task_queue.iter_finished():
-                tasks_to_dequeue.append(task)
+            tasks_to_dequeue = list(task_queue.iter_finished())
             for task in tasks_to_dequeue:
                 task_queue.dequeue(task)
 
     def dequeue_unstarted_tasks(self) -> None:
         for task_queue in self._task_queues.values():
-            tasks_to_dequeue = []
-            for task in task_queue.iter_unstarted():
-                tasks_to_dequeue.append(task)
+            tasks_to_dequeue = list(task_queue.iter_unstarted())
             for task in tasks_to_dequeue:
                 task_queue.dequeue(task)
 
@@ -80,25 +91,73 @@ class _TaskStack:
                 task.send_stop()
 
 
+class _TaskWorker(QThread):
+    # タスクを次々に受け取って実行する長寿命のワーカースレッド
+
+    def __init__(self, parent: QObject, *, target: Callable[[], None]):
+        super().__init__(parent)
+        self._target = target
+
+    def run(self):
+        self._target()
+
+
 class TaskManager(QObject):
     # thread-safe
+    # max_workers個のワーカースレッドをプールし，各ワーカーは未開始のタスクをキューから取り出して実行する
+    # タスクごとにスレッドを生成しない
+    # タスクのget_concurrency_groupごとの同時実行数はGlobalSettings.stage_concurrency_limitsで制限する
+    # 1回のrunで複数の処理を並行して実行するタスクには制限の残りの範囲で並行して実行してよい数を与え，その数だけ数える
+    # 続きがあるタスクは一部を実行するたびにキューに戻すので，重い処理を待つ間に他の生徒の軽い処理が進む
+    # GlobalSettings.adaptive_workersが有効なら同時に実行するタスクの数をmax_workersを上限に負荷に応じて増減する
 
     _logger = create_logger()
 
-    def __init__(self, global_settings_repo: GlobalSettingsRepository):
+    _WORKER_LIMIT_TUNING_INTERVAL_MILLISECONDS = 2000
+
+    def __init__(
+            self,
+            global_settings_repo: GlobalSettingsRepository,
+            resource_usage_io: ResourceUsageIO,
+    ):
         super().__init__(qApp)
 
+        self._global_settings_repo = global_settings_repo
+        self._resource_usage_io = resource_usage_io
         self._max_workers = global_settings_repo.get().max_workers
 
+        self.__student_task_queue = StudentTaskQueue()
         self.__stack = _TaskStack()
-        self.__stack.register_task_queue("student", StudentTaskQueue())
+        self.__stack.register_task_queue("student", self.__student_task_queue)
+
+        self.__concurrency_limits: dict[str, int] = {}
+        self.__active_count_by_group: dict[str, int] = {}
 
-        self.__timer = QTimer()
-        self.__timer.setInterval(100)
-        self.__timer.timeout.connect(self.__timer_timeout)  # type: ignore
-        self.__timer.start()
+        # 同時に実行するタスクの数（自動調整が無効ならmax_workers）
+        self.__worker_limit = self._max_workers
+        # 自動調整が無効ならNone
+        self.__worker_limit_controller: AdaptiveWorkerLimitController | None = None
 
         self.__lock = QMutex()
+        self.__task_available = QWaitCondition()
+        self.__task_finished = QWaitCondition()
+        self.__is_shutdown = False
+
+        self.__workers = [
+            _TaskWorker(self, target=self.__worker_loop)
+            for _ in range(self._max_workers)
+        ]
+        for worker in self.__workers:
+            worker.start()
+
+        # 自動調整が有効なときにタスクが追加されたら開始し，自動調整が無効になるかタスクがなくなったら止める
+        self._worker_limit_tuning_timer = QTimer(self)
+        self._worker_limit_tuning_timer.setInterval(self._WORKER_LIMIT_TUNING_INTERVAL_MILLISECONDS)
+        # noinspection PyUnresolvedReferences
+        self._worker_limit_tuning_timer.timeout.connect(self.tune_worker_limit)
+
+        # noinspection PyUnresolvedReferences
+        qApp.aboutToQuit.connect(self.shutdown)
 
     @contextmanager
     def _lock(self):
@@ -120,31 +179,188 @@ class TaskManager(QObject):
         with self._lock():
             return self.__stack.is_empty()
 
-    def enqueue(self, task: AbstractTask):
+    def get_worker_limit_status(self) -> WorkerLimitStatus:
+        with self._lock():
+            controller = self.__worker_limit_controller
+            return WorkerLimitStatus(
+                worker_limit=self.__worker_limit,
+                max_workers=self._max_workers,
+                reason=None if controller is None else controller.reason,
+            )
+
+    def tune_worker_limit(self) -> None:
+        # 負荷を測って同時に実行するタスクの数を見直す（タイマーで定期的に呼ばれる）
+        if not self._global_settings_repo.get().adaptive_workers:
+            self._worker_limit_tuning_timer.stop()
+            with self._lock():
+                if self.__worker_limit_controller is not None:
+                    self.__worker_limit_controller = None
+                    self.__worker_limit = self._max_workers
+                    self.__task_available.wakeAll()
+            return
+        if self.is_empty():
+            # タスクがなければ負荷を測らない（次にタスクが追加されたときにタイマーを開始する）
+            self._worker_limit_tuning_timer.stop()
+            return
+        usage = self._resource_usage_io.get_stat()
         with self._lock():
-            if isinstance(task, AbstractStudentTask):
-                self.__stack.enqueue("student", task)
+            if self.__worker_limit_controller is None:
+                self.__worker_limit_controller = AdaptiveWorkerLimitController(
+                    max_workers=self._max_workers,
+                    initial_worker_limit=self.__worker_limit,
+                )
+            # 上限のために開始を待っているタスクの数
+            if self.__stack.count_active() >= self.__worker_limit:
+                n_waiting_tasks = self.__stack.count_unstarted()
             else:
-                assert False, task
+                n_waiting_tasks = 0
+            decision = self.__worker_limit_controller.update(usage, n_waiting_tasks=n_waiting_tasks)
+            if decision.worker_limit == self.__worker_limit:
+                return
+            self._logger.info(
+                f"Worker limit changed: {self.__worker_limit} -> {decision.worker_limit} "
+                f"({decision.reason})"
+            )
+            if decision.worker_limit > self.__worker_limit:
+                self.__task_available.wakeAll()
+            self.__worker_limit = decision.worker_limit
+
+    @classmethod
+    def _get_task_queue_name(cls, task: AbstractTask) -> str:
+        if isinstance(task, AbstractStudentTask):
+            return "student"
+        else:
+            assert False, task
 
-    @pyqtSlot()
-    def __timer_timeout(self):
+    def bump_student(self, student_id: StudentID) -> bool:
+        # 生徒の未開始のタスクを次に開始させる（未開始のタスクがなければFalse）
         with self._lock():
-            # 未開始のタスクの開始
-            n_max = max(self._max_workers - self.__stack.count_active(), 0)
-            unstarted_tasks = self.__stack.list_unstarted_tasks(n_max)
-            for task in unstarted_tasks:
-                task.start()
-                self._logger.info(f"Task started: {task}")
+            return self.__student_task_queue.bump(student_id)
 
-            # 終了したタスクの削除
-            self.__stack.dequeue_finished_tasks()
+    def set_focused_student_ids(self, student_ids: Iterable[StudentID]) -> None:
+        # TaskSchedulingPolicy.FOCUSED_FIRSTで優先する生徒を設定する
+        with self._lock():
+            self.__student_task_queue.set_focused_student_ids(student_ids)
 
-    def terminate(self, callback: Callable[[str], None]):
+    def enqueue(self, task: AbstractTask):
+        # スケジューリングポリシーと同時実行数の制限の変更は次にタスクを追加したときから反映される
+        global_settings = self._global_settings_repo.get()
+        with self._lock():
+            assert not self.__is_shutdown
+            self.__student_task_queue.set_policy(global_settings.task_scheduling_policy)
+            self.__concurrency_limits = dict(global_settings.stage_concurrency_limits)
+            self.__stack.enqueue(self._get_task_queue_name(task), task)
+            # 待機しているワーカーをひとつ起こす
+            self.__task_available.wakeOne()
+        if global_settings.adaptive_workers and not self._worker_limit_tuning_timer.isActive():
+            # タイマーを持つスレッドで開始する
+            QMetaObject.invokeMethod(self._worker_limit_tuning_timer, "start")
+
+    def __is_startable_unlocked(self, task: AbstractTask) -> bool:
+        if self.__stack.count_active() >= self.__worker_limit:
+            return False
+        group = task.get_concurrency_group()
+        if group is None or group not in self.__concurrency_limits:
+            return True
+        return self.__active_count_by_group.get(group, 0) < self.__concurrency_limits[group]
+
+    def __grant_concurrency_unlocked(self, task: AbstractTask, group: str | None) -> int:
+        # 開始するタスクが並行して実行してよい処理の数を決める（開始できるなら1以上）
+        concurrency = max(1, task.get_requested_concurrency())
+        if group is not None and group in self.__concurrency_limits:
+            concurrency = min(
+                concurrency,
+                self.__concurrency_limits[group] - self.__active_count_by_group.get(group, 0),
+            )
+        return concurrency
+
+    def __take_next_task(self) -> tuple[AbstractTask, str | None, int] | None:  # None if shutdown
+        # 開始できる未開始のタスクが現れるまで待機して取り出す
+        with self._lock():
+            while True:
+                if self.__is_shutdown:
+                    return None
+                task = self.__stack.activate_next_task(self.__is_startable_unlocked)
+                if task is not None:
+                    group = task.get_concurrency_group()
+                    concurrency = self.__grant_concurrency_unlocked(task, group)
+                    task.set_granted_concurrency(concurrency)
+                    if group is not None:
+                        self.__active_count_by_group[group] \
+                            = self.__active_count_by_group.get(group, 0) + concurrency
+                    return task, group, concurrency
+                self.__task_available.wait(self.__lock)
+
+    def __worker_loop(self):
+        # ワーカースレッドで実行される
         while True:
-            # メッセージ
-            with self._lock():
+            next_task = self.__take_next_task()
+            if next_task is None:
+                return
+            task, group, concurrency = next_task
+            self._logger.info(f"Task started: {task}")
+            time_start = time.perf_counter()
+            is_raised = False
+            try:
+                task.run()
+            except Exception:
+                # 例外でワーカーが失われないように記録して次のタスクへ進む
+                self._logger.exception(f"Task failed: {task!r}")
+                task.set_failed()
+                is_raised = True
+            finally:
+                elapsed_seconds = time.perf_counter() - time_start
+                with self._lock():
+                    if group is not None:
+                        self.__active_count_by_group[group] -= concurrency
+                        if self.__worker_limit_controller is not None:
+                            self.__worker_limit_controller.record_latency(group, elapsed_seconds)
+                    if task.has_remaining_work() and not is_raised \
+                            and not task.is_stop_received() and not self.__is_shutdown:
+                        # 続きがあるタスクは未開始に戻す（例外を送出したタスクは続けない）
+                        self.__stack.set_unstarted(
+                            self._get_task_queue_name(task),
+                            task,
+                            elapsed_seconds=elapsed_seconds,
+                        )
+                    else:
+                        # 終了したタスクの削除
+                        self.__stack.set_finished(
+                            self._get_task_queue_name(task),
+                            task,
+                            elapsed_seconds=elapsed_seconds,
+                        )
+                        self.__stack.dequeue_finished_tasks()
+                        self.__task_finished.wakeAll()
+                    # 制限で開始できなかったタスクが開始できるかもしれないので待機しているワーカーをすべて起こす
+                    self.__task_available.wakeAll()
+
+    def shutdown(self):
+        # ワーカースレッドを終了する（アプリケーションの終了時に呼ばれる）
+        with self._lock():
+            self.__is_shutdown = True
+            self.__stack.dequeue_unstarted_tasks()
+            self.__stack.send_stop_to_all_tasks()
+            self.__task_available.wakeAll()
+        for worker in self.__workers:
+            worker.wait()
+
+    def terminate(self, callback: Callable[[str], None]):
+        # 実行中のタスクを停止してすべて終了するまで待つ
+        # タスクが終了するたびにワーカーから起こされるのでポーリングしない
+        with self._lock():
+            # 新たなタスクが開始しないように未開始のタスクを消す
+            self.__stack.dequeue_unstarted_tasks()
+            # すべてのタスクに終了シグナルを送る
+            self.__stack.send_stop_to_all_tasks()
+            while True:
+                # 終了したタスクの削除
+                self.__stack.dequeue_finished_tasks()
+                # タスクが終了しているかを確認
                 n_tasks = self.__stack.count()
+                if n_tasks == 0:
+                    break
+                # メッセージ
                 active_tasks = self.__stack.list_active_tasks()
                 self._logger.info(
                     f"Waiting {n_tasks} tasks to finish\n"
@@ -155,19 +371,4 @@ class TaskManager(QObject):
                     f"{n_tasks}個のタスクが終了するのを待っています・・・\n"
                     + "\n".join(f" - {task!s}" for task in active_tasks[:8]),
                 )
-            with self._lock():
-                # 新たなタスクが開始しないように未開始のタスクを消す
-                self.__stack.dequeue_unstarted_tasks()
-                # すべてのタスクに終了シグナルを送る
-                self.__stack.send_stop_to_all_tasks()
-            # 少し待つ
-            time.sleep(0.1)
-            with self._lock():
-                # 終了したタスクの削除
-                self.__stack.dequeue_finished_tasks()
-                # タスクが終了しているかを確認
-                n_tasks = self.__stack.count()
-                if n_tasks == 0:
-                    break
-            # 少し待つ
-            time.sleep(0.1)
+                self.__task_finished.wait(self.__lock)
@@ -0,0 +1,210 @@
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor, CancelledError, TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import contextmanager
+from typing import Callable, Any
+
+from PyQt5.QtCore import QMutex, QWaitCondition, QDeadlineTimer
+
+from util.app_logging import create_logger
+
+# ワーカープロセス内の状態（_initialize_worker_processで設定される）
+_worker_stop_flags = None
+_worker_progress_queue = None
+
+
+def _initialize_worker_process(stop_flags, progress_queue, initializer, initargs):
+    # ワーカープロセスの起動時に一度だけ呼ばれる
+    global _worker_stop_flags, _worker_progress_queue
+    _worker_stop_flags = stop_flags
+    _worker_progress_queue = progress_queue
+    if initializer is not None:
+        initializer(*initargs)
+
+
+def _run_in_worker_process(slot: int, ticket: int, fn: Callable, args: tuple) -> Any:
+    # ワーカープロセスで実行される
+    # fnにはこのスロットの停止フラグを見るstop_producerと進捗を親プロセスに送るreport_progressを渡す
+    def stop_producer() -> bool:
+        return bool(_worker_stop_flags[slot])
+
+    def report_progress(message: str) -> None:
+        _worker_progress_queue.put((ticket, message))
+
+    try:
+        return fn(*args, stop_producer=stop_producer, report_progress=report_progress)
+    finally:
+        # この実行の進捗がすべて送られたことを知らせる
+        _worker_progress_queue.put((ticket, None))
+
+
+class ProcessPoolTaskRunner:
+    # thread-safe
+    # 関数をワーカープロセスのプールで実行する
+    # 各ワーカープロセスは起動時にinitializerで自身の依存関係を構築する
+    # runはTaskManagerのワーカースレッドから呼ばれ，ワーカープロセスで関数が終了するまでブロックする
+    # 関数はモジュールのトップレベルに定義されpickleできなければならない
+
+    _logger = create_logger()
+
+    _STOP_POLLING_INTERVAL_SECONDS = 0.05
+    _PROGRESS_DRAIN_TIMEOUT_MILLISECONDS = 1000
+
+    def __init__(
+            self,
+            *,
+            max_workers: int,
+            initializer: Callable[..., None] | None = None,
+            initargs: tuple = (),
+    ):
+        self._max_workers = max_workers
+        self._initializer = initializer
+        self._initargs = initargs
+
+        # Windowsでの起動方式に揃える
+        self._context = multiprocessing.get_context("spawn")
+        # スロットごとの停止フラグ（同時に実行される関数はmax_workers個まで）
+        self._stop_flags = self._context.RawArray("b", max_workers)
+        # ワーカープロセスから送られる (ticket, message) の進捗
+        self._progress_queue = self._context.SimpleQueue()
+
+        self.__lock = QMutex()
+        self.__slot_released = QWaitCondition()
+        self.__progress_finished = QWaitCondition()
+        self.__free_slots = list(range(max_workers))
+        self.__next_ticket = 0
+        self.__progress_callbacks: dict[int, Callable[[str], None] | None] = {}
+        self.__is_shutdown = False
+
+        self.__executor = self.__create_executor()
+
+        # アプリケーションの終了を妨げないようにデーモンスレッドで進捗を受け取る
+        self.__progress_listener = threading.Thread(
+            target=self.__listen_progress,
+            name="ProcessPoolTaskRunner-progress",
+            daemon=True,
+        )
+        self.__progress_listener.start()
+
+    @contextmanager
+    def _lock(self):
+        self.__lock.lock()
+        try:
+            yield
+        finally:
+            self.__lock.unlock()
+
+    @property
+    def max_workers(self) -> int:
+        return self._max_workers
+
+    def __create_executor(self) -> ProcessPoolExecutor:
+        return ProcessPoolExecutor(
+            max_workers=self._max_workers,
+            mp_context=self._context,
+            initializer=_initialize_worker_process,
+            initargs=(self._stop_flags, self._progress_queue, self._initializer, self._initargs),
+        )
+
+    def __listen_progress(self):
+        while True:
+            item = self._progress_queue.get()
+            if item is None:  # shutdown
+                return
+            ticket, message = item
+            with self._lock():
+                if ticket not in self.__progress_callbacks:
+                    continue
+                if message is None:
+                    # この実行の進捗はすべて届いた
+                    del self.__progress_callbacks[ticket]
+                    self.__progress_finished.wakeAll()
+                    continue
+                callback = self.__progress_callbacks[ticket]
+            if callback is not None:
+                try:
+                    callback(message)
+                except Exception:
+                    self._logger.exception("Progress callback failed")
+
+    def __acquire_slot(self, progress_callback: Callable[[str], None] | None) -> tuple[int, int]:
+        with self._lock():
+            while not self.__free_slots:
+                self.__slot_released.wait(self.__lock)
+            slot = self.__free_slots.pop()
+            self._stop_flags[slot] = 0
+            ticket = self.__next_ticket
+            self.__next_ticket += 1
+            self.__progress_callbacks[ticket] = progress_callback
+            return slot, ticket
+
+    def __release_slot(self, slot: int, ticket: int, *, wait_progress: bool) -> None:
+        with self._lock():
+            if wait_progress:
+                # ワーカープロセスは結果を返す前に進捗の終端を送っているのですぐに届く
+                # 関数がワーカープロセスに渡らなかった場合（pickleの失敗など）は終端が届かないので待ちすぎない
+                deadline = QDeadlineTimer(self._PROGRESS_DRAIN_TIMEOUT_MILLISECONDS)
+                while ticket in self.__progress_callbacks:
+                    if not self.__progress_finished.wait(self.__lock, deadline):
+                        break
+            self.__progress_callbacks.pop(ticket, None)
+            self._stop_flags[slot] = 0
+            self.__free_slots.append(slot)
+            self.__slot_released.wakeOne()
+
+    def run(
+            self,
+            fn: Callable[..., Any],
+            *args,
+            stop_producer: Callable[[], bool],  # 停止するときTrueを受け取る
+            progress_callback: Callable[[str], None] | None = None,  # 進捗受信スレッドから呼ばれる
+    ) -> Any:
+        # fn(*args, stop_producer=..., report_progress=...)をワーカープロセスで実行して結果を返す
+        # fnが送出した例外はこのスレッドで送出される
+        slot, ticket = self.__acquire_slot(progress_callback)
+        wait_progress = False
+        try:
+            with self._lock():
+                assert not self.__is_shutdown
+                executor = self.__executor
+            future = executor.submit(_run_in_worker_process, slot, ticket, fn, args)
+            while True:
+                try:
+                    result = future.result(timeout=self._STOP_POLLING_INTERVAL_SECONDS)
+                except FutureTimeoutError:
+                    if stop_producer():
+                        # ワーカープロセスのstop_producerがTrueを返すようになる
+                        self._stop_flags[slot] = 1
+                    continue
+                except BrokenProcessPool:
+                    # ワーカープロセスが異常終了するとプールは使えなくなるので作り直す
+                    self._logger.error("Worker process terminated abruptly, recreating process pool")
+                    with self._lock():
+                        if self.__executor is executor and not self.__is_shutdown:
+                            self.__executor = self.__create_executor()
+                    raise
+                except CancelledError:
+                    # シャットダウンにより開始されなかった
+                    raise
+                except BaseException:
+                    wait_progress = True
+                    raise
+                else:
+                    wait_progress = True
+                    return result
+        finally:
+            self.__release_slot(slot, ticket, wait_progress=wait_progress)
+
+    def shutdown(self) -> None:
+        # 実行中の関数に停止を要求し，ワーカープロセスを終了する
+        with self._lock():
+            if self.__is_shutdown:
+                return
+            self.__is_shutdown = True
+            for slot in range(self._max_workers):
+                self._stop_flags[slot] = 1
+            executor = self.__executor
+        executor.shutdown(wait=True, cancel_futures=True)
+        self._progress_queue.put(None)
+        self.__progress_listener.join()
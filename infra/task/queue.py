@@ -1,6 +1,8 @@
+import heapq
 from abc import ABC, abstractmethod
-from typing import TypeVar, Generic, Iterable
+from typing import TypeVar, Generic, Iterable, NamedTuple, Callable
 
+from domain.model.global_settings import TaskSchedulingPolicy
 from domain.model.value import StudentID
 from infra.task.task import AbstractTask, AbstractStudentTask
 
@@ -8,6 +10,10 @@ T = TypeVar("T", bound=AbstractTask)
 
 
 class AbstractTaskQueue(ABC, Generic[T]):
+    # タスクの状態（未開始・実行中・終了）はキューが管理する
+    # 状態の遷移はTaskManagerがset_active/set_finishedで通知する
+    # 状態ごとのタスクの数はO(1)で取得できるように実装する
+
     @abstractmethod
     def iter_unstarted(self) -> Iterable[T]:
         # キューの開始されていないタスクをイテレートする
@@ -28,19 +34,48 @@ class AbstractTaskQueue(ABC, Generic[T]):
         # すべてのタスクをイテレートする
         raise NotImplementedError()
 
-    def count(self) -> int:
-        # キュー内のすべてのタスクの数を数える
-        return sum(1 for _ in self.iter_all())
+    @abstractmethod
+    def count_unstarted(self) -> int:
+        # キュー内で開始されていないタスクの数を数える
+        raise NotImplementedError()
 
+    @abstractmethod
     def count_active(self) -> int:
         # キュー内で実行中のタスクの数を数える
-        return sum(1 for _ in self.iter_active())
+        raise NotImplementedError()
+
+    @abstractmethod
+    def count_finished(self) -> int:
+        # キュー内で終了したタスクの数を数える
+        raise NotImplementedError()
+
+    def count(self) -> int:
+        # キュー内のすべてのタスクの数を数える
+        return self.count_unstarted() + self.count_active() + self.count_finished()
 
     def is_empty(self) -> bool:
-        # キュー内で実行中のタスクが存在するか検証する（高速な実装）
-        for _ in self.iter_all():
-            return False
-        return True
+        # キュー内にタスクが存在しないか検証する
+        return self.count() == 0
+
+    @abstractmethod
+    def peek_unstarted(self, is_startable: Callable[[T], bool]) -> T | None:
+        # is_startableを満たす未開始のタスクのうち次に開始するべきタスクを返す（なければNone）
+        raise NotImplementedError()
+
+    @abstractmethod
+    def set_active(self, task: T) -> None:
+        # 未開始のタスクを実行中にする
+        raise NotImplementedError()
+
+    @abstractmethod
+    def set_unstarted(self, task: T, *, elapsed_seconds: float) -> None:
+        # 続きがある実行中のタスクを未開始に戻す
+        raise NotImplementedError()
+
+    @abstractmethod
+    def set_finished(self, task: T, *, elapsed_seconds: float) -> None:
+        # 実行中のタスクを終了済みにする
+        raise NotImplementedError()
 
     @abstractmethod
     def enqueue(self, task: T) -> None:
@@ -53,32 +88,260 @@ class AbstractTaskQueue(ABC, Generic[T]):
         raise NotImplementedError()
 
 
+class _TaskRunRecord(NamedTuple):
+    elapsed_seconds: float
+    is_failed: bool
+
+
 class StudentTaskQueue(AbstractTaskQueue[AbstractStudentTask]):
+    # 未開始のタスクはbumpで割り込ませたものを最優先し，残りはスケジューリングポリシーに従って開始する
+    # 未開始に戻されたタスクは最初に追加されたときの順番で扱う
+    # 未開始のタスクはポリシーごとの順番のヒープにも入れておき，次に開始するタスクを未開始のタスクをすべて見ずに選ぶ
+    # ヒープからは消さずに，開始されたり消されたりしたタスクの項目は先頭に来たときに捨てる
+
     def __init__(self):
-        self._q: dict[StudentID, AbstractStudentTask] = {}
+        # 状態ごとに挿入順を保つdictで管理する
+        self._unstarted: dict[StudentID, AbstractStudentTask] = {}
+        self._active: dict[StudentID, AbstractStudentTask] = {}
+        self._finished: dict[StudentID, AbstractStudentTask] = {}
+        # 追加された順番
+        self._sequence: dict[StudentID, int] = {}
+        self._next_sequence = 0
+        # 未開始に戻されるまでに実行した時間
+        self._elapsed_seconds: dict[StudentID, float] = {}
+
+        # 割り込ませたタスクの学籍番号（後から割り込ませたものほど先に開始する）
+        # 続きがあるタスクは終了するまで割り込ませたままにする
+        self._bumped: dict[StudentID, None] = {}
+        self._policy = TaskSchedulingPolicy.FIFO
+        self._focused_student_ids: list[StudentID] = []
+        # タスクの種類と学籍番号ごとの直近の実行の記録
+        self._run_records: dict[tuple[type, StudentID], _TaskRunRecord] = {}
+        # タスクの種類ごとの直近の実行の所要時間の合計と記録の数（平均の見積もりに使う）
+        self._elapsed_seconds_sum_by_task_type: dict[type, float] = {}
+        self._n_run_records_by_task_type: dict[type, int] = {}
+
+        # 未開始のタスクのヒープ（項目の最後の2つは追加された順番と学籍番号）
+        # 追加された順
+        self._fifo_heap: list[tuple[int, StudentID]] = []
+        # 前回失敗したタスクの追加された順
+        self._failed_heap: list[tuple[int, StudentID]] = []
+        # 実行の記録があるタスクの前回の所要時間と追加された順
+        self._recorded_heap: list[tuple[float, int, StudentID]] = []
+        # 実行の記録がないタスクの種類ごとの追加された順（同じ種類なら見積もりは同じ平均になる）
+        self._unrecorded_heaps: dict[type, list[tuple[int, StudentID]]] = {}
+
+    def set_policy(self, policy: TaskSchedulingPolicy) -> None:
+        self._policy = policy
+
+    def set_focused_student_ids(self, student_ids: Iterable[StudentID]) -> None:
+        self._focused_student_ids = list(student_ids)
+
+    def bump(self, student_id: StudentID) -> bool:
+        # 未開始か実行中のタスクを他のタスクより優先する（該当するタスクがなければFalse）
+        if student_id not in self._unstarted and student_id not in self._active:
+            return False
+        self._bumped.pop(student_id, None)
+        self._bumped[student_id] = None
+        return True
 
     def iter_unstarted(self) -> Iterable[AbstractStudentTask]:
-        for task in self._q.values():
-            if not task.isRunning() and not task.isFinished():
-                yield task
+        yield from self._unstarted.values()
 
     def iter_active(self) -> Iterable[AbstractStudentTask]:
-        for task in self._q.values():
-            if task.isRunning():
-                yield task
+        yield from self._active.values()
 
     def iter_finished(self) -> Iterable[AbstractStudentTask]:
-        for task in self._q.values():
-            if task.isFinished():
-                yield task
+        yield from self._finished.values()
 
-    def iter_all(self) -> Iterable[T]:
-        for task in self._q.values():
-            yield task
+    def iter_all(self) -> Iterable[AbstractStudentTask]:
+        yield from self._unstarted.values()
+        yield from self._active.values()
+        yield from self._finished.values()
+
+    def count_unstarted(self) -> int:
+        return len(self._unstarted)
+
+    def count_active(self) -> int:
+        return len(self._active)
+
+    def count_finished(self) -> int:
+        return len(self._finished)
+
+    def __is_unstarted_item(self, item: tuple) -> bool:
+        sequence, student_id = item[-2:]
+        return student_id in self._unstarted and self._sequence[student_id] == sequence
+
+    def __push_heap(self, heap: list[tuple], item: tuple) -> None:
+        heapq.heappush(heap, item)
+        # 今のポリシーで使わないヒープには先頭に来ない項目が溜まるので，未開始のタスクの数に比べて増えすぎたら捨てる
+        if len(heap) > 2 * len(self._unstarted) + 16:
+            heap[:] = set(filter(self.__is_unstarted_item, heap))
+            heapq.heapify(heap)
+
+    def __push_unstarted(self, task: AbstractStudentTask) -> None:
+        # 未開始になったタスクをヒープに入れる
+        # ヒープに残っている同じタスクの項目とは同じ順番になるので重複しても選ばれる順番は変わらない
+        sequence = self._sequence[task.student_id]
+        self.__push_heap(self._fifo_heap, (sequence, task.student_id))
+        record = self._run_records.get((type(task), task.student_id))
+        if record is None:
+            self.__push_heap(
+                self._unrecorded_heaps.setdefault(type(task), []),
+                (sequence, task.student_id),
+            )
+        else:
+            self.__push_heap(self._recorded_heap, (record.elapsed_seconds, sequence, task.student_id))
+            if record.is_failed:
+                self.__push_heap(self._failed_heap, (sequence, task.student_id))
+
+    def __peek_heap(
+            self,
+            heap: list[tuple],
+            is_startable: Callable[[AbstractStudentTask], bool],
+    ) -> tuple[tuple, AbstractStudentTask] | None:
+        # ヒープの順番でis_startableを満たす最初の未開始のタスクとその項目を返す（なければNone）
+        skipped_items = []
+        found = None
+        while heap:
+            item = heap[0]
+            if not self.__is_unstarted_item(item):
+                # 開始されたか消されたタスクの項目
+                heapq.heappop(heap)
+                continue
+            task = self._unstarted[item[-1]]
+            if is_startable(task):
+                found = item, task
+                break
+            skipped_items.append(heapq.heappop(heap))
+        for item in skipped_items:
+            heapq.heappush(heap, item)
+        return found
+
+    def __peek_first_unstarted(
+            self,
+            heap: list[tuple[int, StudentID]],
+            is_startable: Callable[[AbstractStudentTask], bool],
+    ) -> AbstractStudentTask | None:
+        found = self.__peek_heap(heap, is_startable)
+        return None if found is None else found[1]
+
+    def __peek_focused_unstarted(
+            self,
+            is_startable: Callable[[AbstractStudentTask], bool],
+    ) -> AbstractStudentTask | None:
+        for student_id in self._focused_student_ids:
+            task = self._unstarted.get(student_id)
+            if task is not None and is_startable(task):
+                return task
+        return self.__peek_first_unstarted(self._fifo_heap, is_startable)
+
+    def __peek_shortest_expected_unstarted(
+            self,
+            is_startable: Callable[[AbstractStudentTask], bool],
+    ) -> AbstractStudentTask | None:
+        # 実行したことのない生徒は同じ種類のタスクの所要時間の平均だけかかると見積もる
+        # 同じ見積もりなら追加された順にする
+        candidates: list[tuple[float, int, AbstractStudentTask]] = []
+        found = self.__peek_heap(self._recorded_heap, is_startable)
+        if found is not None:
+            (elapsed_seconds, sequence, _), task = found
+            candidates.append((elapsed_seconds, sequence, task))
+        for task_type, heap in self._unrecorded_heaps.items():
+            found = self.__peek_heap(heap, is_startable)
+            if found is None:
+                continue
+            (sequence, _), task = found
+            n_run_records = self._n_run_records_by_task_type.get(task_type, 0)
+            if n_run_records == 0:
+                mean_elapsed_seconds = 0.0
+            else:
+                mean_elapsed_seconds = self._elapsed_seconds_sum_by_task_type[task_type] / n_run_records
+            candidates.append((mean_elapsed_seconds, sequence, task))
+        if not candidates:
+            return None
+        return min(candidates, key=lambda candidate: candidate[:2])[2]
+
+    def __peek_failed_unstarted(
+            self,
+            is_startable: Callable[[AbstractStudentTask], bool],
+    ) -> AbstractStudentTask | None:
+        task = self.__peek_first_unstarted(self._failed_heap, is_startable)
+        if task is not None:
+            return task
+        return self.__peek_first_unstarted(self._fifo_heap, is_startable)
+
+    def peek_unstarted(
+            self,
+            is_startable: Callable[[AbstractStudentTask], bool],
+    ) -> AbstractStudentTask | None:
+        for student_id in reversed(self._bumped):
+            task = self._unstarted.get(student_id)
+            if task is not None and is_startable(task):
+                return task
+        if self._policy == TaskSchedulingPolicy.FIFO:
+            return self.__peek_first_unstarted(self._fifo_heap, is_startable)
+        elif self._policy == TaskSchedulingPolicy.FOCUSED_FIRST:
+            return self.__peek_focused_unstarted(is_startable)
+        elif self._policy == TaskSchedulingPolicy.SHORTEST_EXPECTED_FIRST:
+            return self.__peek_shortest_expected_unstarted(is_startable)
+        elif self._policy == TaskSchedulingPolicy.FAILED_FIRST:
+            return self.__peek_failed_unstarted(is_startable)
+        else:
+            assert False, self._policy
+
+    def set_active(self, task: AbstractStudentTask) -> None:
+        del self._unstarted[task.student_id]
+        self._active[task.student_id] = task
+
+    def set_unstarted(self, task: AbstractStudentTask, *, elapsed_seconds: float) -> None:
+        del self._active[task.student_id]
+        self._unstarted[task.student_id] = task
+        self.__push_unstarted(task)
+        self._elapsed_seconds[task.student_id] \
+            = self._elapsed_seconds.get(task.student_id, 0.0) + elapsed_seconds
+
+    def set_finished(self, task: AbstractStudentTask, *, elapsed_seconds: float) -> None:
+        del self._active[task.student_id]
+        self._finished[task.student_id] = task
+        self._bumped.pop(task.student_id, None)
+        elapsed_seconds += self._elapsed_seconds.pop(task.student_id, 0.0)
+        if not task.is_stop_received():  # 途中で止めたタスクの記録は見積もりに使えない
+            task_type = type(task)
+            previous_record = self._run_records.get((task_type, task.student_id))
+            self._run_records[task_type, task.student_id] = _TaskRunRecord(
+                elapsed_seconds=elapsed_seconds,
+                is_failed=task.is_failed(),
+            )
+            # 平均の見積もりのための合計を更新する
+            self._elapsed_seconds_sum_by_task_type[task_type] \
+                = self._elapsed_seconds_sum_by_task_type.get(task_type, 0.0) + elapsed_seconds
+            if previous_record is None:
+                self._n_run_records_by_task_type[task_type] \
+                    = self._n_run_records_by_task_type.get(task_type, 0) + 1
+            else:
+                self._elapsed_seconds_sum_by_task_type[task_type] -= previous_record.elapsed_seconds
+
+    def _contains(self, student_id: StudentID) -> bool:
+        return (
+                student_id in self._unstarted
+                or student_id in self._active
+                or student_id in self._finished
+        )
 
     def enqueue(self, task: AbstractStudentTask) -> None:
-        assert task.student_id not in self._q
-        self._q[task.student_id] = task
+        assert not self._contains(task.student_id)
+        self._unstarted[task.student_id] = task
+        self._sequence[task.student_id] = self._next_sequence
+        self._next_sequence += 1
+        self.__push_unstarted(task)
 
     def dequeue(self, task: AbstractStudentTask) -> None:
-        del self._q[task.student_id]
+        self._bumped.pop(task.student_id, None)
+        self._elapsed_seconds.pop(task.student_id, None)
+        for q in (self._unstarted, self._active, self._finished):
+            if task.student_id in q:
+                del q[task.student_id]
+                del self._sequence[task.student_id]
+                return
+        raise KeyError(task.student_id)
@@ -1,14 +1,14 @@
-from PyQt5.QtCore import QThread, QObject
-
 from domain.model.value import StudentID
-from util.app_logging import create_logger
 
 
-class AbstractTask(QThread):
-    def __init__(self, parent: QObject):
-        super().__init__(parent)
+class AbstractTask:
+    # TaskManagerのワーカースレッドで実行されるタスクの記述子
+    # スレッドやロガーなどの重いオブジェクトは持たない
 
+    def __init__(self):
         self.__stop = False
+        self.__failed = False
+        self.__granted_concurrency = 1
 
     def send_stop(self) -> None:
         self.__stop = True
@@ -16,12 +16,42 @@ class AbstractTask(QThread):
     def is_stop_received(self) -> bool:
         return self.__stop
 
+    def set_failed(self) -> None:
+        # タスクの対象でエラーが起きたことを記録する（スケジューリングに使われる）
+        self.__failed = True
+
+    def is_failed(self) -> bool:
+        return self.__failed
+
+    def get_concurrency_group(self) -> str | None:
+        # 次のrunで実行する処理の種類（TaskManagerが種類ごとに同時実行数を制限する）
+        # Noneなら制限しない
+        return None
+
+    def get_requested_concurrency(self) -> int:
+        # 次のrunで並行して実行したい処理の数（種類ごとの同時実行数にはこの数だけ数えられる）
+        return 1
+
+    def set_granted_concurrency(self, concurrency: int) -> None:
+        # 次のrunで並行して実行してよい処理の数（TaskManagerが開始する前に設定する）
+        self.__granted_concurrency = concurrency
+
+    def get_granted_concurrency(self) -> int:
+        return self.__granted_concurrency
+
+    def has_remaining_work(self) -> bool:
+        # runが処理の一部だけを実行して続きがあるならTrue
+        # TaskManagerはタスクを未開始に戻して他のタスクと同じようにスケジュールし直す
+        return False
+
+    def run(self) -> None:
+        raise NotImplementedError()
+
 
 class AbstractStudentTask(AbstractTask):
-    def __init__(self, parent: QObject, student_id: StudentID):
-        super().__init__(parent)
+    def __init__(self, student_id: StudentID):
+        super().__init__()
         self._student_id = student_id
-        self._logger = create_logger(name=f"{type(self).__name__}({str(student_id)})")
 
     @property
     def student_id(self):
@@ -141,7 +141,17 @@ def main():
             assert False, result
         # Qtのイベントループに入る
         _ = window  # C++に解放されないようにインスタンスを保つ
-        sys.exit(app.exec_())
+        exit_code = app.exec_()
+        # 書き込みを待っている生徒の結果を書き込む
+        from application.dependency.usecase import get_student_stage_result_flush_usecase
+        get_student_stage_result_flush_usecase().execute()
+        # ワーカースレッドとワーカープロセスを終了する（タスクはaboutToQuitで終了済み）
+        from application.dependency.task import shutdown_workers
+        shutdown_workers()
+        # 開いたままのデータベースへの接続を閉じる（WALの内容がデータベースに書き戻される）
+        from application.dependency.external_io import get_project_database_io
+        get_project_database_io().close_all()
+        sys.exit(exit_code)
     else:  # 応答がキャンセルなら
         pass  # 何もしない
 
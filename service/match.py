@@ -1,43 +1,95 @@
-import copy
 import re
+import time
+from abc import ABC, abstractmethod
 from datetime import datetime
+from typing import Callable, Iterator
 
+from domain.error import MatchServiceError
+from domain.model.output_file import OutputFile
 from domain.model.output_file_test_result import NonmatchedToken, MatchedToken, MatchResult
-from domain.model.pattern import PatternList
-from domain.model.test_config_options import TestConfigOptions
+from domain.model.pattern import PatternList, CompiledPatternList, AbstractPatternList, RegexPattern
+from domain.model.test_config_options import TestConfigOptions, MatchMode
+from infra.cache.compiled_pattern import CompiledPatternListCache
+from infra.task.isolated_process import IsolatedProcessRunner, IsolatedProcessRunnerShutdownError
 from util.app_logging import create_logger
-from util.zen_han import zen_to_han
+from util.zen_han import zen_to_han, iter_zen_to_han
 
 
-class _Matcher:
+_UNSUPPORTED_ENCODING_REASON = "出力ファイルをUTF-8の文字列として読めません"
+
+
+def _create_timeout_reason(timeout: float) -> str:
+    return f"パターンのマッチングが制限時間（{timeout:g}秒）を超えたため中断しました"
+
+
+class _MatchDeadline:
+    # 1回のマッチングにかけられる時間の上限（Noneなら制限しない）
+    def __init__(self, timeout: float | None):
+        self._timeout = timeout
+        self._deadline = None if timeout is None else time.monotonic() + timeout
+
+    def check(self) -> None:
+        if self._deadline is not None and time.monotonic() > self._deadline:
+            raise MatchServiceError(
+                reason=_create_timeout_reason(self._timeout),
+            )
+
+    def get_remaining_seconds(self) -> float:
+        # 残りの時間（制限しないときは使わない）
+        assert self._deadline is not None
+        self.check()
+        return self._deadline - time.monotonic()
+
+
+class _BacktrackingRequired(Exception):
+    # パターンを順に探す方式ではBACKTRACKINGと同じ結果になるかが分からない
+    pass
+
+
+class _Matcher(ABC):
     _logger = create_logger()
 
     def __init__(
             self,
             *,
-            content_string: str,
-            patterns: PatternList,
-            test_config_options: TestConfigOptions,
+            compiled_patterns: CompiledPatternList,
+            deadline: _MatchDeadline,
     ):
-        self._content_string = zen_to_han(content_string)
-        self._patterns = copy.deepcopy(patterns)
-        self._test_config_options = test_config_options
+        self._compiled_patterns = compiled_patterns
+        self._patterns = compiled_patterns.patterns
+        self._deadline = deadline
+
+    @abstractmethod
+    def _match_expected_patterns(self) -> list[tuple[int, int]] | None:
+        # 期待されるパターンのそれぞれのspanを返す（マッチしなければNone）
+        raise NotImplementedError()
+
+    @abstractmethod
+    def _match_unexpected_patterns(
+            self,
+            unexpected_patterns: AbstractPatternList,
+            unexpected_regex: re.Pattern,
+            interval_begin: int,
+            interval_end: int | None,  # Noneなら出力の終わりまで
+    ) -> list[tuple[int, int]] | None:
+        # 期待されないパターンの連番のグループのそれぞれの区間内でのspanを返す（マッチしなければNone）
+        # 区間はそこだけを切り出した文字列として扱い，spanも区間の始まりからの位置で返す
+        # グループは出力の前のものから順に渡される
+        raise NotImplementedError()
 
     def get_best_token_matches(self) -> tuple[str, list[MatchedToken], list[NonmatchedToken]]:
-        # 期待されるパターンと期待されないパターンを分離
-        expected_patterns = self._patterns.expected_patterns
+        # 期待されるパターンと期待されないパターンはコンパイル時に分離済み
+        expected_patterns = self._compiled_patterns.expected_patterns
 
         matched_tokens: list[MatchedToken] = []
         nonmatched_tokens: list[NonmatchedToken] = []
 
         # 期待されるパターンのマッチング
-        regex_pattern, flags = expected_patterns.to_regex_pattern(
-            ignore_case=self._test_config_options.ignore_case,
-        )
-        expected_pattern_match_result \
-            = re.fullmatch(regex_pattern, self._content_string, flags=flags)
+        regex_pattern = self._compiled_patterns.expected_regex.pattern
+        expected_spans = self._match_expected_patterns()
+        self._deadline.check()
 
-        if expected_pattern_match_result is None:
+        if expected_spans is None:
             # 期待されるパターンがマッチしない場合
             for pattern in self._patterns:
                 nonmatched_tokens.append(
@@ -48,14 +100,11 @@ class _Matcher:
             return regex_pattern, matched_tokens, nonmatched_tokens
 
         # 期待されるパターンがマッチした場合
-        group_dict = expected_pattern_match_result.groupdict()
-        spans: dict[int, tuple[int, int]] = {}  # pattern index -> span
-        for pattern in expected_patterns:
-            is_found = group_dict[pattern.regex_group_name]
-            begin = expected_pattern_match_result.start(pattern.regex_group_name)
-            end = expected_pattern_match_result.end(pattern.regex_group_name)
+        # pattern index -> span（パターンの位置をそのまま添字にする）
+        spans: list[tuple[int, int] | None] = [None] * len(self._patterns)
+        for pattern, (begin, end) in zip(expected_patterns, expected_spans):
             spans[pattern.index] = begin, end
-            if is_found:
+            if begin < end:
                 matched_tokens.append(
                     MatchedToken(
                         begin=begin,
@@ -64,6 +113,7 @@ class _Matcher:
                     )
                 )
             else:
+                # 空文字列にしかマッチしないパターンは見つからなかったものとする
                 nonmatched_tokens.append(
                     NonmatchedToken(
                         pattern=pattern,
@@ -71,25 +121,26 @@ class _Matcher:
                 )
 
         # 期待されないパターンを順序付きでマッチング
-        for unexpected_patterns in self._patterns.iter_unexpected_patterns():
+        for unexpected_patterns, unexpected_regex in self._compiled_patterns.unexpected_regexes:
             if unexpected_patterns.first_pattern_index == self._patterns.first_pattern_index:
                 interval_begin = 0
             else:
                 interval_begin = spans[unexpected_patterns.first_pattern_index - 1][1]
 
             if unexpected_patterns.last_pattern_index == self._patterns.last_pattern_index:
-                interval_end = len(self._content_string)
+                interval_end = None
             else:
                 interval_end = spans[unexpected_patterns.last_pattern_index + 1][0]
 
-            interval_text = self._content_string[interval_begin:interval_end]
-
-            regex_pattern, flags = unexpected_patterns.to_regex_pattern(
-                ignore_case=self._test_config_options.ignore_case,
+            regex_pattern = unexpected_regex.pattern
+            unexpected_spans = self._match_unexpected_patterns(
+                unexpected_patterns,
+                unexpected_regex,
+                interval_begin,
+                interval_end,
             )
-            unexpected_pattern_match_result \
-                = re.search(regex_pattern, interval_text, flags=flags)
-            if unexpected_pattern_match_result is None:
+            self._deadline.check()
+            if unexpected_spans is None:
                 for p in unexpected_patterns:
                     nonmatched_tokens.append(
                         NonmatchedToken(
@@ -97,9 +148,7 @@ class _Matcher:
                         )
                     )
             else:
-                for p in unexpected_patterns:
-                    begin = unexpected_pattern_match_result.start(p.regex_group_name)
-                    end = unexpected_pattern_match_result.end(p.regex_group_name)
+                for p, (begin, end) in zip(unexpected_patterns, unexpected_spans):
                     matched_tokens.append(
                         MatchedToken(
                             begin=interval_begin + begin,
@@ -111,28 +160,419 @@ class _Matcher:
         return regex_pattern, matched_tokens, nonmatched_tokens
 
 
+class _InMemoryMatcher(_Matcher, ABC):
+    # 出力全体を1つの文字列にしてマッチングする
+
+    def __init__(self, *, content_string: str, **kwargs):
+        super().__init__(**kwargs)
+        self._content_string = zen_to_han(content_string)
+
+
+class _BacktrackingMatcher(_InMemoryMatcher):
+    # パターン全体を1つの正規表現にしてマッチングする
+    # 長い出力では指数的にバックトラックすることがあり，reのマッチングの途中では制限時間を確かめられない
+
+    def _match_expected_patterns(self) -> list[tuple[int, int]] | None:
+        m = self._compiled_patterns.expected_regex.fullmatch(self._content_string)
+        if m is None:
+            return None
+        return [m.span(pattern.regex_group_name) for pattern in self._compiled_patterns.expected_patterns]
+
+    def _match_unexpected_patterns(
+            self,
+            unexpected_patterns: AbstractPatternList,
+            unexpected_regex: re.Pattern,
+            interval_begin: int,
+            interval_end: int | None,
+    ) -> list[tuple[int, int]] | None:
+        m = unexpected_regex.search(self._content_string[interval_begin:interval_end])
+        if m is None:
+            return None
+        return [m.span(p.regex_group_name) for p in unexpected_patterns]
+
+
+class _LinearMatcher(_InMemoryMatcher):
+    # パターンごとに前のパターンの終わりから最も左にあるものを探す
+    # パターンの間の任意の文字列でバックトラックしないので，出力の長さに対して線形の時間で終わる
+    # 前のパターンが長くマッチしすぎて後のパターンが見つからなくなっても戻ってやり直さない
+    #
+    # すべてのパターンが見つかったときは，全体の正規表現がバックトラックして最初に見つける一致と同じになる
+    # （前のパターンを最も左の位置と優先される長さで一致させた分岐が最初に試されて成功するため）
+    # 見つからなかったパターンが区間のどこにもなければ全体の正規表現も一致しない
+    # is_backtracking_result_requiredならこのどちらでもないときに_BacktrackingRequiredを送出する
+
+    def __init__(self, *, is_backtracking_result_required: bool = False, **kwargs):
+        super().__init__(**kwargs)
+        self._is_backtracking_result_required = is_backtracking_result_required
+
+    def _search_in_order(
+            self,
+            patterns: AbstractPatternList,
+            text: str,
+    ) -> list[tuple[int, int]] | None:
+        spans = []
+        pos = 0
+        for pattern in patterns:
+            self._deadline.check()
+            regex = self._compiled_patterns.pattern_regexes[pattern.index]
+            m = regex.search(text, pos)
+            if m is None:
+                if self._is_backtracking_result_required and regex.search(text) is not None:
+                    raise _BacktrackingRequired()
+                return None
+            spans.append(m.span())
+            pos = m.end()
+        return spans
+
+    def _match_expected_patterns(self) -> list[tuple[int, int]] | None:
+        return self._search_in_order(self._compiled_patterns.expected_patterns, self._content_string)
+
+    def _match_unexpected_patterns(
+            self,
+            unexpected_patterns: AbstractPatternList,
+            unexpected_regex: re.Pattern,
+            interval_begin: int,
+            interval_end: int | None,
+    ) -> list[tuple[int, int]] | None:
+        return self._search_in_order(
+            unexpected_patterns,
+            self._content_string[interval_begin:interval_end],
+        )
+
+
+class _StreamingTextWindow:
+    # チャンクごとに読み進めながら正規表現で探す文字列の窓
+    # 探し終えた部分は捨て，一致の途中かもしれない末尾のcontext_size文字だけを残す
+    # context_size文字より短い一致は出力全体を1つの文字列にして探した場合と同じ位置に見つかる
+
+    def __init__(self, chunks: Iterator[str], *, context_size: int, deadline: _MatchDeadline):
+        self._chunks = chunks
+        self._context_size = context_size
+        self._deadline = deadline
+        self._buffer = ""
+        self._offset = 0  # _buffer[0]の位置
+        self._is_eof = False
+
+    def __read_next_chunk(self) -> None:
+        self._deadline.check()
+        chunk = next(self._chunks, None)
+        if chunk is None:
+            self._is_eof = True
+        else:
+            self._buffer += chunk
+
+    def __discard_before(self, pos: int) -> None:
+        # \bなどの後読みのためにposの直前の1文字は残す
+        n = pos - 1 - self._offset
+        if n > 0:
+            self._buffer = self._buffer[n:]
+            self._offset += n
+
+    def search(self, regex: re.Pattern, pos: int) -> tuple[int, int] | None:
+        # pos以降で最も左にある一致のspanを返す
+        while True:
+            self.__discard_before(pos)
+            m = regex.search(self._buffer, pos - self._offset)
+            if m is not None and (self._is_eof or m.end() + self._context_size <= len(self._buffer)):
+                # 続きを読んでもこれより左の一致が見つかることはない
+                return self._offset + m.start(), self._offset + m.end()
+            if self._is_eof:
+                return None
+            if m is None:
+                # 末尾のcontext_size文字より前から始まる一致はもうない
+                pos = max(pos, self._offset + len(self._buffer) - self._context_size)
+            self.__read_next_chunk()
+
+
+class _ChunkCursor:
+    # チャンクを先頭から順に読み，指定した範囲の部分だけを取り出す
+    def __init__(self, chunks: Iterator[str]):
+        self._chunks = chunks
+        self._chunk = ""
+        self._chunk_offset = 0  # _chunk[0]の位置
+
+    def iter_range(self, begin: int, end: int | None) -> Iterator[str]:
+        # 範囲は前回より後ろでなければならない
+        while True:
+            chunk_end = self._chunk_offset + len(self._chunk)
+            if chunk_end <= begin:
+                chunk = next(self._chunks, None)
+                if chunk is None:
+                    return
+                self._chunk = chunk
+                self._chunk_offset = chunk_end
+                continue
+            if end is not None and self._chunk_offset >= end:
+                return
+            lo = max(begin - self._chunk_offset, 0)
+            hi = len(self._chunk) if end is None else min(end - self._chunk_offset, len(self._chunk))
+            yield self._chunk[lo:hi]
+            begin = self._chunk_offset + hi
+            if end is not None and begin >= end:
+                return
+
+
+class _StreamingLinearMatcher(_Matcher):
+    # _LinearMatcherと同じ方式で，出力全体を1つの文字列にせずにチャンクごとに読み進めながらマッチングする
+    # 期待されるパターンを探すときと期待されないパターンを探すときの2回だけ出力を先頭から読む
+    # （is_backtracking_result_requiredでパターンが見つからなかったときは区間をもう一度読む）
+    # 利用者の正規表現のように長さや先読みに制限のないパターンには使えない
+
+    def __init__(
+            self,
+            *,
+            iter_chunks: Callable[[], Iterator[str]],  # 全角を半角にノーマライズした出力のチャンク
+            context_size: int,
+            is_backtracking_result_required: bool = False,  # _LinearMatcherと同じ
+            **kwargs,
+    ):
+        super().__init__(**kwargs)
+        self._iter_chunks = iter_chunks
+        self._context_size = context_size
+        self._is_backtracking_result_required = is_backtracking_result_required
+        self._unexpected_cursor: _ChunkCursor | None = None
+
+    def _search_in_order(
+            self,
+            patterns: AbstractPatternList,
+            chunks: Iterator[str],
+            iter_region_again: Callable[[], Iterator[str]],
+    ) -> list[tuple[int, int]] | None:
+        window = _StreamingTextWindow(chunks, context_size=self._context_size, deadline=self._deadline)
+        spans = []
+        pos = 0
+        for pattern in patterns:
+            self._deadline.check()
+            regex = self._compiled_patterns.pattern_regexes[pattern.index]
+            span = window.search(regex, pos)
+            if span is None:
+                if self._is_backtracking_result_required:
+                    region_window = _StreamingTextWindow(
+                        iter_region_again(),
+                        context_size=self._context_size,
+                        deadline=self._deadline,
+                    )
+                    if region_window.search(regex, 0) is not None:
+                        raise _BacktrackingRequired()
+                return None
+            spans.append(span)
+            pos = span[1]
+        return spans
+
+    def _match_expected_patterns(self) -> list[tuple[int, int]] | None:
+        return self._search_in_order(
+            self._compiled_patterns.expected_patterns,
+            self._iter_chunks(),
+            self._iter_chunks,
+        )
+
+    def _match_unexpected_patterns(
+            self,
+            unexpected_patterns: AbstractPatternList,
+            unexpected_regex: re.Pattern,
+            interval_begin: int,
+            interval_end: int | None,
+    ) -> list[tuple[int, int]] | None:
+        if self._unexpected_cursor is None:
+            self._unexpected_cursor = _ChunkCursor(self._iter_chunks())
+        return self._search_in_order(
+            unexpected_patterns,
+            self._unexpected_cursor.iter_range(interval_begin, interval_end),
+            lambda: _ChunkCursor(self._iter_chunks()).iter_range(interval_begin, interval_end),
+        )
+
+
+def _get_best_token_matches_in_worker_process(
+        content_string: str,
+        compiled_patterns: CompiledPatternList,
+        match_mode: MatchMode,
+) -> tuple[str, list[MatchedToken], list[NonmatchedToken]]:
+    # IsolatedProcessRunnerのワーカープロセスで実行される
+    # 制限時間は親プロセスがワーカープロセスを止めることで守る
+    # 正規表現はpickleから戻すときにreのキャッシュから取り出されるので，同じ設定ではコンパイルし直さない
+    matcher_cls: type[_Matcher]
+    if match_mode == MatchMode.LINEAR:
+        matcher_cls = _LinearMatcher
+    else:
+        matcher_cls = _BacktrackingMatcher
+    matcher = matcher_cls(
+        content_string=content_string,
+        compiled_patterns=compiled_patterns,
+        deadline=_MatchDeadline(None),
+    )
+    return matcher.get_best_token_matches()
+
+
 class MatchGetBestService:
+    # パターン全体の正規表現や利用者の正規表現はreの中で指数的にバックトラックすることがあり，
+    # 途中で制限時間を確かめられないので，必要なときだけ止められるワーカープロセスで実行する
+    # BACKTRACKINGでもまずこのスレッドでパターンを順に探し，結果が同じになると分かればそれを使う
+
     _logger = create_logger()
 
-    def __init__(self):
-        pass
+    # この大きさ以上の出力はチャンクごとに読み進めながらマッチングする
+    _STREAMING_THRESHOLD_BYTES = 1 << 20
+    _STREAMING_CHUNK_SIZE_BYTES = 1 << 16
+    # チャンクの境界をまたいでも見つけられるトークンの長さ（文字数）
+    _STREAMING_CONTEXT_SIZE = 1 << 16
+
+    def __init__(
+            self,
+            *,
+            compiled_pattern_list_cache: CompiledPatternListCache,
+            isolated_process_runner: IsolatedProcessRunner,
+    ):
+        self._compiled_pattern_list_cache = compiled_pattern_list_cache
+        self._isolated_process_runner = isolated_process_runner
+
+    @staticmethod
+    def _has_regex_pattern(patterns: PatternList) -> bool:
+        # 利用者の正規表現は1つだけでも途中で止められないほど時間がかかることがある
+        return any(isinstance(pattern, RegexPattern) for pattern in patterns)
+
+    def _get_best_token_matches_in_isolated_process(
+            self,
+            *,
+            content_string: str,
+            compiled_patterns: CompiledPatternList,
+            test_config_options: TestConfigOptions,
+            deadline: _MatchDeadline,
+    ) -> tuple[str, list[MatchedToken], list[NonmatchedToken]]:
+        try:
+            return self._isolated_process_runner.run(
+                _get_best_token_matches_in_worker_process,
+                content_string,
+                compiled_patterns,
+                test_config_options.match_mode,
+                timeout=deadline.get_remaining_seconds(),
+            )
+        except TimeoutError:
+            raise MatchServiceError(
+                reason=_create_timeout_reason(test_config_options.match_timeout),
+            )
+        except ChildProcessError:
+            self._logger.exception("Matching worker process terminated abruptly")
+            raise MatchServiceError(
+                reason="パターンのマッチングを実行するプロセスが異常終了しました",
+            )
+        except IsolatedProcessRunnerShutdownError:
+            # アプリケーションの終了やプロジェクトの切り替えでワーカープロセスが終了された
+            self._logger.info("Matching worker process has been shut down")
+            raise MatchServiceError(
+                reason="パターンのマッチングを実行するプロセスが終了しています",
+            )
+
+    def _get_best_token_matches(
+            self,
+            *,
+            content_string: str,
+            compiled_patterns: CompiledPatternList,
+            test_config_options: TestConfigOptions,
+            deadline: _MatchDeadline,
+    ) -> tuple[str, list[MatchedToken], list[NonmatchedToken]]:
+        if not self._has_regex_pattern(compiled_patterns.patterns):
+            # テキストのパターンを順に探すだけならパターンごとに制限時間を確かめれば十分
+            matcher = _LinearMatcher(
+                content_string=content_string,
+                compiled_patterns=compiled_patterns,
+                deadline=deadline,
+                is_backtracking_result_required=test_config_options.match_mode == MatchMode.BACKTRACKING,
+            )
+            try:
+                return matcher.get_best_token_matches()
+            except _BacktrackingRequired:
+                pass
+        return self._get_best_token_matches_in_isolated_process(
+            content_string=content_string,
+            compiled_patterns=compiled_patterns,
+            test_config_options=test_config_options,
+            deadline=deadline,
+        )
+
+    def execute_for_output_file(
+            self,
+            *,
+            output_file: OutputFile,
+            patterns: PatternList,
+            test_config_options: TestConfigOptions,
+    ) -> MatchResult:
+        # 大きな出力はデコードと全角の変換をした全体の文字列を作らずにチャンクごとにマッチングする
+        if len(output_file.content_bytes) < self._STREAMING_THRESHOLD_BYTES \
+                or self._has_regex_pattern(patterns):
+            content_string = output_file.content_string
+            if content_string is None:
+                raise MatchServiceError(
+                    reason=_UNSUPPORTED_ENCODING_REASON,
+                )
+            return self.execute(
+                content_string=content_string,
+                patterns=patterns,
+                test_config_options=test_config_options,
+            )
+
+        def iter_chunks() -> Iterator[str]:
+            return iter_zen_to_han(output_file.iter_content_string_chunks(self._STREAMING_CHUNK_SIZE_BYTES))
+
+        time_start = datetime.now()
+        compiled_patterns = self._compiled_pattern_list_cache.get(
+            patterns,
+            ignore_case=test_config_options.ignore_case,
+        )
+        deadline = _MatchDeadline(test_config_options.match_timeout)
+        matcher = _StreamingLinearMatcher(
+            iter_chunks=iter_chunks,
+            context_size=self._STREAMING_CONTEXT_SIZE,
+            is_backtracking_result_required=test_config_options.match_mode == MatchMode.BACKTRACKING,
+            compiled_patterns=compiled_patterns,
+            deadline=deadline,
+        )
+        try:
+            regex_pattern, matched_tokens, nonmatched_tokens = matcher.get_best_token_matches()
+        except UnicodeDecodeError:
+            raise MatchServiceError(
+                reason=_UNSUPPORTED_ENCODING_REASON,
+            )
+        except _BacktrackingRequired:
+            # バックトラックしなければ結果が分からないときだけ出力全体をワーカープロセスに渡す
+            content_string = output_file.content_string
+            assert content_string is not None  # チャンクごとにデコードできている
+            regex_pattern, matched_tokens, nonmatched_tokens \
+                = self._get_best_token_matches_in_isolated_process(
+                    content_string=content_string,
+                    compiled_patterns=compiled_patterns,
+                    test_config_options=test_config_options,
+                    deadline=deadline,
+                )
+        time_end = datetime.now()
+
+        # 結果を生成
+        return MatchResult(
+            regex_pattern=regex_pattern,
+            matched_tokens=matched_tokens,
+            nonmatched_tokens=nonmatched_tokens,
+            test_execution_timedelta=time_end - time_start,
+        )
 
-    @classmethod
     def execute(
-            cls,
+            self,
             *,
             content_string: str,
             patterns: PatternList,
             test_config_options: TestConfigOptions,
     ) -> MatchResult:
         # マッチングを実行
-        matcher = _Matcher(
+        time_start = datetime.now()
+        # 正規表現のコンパイルはテストケースの設定ごとに1回だけ行う
+        compiled_patterns = self._compiled_pattern_list_cache.get(
+            patterns,
+            ignore_case=test_config_options.ignore_case,
+        )
+        regex_pattern, matched_tokens, nonmatched_tokens = self._get_best_token_matches(
             content_string=content_string,
-            patterns=patterns,
+            compiled_patterns=compiled_patterns,
             test_config_options=test_config_options,
+            deadline=_MatchDeadline(test_config_options.match_timeout),
         )
-        time_start = datetime.now()
-        regex_pattern, matched_tokens, nonmatched_tokens = matcher.get_best_token_matches()
         time_end = datetime.now()
 
         # 結果を生成
@@ -32,6 +32,25 @@ class StudentMarkPutService:
         self._student_mark_repo.put(student_mark)
 
 
+class StudentMarkGetAllService:
+    # 複数の生徒の採点データをまとめて取得する
+    # 採点データがない生徒は未採点として返す（StudentMarkGetSubServiceと違って採点データを作らない）
+
+    def __init__(
+            self,
+            *,
+            student_mark_repo: StudentMarkRepository,
+    ):
+        self._student_mark_repo = student_mark_repo
+
+    def execute(self, student_ids: list[StudentID]) -> dict[StudentID, StudentMark]:
+        marks = self._student_mark_repo.get_all(student_ids)
+        return {
+            student_id: marks.get(student_id) or StudentMark(student_id=student_id, score=None)
+            for student_id in student_ids
+        }
+
+
 class StudentMarkCheckTimestampQueryService:
     # 生徒の採点データの最終更新日時を取得する
 
@@ -1,8 +1,10 @@
 from datetime import datetime
+from typing import Callable
 
 from domain.model.stage_path import StagePath
 from domain.model.stage import AbstractStage, BuildStage, ExecuteStage, TestStage
-from domain.model.student_stage_path_result import StudentStagePathResult
+from domain.model.student_stage_path_result import StudentStagePathResult, \
+    StudentStagePathResultSummary
 from domain.model.student_stage_result import BuildSuccessStudentStageResult, \
     ExecuteSuccessStudentStageResult, TestSuccessStudentStageResult, AbstractStudentStageResult
 from domain.model.value import StudentID
@@ -29,6 +31,45 @@ class StudentStagePathResultGetService:
         return self._student_stage_path_result_repo.get(student_id, stage_path)
 
 
+class StudentStagePathResultGetAllService:
+    # 複数の生徒のすべてのステージパスの結果をまとめて取得する
+    # 生徒やステージパスごとにStudentStagePathResultGetServiceを呼ぶとその度にクエリが発行される
+
+    def __init__(
+            self,
+            *,
+            stage_path_list_sub_service: StagePathListSubService,
+            student_stage_path_result_repo: StudentStagePathResultRepository,
+    ):
+        self._stage_path_list_sub_service = stage_path_list_sub_service
+        self._student_stage_path_result_repo = student_stage_path_result_repo
+
+    def execute(self, student_ids: list[StudentID]) \
+            -> dict[StudentID, dict[StagePath, StudentStagePathResult]]:
+        stage_paths = self._stage_path_list_sub_service.execute()
+        return self._student_stage_path_result_repo.get_all(student_ids, stage_paths)
+
+
+class StudentStagePathResultGetAllSummaryService:
+    # 複数の生徒のすべてのステージパスの結果の要約をまとめて取得する
+    # 出力ファイルやテスト結果の詳細を読まないので結果の状態だけが必要なときに使う
+    # テーブル表示におけるHOTSPOT
+
+    def __init__(
+            self,
+            *,
+            stage_path_list_sub_service: StagePathListSubService,
+            student_stage_path_result_repo: StudentStagePathResultRepository,
+    ):
+        self._stage_path_list_sub_service = stage_path_list_sub_service
+        self._student_stage_path_result_repo = student_stage_path_result_repo
+
+    def execute(self, student_ids: list[StudentID]) \
+            -> dict[StudentID, dict[StagePath, StudentStagePathResultSummary]]:
+        stage_paths = self._stage_path_list_sub_service.execute()
+        return self._student_stage_path_result_repo.get_all_summaries(student_ids, stage_paths)
+
+
 class StudentStagePathResultCheckRollbackService:
     def __init__(
             self,
@@ -132,26 +173,49 @@ class StudentStageResultRollbackService:
 
 class StudentStageResultClearService:
     # 生徒の結果データを全削除する
+    # CHUNK_SIZE人ずつ1つのトランザクションで削除するので，途中で停止しても各生徒の結果は全部残っているか全部消えているかのどちらか
+
+    CHUNK_SIZE = 50
 
     def __init__(
             self,
             *,
-            stage_path_list_sub_service: StagePathListSubService,
             student_stage_path_result_repo: StudentStagePathResultRepository,
     ):
-        self._stage_path_list_sub_service = stage_path_list_sub_service
         self._student_stage_path_result_repo = student_stage_path_result_repo
 
     def execute(
             self,
             *,
-            student_id: StudentID,
-    ) -> None:
-        stage_paths = self._stage_path_list_sub_service.execute()
-        for stage_path in stage_paths:
-            stage_path_result = self._student_stage_path_result_repo.get(student_id, stage_path)
-            stage_path_result.delete_all_results()
-            self._student_stage_path_result_repo.put(stage_path_result)
+            student_ids: list[StudentID],
+            stop_producer: Callable[[], bool],  # 停止するときTrueを受け取る
+            progress_callback: Callable[[int, int], None],  # (削除し終えた生徒の数, 生徒の数)
+    ) -> int:  # 削除し終えた生徒の数
+        n_cleared = 0
+        progress_callback(n_cleared, len(student_ids))
+        for i in range(0, len(student_ids), self.CHUNK_SIZE):
+            if stop_producer():
+                break
+            chunk = student_ids[i:i + self.CHUNK_SIZE]
+            self._student_stage_path_result_repo.delete_all(chunk)
+            n_cleared += len(chunk)
+            progress_callback(n_cleared, len(student_ids))
+        return n_cleared
+
+
+class StudentStageResultFlushService:
+    # 書き込みを待っている生徒の結果をデータベースに書き込む
+    # 結果は生徒ごとにまとめて書き込まれるので，タスクが終わるときやプロジェクトを閉じるときに呼ぶ
+
+    def __init__(
+            self,
+            *,
+            student_stage_path_result_repo: StudentStagePathResultRepository,
+    ):
+        self._student_stage_path_result_repo = student_stage_path_result_repo
+
+    def execute(self) -> None:
+        self._student_stage_path_result_repo.flush()
 
 
 class StudentPutStageResultService:
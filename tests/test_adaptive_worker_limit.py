@@ -0,0 +1,72 @@
+from infra.dto.resource_usage import ResourceUsage
+from infra.task.concurrency import AdaptiveWorkerLimitController
+
+
+def _usage(*, cpu_percent: int = 10, system_memory_percent: int = 50) -> ResourceUsage:
+    return ResourceUsage(
+        disk_read_count=0,
+        disk_write_count=0,
+        cpu_percent=cpu_percent,
+        memory=0,
+        system_memory_percent=system_memory_percent,
+    )
+
+
+def test_grow_while_tasks_waiting_and_cpu_idle():
+    controller = AdaptiveWorkerLimitController(max_workers=4, initial_worker_limit=1)
+
+    for _ in range(10):
+        controller.update(_usage(cpu_percent=10), n_waiting_tasks=5)
+
+    # 上限を超えて増えない
+    assert controller.worker_limit == 4
+
+
+def test_hold_while_cpu_busy_or_no_tasks_waiting():
+    controller = AdaptiveWorkerLimitController(max_workers=4, initial_worker_limit=2)
+
+    controller.update(_usage(cpu_percent=95), n_waiting_tasks=5)
+    controller.update(_usage(cpu_percent=10), n_waiting_tasks=0)
+
+    assert controller.worker_limit == 2
+
+
+def test_shrink_on_memory_pressure():
+    controller = AdaptiveWorkerLimitController(max_workers=4, initial_worker_limit=4)
+
+    for _ in range(10):
+        decision = controller.update(_usage(system_memory_percent=95), n_waiting_tasks=5)
+
+    # 1より少なくならない
+    assert decision.worker_limit == 1
+    assert "メモリ" in decision.reason
+
+
+def test_shrink_when_latency_degrades_after_growth():
+    controller = AdaptiveWorkerLimitController(max_workers=4, initial_worker_limit=1)
+    for _ in range(3):
+        controller.record_latency("compile", 1.0)
+    controller.update(_usage(), n_waiting_tasks=5)
+    assert controller.worker_limit == 2
+
+    # 増やした効果を見るまでは増やさない
+    controller.update(_usage(), n_waiting_tasks=5)
+    assert controller.worker_limit == 2
+
+    # 増やしたら所要時間が大きく伸びた
+    for _ in range(5):
+        controller.record_latency("compile", 4.0)
+    decision = controller.update(_usage(), n_waiting_tasks=5)
+
+    assert decision.worker_limit == 1
+    assert "compile" in decision.reason
+
+
+def test_keep_growing_while_latency_stable():
+    controller = AdaptiveWorkerLimitController(max_workers=4, initial_worker_limit=1)
+    for _ in range(3):
+        controller.update(_usage(), n_waiting_tasks=5)
+        for _ in range(3):
+            controller.record_latency("execute", 1.0)
+
+    assert controller.worker_limit == 4
@@ -0,0 +1,261 @@
+import os
+import time
+from datetime import datetime
+from random import Random
+
+import pytest
+
+from application.dependency import invalidate_cached_providers
+from application.dependency.external_io import get_project_database_io
+from application.dependency.path_provider import get_database_path_provider
+from application.dependency.repository import get_student_executable_repository, \
+    get_student_source_repository, get_student_stage_path_result_repository, get_student_repository
+from domain.model.file_item import ExecutableFileItem, SourceFileItem
+from domain.model.output_file import OutputFile, OutputFileCollection
+from domain.model.stage import ExecuteStage, TestStage
+from domain.model.stage_path import StagePath
+from domain.model.student import Student
+from domain.model.student_stage_result import BuildSuccessStudentStageResult, \
+    CompileSuccessStudentStageResult, ExecuteSuccessStudentStageResult, \
+    TestSuccessStudentStageResult, TestResultOutputFileCollection
+from domain.model.test_result_output_file_entry import TestResultUnexpectedOutputFileEntry
+from domain.model.value import StudentID, TestCaseID, FileID
+from infra.repository.content_blob import ContentBlobHelper, CODEC_RAW, CODEC_ZLIB, get_available_codecs
+
+
+def _get_blob_ref_counts() -> list[int]:
+    with get_project_database_io().connect() as con:
+        return [row["ref_count"] for row in con.execute("SELECT ref_count FROM content_blob")]
+
+
+def test_identical_executables_stored_once(sample_student_ids):
+    repo = get_student_executable_repository()
+    student_id_1, student_id_2, *_ = sample_student_ids
+    content_bytes = b"MZ" + bytes(range(256)) * 16
+
+    repo.put(student_id_1, ExecutableFileItem(content_bytes=content_bytes))
+    repo.put(student_id_2, ExecutableFileItem(content_bytes=content_bytes))
+    assert _get_blob_ref_counts() == [2]
+    assert repo.get(student_id_1).content_bytes == content_bytes
+
+    # 同じ内容で上書きしても参照数は変わらない
+    repo.put(student_id_1, ExecutableFileItem(content_bytes=content_bytes))
+    assert _get_blob_ref_counts() == [2]
+
+    # 別の内容で上書きすると古い内容の参照が外れる
+    repo.put(student_id_1, ExecutableFileItem(content_bytes=b"other"))
+    assert sorted(_get_blob_ref_counts()) == [1, 1]
+
+    repo.delete(student_id_1)
+    repo.delete(student_id_2)
+    assert _get_blob_ref_counts() == []
+
+
+def test_migrate_source_bytes_to_blobs(sample_student_ids):
+    student_id_1, student_id_2, *_ = sample_student_ids
+    with get_project_database_io().connect() as con:
+        # 中身をそのまま持っていた以前のスキーマ
+        con.execute(
+            """
+            CREATE TABLE student_source
+            (
+                student_id    TEXT PRIMARY KEY,
+                content_bytes BLOB,
+                encoding TEXT,
+                FOREIGN KEY (student_id) REFERENCES student (student_id)
+            )
+            """
+        )
+        con.executemany(
+            "INSERT INTO student_source VALUES (?, ?, ?)",
+            [(str(student_id), b"int main(void) { return 0; }", "utf-8")
+             for student_id in (student_id_1, student_id_2)],
+        )
+        con.commit()
+
+    repo = get_student_source_repository()
+
+    for student_id in (student_id_1, student_id_2):
+        assert repo.get(student_id) == SourceFileItem(
+            content_bytes=b"int main(void) { return 0; }",
+            encoding="utf-8",
+        )
+    assert _get_blob_ref_counts() == [2]
+
+
+def test_identical_outputs_shared_across_students_and_stages(sample_student_ids):
+    repo = get_student_stage_path_result_repository()
+    testcase_id = TestCaseID("TestCase-1")
+    stage_path = StagePath.list_paths([testcase_id])[0]
+    stdout = b"Hello World\n" * 100
+    for student_id in sample_student_ids:
+        stdout_file = OutputFile(file_id=FileID.STDOUT, content=stdout)
+        stage_path_result = repo.get(student_id, stage_path)
+        for result in [
+            BuildSuccessStudentStageResult.create_instance(
+                student_id=student_id,
+                submission_folder_checksum=0,
+            ),
+            CompileSuccessStudentStageResult.create_instance(
+                student_id=student_id,
+                output="",
+            ),
+            ExecuteSuccessStudentStageResult.create_instance(
+                student_id=student_id,
+                testcase_id=testcase_id,
+                execute_config_mtime=datetime.fromisoformat("2023-01-01T00:00:01"),
+                output_file_collection=OutputFileCollection([stdout_file]),
+            ),
+            TestSuccessStudentStageResult.create_instance(
+                student_id=student_id,
+                testcase_id=testcase_id,
+                test_config_mtime=datetime.fromisoformat("2023-01-02T00:00:01"),
+                test_result_output_file_collection=TestResultOutputFileCollection([
+                    TestResultUnexpectedOutputFileEntry(file_id=FileID.STDOUT, actual=stdout_file),
+                ]),
+            ),
+        ]:
+            stage_path_result.put_result(result)
+        repo.put(stage_path_result)
+    repo.flush()
+
+    # 実行結果とテスト結果の出力が全生徒で1つの内容を参照する
+    assert _get_blob_ref_counts() == [len(sample_student_ids) * 2]
+    retrieved = repo.get_all(sample_student_ids, [stage_path])
+    for student_id in sample_student_ids:
+        execute_result = retrieved[student_id][stage_path].get_result(ExecuteStage(testcase_id))
+        assert execute_result.output_file_collection.find(FileID.STDOUT).content_bytes == stdout
+        test_result = retrieved[student_id][stage_path].get_result(TestStage(testcase_id))
+        entry = test_result.test_result_output_file_collection.find(FileID.STDOUT)
+        assert entry.actual.content_bytes == stdout
+
+    repo.delete_all(sample_student_ids[:1])
+    assert _get_blob_ref_counts() == [(len(sample_student_ids) - 1) * 2]
+    repo.delete_all(sample_student_ids)
+    assert _get_blob_ref_counts() == []
+
+
+@pytest.mark.parametrize("codec", get_available_codecs())
+def test_compress_only_large_and_compressible_contents(codec):
+    helper = ContentBlobHelper(compress_threshold=1024, codec=codec)
+    small = b"Hello World\n"
+    large = b"Hello World\n" * 1000
+    incompressible = os.urandom(4096)
+    with get_project_database_io().connect() as con:
+        cur = con.cursor()
+        helper.create_table_if_not_exists(cur)
+        hashes = [helper.acquire(cur, content) for content in (small, large, incompressible)]
+        codecs = {
+            row["blob_hash"]: row["codec"]
+            for row in cur.execute("SELECT blob_hash, codec FROM content_blob")
+        }
+        assert helper.get_all(cur, hashes) == dict(zip(hashes, [small, large, incompressible]))
+        con.commit()
+
+    assert [codecs[blob_hash] for blob_hash in hashes] == [CODEC_RAW, codec, CODEC_RAW]
+
+
+def test_read_contents_written_with_other_codecs():
+    # 圧縮方式の設定を変えても以前に保存した内容を読める
+    content = b"Hello World\n" * 1000
+    with get_project_database_io().connect() as con:
+        cur = con.cursor()
+        hashes = []
+        for codec in get_available_codecs():
+            helper = ContentBlobHelper(compress_threshold=0, codec=codec)
+            helper.create_table_if_not_exists(cur)
+            hashes.append(helper.acquire(cur, content + codec.encode()))
+        helper = ContentBlobHelper(compress_threshold=0, codec=CODEC_ZLIB)
+        for blob_hash, codec in zip(hashes, get_available_codecs()):
+            assert helper.get(cur, blob_hash) == content + codec.encode()
+
+
+def _create_synthetic_project(n_students: int) -> list[StudentID]:
+    student_ids = [StudentID(f"00D00{i:05d}A") for i in range(n_students)]
+    get_student_repository().create_all([
+        Student(
+            student_id=student_id,
+            name=f"student-{i}",
+            name_en=f"student-{i}-en",
+            email_address=f"student-{i}@example.com",
+            submitted_at=datetime.fromtimestamp(i * 10000 + 86400),
+            num_submissions=1,
+            submission_folder_name=str(student_id),
+        )
+        for i, student_id in enumerate(student_ids)
+    ])
+    executable_repo = get_student_executable_repository()
+    result_repo = get_student_stage_path_result_repository()
+    testcase_id = TestCaseID("TestCase-1")
+    stage_path = StagePath.list_paths([testcase_id])[0]
+    random = Random(0)
+    for student_id in student_ids:
+        # 実行ファイル：共通のランタイムに生徒ごとに異なるコードが少し付いたもの
+        executable = bytes(range(256)) * 128 + random.randbytes(4096)
+        executable_repo.put(student_id, ExecutableFileItem(content_bytes=executable))
+        # 出力：ループで同じような行を繰り返し出力したもの
+        stdout = "".join(
+            f"{student_id}: i = {i}, sum = {i * (i + 1) // 2}\n" for i in range(1000)
+        ).encode()
+        stage_path_result = result_repo.get(student_id, stage_path)
+        for result in [
+            BuildSuccessStudentStageResult.create_instance(
+                student_id=student_id,
+                submission_folder_checksum=0,
+            ),
+            CompileSuccessStudentStageResult.create_instance(
+                student_id=student_id,
+                output="",
+            ),
+            ExecuteSuccessStudentStageResult.create_instance(
+                student_id=student_id,
+                testcase_id=testcase_id,
+                execute_config_mtime=datetime.fromisoformat("2023-01-01T00:00:01"),
+                output_file_collection=OutputFileCollection([
+                    OutputFile(file_id=FileID.STDOUT, content=stdout),
+                ]),
+            ),
+        ]:
+            stage_path_result.put_result(result)
+        result_repo.put(stage_path_result)
+    result_repo.flush()
+    return student_ids
+
+
+def _measure_synthetic_project(codec: str, monkeypatch) -> tuple[int, float]:
+    import infra.repository.content_blob
+    monkeypatch.setattr(infra.repository.content_blob, "get_default_codec", lambda: codec)
+
+    # 前回のデータベースを閉じて消し，新しいデータベースで作り直す
+    invalidate_cached_providers()
+    database_fullpath = get_database_path_provider().fullpath()
+    for path in database_fullpath.parent.glob(database_fullpath.name + "*"):
+        path.unlink()
+
+    student_ids = _create_synthetic_project(400)
+    with get_project_database_io().connect() as con:
+        con.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    database_size = database_fullpath.stat().st_size
+
+    executable_repo = get_student_executable_repository()
+    result_repo = get_student_stage_path_result_repository()
+    stage_path = StagePath.list_paths([TestCaseID("TestCase-1")])[0]
+    time_start = time.perf_counter()
+    for student_id in student_ids:
+        executable_repo.get(student_id)
+    result_repo.get_all(student_ids, [stage_path])
+    elapsed_seconds = time.perf_counter() - time_start
+    return database_size, elapsed_seconds
+
+
+def test_benchmark_compression_400_students(monkeypatch):
+    measured = {}
+    for codec in get_available_codecs():
+        measured[codec] = _measure_synthetic_project(codec, monkeypatch)
+        database_size, elapsed_seconds = measured[codec]
+        print(f"{codec}: database {database_size / 1024 / 1024:.1f} MiB, read {elapsed_seconds:.3f}s")
+
+    raw_size, _ = measured[CODEC_RAW]
+    for codec in get_available_codecs():
+        if codec != CODEC_RAW:
+            assert measured[codec][0] < raw_size / 2
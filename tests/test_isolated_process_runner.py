@@ -0,0 +1,97 @@
+import os
+import threading
+import time
+
+import pytest
+
+from infra.task.isolated_process import IsolatedProcessRunner, IsolatedProcessRunnerShutdownError
+
+
+def _get_pid():
+    return os.getpid()
+
+
+def _add(a, b):
+    return a + b
+
+
+def _raise_error():
+    raise ValueError("error in worker process")
+
+
+def _sleep(seconds):
+    time.sleep(seconds)
+    return seconds
+
+
+def _exit_abruptly():
+    os._exit(1)
+
+
+@pytest.fixture
+def runner():
+    runner = IsolatedProcessRunner(max_workers=2)
+    yield runner
+    runner.shutdown()
+
+
+def test_run_in_reused_worker_process(runner):
+    pid = runner.run(_get_pid, timeout=10)
+    assert pid != os.getpid()
+    assert runner.run(_add, 1, 2, timeout=10) == 3
+    # 終わったワーカープロセスは使い回す
+    assert runner.run(_get_pid, timeout=10) == pid
+
+
+def test_error_raised_in_caller(runner):
+    with pytest.raises(ValueError, match="error in worker process"):
+        runner.run(_raise_error, timeout=10)
+    assert runner.run(_add, 1, 2, timeout=10) == 3
+
+
+def test_timed_out_worker_process_killed(runner):
+    pid = runner.run(_get_pid, timeout=10)
+
+    time_start = time.perf_counter()
+    with pytest.raises(TimeoutError):
+        runner.run(_sleep, 60, timeout=0.2)
+    assert time.perf_counter() - time_start < 10
+
+    # 止めたワーカープロセスの代わりに新しいワーカープロセスで実行する
+    assert runner.run(_sleep, 0, timeout=10) == 0
+    assert runner.run(_get_pid, timeout=10) != pid
+
+
+def test_abrupt_exit_raises_child_process_error(runner):
+    with pytest.raises(ChildProcessError):
+        runner.run(_exit_abruptly, timeout=10)
+    assert runner.run(_add, 1, 2, timeout=10) == 3
+
+
+def test_run_after_shutdown_raises_error():
+    runner = IsolatedProcessRunner(max_workers=1)
+    assert runner.run(_add, 1, 2, timeout=10) == 3
+
+    # ワーカープロセスが空くのを待っているスレッドもshutdownで起こされてエラーになる
+    errors = []
+
+    def run_while_worker_busy():
+        try:
+            runner.run(_add, 1, 2, timeout=10)
+        except IsolatedProcessRunnerShutdownError as e:
+            errors.append(e)
+
+    busy_thread = threading.Thread(target=runner.run, args=(_sleep, 1), kwargs=dict(timeout=10))
+    busy_thread.start()
+    time.sleep(0.5)
+    waiting_thread = threading.Thread(target=run_while_worker_busy)
+    waiting_thread.start()
+    time.sleep(0.1)
+    runner.shutdown()
+    waiting_thread.join(timeout=0.5)
+    assert not waiting_thread.is_alive()
+    assert len(errors) == 1
+    busy_thread.join()
+
+    with pytest.raises(IsolatedProcessRunnerShutdownError):
+        runner.run(_add, 1, 2, timeout=10)
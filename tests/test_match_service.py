@@ -1,11 +1,19 @@
+import copy
 import random
+import time
+import tracemalloc
 from datetime import timedelta
 
 import pytest
 
 from application.dependency.service import get_match_get_best_service
+from domain.error import MatchServiceError
+from domain.model.output_file import OutputFile
+from domain.model.output_file_test_result import MatchResult
 from domain.model.pattern import PatternList, TextPattern, SpacePattern, EOLPattern, RegexPattern
-from domain.model.test_config_options import TestConfigOptions
+from domain.model.test_config_options import TestConfigOptions, MatchMode
+from domain.model.value import FileID
+from service.match import MatchGetBestService, _BacktrackingMatcher, _MatchDeadline
 
 r"""
 パターンマッチ機能の仕様:
@@ -758,3 +766,428 @@ def test_execution_time_recording(match_service, test_config_options):
 
     # is_acceptedの確認（実行時間テストなので結果は問わない）
     assert isinstance(result.is_accepted, bool)
+
+
+def test_compile_patterns_once_per_config(match_service, test_config_options, monkeypatch):
+    """同じ設定のパターンは生徒ごとにコンパイルし直さないことのテスト"""
+    compiled_args = []
+    original_compile = PatternList.compile
+
+    def compile_and_count(self, *, ignore_case):
+        compiled_args.append(ignore_case)
+        return original_compile(self, ignore_case=ignore_case)
+
+    monkeypatch.setattr(PatternList, "compile", compile_and_count)
+
+    def create_patterns():
+        # 設定を読み込むたびに別のインスタンスになる
+        return PatternList.from_json(PatternList([
+            TextPattern(index=0, is_expected=True, text="Hello", is_multiple_space_ignored=True,
+                        is_word=False),
+            TextPattern(index=1, is_expected=False, text="Error", is_multiple_space_ignored=True,
+                        is_word=False),
+            SpacePattern(index=2, is_expected=True),
+            TextPattern(index=3, is_expected=True, text="World", is_multiple_space_ignored=True,
+                        is_word=False),
+        ]).to_json())
+
+    results = [
+        match_service.execute(
+            content_string=f"Hello {i} World",
+            patterns=create_patterns(),
+            test_config_options=test_config_options,
+        )
+        for i in range(400)
+    ]
+    assert compiled_args == [False]
+    assert all(result.is_accepted for result in results)
+
+    # 大文字小文字の扱いが異なれば別にコンパイルする
+    result = match_service.execute(
+        content_string="hello world",
+        patterns=create_patterns(),
+        test_config_options=TestConfigOptions(ignore_case=True),
+    )
+    assert compiled_args == [False, True]
+    assert result.is_accepted is True
+
+
+def test_benchmark_match_50_patterns(match_service, test_config_options, monkeypatch):
+    """50個のパターンのマッチングでパターンをコピーしないことのベンチマーク"""
+    words = [f"word{i}" for i in range(50)]
+    patterns = PatternList([
+        TextPattern(index=i, is_expected=i % 5 != 4, text=word, is_multiple_space_ignored=True,
+                    is_word=True)
+        for i, word in enumerate(words)
+    ])
+    content_string = " ".join(word for i, word in enumerate(words) if i % 5 != 4) + "\n"
+
+    def execute():
+        return match_service.execute(
+            content_string=content_string,
+            patterns=patterns,
+            test_config_options=test_config_options,
+        )
+
+    # 正規表現のコンパイルは計測に含めない
+    assert execute().is_accepted is True
+
+    # パターンはコピーせずにそのまま使う
+    copied = []
+    original_deepcopy = copy.deepcopy
+
+    def deepcopy_and_count(x, memo=None):
+        copied.append(x)
+        return original_deepcopy(x, memo)
+
+    monkeypatch.setattr(copy, "deepcopy", deepcopy_and_count)
+    result = execute()
+    monkeypatch.setattr(copy, "deepcopy", original_deepcopy)
+    assert copied == []
+    pattern_lst = list(patterns)
+    assert all(token.pattern is pattern_lst[token.pattern.index] for token in result.matched_tokens)
+
+    n_matches = 200
+    time_start = time.perf_counter()
+    for _ in range(n_matches):
+        execute()
+    elapsed_seconds = (time.perf_counter() - time_start) / n_matches
+
+    tracemalloc.start()
+    try:
+        snapshot_before = tracemalloc.take_snapshot()
+        tracemalloc.reset_peak()
+        base_size, _ = tracemalloc.get_traced_memory()
+        execute()
+        _, peak_size = tracemalloc.get_traced_memory()
+        snapshot_after = tracemalloc.take_snapshot()
+    finally:
+        tracemalloc.stop()
+    n_blocks = sum(
+        stat.count_diff
+        for stat in snapshot_after.compare_to(snapshot_before, "filename")
+        if stat.count_diff > 0
+    )
+    print(f"50 patterns: {elapsed_seconds * 1e6:.0f} us/match, "
+          f"peak {peak_size - base_size} bytes/match, {n_blocks} blocks retained/match")
+
+
+def test_linear_mode_same_as_backtracking_for_text_patterns(match_service):
+    """テキストのパターンだけならパターンを順に探す方式でも結果が同じことのテスト"""
+    rng = random.Random(0)
+    for _ in range(1000):
+        patterns = PatternList([
+            TextPattern(index=i, is_expected=rng.random() < 0.7,
+                        text="".join(rng.choice("ab ") for _ in range(3)).strip() or "a",
+                        is_multiple_space_ignored=True, is_word=rng.random() < 0.3)
+            for i in range(rng.randint(1, 6))
+        ])
+        if not list(patterns.expected_patterns):
+            continue
+        content_string = "".join(rng.choice("ab \n") for _ in range(rng.randint(0, 20)))
+        results = [
+            match_service.execute(
+                content_string=content_string,
+                patterns=patterns,
+                test_config_options=TestConfigOptions(ignore_case=False, match_mode=match_mode),
+            )
+            for match_mode in (MatchMode.BACKTRACKING, MatchMode.LINEAR)
+        ]
+        assert results[0].matched_tokens == results[1].matched_tokens, (patterns, content_string)
+        assert results[0].nonmatched_tokens == results[1].nonmatched_tokens, (patterns, content_string)
+
+
+def test_backtracking_mode_same_as_backtracking_matcher(match_service):
+    """BACKTRACKINGでパターンを順に探して済ませても全体の正規表現と結果が同じことのテスト"""
+    rng = random.Random(0)
+    for _ in range(1000):
+        patterns = PatternList([
+            rng.choice([
+                TextPattern(index=i, is_expected=rng.random() < 0.7,
+                            text="".join(rng.choice("ab ") for _ in range(3)).strip() or "a",
+                            is_multiple_space_ignored=True, is_word=rng.random() < 0.3),
+                SpacePattern(index=i, is_expected=rng.random() < 0.7),
+                EOLPattern(index=i, is_expected=rng.random() < 0.7),
+            ])
+            for i in range(rng.randint(1, 6))
+        ])
+        if not list(patterns.expected_patterns):
+            continue
+        content_string = "".join(rng.choice("ab \n") for _ in range(rng.randint(0, 20)))
+        regex_pattern, matched_tokens, nonmatched_tokens = _BacktrackingMatcher(
+            content_string=content_string,
+            compiled_patterns=patterns.compile(ignore_case=False),
+            deadline=_MatchDeadline(None),
+        ).get_best_token_matches()
+        expected = MatchResult(
+            regex_pattern=regex_pattern,
+            matched_tokens=matched_tokens,
+            nonmatched_tokens=nonmatched_tokens,
+            test_execution_timedelta=timedelta(),
+        )
+        actual = match_service.execute(
+            content_string=content_string,
+            patterns=patterns,
+            test_config_options=TestConfigOptions(ignore_case=False, match_mode=MatchMode.BACKTRACKING),
+        )
+        assert actual.matched_tokens == expected.matched_tokens, (patterns, content_string)
+        assert actual.nonmatched_tokens == expected.nonmatched_tokens, (patterns, content_string)
+
+
+def test_backtracking_mode_isolated_only_when_inconclusive(match_service, monkeypatch):
+    """BACKTRACKINGでもパターンを順に探して結果が分かればワーカープロセスを使わないことのテスト"""
+    runner = match_service._isolated_process_runner
+    n_calls = 0
+    original_run = runner.run
+
+    def run(*args, **kwargs):
+        nonlocal n_calls
+        n_calls += 1
+        return original_run(*args, **kwargs)
+
+    monkeypatch.setattr(runner, "run", run)
+
+    patterns = PatternList([
+        TextPattern(index=i, is_expected=True, text=text, is_multiple_space_ignored=True,
+                    is_word=False)
+        for i, text in enumerate("abcd")
+    ])
+    test_config_options = TestConfigOptions(ignore_case=False, match_mode=MatchMode.BACKTRACKING)
+
+    # すべてのパターンが見つかる
+    result = match_service.execute(
+        content_string="abc" * 1000 + "d",
+        patterns=patterns,
+        test_config_options=test_config_options,
+    )
+    assert result.is_accepted is True
+    # 見つからないパターンが出力のどこにもない
+    result = match_service.execute(
+        content_string="abc" * 100000,
+        patterns=patterns,
+        test_config_options=test_config_options,
+    )
+    assert result.count_nonmatched_tokens() == 4
+    assert n_calls == 0
+
+    # 見つからないパターンが前にある
+    result = match_service.execute(
+        content_string="dabc",
+        patterns=patterns,
+        test_config_options=test_config_options,
+    )
+    assert result.count_nonmatched_tokens() == 4
+    assert n_calls == 1
+
+
+def test_linear_mode_does_not_backtrack_on_long_output(match_service):
+    """出力が長くても順に探す方式ではパターンの数の累乗の時間がかからないことのテスト"""
+    patterns = PatternList([
+        TextPattern(index=i, is_expected=True, text=text, is_multiple_space_ignored=True,
+                    is_word=False)
+        for i, text in enumerate("abcd")
+    ])
+
+    # 全体を1つの正規表現にする方式ではこの長さの出力でも数秒かかる
+    time_start = time.perf_counter()
+    result = match_service.execute(
+        content_string="abc" * 100000,
+        patterns=patterns,
+        test_config_options=TestConfigOptions(ignore_case=False, match_mode=MatchMode.LINEAR),
+    )
+    assert time.perf_counter() - time_start < 1
+    assert result.is_accepted is False
+    assert result.count_nonmatched_tokens() == 4
+
+
+def test_match_mode_defaults_to_backtracking_for_existing_configs():
+    """マッチングの方式がない設定は以前と同じ方式で採点されることのテスト"""
+    options = TestConfigOptions.from_json(dict(ignore_case=False))
+    assert options.match_mode == MatchMode.BACKTRACKING
+    options = TestConfigOptions(ignore_case=False, match_mode=MatchMode.LINEAR)
+    assert TestConfigOptions.from_json(options.to_json()) == options
+
+
+def test_match_time_budget_exceeded(match_service):
+    """マッチングが制限時間を超えるとエラーになることのテスト"""
+    patterns = PatternList([
+        TextPattern(index=0, is_expected=True, text="Hello", is_multiple_space_ignored=True,
+                    is_word=False),
+    ])
+    with pytest.raises(MatchServiceError) as exc_info:
+        match_service.execute(
+            content_string="Hello World",
+            patterns=patterns,
+            test_config_options=TestConfigOptions(ignore_case=False, match_timeout=0),
+        )
+    assert "制限時間" in exc_info.value.reason
+
+
+def test_backtracking_match_killed_after_timeout(match_service):
+    """途中で止められない正規表現のマッチングもワーカープロセスごと止めて制限時間を守ることのテスト"""
+    patterns = PatternList([
+        TextPattern(index=i, is_expected=True, text=text, is_multiple_space_ignored=True,
+                    is_word=False)
+        for i, text in enumerate("abcd")
+    ])
+    test_config_options = TestConfigOptions(
+        ignore_case=False,
+        match_mode=MatchMode.BACKTRACKING,
+        match_timeout=0.5,
+    )
+
+    # 全体を1つの正規表現にする方式ではこの長さの出力に数十秒以上かかる
+    # 先頭の"d"があるのでパターンを順に探すだけではBACKTRACKINGの結果が分からない
+    time_start = time.perf_counter()
+    with pytest.raises(MatchServiceError) as exc_info:
+        match_service.execute(
+            content_string="d" + "abc" * 1000,
+            patterns=patterns,
+            test_config_options=test_config_options,
+        )
+    assert "制限時間" in exc_info.value.reason
+    # ワーカープロセスの起動の時間は制限時間に含まれない
+    assert time.perf_counter() - time_start < 10
+
+    # 止めたワーカープロセスの代わりが起動される
+    result = match_service.execute(
+        content_string="abcd",
+        patterns=patterns,
+        test_config_options=test_config_options,
+    )
+    assert result.is_accepted is True
+
+
+def test_match_after_worker_shutdown_raises_match_service_error(match_service):
+    """ワーカープロセスが終了された後のマッチングはマッチングのエラーになることのテスト"""
+    patterns = PatternList([
+        TextPattern(index=i, is_expected=True, text=text, is_multiple_space_ignored=True,
+                    is_word=False)
+        for i, text in enumerate("abcd")
+    ])
+    match_service._isolated_process_runner.shutdown()
+    with pytest.raises(MatchServiceError):
+        match_service.execute(
+            content_string="dabc",
+            patterns=patterns,
+            test_config_options=TestConfigOptions(ignore_case=False, match_mode=MatchMode.BACKTRACKING),
+        )
+
+
+def test_streaming_same_as_in_memory(match_service, monkeypatch):
+    """チャンクごとに読み進めるマッチングでも出力全体を文字列にした場合と結果が同じことのテスト"""
+    # チャンクの境界が全角文字やトークンの途中に来るように小さくする
+    monkeypatch.setattr(MatchGetBestService, "_STREAMING_THRESHOLD_BYTES", 0)
+    monkeypatch.setattr(MatchGetBestService, "_STREAMING_CHUNK_SIZE_BYTES", 5)
+    monkeypatch.setattr(MatchGetBestService, "_STREAMING_CONTEXT_SIZE", 16)
+
+    rng = random.Random(0)
+    test_config_options = TestConfigOptions(ignore_case=True)
+    for _ in range(1000):
+        patterns = PatternList([
+            rng.choice([
+                TextPattern(index=i, is_expected=rng.random() < 0.7,
+                            text="".join(rng.choice("abＡ ") for _ in range(3)).strip() or "a",
+                            is_multiple_space_ignored=True, is_word=rng.random() < 0.3),
+                SpacePattern(index=i, is_expected=rng.random() < 0.7),
+                EOLPattern(index=i, is_expected=rng.random() < 0.7),
+            ])
+            for i in range(rng.randint(1, 6))
+        ])
+        if not list(patterns.expected_patterns):
+            continue
+        content_string = "".join(rng.choice("abAＢ １\n") for _ in range(rng.randint(0, 60)))
+        expected = match_service.execute(
+            content_string=content_string,
+            patterns=patterns,
+            test_config_options=test_config_options,
+        )
+        actual = match_service.execute_for_output_file(
+            output_file=OutputFile(file_id=FileID.STDOUT, content=content_string),
+            patterns=patterns,
+            test_config_options=test_config_options,
+        )
+        assert actual.matched_tokens == expected.matched_tokens, (patterns, content_string)
+        assert actual.nonmatched_tokens == expected.nonmatched_tokens, (patterns, content_string)
+
+
+def test_streaming_backtracking_mode_falls_back_to_whole_output(match_service, monkeypatch):
+    """チャンクごとに読み進めてBACKTRACKINGの結果が分からなければ出力全体でマッチングすることのテスト"""
+    monkeypatch.setattr(MatchGetBestService, "_STREAMING_THRESHOLD_BYTES", 0)
+    monkeypatch.setattr(MatchGetBestService, "_STREAMING_CHUNK_SIZE_BYTES", 5)
+    monkeypatch.setattr(MatchGetBestService, "_STREAMING_CONTEXT_SIZE", 16)
+
+    patterns = PatternList([
+        TextPattern(index=i, is_expected=True, text=text, is_multiple_space_ignored=True,
+                    is_word=False)
+        for i, text in enumerate("abcd")
+    ])
+    test_config_options = TestConfigOptions(ignore_case=False, match_mode=MatchMode.BACKTRACKING)
+    for content_string in ["ａbcd", "dａbc", "ａbc" * 10, "ａbc" * 10 + "d"]:
+        expected = match_service.execute(
+            content_string=content_string,
+            patterns=patterns,
+            test_config_options=test_config_options,
+        )
+        actual = match_service.execute_for_output_file(
+            output_file=OutputFile(file_id=FileID.STDOUT, content=content_string),
+            patterns=patterns,
+            test_config_options=test_config_options,
+        )
+        assert actual.matched_tokens == expected.matched_tokens, content_string
+        assert actual.nonmatched_tokens == expected.nonmatched_tokens, content_string
+
+
+def test_streaming_memory_does_not_grow_with_output(match_service, monkeypatch):
+    """大きな出力でもデコードした全体の文字列を作らずにマッチングすることのテスト"""
+    monkeypatch.setattr(MatchGetBestService, "_STREAMING_THRESHOLD_BYTES", 0)
+
+    def measure_peak_size(n_lines: int) -> tuple[int, int]:
+        content_bytes = "".join(f"ｉ = {i}\n" for i in range(n_lines)).encode("utf-8")
+        output_file = OutputFile(file_id=FileID.STDOUT, content=content_bytes)
+        patterns = PatternList([
+            TextPattern(index=0, is_expected=True, text="i = 0", is_multiple_space_ignored=True,
+                        is_word=True),
+            TextPattern(index=1, is_expected=False, text="error", is_multiple_space_ignored=True,
+                        is_word=False),
+            TextPattern(index=2, is_expected=True, text=f"i = {n_lines - 1}", is_multiple_space_ignored=True,
+                        is_word=True),
+            EOLPattern(index=3, is_expected=True),
+        ])
+
+        tracemalloc.start()
+        try:
+            result = match_service.execute_for_output_file(
+                output_file=output_file,
+                patterns=patterns,
+                test_config_options=TestConfigOptions(ignore_case=False),
+            )
+            _, peak_size = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+
+        assert result.is_accepted is True
+        assert [token.pattern.index for token in result.matched_tokens] == [0, 2, 3]
+        print(f"output {len(content_bytes)} bytes, peak {peak_size} bytes")
+        return len(content_bytes), peak_size
+
+    _, small_peak_size = measure_peak_size(50000)
+    large_content_size, large_peak_size = measure_peak_size(200000)
+    # 全体を文字列にするとデコードと全角の変換でそれぞれ出力の大きさ以上のメモリを使う
+    assert large_peak_size < large_content_size / 2
+    assert large_peak_size < small_peak_size * 1.5
+
+
+def test_streaming_unsupported_encoding(match_service, monkeypatch):
+    """UTF-8として読めない出力はエラーになることのテスト"""
+    monkeypatch.setattr(MatchGetBestService, "_STREAMING_THRESHOLD_BYTES", 0)
+    patterns = PatternList([
+        TextPattern(index=0, is_expected=True, text="Hello", is_multiple_space_ignored=True,
+                    is_word=False),
+    ])
+    with pytest.raises(MatchServiceError):
+        match_service.execute_for_output_file(
+            output_file=OutputFile(file_id=FileID.STDOUT, content=b"Hello \xff\xfe"),
+            patterns=patterns,
+            test_config_options=TestConfigOptions(ignore_case=False),
+        )
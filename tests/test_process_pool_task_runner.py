@@ -0,0 +1,114 @@
+import os
+import time
+
+import psutil
+import pytest
+
+from application.dependency import invalidate_cached_providers
+from application.dependency.task import get_process_pool_task_runner
+from domain.error import StopTask
+from infra.task.process_pool import ProcessPoolTaskRunner
+
+_initialized_value = None
+
+
+def _initialize(value):
+    global _initialized_value
+    _initialized_value = value
+
+
+def _get_pid_and_initialized_value(*, stop_producer, report_progress):
+    return os.getpid(), _initialized_value
+
+
+def _report_three_times(n, *, stop_producer, report_progress):
+    for i in range(3):
+        report_progress(f"{n}-{i}")
+    return n
+
+
+def _raise_error(*, stop_producer, report_progress):
+    raise ValueError("error in worker process")
+
+
+def _get_pid_and_isolated_process_runner_max_workers(*, stop_producer, report_progress):
+    from application.dependency.task import get_isolated_process_runner
+    # noinspection PyProtectedMember
+    return os.getpid(), get_isolated_process_runner()._max_workers
+
+
+def _run_until_stopped(*, stop_producer, report_progress):
+    report_progress("started")
+    while not stop_producer():
+        time.sleep(0.001)
+    raise StopTask()
+
+
+@pytest.fixture
+def runner():
+    runner = ProcessPoolTaskRunner(
+        max_workers=2,
+        initializer=_initialize,
+        initargs=("initialized",),
+    )
+    yield runner
+    runner.shutdown()
+
+
+def test_run_in_initialized_worker_process(runner):
+    pid, initialized_value = runner.run(
+        _get_pid_and_initialized_value,
+        stop_producer=lambda: False,
+    )
+    assert pid != os.getpid()
+    assert initialized_value == "initialized"
+
+
+def test_progress_delivered_before_run_returns(runner):
+    messages = []
+    result = runner.run(
+        _report_three_times,
+        7,
+        stop_producer=lambda: False,
+        progress_callback=messages.append,
+    )
+    assert result == 7
+    assert messages == ["7-0", "7-1", "7-2"]
+
+
+def test_exception_raised_in_caller(runner):
+    with pytest.raises(ValueError):
+        runner.run(_raise_error, stop_producer=lambda: False)
+    # 例外のあとも続けて実行できる
+    assert runner.run(_report_three_times, 1, stop_producer=lambda: False) == 1
+
+
+def test_stop_propagated_to_worker_process(runner):
+    messages = []
+    time_start = time.perf_counter()
+
+    def stop_producer():
+        return bool(messages)  # ワーカープロセスで開始したら停止を要求する
+
+    with pytest.raises(StopTask):
+        runner.run(
+            _run_until_stopped,
+            stop_producer=stop_producer,
+            progress_callback=messages.append,
+        )
+    assert messages == ["started"]
+    assert time.perf_counter() - time_start < 30
+
+
+def test_worker_processes_shut_down_on_invalidate():
+    runner = get_process_pool_task_runner()
+    pid, isolated_max_workers = runner.run(
+        _get_pid_and_isolated_process_runner_max_workers,
+        stop_producer=lambda: False,
+    )
+    # ワーカープロセスの中のマッチング用のワーカープロセスは1つに制限される
+    assert isolated_max_workers == 1
+    assert psutil.pid_exists(pid)
+
+    invalidate_cached_providers()
+    assert not psutil.pid_exists(pid)
@@ -0,0 +1,283 @@
+import multiprocessing
+import sqlite3
+import threading
+import time
+
+import pytest
+
+from application.dependency.external_io import get_project_database_io
+from application.dependency.path_provider import get_database_path_provider
+from application.dependency.repository import get_student_repository, \
+    get_student_stage_path_result_repository, get_student_mark_repository, \
+    get_student_executable_repository
+from application.dependency.service import get_student_put_stage_result_service
+from domain.model.file_item import ExecutableFileItem
+from domain.model.stage import BuildStage
+from domain.model.stage_path import StagePath
+from domain.model.student_mark import StudentMark
+from domain.model.student_stage_result import BuildSuccessStudentStageResult
+from domain.model.value import TestCaseID
+from infra.io.project_database import ProjectDatabaseIO
+
+
+@pytest.fixture
+def database_io():
+    database_io = get_project_database_io()
+    database_io.execute_schema_once("CREATE TABLE IF NOT EXISTS t (v INTEGER)")
+    return database_io
+
+
+def _count_rows(database_io) -> int:
+    with database_io.connect() as con:
+        return con.execute("SELECT COUNT(*) FROM t").fetchone()[0]
+
+
+def test_connection_reused_per_thread(database_io):
+    with database_io.connect() as con:
+        con_main_1 = con
+    with database_io.connect() as con:
+        con_main_2 = con
+
+    other_connections = []
+
+    def connect_in_other_thread():
+        with database_io.connect() as con_other:
+            other_connections.append(con_other)
+
+    thread = threading.Thread(target=connect_in_other_thread)
+    thread.start()
+    thread.join()
+
+    assert con_main_1 is con_main_2
+    assert other_connections[0] is not con_main_1
+
+
+def test_wal_enabled(database_io):
+    with database_io.connect() as con:
+        assert con.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+        assert con.execute("PRAGMA foreign_keys").fetchone()[0] == 1
+
+
+def test_uncommitted_changes_discarded(database_io):
+    with database_io.connect() as con:
+        con.execute("INSERT INTO t (v) VALUES (1)")
+    with database_io.connect() as con:
+        con.execute("INSERT INTO t (v) VALUES (2)")
+        con.commit()
+    with pytest.raises(RuntimeError):
+        with database_io.connect() as con:
+            con.execute("INSERT INTO t (v) VALUES (3)")
+            raise RuntimeError()
+
+    assert _count_rows(database_io) == 1
+
+
+def test_nested_connect_shares_connection(database_io):
+    with database_io.connect() as con_outer:
+        con_outer.execute("INSERT INTO t (v) VALUES (1)")
+        with database_io.connect() as con_inner:
+            assert con_inner is con_outer
+        # 内側を抜けても外側のトランザクションは続く
+        assert con_outer.in_transaction
+        con_outer.commit()
+
+    assert _count_rows(database_io) == 1
+
+
+def test_reconnect_after_close_all(database_io):
+    with database_io.connect() as con:
+        con_before = con
+    database_io.close_all()
+    database_io.execute_schema_once("CREATE TABLE IF NOT EXISTS t (v INTEGER)")
+
+    with database_io.connect() as con:
+        assert con is not con_before
+        con.execute("INSERT INTO t (v) VALUES (1)")
+        con.commit()
+    assert _count_rows(database_io) == 1
+
+
+def test_benchmark_repository_ops(sample_student_ids):
+    student_repo = get_student_repository()
+    student_mark_repo = get_student_mark_repository()
+    stage_path_result_repo = get_student_stage_path_result_repository()
+    stage_path = StagePath.list_paths([TestCaseID("TestCase-1")])[0]
+    for student_id in sample_student_ids:
+        student_mark_repo.create(student_id)
+
+    n_rounds = 100
+    time_start = time.perf_counter()
+    for _ in range(n_rounds):
+        for student_id in sample_student_ids:
+            student_repo.get(student_id)
+            stage_path_result_repo.get(student_id, stage_path)
+            student_mark_repo.get(student_id)
+    elapsed_seconds = time.perf_counter() - time_start
+    n_ops = n_rounds * len(sample_student_ids) * 3
+    print(f"{n_ops} repository ops: {elapsed_seconds:.3f}s ({n_ops / elapsed_seconds:.0f} ops/s)")
+
+    # 操作のたびに接続を開いてテーブルを作成していたときは約800 ops/sだった
+    assert n_ops / elapsed_seconds > 2000
+
+
+def _hold_write_lock(database_fullpath, seconds: float, locked: threading.Event) -> None:
+    # 別の接続（別のプロセスの書き込みの代わり）で書き込みのロックを取ったままにする
+    con = sqlite3.connect(database_fullpath)
+    try:
+        con.execute("BEGIN IMMEDIATE")
+        locked.set()
+        time.sleep(seconds)
+        con.commit()
+    finally:
+        con.close()
+
+
+@pytest.fixture
+def short_busy_timeout_database_io(monkeypatch):
+    # SQLiteが自身で待つ時間を短くしてtransactionのやり直しを確かめる
+    monkeypatch.setattr(ProjectDatabaseIO, "_BUSY_TIMEOUT_SECONDS", 0.01)
+    database_io = ProjectDatabaseIO(database_path_provider=get_database_path_provider())
+    database_io.execute_schema_once("CREATE TABLE IF NOT EXISTS t (v INTEGER)")
+    yield database_io
+    database_io.close_all()
+
+
+def test_transaction_retries_while_locked(short_busy_timeout_database_io):
+    database_io = short_busy_timeout_database_io
+    locked = threading.Event()
+    thread = threading.Thread(
+        target=_hold_write_lock,
+        args=(get_database_path_provider().fullpath(), 0.3, locked),
+    )
+    thread.start()
+    locked.wait()
+    with database_io.transaction() as con:
+        con.execute("INSERT INTO t (v) VALUES (1)")
+    thread.join()
+
+    assert _count_rows(database_io) == 1
+    stats = database_io.get_lock_wait_stats()
+    assert stats.n_retries > 0
+    assert stats.n_failures == 0
+    assert stats.max_wait_seconds >= 0.2
+
+
+def test_transaction_gives_up_after_deadline(short_busy_timeout_database_io, monkeypatch):
+    database_io = short_busy_timeout_database_io
+    monkeypatch.setattr(ProjectDatabaseIO, "_BUSY_RETRY_DEADLINE_SECONDS", 0.1)
+    locked = threading.Event()
+    thread = threading.Thread(
+        target=_hold_write_lock,
+        args=(get_database_path_provider().fullpath(), 0.5, locked),
+    )
+    thread.start()
+    locked.wait()
+    with pytest.raises(sqlite3.OperationalError):
+        with database_io.transaction() as con:
+            con.execute("INSERT INTO t (v) VALUES (1)")
+    thread.join()
+
+    assert _count_rows(database_io) == 0
+    assert database_io.get_lock_wait_stats().n_failures == 1
+
+
+def test_nested_transaction_commits_with_outer(database_io):
+    with pytest.raises(RuntimeError):
+        with database_io.transaction() as con_outer:
+            con_outer.execute("INSERT INTO t (v) VALUES (1)")
+            with database_io.transaction() as con_inner:
+                con_inner.execute("INSERT INTO t (v) VALUES (2)")
+            raise RuntimeError()
+    assert _count_rows(database_io) == 0
+
+    with database_io.transaction() as con_outer:
+        con_outer.execute("INSERT INTO t (v) VALUES (1)")
+        with database_io.transaction() as con_inner:
+            con_inner.execute("INSERT INTO t (v) VALUES (2)")
+        assert con_outer.in_transaction
+    assert _count_rows(database_io) == 2
+
+
+_STRESS_N_STUDENTS = 10
+_STRESS_N_ROUNDS = 30
+
+
+def _hammer_repositories(worker_index: int) -> None:
+    # 同じ生徒の結果・点数・実行ファイルを他のワーカーと取り合うように書き込む
+    student_repo = get_student_repository()
+    student_ids = [student.student_id for student in student_repo.list()][:_STRESS_N_STUDENTS]
+    student_mark_repo = get_student_mark_repository()
+    executable_repo = get_student_executable_repository()
+    stage_path_result_repo = get_student_stage_path_result_repository()
+    put_service = get_student_put_stage_result_service()
+    stage_path = StagePath.list_paths([TestCaseID("TestCase-1")])[0]
+    for i in range(_STRESS_N_ROUNDS):
+        student_id = student_ids[(worker_index + i) % len(student_ids)]
+        student_mark_repo.put(StudentMark(student_id=student_id, score=i))
+        # 一部のワーカーは同じ内容を書き込んで内容の参照数を取り合う
+        executable_repo.put(student_id, ExecutableFileItem(content_bytes=f"exe-{i % 3}".encode()))
+        executable_repo.get(student_id)
+        put_service.execute(stage_path, BuildSuccessStudentStageResult.create_instance(
+            student_id=student_id,
+            submission_folder_checksum=worker_index * 1000 + i,
+        ))
+        stage_path_result_repo.flush()
+
+
+def _hammer_repositories_in_process(project_id, worker_index: int) -> None:
+    # ワーカープロセスで実行される
+    from conftest import override_dependency
+    from application.state.current_project import set_current_project_id
+    set_current_project_id(project_id)
+    override_dependency()
+    _hammer_repositories(worker_index)
+    get_project_database_io().close_all()
+
+
+def test_stress_repositories_from_threads_and_processes(sample_student_ids):
+    from application.state.current_project import get_current_project_id
+
+    n_threads, n_processes = 16, 3
+    get_student_stage_path_result_repository()  # テーブルを作っておく
+    context = multiprocessing.get_context("spawn")
+    processes = [
+        context.Process(
+            target=_hammer_repositories_in_process,
+            args=(get_current_project_id(), n_threads + i),
+        )
+        for i in range(n_processes)
+    ]
+    for process in processes:
+        process.start()
+    errors = []
+
+    def hammer_in_thread(worker_index: int):
+        try:
+            _hammer_repositories(worker_index)
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=hammer_in_thread, args=(i,)) for i in range(n_threads)]
+    time_start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    for process in processes:
+        process.join()
+    elapsed_seconds = time.perf_counter() - time_start
+
+    stats = get_project_database_io().get_lock_wait_stats()
+    print(f"{n_threads} threads + {n_processes} processes: {elapsed_seconds:.3f}s, {stats}")
+    assert errors == []
+    assert all(process.exitcode == 0 for process in processes)
+
+    with get_project_database_io().connect() as con:
+        # 内容の参照数がどこかで数え損なわれていない
+        n_refs = con.execute("SELECT SUM(ref_count) FROM content_blob").fetchone()[0]
+        n_executables = con.execute("SELECT COUNT(*) FROM student_executable").fetchone()[0]
+        assert n_refs == n_executables == len(sample_student_ids)
+    stage_path = StagePath.list_paths([TestCaseID("TestCase-1")])[0]
+    for student_id in sample_student_ids:
+        assert get_student_stage_path_result_repository().get(student_id, stage_path).has_result(BuildStage())
+        assert get_student_mark_repository().get(student_id).is_marked
@@ -0,0 +1,113 @@
+import threading
+
+import pytest
+from PyQt5.QtCore import QCoreApplication, QEventLoop, QTimer
+
+from application.dependency.external_io import get_student_change_event_bus
+from application.dependency.repository import get_student_mark_repository, \
+    get_student_stage_path_result_repository
+from control.widget_student_table import AbstractStudentTableModelDataProvider, StudentTableModel
+from domain.model.stage_path import StagePath
+from domain.model.student_mark import StudentMark
+from domain.model.student_stage_result import BuildSuccessStudentStageResult
+from domain.model.value import StudentID, TestCaseID
+from infra.event.student_change import StudentChangeEvent, StudentChangeEventBus, StudentChangeKind
+
+
+@pytest.fixture
+def qt_app():
+    return QCoreApplication.instance() or QCoreApplication([])
+
+
+@pytest.fixture
+def published_events():
+    events = []
+    get_student_change_event_bus().subscribe(events.extend)
+    return events
+
+
+def test_repositories_publish_change_events(sample_student_ids, published_events):
+    student_id_1, student_id_2, *_ = sample_student_ids
+    repo = get_student_stage_path_result_repository()
+    stage_path = StagePath.list_paths([TestCaseID("TestCase-1")])[0]
+
+    # 結果はflushを待たずにputした時点で知らせる
+    stage_path_result = repo.get(student_id_1, stage_path)
+    stage_path_result.put_result(BuildSuccessStudentStageResult.create_instance(
+        student_id=student_id_1,
+        submission_folder_checksum=0,
+    ))
+    repo.put(stage_path_result)
+    assert published_events == [StudentChangeEvent(student_id_1, StudentChangeKind.STAGE_RESULT)]
+
+    published_events.clear()
+    get_student_mark_repository().put(StudentMark(student_id=student_id_2, score=10))
+    assert published_events == [StudentChangeEvent(student_id_2, StudentChangeKind.MARK)]
+
+    published_events.clear()
+    repo.delete_all([student_id_1, student_id_2])
+    assert published_events == [
+        StudentChangeEvent(student_id_1, StudentChangeKind.STAGE_RESULT),
+        StudentChangeEvent(student_id_2, StudentChangeKind.STAGE_RESULT),
+    ]
+
+
+def test_failing_subscriber_does_not_block_others():
+    bus = StudentChangeEventBus()
+    received = []
+
+    def failing_subscriber(_):
+        raise RuntimeError("subscriber failed")
+
+    bus.subscribe(failing_subscriber)
+    bus.subscribe(received.extend)
+    bus.publish_all([StudentID("00D0000000A")], StudentChangeKind.MARK)
+    assert received == [StudentChangeEvent(StudentID("00D0000000A"), StudentChangeKind.MARK)]
+
+    bus.unsubscribe(received.extend)
+    bus.publish_all([StudentID("00D0000000A")], StudentChangeKind.MARK)
+    assert len(received) == 1
+
+
+class _CountingDataProvider(AbstractStudentTableModelDataProvider):
+    def __init__(self, student_ids: list[StudentID]):
+        super().__init__(student_ids)
+        self.invalidated_rows = []
+
+    def invalidate_cache(self, row: int):
+        self.invalidated_rows.append(row)
+
+
+def test_table_model_coalesces_bursts_into_row_ranges(qt_app):
+    student_ids = [StudentID(f"00D00{i:05d}A") for i in range(20)]
+    bus = StudentChangeEventBus()
+    provider = _CountingDataProvider(student_ids)
+    model = StudentTableModel(provider=provider, student_change_event_bus=bus)
+    changed_ranges = []
+    # noinspection PyUnresolvedReferences
+    model.dataChanged.connect(
+        lambda top_left, bottom_right: changed_ranges.append(
+            (top_left.row(), bottom_right.row(), top_left.column(), bottom_right.column())
+        )
+    )
+
+    # 複数のスレッドから同じ行への変更を何度も知らせる
+    changed_rows = [0, 1, 2, 3, 4, 7, 8, 15]
+
+    def publish_changes():
+        for _ in range(50):
+            bus.publish_all([student_ids[i_row] for i_row in changed_rows], StudentChangeKind.STAGE_RESULT)
+
+    threads = [threading.Thread(target=publish_changes) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    loop = QEventLoop()
+    QTimer.singleShot(200, loop.quit)
+    loop.exec_()
+
+    last_column = model.columnCount() - 1
+    assert changed_ranges == [(0, 4, 0, last_column), (7, 8, 0, last_column), (15, 15, 0, last_column)]
+    assert sorted(provider.invalidated_rows) == changed_rows
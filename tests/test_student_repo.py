@@ -49,3 +49,48 @@ def test_list(sample_students):
     assert len(students_by_list) == len(sample_students)
     for student, student_by_get in zip(sample_students, students_by_list):
         assert _compare_student(student, student_by_get)
+
+
+def test_get_and_list_read_database_once(sample_students):
+    from application.dependency.external_io import get_project_database_io
+
+    repo = get_student_repository()
+    statements = []
+    with get_project_database_io().connect() as con:
+        con.set_trace_callback(statements.append)
+        try:
+            for _ in range(3):
+                for student in sample_students:
+                    assert _compare_student(student, repo.get(student.student_id))
+                assert len(repo.list()) == len(sample_students)
+        finally:
+            con.set_trace_callback(None)
+
+    assert len([statement for statement in statements if "FROM student" in statement]) == 1
+
+
+def test_cache_invalidated_on_create_all(sample_students):
+    import dataclasses
+
+    repo = get_student_repository()
+    assert len(repo.list()) == len(sample_students)
+    new_student = dataclasses.replace(
+        sample_students[0],
+        student_id=StudentID("00D0000100A"),
+        name="student-new",
+    )
+    repo.create_all([new_student])
+
+    assert _compare_student(new_student, repo.get(new_student.student_id))
+    assert [student.student_id for student in repo.list()] \
+           == sorted([student.student_id for student in sample_students] + [new_student.student_id])
+
+
+def test_returned_students_are_immutable(sample_students):
+    import dataclasses
+
+    repo = get_student_repository()
+    student = repo.get(sample_students[0].student_id)
+    with pytest.raises(dataclasses.FrozenInstanceError):
+        # noinspection PyDataclass
+        student.name = "changed"
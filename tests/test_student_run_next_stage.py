@@ -0,0 +1,179 @@
+import dataclasses
+import threading
+import time
+
+import pytest
+from pytest_mock import MockerFixture
+
+from application.dependency.repository import get_global_settings_repository
+from application.dependency.usecase import get_student_run_next_stage_usecase
+from domain.model.stage import AbstractStage, BuildStage, CompileStage, TestStage
+from domain.model.stage_path import StagePath
+from domain.model.value import StudentID, TestCaseID
+from usecase.dto.student_run_next_stage import StudentRunNextStageState
+
+STUDENT_ID = StudentID("00D0000001A")
+
+
+class _FakeStagePathResult:
+    # 実行済みのステージの集合から結果を模倣する
+    def __init__(self, stage_path: StagePath, finished_stages: set, failed_stages: set):
+        self._stage_path = stage_path
+        self._finished_stages = finished_stages
+        self._failed_stages = failed_stages
+
+    @property
+    def stage_statuses(self):
+        return tuple(stage in self._finished_stages for stage in self._stage_path)
+
+    @property
+    def is_last_stage_success(self) -> bool | None:
+        last_stage = None
+        for stage in self._stage_path:
+            if stage in self._finished_stages:
+                last_stage = stage
+        if last_stage is None:
+            return None
+        return last_stage not in self._failed_stages
+
+    @property
+    def are_all_finished(self) -> bool:
+        return self.get_next_stage() is None or self.is_last_stage_success is False
+
+    def get_next_stage(self) -> AbstractStage | None:
+        for stage in self._stage_path:
+            if stage not in self._finished_stages:
+                return stage
+        return None
+
+
+class _FakeStages:
+    def __init__(self, mocker: MockerFixture, testcase_ids: list[TestCaseID], seconds_per_stage: float):
+        self._lock = threading.Lock()
+        self._seconds_per_stage = seconds_per_stage
+        self.finished_stages: set[AbstractStage] = set()
+        self.failed_stages: set[AbstractStage] = set()
+        self.run_stages: list[AbstractStage] = []
+        self.thread_idents: set[int] = set()
+
+        mocker.patch(
+            "service.testcase_config.TestCaseConfigListIDSubService.execute",
+            return_value=testcase_ids,
+        )
+        mocker.patch(
+            "service.student_stage_path_result.StudentStagePathResultGetService.execute",
+            side_effect=self._get_result,
+        )
+        mocker.patch(
+            "service.student_stage_path_result.StudentStagePathResultCheckRollbackService.execute",
+            return_value=None,
+        )
+        for name in ["build", "compile", "execute", "test"]:
+            mocker.patch(
+                f"usecase.student_run_{name}.StudentRun{name.capitalize()}StageUseCase.execute",
+                side_effect=self._run_stage,
+            )
+
+    def _get_result(self, student_id: StudentID, stage_path: StagePath):
+        with self._lock:
+            return _FakeStagePathResult(
+                stage_path,
+                set(self.finished_stages),
+                set(self.failed_stages),
+            )
+
+    def _run_stage(self, *, student_id: StudentID, stage_path: StagePath):
+        stage = self._get_result(student_id, stage_path).get_next_stage()
+        time.sleep(self._seconds_per_stage)
+        with self._lock:
+            self.run_stages.append(stage)
+            self.thread_idents.add(threading.get_ident())
+            self.finished_stages.add(stage)
+
+
+def _set_max_testcase_workers(value: int):
+    global_settings_repo = get_global_settings_repository()
+    global_settings_repo.put(dataclasses.replace(
+        global_settings_repo.get(),
+        max_testcase_workers=value,
+    ))
+
+
+def _run_until_finished(max_parallel_stages: int | None = None) -> tuple[StudentRunNextStageState, int]:
+    state = StudentRunNextStageState()
+    n_calls = 0
+    while not state.is_finished:
+        state = get_student_run_next_stage_usecase().execute(
+            student_id=STUDENT_ID,
+            state=state,
+            stop_producer=lambda: False,
+            max_parallel_stages=max_parallel_stages,
+        )
+        n_calls += 1
+    return state, n_calls
+
+
+def test_all_stages_run_once(mocker: MockerFixture):
+    testcase_ids = [TestCaseID(f"testcase-{i}") for i in range(3)]
+    fake_stages = _FakeStages(mocker, testcase_ids, seconds_per_stage=0)
+    _set_max_testcase_workers(1)
+
+    state, n_calls = _run_until_finished()
+
+    assert state.is_finished
+    assert not state.is_failed
+    # ビルドとコンパイルは一度だけ実行される
+    assert fake_stages.run_stages[:2] == [BuildStage(), CompileStage()]
+    assert len(fake_stages.run_stages) == 2 + 2 * len(testcase_ids)
+    assert len(set(fake_stages.run_stages)) == len(fake_stages.run_stages)
+    # 調べるだけの呼び出し，ビルド，コンパイル，実行，テスト
+    assert n_calls == 5
+
+
+def test_failed_stage_reported(mocker: MockerFixture):
+    testcase_ids = [TestCaseID(f"testcase-{i}") for i in range(2)]
+    fake_stages = _FakeStages(mocker, testcase_ids, seconds_per_stage=0)
+    fake_stages.failed_stages.add(TestStage(testcase_id=testcase_ids[1]))
+
+    state, _ = _run_until_finished()
+
+    assert state.is_finished
+    assert state.is_failed
+    assert state.failed_stage_path_indexes == {1}
+
+
+@pytest.mark.parametrize("max_testcase_workers", [1, 4])
+def test_testcases_run_in_parallel(mocker: MockerFixture, max_testcase_workers: int):
+    seconds_per_stage = 0.1
+    n_testcases = 4
+    testcase_ids = [TestCaseID(f"testcase-{i}") for i in range(n_testcases)]
+    _FakeStages(mocker, testcase_ids, seconds_per_stage=seconds_per_stage)
+    _set_max_testcase_workers(max_testcase_workers)
+
+    time_start = time.perf_counter()
+    _run_until_finished()
+    elapsed_seconds = time.perf_counter() - time_start
+    print(f"{max_testcase_workers=} {elapsed_seconds=:.3f}")
+
+    # ビルドとコンパイルのあと，実行とテストはテストケースの数をmax_testcase_workersで割った回数だけ待つ
+    n_rounds = -(-n_testcases // max_testcase_workers)
+    expected_seconds = (2 + 2 * n_rounds) * seconds_per_stage
+    assert expected_seconds <= elapsed_seconds < expected_seconds * 1.5
+
+
+def test_parallel_stages_capped_by_granted_concurrency(mocker: MockerFixture):
+    seconds_per_stage = 0.1
+    n_testcases = 4
+    testcase_ids = [TestCaseID(f"testcase-{i}") for i in range(n_testcases)]
+    fake_stages = _FakeStages(mocker, testcase_ids, seconds_per_stage=seconds_per_stage)
+    _set_max_testcase_workers(4)
+
+    time_start = time.perf_counter()
+    _run_until_finished(max_parallel_stages=2)
+    elapsed_seconds = time.perf_counter() - time_start
+
+    # TaskManagerが与えた数までしか並行して実行しない
+    expected_seconds = (2 + 2 * 2) * seconds_per_stage
+    assert expected_seconds <= elapsed_seconds < expected_seconds * 1.5
+    # 実行とテストで同じスレッドが使い回される
+    assert len(fake_stages.thread_idents) == 2
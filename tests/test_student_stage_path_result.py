@@ -1,4 +1,5 @@
 import itertools
+import sqlite3
 from datetime import datetime
 from typing import Optional
 
@@ -809,3 +810,242 @@ def test_stage_path_result_methods(
 
     # is_last_stage_success
     assert retrieved.is_last_stage_success is True
+
+
+# --- まとめて取得するテスト ---
+# noinspection DuplicatedCode
+def test_get_all_matches_get(
+        repo,
+        build_success_result,
+        compile_success_result,
+        execute_success_result,
+        test_failure_result,
+        compile_failure_result,
+        student_id_1,
+        student_id_2,
+        testcase_id_1,
+        testcase_id_2,
+        stage_path_1,
+        stage_path_2,
+        sample_student_ids,
+):
+    # 生徒1: テストケース1はテストまで，テストケース2は実行まで
+    for stage_path, results in [
+        (stage_path_1, [
+            build_success_result(student_id_1),
+            compile_success_result(student_id_1),
+            execute_success_result(student_id_1, testcase_id_1),
+            test_failure_result(student_id_1, testcase_id_1),
+        ]),
+        (stage_path_2, [
+            build_success_result(student_id_1),
+            compile_success_result(student_id_1),
+            execute_success_result(student_id_1, testcase_id_2),
+        ]),
+    ]:
+        stage_path_result = repo.get(student_id_1, stage_path)
+        for result in results:
+            stage_path_result.put_result(result)
+        repo.put(stage_path_result)
+    # 生徒2: コンパイルに失敗
+    stage_path_result = repo.get(student_id_2, stage_path_1)
+    stage_path_result.put_result(build_success_result(student_id_2))
+    stage_path_result.put_result(compile_failure_result(student_id_2))
+    repo.put(stage_path_result)
+    repo.flush()
+
+    stage_paths = [stage_path_1, stage_path_2]
+    retrieved_all = repo.get_all(sample_student_ids, stage_paths)
+
+    assert list(retrieved_all) == sample_student_ids
+    for student_id in sample_student_ids:
+        assert list(retrieved_all[student_id]) == stage_paths
+        for stage_path in stage_paths:
+            expected = repo.get(student_id, stage_path)
+            retrieved = retrieved_all[student_id][stage_path]
+            assert retrieved.student_id == student_id
+            for stage in stage_path:
+                if expected.get_result(stage) is None:
+                    assert retrieved.get_result(stage) is None
+                else:
+                    _assert_stage_results_are_equal(
+                        expected.get_result(stage),
+                        retrieved.get_result(stage),
+                    )
+
+
+def test_get_all_issues_one_query_per_table(repo, sample_student_ids, stage_path_1, stage_path_2, mocker):
+    spies = [mocker.spy(helper, "get_stage_results") for helper in repo._helpers.values()]
+
+    repo.get_all(sample_student_ids, [stage_path_1, stage_path_2])
+
+    assert all(spy.call_count == 1 for spy in spies)
+
+
+def test_get_all_joins_outer_transaction(repo, sample_student_ids, stage_path_1):
+    from application.dependency.external_io import get_project_database_io
+
+    expected = repo.get_all(sample_student_ids, [stage_path_1])
+    with get_project_database_io().transaction() as con:
+        # 外側のトランザクションの中でもトランザクションを開始しようとせず，コミットもしない
+        retrieved = repo.get_all(sample_student_ids, [stage_path_1])
+        assert con.in_transaction
+    assert retrieved.keys() == expected.keys()
+
+
+# --- 書き込みをまとめるテスト ---
+def test_put_is_visible_before_flush_and_written_on_flush(
+        repo,
+        build_success_result,
+        student_id_1,
+        stage_path_1,
+):
+    from application.dependency.external_io import get_project_database_io, get_student_change_event_bus
+    from infra.repository.student_stage_path_result import StudentStagePathResultRepository
+
+    stage_path_result = repo.get(student_id_1, stage_path_1)
+    stage_path_result.put_result(build_success_result(student_id_1))
+    repo.put(stage_path_result)
+
+    # 同じインスタンスからはflushの前でも見える
+    assert repo.get(student_id_1, stage_path_1).has_result(BuildStage())
+    assert repo.get_all([student_id_1], [stage_path_1])[student_id_1][stage_path_1].has_result(BuildStage())
+    summaries = repo.get_all_summaries([student_id_1], [stage_path_1])
+    assert summaries[student_id_1][stage_path_1].get_summary_by_stage_type(BuildStage).is_success
+
+    # データベースにはflushで書き込まれる
+    other_repo = StudentStagePathResultRepository(
+        project_database_io=get_project_database_io(),
+        student_change_event_bus=get_student_change_event_bus(),
+    )
+    assert not other_repo.get(student_id_1, stage_path_1).has_result(BuildStage())
+    repo.flush()
+    assert other_repo.get(student_id_1, stage_path_1).has_result(BuildStage())
+    assert other_repo.get_timestamp(student_id_1) == repo.get_timestamp(student_id_1)
+
+
+def test_failed_delete_all_keeps_pending_results(
+        repo,
+        build_success_result,
+        student_id_1,
+        stage_path_1,
+        mocker,
+):
+    stage_path_result = repo.get(student_id_1, stage_path_1)
+    stage_path_result.put_result(build_success_result(student_id_1))
+    repo.put(stage_path_result)
+
+    # 削除のトランザクションが失敗したら書き込みを待っている結果は捨てない
+    mocker.patch.object(
+        repo._result_timestamp_helper, "update_all", side_effect=sqlite3.OperationalError("database is locked"),
+    )
+    with pytest.raises(sqlite3.OperationalError):
+        repo.delete_all([student_id_1])
+    mocker.stopall()
+    assert repo.get(student_id_1, stage_path_1).has_result(BuildStage())
+    repo.flush()
+    assert repo.get(student_id_1, stage_path_1).has_result(BuildStage())
+
+    # 削除を確定したら書き込みを待っている結果も捨てる
+    stage_path_result = repo.get(student_id_1, stage_path_1)
+    stage_path_result.put_result(build_success_result(student_id_1))
+    repo.put(stage_path_result)
+    repo.delete_all([student_id_1])
+    repo.flush()
+    assert not repo.get(student_id_1, stage_path_1).has_result(BuildStage())
+
+
+def test_bulk_puts_are_committed_in_batches(repo, stage_path_1):
+    from application.dependency.external_io import get_project_database_io
+    from application.dependency.repository import get_student_repository
+    from application.dependency.service import get_student_put_stage_result_service
+    from domain.model.student import Student
+
+    n_students = 100
+    student_ids = [StudentID(f"00D00{i:05d}A") for i in range(n_students)]
+    get_student_repository().create_all([
+        Student(
+            student_id=student_id,
+            name=f"student-{i}",
+            name_en=f"student-{i}-en",
+            email_address=f"student-{i}@example.com",
+            submitted_at=datetime.fromtimestamp(i * 10000 + 86400),
+            num_submissions=1,
+            submission_folder_name=str(student_id),
+        )
+        for i, student_id in enumerate(student_ids)
+    ])
+
+    put_service = get_student_put_stage_result_service()
+    statements = []
+    with get_project_database_io().connect() as con:
+        con.set_trace_callback(statements.append)
+        try:
+            # 生徒ごとにステージを1つずつ保存する
+            for student_id in student_ids:
+                put_service.execute(stage_path_1, BuildSuccessStudentStageResult.create_instance(
+                    student_id=student_id,
+                    submission_folder_checksum=0,
+                ))
+                put_service.execute(stage_path_1, CompileSuccessStudentStageResult.create_instance(
+                    student_id=student_id,
+                    output="",
+                ))
+            repo.flush()
+        finally:
+            con.set_trace_callback(None)
+
+    n_puts = n_students * 2
+    n_commits = sum(1 for statement in statements if statement == "COMMIT")
+    print(f"{n_puts} puts: {n_commits} commits")
+    assert 0 < n_commits <= n_puts / 10
+    for student_id in student_ids:
+        assert repo.get(student_id, stage_path_1).has_result(CompileStage())
+
+
+def test_benchmark_get_all_400_students_10_testcases(repo):
+    from application.dependency.repository import get_student_repository
+    from domain.model.student import Student
+    import time
+
+    n_students, n_testcases = 400, 10
+    student_ids = [StudentID(f"00D00{i:05d}A") for i in range(n_students)]
+    get_student_repository().create_all([
+        Student(
+            student_id=student_id,
+            name=f"student-{i}",
+            name_en=f"student-{i}-en",
+            email_address=f"student-{i}@example.com",
+            submitted_at=datetime.fromtimestamp(i * 10000 + 86400),
+            num_submissions=1,
+            submission_folder_name=str(student_id),
+        )
+        for i, student_id in enumerate(student_ids)
+    ])
+    stage_paths = StagePath.list_paths([TestCaseID(f"TestCase-{i}") for i in range(n_testcases)])
+    for student_id in student_ids:
+        stage_path_result = repo.get(student_id, stage_paths[0])
+        stage_path_result.put_result(BuildSuccessStudentStageResult.create_instance(
+            student_id=student_id,
+            submission_folder_checksum=0,
+        ))
+        repo.put(stage_path_result)
+
+    time_start = time.perf_counter()
+    expected = {
+        (student_id, stage_path): repo.get(student_id, stage_path)
+        for student_id in student_ids
+        for stage_path in stage_paths
+    }
+    elapsed_seconds_get = time.perf_counter() - time_start
+
+    time_start = time.perf_counter()
+    retrieved_all = repo.get_all(student_ids, stage_paths)
+    elapsed_seconds_get_all = time.perf_counter() - time_start
+    print(f"{n_students} students x {n_testcases} testcases: "
+          f"get {elapsed_seconds_get:.3f}s, get_all {elapsed_seconds_get_all:.3f}s")
+
+    for (student_id, stage_path), stage_path_result in expected.items():
+        retrieved = retrieved_all[student_id][stage_path]
+        assert retrieved.stage_statuses == stage_path_result.stage_statuses
+    assert elapsed_seconds_get_all < elapsed_seconds_get / 10
@@ -0,0 +1,118 @@
+import time
+from datetime import datetime
+
+import pytest
+
+from application.dependency.repository import get_student_stage_path_result_repository, \
+    get_student_repository
+from application.dependency.usecase import get_student_stage_result_clear_usecase
+from domain.error import StopTask
+from domain.model.stage import BuildStage, CompileStage, ExecuteStage, TestStage
+from domain.model.stage_path import StagePath
+from domain.model.student import Student
+from domain.model.student_stage_result import BuildSuccessStudentStageResult, \
+    CompileSuccessStudentStageResult
+from domain.model.value import StudentID, TestCaseID
+from service.student_stage_path_result import StudentStageResultClearService
+
+
+@pytest.fixture
+def stage_path():
+    return StagePath([
+        BuildStage(),
+        CompileStage(),
+        ExecuteStage(TestCaseID("TestCase-1")),
+        TestStage(TestCaseID("TestCase-1")),
+    ])
+
+
+def _create_students(n: int) -> list[StudentID]:
+    students = []
+    for i in range(n):
+        student_id = StudentID(f"00D00{i:05d}A")
+        students.append(Student(
+            student_id=student_id,
+            name=f"student-{i}",
+            name_en=f"student-{i}-en",
+            email_address=f"student-{i}@example.com",
+            submitted_at=datetime.fromtimestamp(i * 10000 + 86400),
+            num_submissions=1,
+            submission_folder_name=str(student_id),
+        ))
+    get_student_repository().create_all(students)
+    return [student.student_id for student in students]
+
+
+def _put_results(student_ids: list[StudentID], stage_path: StagePath) -> None:
+    repo = get_student_stage_path_result_repository()
+    for student_id in student_ids:
+        stage_path_result = repo.get(student_id, stage_path)
+        stage_path_result.put_result(BuildSuccessStudentStageResult.create_instance(
+            student_id=student_id,
+            submission_folder_checksum=1,
+        ))
+        stage_path_result.put_result(CompileSuccessStudentStageResult.create_instance(
+            student_id=student_id,
+            output="",
+        ))
+        repo.put(stage_path_result)
+
+
+def _has_results(student_id: StudentID, stage_path: StagePath) -> bool:
+    stage_path_result = get_student_stage_path_result_repository().get(student_id, stage_path)
+    return any(stage_path_result.has_result(stage) for stage in stage_path)
+
+
+def test_clear_all_students(stage_path):
+    student_ids = _create_students(10)
+    _put_results(student_ids, stage_path)
+    t0 = get_student_stage_path_result_repository().get_timestamp(student_ids[0])
+
+    progress = []
+    get_student_stage_result_clear_usecase().execute(
+        student_ids=student_ids,
+        stop_producer=lambda: False,
+        progress_callback=lambda n_cleared, n_students: progress.append((n_cleared, n_students)),
+    )
+
+    assert not any(_has_results(student_id, stage_path) for student_id in student_ids)
+    # 表示を更新させるためにタイムスタンプが更新される
+    assert get_student_stage_path_result_repository().get_timestamp(student_ids[0]) > t0
+    assert progress[0] == (0, 10)
+    assert progress[-1] == (10, 10)
+
+
+def test_stop_leaves_each_student_fully_cleared_or_untouched(stage_path):
+    chunk_size = StudentStageResultClearService.CHUNK_SIZE
+    student_ids = _create_students(chunk_size * 2 + 1)
+    _put_results(student_ids, stage_path)
+
+    progress = []
+    with pytest.raises(StopTask):
+        get_student_stage_result_clear_usecase().execute(
+            student_ids=student_ids,
+            stop_producer=lambda: len(progress) > 1,  # 最初のチャンクを削除したら停止する
+            progress_callback=lambda n_cleared, n_students: progress.append(n_cleared),
+        )
+
+    assert progress == [0, chunk_size]
+    assert not any(_has_results(student_id, stage_path) for student_id in student_ids[:chunk_size])
+    assert all(_has_results(student_id, stage_path) for student_id in student_ids[chunk_size:])
+
+
+def test_benchmark_clear_400_students(stage_path):
+    n_students = 400
+    student_ids = _create_students(n_students)
+    _put_results(student_ids, stage_path)
+
+    time_start = time.perf_counter()
+    get_student_stage_result_clear_usecase().execute(
+        student_ids=student_ids,
+        stop_producer=lambda: False,
+        progress_callback=lambda n_cleared, n_students: None,
+    )
+    elapsed_seconds = time.perf_counter() - time_start
+    print(f"clear {n_students} students: {elapsed_seconds:.3f}s")
+
+    assert not any(_has_results(student_id, stage_path) for student_id in student_ids)
+    assert elapsed_seconds < 5
@@ -0,0 +1,253 @@
+import json
+from datetime import datetime
+
+import pytest
+
+from application.dependency.external_io import get_project_database_io
+from application.dependency.repository import get_student_stage_path_result_repository
+from application.dependency.service import get_match_get_best_service
+from domain.model.expected_output_file import ExpectedOutputFile
+from domain.model.output_file import OutputFile, OutputFileCollection
+from domain.model.pattern import PatternList, TextPattern
+from domain.model.stage import BuildStage, CompileStage, ExecuteStage, TestStage
+from domain.model.stage_path import StagePath
+from domain.model.student_stage_result import BuildSuccessStudentStageResult, \
+    CompileSuccessStudentStageResult, ExecuteSuccessStudentStageResult, \
+    TestSuccessStudentStageResult, TestFailureStudentStageResult, TestResultOutputFileCollection
+from domain.model.test_config_options import TestConfigOptions
+from domain.model.test_result_output_file_entry import TestResultAbsentOutputFileEntry, \
+    TestResultUnexpectedOutputFileEntry, TestResultTestedOutputFileEntry
+from domain.model.value import StudentID, TestCaseID, FileID
+
+_TESTCASE_ID = TestCaseID("TestCase-1")
+
+_STAGE_PATH = StagePath([
+    BuildStage(),
+    CompileStage(),
+    ExecuteStage(_TESTCASE_ID),
+    TestStage(_TESTCASE_ID),
+])
+
+
+def _create_results(student_id: StudentID, stdout: str, *, is_accepted: bool):
+    patterns = PatternList([
+        TextPattern(index=0, is_expected=True, text="Hello", is_multiple_space_ignored=True,
+                    is_word=False),
+        TextPattern(index=1, is_expected=is_accepted, text="World", is_multiple_space_ignored=True,
+                    is_word=False),
+    ])
+    stdout_file = OutputFile(file_id=FileID.STDOUT, content=stdout)
+    unexpected_file = OutputFile(file_id=FileID("out.txt"), content=bytes(range(256)))
+    absent_patterns = PatternList([
+        TextPattern(index=0, is_expected=False, text="Error", is_multiple_space_ignored=True,
+                    is_word=False),
+    ])
+    match_result = get_match_get_best_service().execute(
+        content_string=stdout_file.content_string,
+        patterns=patterns,
+        test_config_options=TestConfigOptions(ignore_case=False),
+    )
+    execute_result = ExecuteSuccessStudentStageResult.create_instance(
+        student_id=student_id,
+        testcase_id=_TESTCASE_ID,
+        execute_config_mtime=datetime.fromisoformat("2023-01-01T00:00:01"),
+        output_file_collection=OutputFileCollection([stdout_file, unexpected_file]),
+    )
+    test_result = TestSuccessStudentStageResult.create_instance(
+        student_id=student_id,
+        testcase_id=_TESTCASE_ID,
+        test_config_mtime=datetime.fromisoformat("2023-01-02T00:00:01"),
+        test_result_output_file_collection=TestResultOutputFileCollection([
+            TestResultTestedOutputFileEntry(
+                file_id=FileID.STDOUT,
+                actual=stdout_file,
+                expected=ExpectedOutputFile(file_id=FileID.STDOUT, patterns=patterns),
+                test_result=match_result,
+            ),
+            TestResultUnexpectedOutputFileEntry(
+                file_id=FileID("out.txt"),
+                actual=unexpected_file,
+            ),
+            *([] if is_accepted else [
+                # 期待される出力ファイルがなければ不正解
+                TestResultAbsentOutputFileEntry(
+                    file_id=FileID("result.txt"),
+                    expected=ExpectedOutputFile(file_id=FileID("result.txt"), patterns=absent_patterns),
+                ),
+            ]),
+        ]),
+    )
+    return [
+        BuildSuccessStudentStageResult.create_instance(
+            student_id=student_id,
+            submission_folder_checksum=123,
+        ),
+        CompileSuccessStudentStageResult.create_instance(
+            student_id=student_id,
+            output="compile ok",
+        ),
+        execute_result,
+        test_result,
+    ]
+
+
+def _put_results(repo, student_id: StudentID, results) -> None:
+    stage_path_result = repo.get(student_id, _STAGE_PATH)
+    for result in results:
+        stage_path_result.put_result(result)
+    repo.put(stage_path_result)
+    repo.flush()
+
+
+def _assert_results_equal(expected_results, stage_path_result) -> None:
+    for expected in expected_results:
+        actual = stage_path_result.get_result(expected.stage)
+        assert type(actual) is type(expected)
+        assert actual.to_json() == expected.to_json()
+
+
+def test_round_trip_output_files_and_tokens(sample_student_ids):
+    repo = get_student_stage_path_result_repository()
+    student_id = sample_student_ids[0]
+    results = _create_results(student_id, "Hello World\n", is_accepted=False)
+    _put_results(repo, student_id, results)
+
+    _assert_results_equal(results, repo.get(student_id, _STAGE_PATH))
+    _assert_results_equal(results, repo.get_all([student_id], [_STAGE_PATH])[student_id][_STAGE_PATH])
+
+    # 失敗で上書きすると出力ファイルとトークンの行も消える
+    stage_path_result = repo.get(student_id, _STAGE_PATH)
+    stage_path_result.put_result(TestFailureStudentStageResult.create_instance(
+        student_id=student_id,
+        testcase_id=_TESTCASE_ID,
+        reason="test failed",
+    ))
+    repo.put(stage_path_result)
+    repo.flush()
+    with get_project_database_io().connect() as con:
+        for table_name in ("student_test_output_file", "student_test_token"):
+            assert con.execute(f"SELECT COUNT(*) FROM {table_name}").fetchone()[0] == 0
+
+
+@pytest.mark.parametrize("is_accepted", [True, False])
+def test_summaries_do_not_read_output_payloads(sample_student_ids, is_accepted):
+    repo = get_student_stage_path_result_repository()
+    student_id = sample_student_ids[0]
+    _put_results(repo, student_id, _create_results(student_id, "Hello World\n", is_accepted=is_accepted))
+
+    statements = []
+    with get_project_database_io().connect() as con:
+        con.set_trace_callback(statements.append)
+        try:
+            summaries = repo.get_all_summaries(sample_student_ids, [_STAGE_PATH])
+        finally:
+            con.set_trace_callback(None)
+
+    assert statements
+    for statement in statements:
+        for table_name in ("student_execute_output_file", "student_test_output_file", "student_test_token",
+                           "content_blob"):
+            assert table_name not in statement
+    test_summary = summaries[student_id][_STAGE_PATH].get_summary_by_stage_type(TestStage)
+    assert test_summary.is_success
+    assert test_summary.is_accepted is is_accepted
+    assert summaries[sample_student_ids[1]][_STAGE_PATH].get_summary_by_stage_type(TestStage) is None
+
+
+def _create_json_tables(con) -> None:
+    # 出力ファイルをbase64のJSONで持っていた以前のスキーマ
+    con.execute(
+        """
+        CREATE TABLE student_execute_result
+        (
+            student_id                  TEXT,
+            testcase_id                 TEXT,
+            execute_config_mtime        DATETIME,
+            output_file_collection_json TEXT,
+            reason                      TEXT,
+            PRIMARY KEY (student_id, testcase_id),
+            FOREIGN KEY (student_id) REFERENCES student (student_id)
+        )
+        """
+    )
+    con.execute(
+        """
+        CREATE TABLE student_test_result
+        (
+            student_id                         TEXT,
+            testcase_id                        TEXT,
+            test_config_mtime                  DATETIME,
+            test_result_output_file_collection TEXT,
+            reason                             TEXT,
+            PRIMARY KEY (student_id, testcase_id),
+            FOREIGN KEY (student_id) REFERENCES student (student_id)
+        )
+        """
+    )
+
+
+def _put_json_results(con, results) -> None:
+    for result in results:
+        if isinstance(result, ExecuteSuccessStudentStageResult):
+            con.execute(
+                "INSERT INTO student_execute_result VALUES (?, ?, ?, ?, NULL)",
+                (str(result.student_id), str(result.testcase_id),
+                 result.execute_config_mtime.isoformat(),
+                 json.dumps(result.output_file_collection.to_json()))
+            )
+        elif isinstance(result, TestSuccessStudentStageResult):
+            con.execute(
+                "INSERT INTO student_test_result VALUES (?, ?, ?, ?, NULL)",
+                (str(result.student_id), str(result.testcase_id),
+                 result.test_config_mtime.isoformat(),
+                 json.dumps(result.test_result_output_file_collection.to_json()))
+            )
+
+
+def _get_result_tables_size(con) -> int:
+    # Execute・Testの結果のテーブルと出力の内容のテーブル，それらのインデックスに格納されているデータの合計の大きさ
+    # （ページ単位の端数に左右されないようにページの大きさではなく格納されているデータの大きさで比べる）
+    return con.execute(
+        "SELECT SUM(payload) FROM dbstat "
+        "WHERE name LIKE '%student_execute_%' OR name LIKE '%student_test_%' OR name LIKE '%content_blob%'"
+    ).fetchone()[0]
+
+
+def test_migrate_from_json_schema_and_shrink_storage(sample_student_ids):
+    # 典型的な提出物の出力程度の大きさのテキスト
+    stdouts = {
+        student_id: "".join(f"Hello World {student_id} line {i}\n" for i in range(50))
+        for student_id in sample_student_ids
+    }
+    results = {
+        student_id: _create_results(student_id, stdouts[student_id], is_accepted=i % 2 == 0)
+        for i, student_id in enumerate(sample_student_ids)
+    }
+    database_io = get_project_database_io()
+    with database_io.connect() as con:
+        _create_json_tables(con)
+        for student_id in sample_student_ids:
+            _put_json_results(con, results[student_id])
+        con.commit()
+        json_size = _get_result_tables_size(con)
+
+    # 最初にリポジトリを作るときに移行する
+    repo = get_student_stage_path_result_repository()
+
+    with database_io.connect() as con:
+        column_names = {row["name"] for row in con.execute("PRAGMA table_info(student_test_result)")}
+        assert "test_result_output_file_collection" not in column_names
+        assert "is_accepted" in column_names
+        table_names = {row["name"] for row in con.execute("SELECT name FROM sqlite_master")}
+        assert "student_execute_result_json" not in table_names
+        assert "student_test_result_json" not in table_names
+    for student_id in sample_student_ids:
+        stage_path_result = repo.get(student_id, _STAGE_PATH)
+        for result in results[student_id]:
+            if isinstance(result, (ExecuteSuccessStudentStageResult, TestSuccessStudentStageResult)):
+                assert stage_path_result.get_result(result.stage).to_json() == result.to_json()
+
+    with database_io.connect() as con:
+        normalized_size = _get_result_tables_size(con)
+    print(f"json schema: {json_size} bytes, normalized schema: {normalized_size} bytes")
+    assert normalized_size <= json_size * 0.75
@@ -0,0 +1,216 @@
+import time
+from datetime import datetime
+
+import pytest
+from PyQt5.QtCore import Qt, QCoreApplication, QEventLoop, QTimer
+
+from application.dependency.external_io import get_project_database_io
+from application.dependency.repository import get_student_mark_repository, \
+    get_student_repository, get_student_stage_path_result_repository
+from application.dependency.usecase import get_student_table_get_row_snapshots_usecase
+from control.widget_student_table import StudentTableColumns, StudentTableModelDataProvider, \
+    _StudentTableRowSnapshotLoader, _list_prefetch_rows
+from domain.model.stage import BuildStage, CompileStage
+from domain.model.stage_path import StagePath
+from domain.model.student import Student
+from domain.model.student_mark import StudentMark
+from domain.model.student_stage_result import BuildSuccessStudentStageResult, \
+    CompileSuccessStudentStageResult, CompileFailureStudentStageResult
+from domain.model.value import StudentID
+from usecase.dto.student_table_cell_data import StudentStageStateCellDataStageState
+
+# テストケースがないときのステージパス
+_STAGE_PATH = StagePath.list_paths([])[0]
+
+
+@pytest.fixture
+def qt_app():
+    return QCoreApplication.instance() or QCoreApplication([])
+
+
+def _put_results(student_id: StudentID, *, is_compile_failed: bool) -> None:
+    repo = get_student_stage_path_result_repository()
+    stage_path_result = repo.get(student_id, _STAGE_PATH)
+    stage_path_result.put_result(BuildSuccessStudentStageResult.create_instance(
+        student_id=student_id,
+        submission_folder_checksum=0,
+    ))
+    if is_compile_failed:
+        stage_path_result.put_result(CompileFailureStudentStageResult.create_instance(
+            student_id=student_id,
+            reason="コンパイルエラー",
+            output="error: expected ';'",
+        ))
+    else:
+        stage_path_result.put_result(CompileSuccessStudentStageResult.create_instance(
+            student_id=student_id,
+            output="",
+        ))
+    repo.put(stage_path_result)
+
+
+def test_row_snapshots(sample_student_ids):
+    student_id_1, student_id_2, student_id_3, *_ = sample_student_ids
+    _put_results(student_id_1, is_compile_failed=False)
+    _put_results(student_id_2, is_compile_failed=True)
+    get_student_mark_repository().put(StudentMark(student_id=student_id_1, score=80))
+
+    row_snapshots = get_student_table_get_row_snapshots_usecase().execute(
+        [student_id_1, student_id_2, student_id_3],
+    )
+
+    assert row_snapshots[student_id_1].student_name_cell.student_name == "student-0"
+    assert row_snapshots[student_id_1].mark.score == 80
+    assert row_snapshots[student_id_1].stage_state_cells[CompileStage].states == {
+        _STAGE_PATH: StudentStageStateCellDataStageState.FINISHED_SUCCESS,
+    }
+    assert row_snapshots[student_id_1].error_cell.text_entries == []
+    assert row_snapshots[student_id_2].stage_state_cells[BuildStage].states == {
+        _STAGE_PATH: StudentStageStateCellDataStageState.FINISHED_SUCCESS,
+    }
+    assert row_snapshots[student_id_2].stage_state_cells[CompileStage].states == {
+        _STAGE_PATH: StudentStageStateCellDataStageState.FINISHED_FAILURE,
+    }
+    assert row_snapshots[student_id_2].error_cell.aggregate_text_entries()[0].summary_text == "コンパイルエラー"
+    assert row_snapshots[student_id_3].stage_state_cells[BuildStage].states == {
+        _STAGE_PATH: StudentStageStateCellDataStageState.UNFINISHED,
+    }
+    # 採点データがない生徒は未採点として返し，採点データを作らない
+    assert not row_snapshots[student_id_2].mark.is_marked
+    assert not get_student_mark_repository().exists(student_id_2)
+
+
+def test_invalidated_row_is_reloaded(sample_student_ids):
+    provider = StudentTableModelDataProvider(student_ids=sample_student_ids)
+    requested_rows = []
+    provider.set_row_request_listener(requested_rows.append)
+
+    # スナップショットがない行はプレースホルダーを返して読み込みを要求する
+    assert provider.get_data(0, StudentTableColumns.COL_SCORE, Qt.DisplayRole) == "…"
+    assert requested_rows == [0]
+    assert provider.load_rows([0, 1]) == [0, 1]
+    assert provider.get_data(0, StudentTableColumns.COL_SCORE, Qt.DisplayRole) == "未採点"
+    assert provider.list_rows_to_load(range(3)) == [2]
+
+    # 変更された行は読み込み直すまで古いスナップショットを返す
+    get_student_mark_repository().put(StudentMark(student_id=sample_student_ids[0], score=70))
+    provider.invalidate_cache(0)
+    assert provider.get_data(0, StudentTableColumns.COL_SCORE, Qt.DisplayRole) == "未採点"
+    assert requested_rows == [0, 0]
+    assert provider.load_rows([0]) == [0]
+    assert provider.get_data(0, StudentTableColumns.COL_SCORE, Qt.DisplayRole) == "70"
+    assert requested_rows == [0, 0]
+
+
+def test_rows_changed_while_loading_are_not_marked_fresh(sample_student_ids, monkeypatch):
+    provider = StudentTableModelDataProvider(student_ids=sample_student_ids)
+
+    class _InvalidatingUseCase:
+        @staticmethod
+        def execute(student_ids):
+            # データベースを読んでいる間に行0が変更される
+            row_snapshots = get_student_table_get_row_snapshots_usecase().execute(student_ids)
+            provider.invalidate_cache(0)
+            return row_snapshots
+
+    import control.widget_student_table
+    monkeypatch.setattr(
+        control.widget_student_table,
+        "get_student_table_get_row_snapshots_usecase",
+        _InvalidatingUseCase,
+    )
+    assert provider.load_rows([0, 1]) == [1]
+    assert provider.list_rows_to_load([0, 1]) == [0]
+
+
+def test_prefetch_rows_follow_scroll_direction():
+    assert _list_prefetch_rows(10, 14, 1, 100) == [
+        *range(10, 15), *range(15, 25), *range(9, 4, -1),
+    ]
+    assert _list_prefetch_rows(10, 14, -1, 100) == [
+        *range(10, 15), *range(9, -1, -1), *range(15, 20),
+    ]
+    assert _list_prefetch_rows(95, 99, 1, 100) == [*range(95, 100), *range(94, 89, -1)]
+
+
+def test_loader_creates_snapshots_in_background(qt_app, sample_student_ids):
+    provider = StudentTableModelDataProvider(student_ids=sample_student_ids)
+    loader = _StudentTableRowSnapshotLoader(provider=provider)
+    loaded_rows = []
+    # noinspection PyUnresolvedReferences
+    loader.rows_loaded.connect(loaded_rows.extend)
+    loader.start()
+    try:
+        loader.request_rows(_list_prefetch_rows(0, 4, 1, len(sample_student_ids)), is_prefetch=True)
+        loop = QEventLoop()
+        timer = QTimer()
+        timer.setInterval(1)
+        # noinspection PyUnresolvedReferences
+        timer.timeout.connect(lambda: len(loaded_rows) == len(sample_student_ids) and loop.quit())
+        timer.start()
+        QTimer.singleShot(5000, loop.quit)
+        loop.exec_()
+        timer.stop()
+    finally:
+        loader.stop()
+        loader.wait()
+
+    assert sorted(loaded_rows) == list(range(len(sample_student_ids)))
+    assert provider.get_data(0, StudentTableColumns.COL_NAME, Qt.DisplayRole) == "student-0"
+
+
+def _create_students(n_students: int) -> list[StudentID]:
+    student_ids = [StudentID(f"00D00{i:05d}A") for i in range(n_students)]
+    get_student_repository().create_all([
+        Student(
+            student_id=student_id,
+            name=f"student-{i}",
+            name_en=f"student-{i}-en",
+            email_address=f"student-{i}@example.com",
+            submitted_at=datetime.fromtimestamp(i * 10000 + 86400),
+            num_submissions=1,
+            submission_folder_name=str(student_id),
+        )
+        for i, student_id in enumerate(student_ids)
+    ])
+    for i, student_id in enumerate(student_ids):
+        _put_results(student_id, is_compile_failed=i % 3 == 0)
+        if i % 2 == 0:
+            get_student_mark_repository().put(StudentMark(student_id=student_id, score=i % 100))
+    get_student_stage_path_result_repository().flush()
+    return student_ids
+
+
+def _render_table(student_ids: list[StudentID]) -> tuple[int, float]:
+    # 表示されるすべてのセルについてビューが問い合わせるロールのデータを取得し，発行されたクエリの数と時間を返す
+    provider = StudentTableModelDataProvider(student_ids=student_ids)
+    statements = []
+    with get_project_database_io().connect() as con:
+        con.set_trace_callback(statements.append)
+        try:
+            time_start = time.perf_counter()
+            # ワーカースレッドと同じようにブロックごとにスナップショットを作る
+            for block_begin in range(0, len(student_ids), provider.ROW_BLOCK_SIZE):
+                provider.load_rows(list(provider.get_row_block(block_begin)))
+            for i_row in range(len(student_ids)):
+                for i_col in range(len(StudentTableColumns.HEADER)):
+                    for role in (Qt.DisplayRole, Qt.ForegroundRole, Qt.ToolTipRole, Qt.TextAlignmentRole):
+                        provider.get_data(i_row, i_col, role)
+            elapsed_seconds = time.perf_counter() - time_start
+        finally:
+            con.set_trace_callback(None)
+    return len(statements), elapsed_seconds
+
+
+def test_benchmark_render_500_rows(monkeypatch):
+    student_ids = _create_students(500)
+
+    # 1行ずつスナップショットを作る場合と比べる
+    monkeypatch.setattr(StudentTableModelDataProvider, "ROW_BLOCK_SIZE", 1)
+    n_statements_per_row, elapsed_seconds_per_row = _render_table(student_ids)
+    monkeypatch.undo()
+    n_statements, elapsed_seconds = _render_table(student_ids)
+
+    print(f"per row: {n_statements_per_row} statements, {elapsed_seconds_per_row:.3f}s")
+    print(f"batched: {n_statements} statements, {elapsed_seconds:.3f}s")
+    assert n_statements * 10 <= n_statements_per_row
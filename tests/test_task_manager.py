@@ -0,0 +1,410 @@
+import dataclasses
+import time
+
+import pytest
+from PyQt5.QtCore import QCoreApplication, QEventLoop, QTimer, QMutex
+
+from application.dependency.external_io import get_resource_usage_io
+from application.dependency.repository import get_global_settings_repository
+from domain.model.value import StudentID
+from infra.dto.resource_usage import ResourceUsage
+from infra.task.manager import TaskManager
+from infra.task.task import AbstractStudentTask
+
+
+@pytest.fixture
+def qt_app():
+    return QCoreApplication.instance() or QCoreApplication([])
+
+
+@pytest.fixture
+def task_manager(qt_app):
+    task_manager = TaskManager(
+        global_settings_repo=get_global_settings_repository(),
+        resource_usage_io=get_resource_usage_io(),
+    )
+    yield task_manager
+    task_manager.shutdown()
+
+
+class _ConcurrencyProbe:
+    def __init__(self):
+        self._lock = QMutex()
+        self.n_active = 0
+        self.n_active_max = 0
+        self.n_finished = 0
+
+    def enter(self):
+        self._lock.lock()
+        self.n_active += 1
+        self.n_active_max = max(self.n_active_max, self.n_active)
+        self._lock.unlock()
+
+    def leave(self):
+        self._lock.lock()
+        self.n_active -= 1
+        self.n_finished += 1
+        self._lock.unlock()
+
+
+class _NoopStudentTask(AbstractStudentTask):
+    def __init__(self, student_id: StudentID, probe: _ConcurrencyProbe):
+        super().__init__(student_id)
+        self._probe = probe
+
+    def run(self):
+        self._probe.enter()
+        self._probe.leave()
+
+    def __repr__(self):
+        return f"_NoopStudentTask(student_id={self.student_id!r})"
+
+    def __str__(self):
+        return f"noop {self.student_id}"
+
+
+class _BlockingStudentTask(_NoopStudentTask):
+    def run(self):
+        self._probe.enter()
+        while not self.is_stop_received():
+            time.sleep(0.001)
+        self._probe.leave()
+
+
+class _FailingStudentTask(_NoopStudentTask):
+    def run(self):
+        self._probe.enter()
+        self._probe.leave()
+        raise RuntimeError("task failure")
+
+
+def _wait_until_empty(task_manager: TaskManager, timeout_seconds: float) -> None:
+    loop = QEventLoop()
+    timer = QTimer()
+    timer.setInterval(1)
+    # noinspection PyUnresolvedReferences
+    timer.timeout.connect(lambda: task_manager.is_empty() and loop.quit())
+    timer.start()
+    QTimer.singleShot(int(timeout_seconds * 1000), loop.quit)
+    loop.exec_()
+    timer.stop()
+
+
+def _create_tasks(n: int, probe: _ConcurrencyProbe) -> list[_NoopStudentTask]:
+    return [_NoopStudentTask(StudentID(f"00D00{i:05d}A"), probe) for i in range(n)]
+
+
+def test_all_tasks_finished(task_manager):
+    probe = _ConcurrencyProbe()
+    tasks = _create_tasks(20, probe)
+
+    for task in tasks:
+        task_manager.enqueue(task)
+
+    _wait_until_empty(task_manager, timeout_seconds=10)
+
+    assert task_manager.is_empty()
+    assert task_manager.count() == 0
+    assert task_manager.count_active() == 0
+    assert probe.n_finished == 20
+
+
+def test_max_workers_not_exceeded(task_manager):
+    max_workers = get_global_settings_repository().get().max_workers
+    probe = _ConcurrencyProbe()
+
+    for task in _create_tasks(50, probe):
+        task_manager.enqueue(task)
+        assert task_manager.count_active() <= max_workers
+
+    _wait_until_empty(task_manager, timeout_seconds=10)
+
+    assert probe.n_finished == 50
+    assert probe.n_active_max <= max_workers
+
+
+def test_benchmark_500_noop_tasks(task_manager):
+    # 100msごとのポーリングでは1ティックにつきmax_workers個までしかタスクを開始できないため
+    # 少なくとも n_tasks / max_workers * 0.1 秒かかっていた（500タスク・4ワーカーで12.5秒）
+    n_tasks = 500
+    max_workers = get_global_settings_repository().get().max_workers
+    polling_lower_bound_seconds = n_tasks / max_workers * 0.1
+
+    probe = _ConcurrencyProbe()
+    tasks = _create_tasks(n_tasks, probe)
+
+    time_start = time.perf_counter()
+    for task in tasks:
+        task_manager.enqueue(task)
+    _wait_until_empty(task_manager, timeout_seconds=polling_lower_bound_seconds)
+    elapsed_seconds = time.perf_counter() - time_start
+    print(f"{n_tasks} no-op tasks: {elapsed_seconds:.3f}s "
+          f"(polling lower bound: {polling_lower_bound_seconds:.1f}s)")
+
+    assert probe.n_finished == n_tasks
+    assert elapsed_seconds < polling_lower_bound_seconds / 4
+
+
+def test_worker_survives_task_failure(task_manager):
+    max_workers = get_global_settings_repository().get().max_workers
+    probe = _ConcurrencyProbe()
+    n_tasks = max_workers * 3
+    for i in range(n_tasks):
+        task_manager.enqueue(_FailingStudentTask(StudentID(f"00D00{i:05d}A"), probe))
+
+    _wait_until_empty(task_manager, timeout_seconds=10)
+
+    # 例外を送出するタスクがあってもワーカーは失われずすべてのタスクが実行される
+    assert task_manager.is_empty()
+    assert probe.n_finished == n_tasks
+
+
+def test_shutdown_stops_active_tasks_and_discards_unstarted_tasks(qt_app):
+    max_workers = get_global_settings_repository().get().max_workers
+    task_manager = TaskManager(
+        global_settings_repo=get_global_settings_repository(),
+        resource_usage_io=get_resource_usage_io(),
+    )
+    probe = _ConcurrencyProbe()
+    n_tasks = max_workers * 2
+    for i in range(n_tasks):
+        task_manager.enqueue(_BlockingStudentTask(StudentID(f"00D00{i:05d}A"), probe))
+    while probe.n_active < max_workers:
+        time.sleep(0.001)
+
+    task_manager.shutdown()
+
+    # 実行中のタスクは停止し，未開始のタスクは実行されない
+    assert task_manager.is_empty()
+    assert probe.n_finished == max_workers
+
+
+def test_bumped_student_starts_next(task_manager):
+    max_workers = get_global_settings_repository().get().max_workers
+    probe = _ConcurrencyProbe()
+    blocking_tasks = [
+        _BlockingStudentTask(StudentID(f"00D01{i:05d}A"), probe)
+        for i in range(max_workers)
+    ]
+    for task in blocking_tasks:
+        task_manager.enqueue(task)
+    while probe.n_active < max_workers:
+        time.sleep(0.001)
+
+    # すべてのワーカーが塞がっている間に大量のタスクを積んで最後の生徒を割り込ませる
+    started_student_ids = []
+    tasks = _create_tasks(300, probe)
+    for task in tasks:
+        task.run = lambda task=task: started_student_ids.append(task.student_id)
+        task_manager.enqueue(task)
+    assert task_manager.bump_student(tasks[-1].student_id)
+
+    time_start = time.perf_counter()
+    blocking_tasks[0].send_stop()
+    while not started_student_ids:
+        time.sleep(0.001)
+    elapsed_seconds = time.perf_counter() - time_start
+    for task in blocking_tasks[1:]:
+        task.send_stop()
+    _wait_until_empty(task_manager, timeout_seconds=10)
+
+    assert started_student_ids[0] == tasks[-1].student_id
+    assert elapsed_seconds < 1
+
+
+class _MultiUnitStudentTask(_NoopStudentTask):
+    # 1回のrunで処理をひとつずつ実行する
+    def __init__(self, student_id: StudentID, probes: dict[str, _ConcurrencyProbe], groups: list[str]):
+        super().__init__(student_id, probes["all"])
+        self._probes = probes
+        self._groups = list(groups)
+        self.is_light_overlapped_with_heavy = False
+
+    def get_concurrency_group(self) -> str | None:
+        return self._groups[0]
+
+    def has_remaining_work(self) -> bool:
+        return bool(self._groups)
+
+    def run(self):
+        group = self._groups.pop(0)
+        self._probes[group].enter()
+        if group == "light" and self._probes["heavy"].n_active > 0:
+            self.is_light_overlapped_with_heavy = True
+        time.sleep(0.02 if group == "heavy" else 0.002)
+        self._probes[group].leave()
+
+
+def test_concurrency_limit_per_group(task_manager):
+    global_settings_repo = get_global_settings_repository()
+    global_settings_repo.put(dataclasses.replace(
+        global_settings_repo.get(),
+        stage_concurrency_limits={"heavy": 1},
+    ))
+    probes = {"all": _ConcurrencyProbe(), "heavy": _ConcurrencyProbe(), "light": _ConcurrencyProbe()}
+    tasks = [
+        _MultiUnitStudentTask(StudentID(f"00D00{i:05d}A"), probes, ["heavy", "light", "light"])
+        for i in range(20)
+    ]
+    for task in tasks:
+        task_manager.enqueue(task)
+
+    _wait_until_empty(task_manager, timeout_seconds=10)
+
+    assert task_manager.is_empty()
+    assert probes["heavy"].n_finished == 20
+    assert probes["light"].n_finished == 40
+    # 重い処理は制限を超えて同時に実行されず，その間に他の生徒の軽い処理が進む
+    assert probes["heavy"].n_active_max == 1
+    assert any(task.is_light_overlapped_with_heavy for task in tasks)
+
+
+class _ParallelUnitStudentTask(_NoopStudentTask):
+    # 1回のrunで与えられた数だけ処理を並行して実行する
+    def __init__(self, student_id: StudentID, probe: _ConcurrencyProbe, requested_concurrency: int):
+        super().__init__(student_id, probe)
+        self._requested_concurrency = requested_concurrency
+        self.granted_concurrency = None
+
+    def get_concurrency_group(self) -> str | None:
+        return "heavy"
+
+    def get_requested_concurrency(self) -> int:
+        return self._requested_concurrency
+
+    def run(self):
+        self.granted_concurrency = self.get_granted_concurrency()
+        for _ in range(self.granted_concurrency):
+            self._probe.enter()
+        time.sleep(0.02)
+        for _ in range(self.granted_concurrency):
+            self._probe.leave()
+
+
+def test_parallel_units_counted_against_group_limit(task_manager):
+    global_settings_repo = get_global_settings_repository()
+    global_settings_repo.put(dataclasses.replace(
+        global_settings_repo.get(),
+        stage_concurrency_limits={"heavy": 3},
+    ))
+    probe = _ConcurrencyProbe()
+    tasks = [_ParallelUnitStudentTask(StudentID(f"00D00{i:05d}A"), probe, 2) for i in range(10)]
+    for task in tasks:
+        task_manager.enqueue(task)
+
+    _wait_until_empty(task_manager, timeout_seconds=10)
+
+    # 並行して実行する処理をひとつずつ数えて制限を超えない
+    assert probe.n_active_max <= 3
+    assert probe.n_finished == sum(task.granted_concurrency for task in tasks)
+    assert {task.granted_concurrency for task in tasks} <= {1, 2}
+
+
+def test_adaptive_worker_limit_shrinks_under_memory_pressure(task_manager, mocker):
+    global_settings_repo = get_global_settings_repository()
+    global_settings_repo.put(dataclasses.replace(
+        global_settings_repo.get(),
+        adaptive_workers=True,
+    ))
+    mocker.patch.object(
+        task_manager._resource_usage_io,
+        "get_stat",
+        return_value=ResourceUsage(
+            disk_read_count=0,
+            disk_write_count=0,
+            cpu_percent=10,
+            memory=0,
+            system_memory_percent=95,
+        ),
+    )
+    max_workers = task_manager.get_worker_limit_status().max_workers
+    probe = _ConcurrencyProbe()
+    tasks = [_BlockingStudentTask(StudentID(f"00D00{i:05d}A"), probe) for i in range(max_workers)]
+    # タスクがなければ負荷を測らないので，ひとつ実行している間に調整する
+    task_manager.enqueue(tasks[0])
+    while probe.n_active < 1:
+        time.sleep(0.001)
+    for _ in range(max_workers):
+        task_manager.tune_worker_limit()
+    status = task_manager.get_worker_limit_status()
+    assert status.worker_limit == 1
+    assert status.reason is not None
+
+    for task in tasks[1:]:
+        task_manager.enqueue(task)
+    time.sleep(0.1)
+    # 並列数を減らしている間は1つずつしか実行されない
+    assert probe.n_active_max == 1
+    for task in tasks:
+        task.send_stop()
+    _wait_until_empty(task_manager, timeout_seconds=10)
+    assert probe.n_finished == max_workers
+
+    # 自動調整を無効にすると上限に戻る
+    global_settings_repo.put(dataclasses.replace(
+        global_settings_repo.get(),
+        adaptive_workers=False,
+    ))
+    task_manager.tune_worker_limit()
+    status = task_manager.get_worker_limit_status()
+    assert status.worker_limit == max_workers
+    assert status.reason is None
+
+
+def test_worker_limit_tuning_timer_runs_only_when_needed(task_manager, mocker):
+    get_stat = mocker.patch.object(
+        task_manager._resource_usage_io,
+        "get_stat",
+        return_value=ResourceUsage(
+            disk_read_count=0,
+            disk_write_count=0,
+            cpu_percent=10,
+            memory=0,
+            system_memory_percent=10,
+        ),
+    )
+    probe = _ConcurrencyProbe()
+
+    # 自動調整が無効ならタイマーを開始しない
+    task_manager.enqueue(_NoopStudentTask(StudentID("00D0000000A"), probe))
+    _wait_until_empty(task_manager, timeout_seconds=10)
+    assert not task_manager._worker_limit_tuning_timer.isActive()
+
+    global_settings_repo = get_global_settings_repository()
+    global_settings_repo.put(dataclasses.replace(
+        global_settings_repo.get(),
+        adaptive_workers=True,
+    ))
+    task = _BlockingStudentTask(StudentID("00D0000001A"), probe)
+    task_manager.enqueue(task)
+    assert task_manager._worker_limit_tuning_timer.isActive()
+    task_manager.tune_worker_limit()
+    assert get_stat.call_count == 1
+
+    # タスクがなくなったら負荷を測らずにタイマーを止める
+    task.send_stop()
+    _wait_until_empty(task_manager, timeout_seconds=10)
+    task_manager.tune_worker_limit()
+    assert get_stat.call_count == 1
+    assert not task_manager._worker_limit_tuning_timer.isActive()
+
+
+def test_terminate_waits_for_active_tasks_without_polling(task_manager):
+    max_workers = get_global_settings_repository().get().max_workers
+    probe = _ConcurrencyProbe()
+    for i in range(max_workers * 2):
+        task_manager.enqueue(_BlockingStudentTask(StudentID(f"00D00{i:05d}A"), probe))
+    while probe.n_active < max_workers:
+        time.sleep(0.001)
+
+    messages = []
+    time_start = time.perf_counter()
+    task_manager.terminate(messages.append)
+    elapsed_seconds = time.perf_counter() - time_start
+
+    # 実行中のタスクが停止した時点で戻り（0.1秒ごとのポーリングでは少なくとも0.1秒かかっていた），
+    # 未開始のタスクは実行されない
+    assert task_manager.is_empty()
+    assert probe.n_finished == max_workers
+    assert messages
+    assert elapsed_seconds < 0.1
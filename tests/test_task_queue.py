@@ -0,0 +1,163 @@
+from domain.model.global_settings import TaskSchedulingPolicy
+from domain.model.value import StudentID
+from infra.task.queue import StudentTaskQueue
+from infra.task.task import AbstractStudentTask
+
+
+class _StudentTask(AbstractStudentTask):
+    def run(self):
+        pass
+
+    def __repr__(self):
+        return f"_StudentTask(student_id={self.student_id!r})"
+
+    def __str__(self):
+        return f"task {self.student_id}"
+
+
+def _student_id(i: int) -> StudentID:
+    return StudentID(f"00D00{i:05d}A")
+
+
+def _create_queue(n: int) -> tuple[StudentTaskQueue, list[_StudentTask]]:
+    queue = StudentTaskQueue()
+    tasks = [_StudentTask(_student_id(i)) for i in range(n)]
+    for task in tasks:
+        queue.enqueue(task)
+    return queue, tasks
+
+
+def _run_all(queue: StudentTaskQueue, elapsed_seconds=None, failed=()) -> list[StudentID]:
+    # 未開始のタスクを選ばれた順にすべて終了させて学籍番号を返す
+    student_ids = []
+    while (task := queue.peek_unstarted(lambda _: True)) is not None:
+        queue.set_active(task)
+        if task.student_id in failed:
+            task.set_failed()
+        queue.set_finished(
+            task,
+            elapsed_seconds=elapsed_seconds[task.student_id] if elapsed_seconds else 0.0,
+        )
+        queue.dequeue(task)
+        student_ids.append(task.student_id)
+    return student_ids
+
+
+def _enqueue_again(queue: StudentTaskQueue, n: int) -> None:
+    for i in range(n):
+        queue.enqueue(_StudentTask(_student_id(i)))
+
+
+def test_fifo():
+    queue, tasks = _create_queue(5)
+    assert _run_all(queue) == [task.student_id for task in tasks]
+    assert queue.is_empty()
+
+
+def test_bump_overrides_policy():
+    queue, tasks = _create_queue(5)
+    assert queue.bump(_student_id(3))
+    assert queue.bump(_student_id(1))
+    # 後から割り込ませたものほど先に開始する
+    assert _run_all(queue) == [_student_id(i) for i in (1, 3, 0, 2, 4)]
+
+
+def test_bump_unknown_student():
+    queue, tasks = _create_queue(2)
+    assert not queue.bump(_student_id(99))
+    assert queue.peek_unstarted(lambda _: True) is tasks[0]
+
+
+def test_bump_kept_while_task_has_remaining_work():
+    queue, tasks = _create_queue(3)
+    queue.set_active(tasks[2])
+    assert queue.bump(tasks[2].student_id)
+    queue.set_unstarted(tasks[2], elapsed_seconds=0.0)
+    assert queue.peek_unstarted(lambda _: True) is tasks[2]
+
+
+def test_set_unstarted_keeps_original_order():
+    queue, tasks = _create_queue(3)
+    queue.set_active(tasks[0])
+    queue.set_active(tasks[1])
+    queue.set_unstarted(tasks[1], elapsed_seconds=0.0)
+    queue.set_unstarted(tasks[0], elapsed_seconds=0.0)
+    assert _run_all(queue) == [task.student_id for task in tasks]
+
+
+def test_is_startable():
+    queue, tasks = _create_queue(3)
+    assert queue.peek_unstarted(lambda task: task is not tasks[0]) is tasks[1]
+    assert queue.peek_unstarted(lambda _: False) is None
+
+
+def test_focused_first():
+    queue, tasks = _create_queue(5)
+    queue.set_policy(TaskSchedulingPolicy.FOCUSED_FIRST)
+    queue.set_focused_student_ids([_student_id(4), _student_id(2)])
+    assert _run_all(queue) == [_student_id(i) for i in (4, 2, 0, 1, 3)]
+
+
+def test_shortest_expected_first():
+    queue, tasks = _create_queue(4)
+    elapsed_seconds = {
+        _student_id(0): 4.0,
+        _student_id(1): 1.0,
+        _student_id(2): 3.0,
+        _student_id(3): 2.0,
+    }
+    _run_all(queue, elapsed_seconds=elapsed_seconds)
+
+    queue.set_policy(TaskSchedulingPolicy.SHORTEST_EXPECTED_FIRST)
+    _enqueue_again(queue, 5)
+    # 実行したことのない生徒4は平均の2.5秒と見積もる
+    assert _run_all(queue) == [_student_id(i) for i in (1, 3, 4, 2, 0)]
+
+
+def test_failed_first():
+    queue, tasks = _create_queue(5)
+    _run_all(queue, failed={_student_id(1), _student_id(3)})
+
+    queue.set_policy(TaskSchedulingPolicy.FAILED_FIRST)
+    _enqueue_again(queue, 5)
+    assert _run_all(queue) == [_student_id(i) for i in (1, 3, 0, 2, 4)]
+
+
+def test_stopped_task_not_recorded():
+    queue, tasks = _create_queue(2)
+    tasks[0].send_stop()
+    _run_all(queue, failed={_student_id(0)})
+
+    queue.set_policy(TaskSchedulingPolicy.FAILED_FIRST)
+    _enqueue_again(queue, 2)
+    assert _run_all(queue) == [_student_id(0), _student_id(1)]
+
+
+def test_peek_does_not_scan_all_unstarted_tasks():
+    queue, tasks = _create_queue(1000)
+    n_calls = 0
+
+    def is_startable(task):
+        nonlocal n_calls
+        n_calls += 1
+        return True
+
+    # 実行中のタスクを未開始に戻しても先頭のタスクだけを調べて選ぶ
+    for _ in range(100):
+        task = queue.peek_unstarted(is_startable)
+        assert task is tasks[0]
+        queue.set_active(task)
+        queue.set_unstarted(task, elapsed_seconds=0.0)
+    assert n_calls == 100
+
+
+def test_shortest_expected_first_mean_updated_by_new_records():
+    queue, tasks = _create_queue(2)
+    _run_all(queue, elapsed_seconds={_student_id(0): 1.0, _student_id(1): 5.0})
+    _enqueue_again(queue, 2)
+    _run_all(queue, elapsed_seconds={_student_id(0): 4.0, _student_id(1): 1.0})
+
+    queue.set_policy(TaskSchedulingPolicy.SHORTEST_EXPECTED_FIRST)
+    _enqueue_again(queue, 3)
+    # 直近の記録だけを使い，実行したことのない生徒2は平均の(4 + 1) / 2 = 2.5秒と見積もる
+    assert _run_all(queue) == [_student_id(i) for i in (1, 2, 0)]
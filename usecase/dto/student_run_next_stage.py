@@ -0,0 +1,36 @@
+from dataclasses import dataclass, field
+
+from domain.model.stage import AbstractStage
+from domain.model.stage_path import StagePath
+
+
+@dataclass(frozen=True)
+class StudentNextStage:
+    # 次に実行するステージ
+    stage_path_index: int
+    stage_path: StagePath
+    stage: AbstractStage
+
+
+@dataclass
+class StudentRunNextStageState:
+    # 生徒のステージを1ステージずつ実行するときに実行の間で引き継ぐ状態
+    # ワーカープロセスとの間で受け渡せるようにpickleできる値だけを持つ
+
+    # 次に実行するステージ（空ならまだ調べていないか，実行するステージがない）
+    # 複数あるときは独立したテストケースのステージなので並行して実行できる
+    next_stages: list[StudentNextStage] = field(default_factory=list)
+    # 次に実行するステージを調べたことがあるか
+    is_planned: bool = False
+    # これ以上進捗がないことが判明したステージパス
+    finished_stage_path_indexes: set[int] = field(default_factory=set)
+    # 最後に実行したステージが失敗したステージパス
+    failed_stage_path_indexes: set[int] = field(default_factory=set)
+
+    @property
+    def is_finished(self) -> bool:
+        return self.is_planned and not self.next_stages
+
+    @property
+    def is_failed(self) -> bool:
+        return bool(self.failed_stage_path_indexes)
@@ -3,6 +3,7 @@ from enum import Enum, auto
 
 from domain.model.stage_path import StagePath
 from domain.model.stage import AbstractStage
+from domain.model.student_mark import StudentMark
 from domain.model.value import StudentID
 
 
@@ -52,3 +53,14 @@ class StudentErrorCellData:
                 aggregated_text_entries.append(text_entry)
                 seen.add(text_entry.summary_text)
         return aggregated_text_entries
+
+
+@dataclass
+class StudentTableRowSnapshot:
+    # テーブルの1行分のすべての列を表示するために必要なデータ
+    student_id: StudentID
+    student_id_cell: StudentIDCellData
+    student_name_cell: StudentNameCellData
+    stage_state_cells: dict[type[AbstractStage], StudentStageStateCellData]
+    error_cell: StudentErrorCellData
+    mark: StudentMark
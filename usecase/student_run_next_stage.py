@@ -1,3 +1,4 @@
+from concurrent.futures import Executor, wait
 from typing import Callable
 
 from domain.error import StopTask
@@ -5,9 +6,11 @@ from domain.model.stage_path import StagePath
 from domain.model.stage import BuildStage, CompileStage, ExecuteStage, TestStage
 from domain.model.student_stage_path_result import StudentStagePathResult
 from domain.model.value import StudentID
+from service.global_settings import GlobalSettingsGetService
 from service.stage_path import StagePathListSubService
 from service.student_stage_path_result import StudentStagePathResultGetService, \
     StudentStagePathResultCheckRollbackService, StudentStageResultRollbackService
+from usecase.dto.student_run_next_stage import StudentNextStage, StudentRunNextStageState
 from usecase.student_run_build import StudentRunBuildStageUseCase
 from usecase.student_run_compile import StudentRunCompileStageUseCase
 from usecase.student_run_execute import StudentRunExecuteStageUseCase
@@ -28,6 +31,8 @@ class StudentRunNextStageUseCase:
             student_run_execute_stage_usecase: StudentRunExecuteStageUseCase,
             student_run_test_stage_usecase: StudentRunTestStageUseCase,
             student_stage_path_result_check_rollback_service: StudentStagePathResultCheckRollbackService,
+            global_settings_get_service: GlobalSettingsGetService,
+            testcase_stage_executor: Executor,
     ):
         self._stage_path_list_sub_service \
             = stage_path_list_sub_service
@@ -45,6 +50,10 @@ class StudentRunNextStageUseCase:
             = student_run_test_stage_usecase
         self._student_stage_path_result_check_rollback_service \
             = student_stage_path_result_check_rollback_service
+        self._global_settings_get_service \
+            = global_settings_get_service
+        self._testcase_stage_executor \
+            = testcase_stage_executor
 
     def __rollback(
             self,
@@ -68,88 +77,164 @@ class StudentRunNextStageUseCase:
         self._logger.info(f"{student_id} rollback {rollback_stage_type}")
         return True
 
-    def execute(
+    def __find_next_stages(
             self,
             *,
             student_id: StudentID,
-            stop_producer: Callable[[], bool],  # 停止するときTrueを受け取る
-    ) -> None:
-        finished_stage_path_indexes = set()
-        while True:
-            if stop_producer():
-                raise StopTask()
-
-            stage_path_lst: list[StagePath] = self._stage_path_list_sub_service.execute()
-
-            # 各ステージパスの実行可能なステージを1ステージだけ実行
-            result_updated = False
-            for stage_path_index, stage_path in enumerate(stage_path_lst):
-                # このステージパスを実行してもこれ以上進捗がないことがすでに判明しているなら即スキップ
-                if stage_path_index in finished_stage_path_indexes:
-                    continue
-
-                # このステージパスの結果を取得
+            state: StudentRunNextStageState,
+    ) -> list[StudentNextStage]:
+        # 進捗の見込みがあるステージパスの次のステージを見つける
+        # ビルドとコンパイルはすべてのステージパスで共有されるのでそれだけを返す
+        # 実行とテストはステージパス（テストケース）ごとに独立しているので同じ種類のステージをまとめて返す
+        # （同時実行数の制限はステージの種類ごとなので種類を混ぜない）
+        next_stages: list[StudentNextStage] = []
+        stage_path_lst: list[StagePath] = self._stage_path_list_sub_service.execute()
+        for stage_path_index, stage_path in enumerate(stage_path_lst):
+            # このステージパスを実行してもこれ以上進捗がないことがすでに判明しているなら即スキップ
+            if stage_path_index in state.finished_stage_path_indexes:
+                continue
+
+            # このステージパスの結果を取得
+            stage_path_result: StudentStagePathResult \
+                = self._student_stage_path_result_get_service.execute(student_id, stage_path)
+
+            # 完了したステージを検証し，場合に応じてロールバック
+            is_rollback_dispatched = self.__rollback(
+                stage_path_result=stage_path_result,
+                student_id=student_id,
+            )
+            if is_rollback_dispatched:
+                # ロールバックが実行されたらもう一度このステージパスの結果を取得
                 stage_path_result: StudentStagePathResult \
                     = self._student_stage_path_result_get_service.execute(student_id, stage_path)
 
-                # 完了したステージを検証し，場合に応じてロールバック
-                is_rollback_dispatched = self.__rollback(
-                    stage_path_result=stage_path_result,
-                    student_id=student_id,
-                )
-                if is_rollback_dispatched:
-                    # ロールバックが実行されたらもう一度このステージパスの結果を取得
-                    stage_path_result: StudentStagePathResult \
-                        = self._student_stage_path_result_get_service.execute(student_id,
-                                                                              stage_path)
-
-                # このステージパスのすべてのステージが終了しているなら終了
-                if stage_path_result.are_all_finished:
-                    finished_stage_path_indexes.add(stage_path_index)
-                    continue
-
-                # 次のステージを実行
-                next_stage = stage_path_result.get_next_stage()
-                if isinstance(next_stage, BuildStage):
-                    self._logger.info(f"{student_id} run BUILD {next_stage}")
-                    self._student_run_build_stage_usecase.execute(
-                        student_id=student_id,
-                        stage_path=stage_path,
-                    )
-                elif isinstance(next_stage, CompileStage):
-                    self._logger.info(f"{student_id} run COMPILE {next_stage}")
-                    self._student_run_compile_stage_usecase.execute(
-                        student_id=student_id,
-                        stage_path=stage_path,
-                    )
-                elif isinstance(next_stage, ExecuteStage):
-                    self._logger.info(f"{student_id} run EXECUTE {next_stage}")
-                    self._student_run_execute_stage_usecase.execute(
-                        student_id=student_id,
-                        stage_path=stage_path,
-                    )
-                elif isinstance(next_stage, TestStage):
-                    self._logger.info(f"{student_id} run TEST {next_stage}")
-                    self._student_run_test_stage_usecase.execute(
+            if stage_path_result.is_last_stage_success is False:
+                state.failed_stage_path_indexes.add(stage_path_index)
+
+            # このステージパスのすべてのステージが終了しているなら終了
+            if stage_path_result.are_all_finished:
+                state.finished_stage_path_indexes.add(stage_path_index)
+                continue
+
+            next_stage = StudentNextStage(
+                stage_path_index=stage_path_index,
+                stage_path=stage_path,
+                stage=stage_path_result.get_next_stage(),
+            )
+            if isinstance(next_stage.stage, (ExecuteStage, TestStage)):
+                if not next_stages or type(next_stage.stage) is type(next_stages[0].stage):
+                    next_stages.append(next_stage)
+            elif not next_stages:
+                return [next_stage]
+            else:
+                # 共有されるステージは実行中のステージパスが終わってから実行する
+                break
+        return next_stages
+
+    def __run_stage(
+            self,
+            *,
+            student_id: StudentID,
+            next_stage: StudentNextStage,
+            progress_callback: Callable[[str], None] | None,
+    ) -> tuple[bool, bool]:  # (ステージの状況が変化したか, ステージが失敗したか)
+        stage_path, stage = next_stage.stage_path, next_stage.stage
+        if isinstance(stage, BuildStage):
+            stage_usecase = self._student_run_build_stage_usecase
+        elif isinstance(stage, CompileStage):
+            stage_usecase = self._student_run_compile_stage_usecase
+        elif isinstance(stage, ExecuteStage):
+            stage_usecase = self._student_run_execute_stage_usecase
+        elif isinstance(stage, TestStage):
+            stage_usecase = self._student_run_test_stage_usecase
+        else:
+            assert False, stage
+        self._logger.info(f"{student_id} run {stage.get_name().upper()} {stage}")
+        if progress_callback is not None:
+            progress_callback(f"{stage.get_name().upper()} {stage}")
+
+        finish_states_before_run = (
+            self._student_stage_path_result_get_service.execute(
+                student_id,
+                stage_path,
+            ).stage_statuses
+        )
+        stage_usecase.execute(
+            student_id=student_id,
+            stage_path=stage_path,
+        )
+
+        # 実行前の進捗の状況と実行後の進捗の状況を比較してこのステージパスの実行を終了するかどうかを決定
+        stage_path_result_after_run: StudentStagePathResult \
+            = self._student_stage_path_result_get_service.execute(student_id, stage_path)
+        finish_states_after_run = stage_path_result_after_run.stage_statuses
+        return (
+            finish_states_before_run != finish_states_after_run,
+            stage_path_result_after_run.is_last_stage_success is False,
+        )
+
+    def execute(
+            self,
+            *,
+            student_id: StudentID,
+            state: StudentRunNextStageState,
+            stop_producer: Callable[[], bool],  # 停止するときTrueを受け取る
+            progress_callback: Callable[[str], None] | None = None,  # ステージを実行する前に呼ばれる
+            max_parallel_stages: int | None = None,  # 並行して実行するステージの数の上限（TaskManagerが与える）
+    ) -> StudentRunNextStageState:
+        # state.next_stagesを実行してから次に実行するステージを調べて更新したstateを返す
+        # 最初の呼び出し（state.next_stagesが空）では次に実行するステージを調べるだけ
+        # stateはワーカープロセスとの間でやり取りされることがあるので更新したものを返り値として返す
+        # state.is_finishedになるまで繰り返し呼ぶとすべてのステージパスを進められるだけ進める
+        if stop_producer():
+            raise StopTask()
+
+        if state.next_stages:
+            def run_stages(next_stages: list[StudentNextStage]) -> list[tuple[bool, bool]]:
+                return [
+                    self.__run_stage(
                         student_id=student_id,
-                        stage_path=stage_path,
+                        next_stage=next_stage,
+                        progress_callback=progress_callback,
                     )
+                    for next_stage in next_stages
+                ]
+
+            # 独立したテストケースのステージは共有のスレッドのプールで並行して実行する
+            n_parallel_stages = min(
+                len(state.next_stages),
+                self._global_settings_get_service.execute().max_testcase_workers,
+            )
+            if max_parallel_stages is not None:
+                n_parallel_stages = min(n_parallel_stages, max_parallel_stages)
+            n_parallel_stages = max(1, n_parallel_stages)
+            # ステージをn_parallel_stages組に分けて，最初の組はこのスレッドで実行する
+            stage_groups = [state.next_stages[i::n_parallel_stages] for i in range(n_parallel_stages)]
+            futures = [
+                self._testcase_stage_executor.submit(run_stages, stage_group)
+                for stage_group in stage_groups[1:]
+            ]
+            try:
+                outcome_groups = [run_stages(stage_groups[0])]
+            finally:
+                # 例外が送出されても他の組が終わるまで待つ
+                wait(futures)
+            outcome_groups += [future.result() for future in futures]
+            outcomes: list[tuple[bool, bool] | None] = [None] * len(state.next_stages)
+            for i, outcome_group in enumerate(outcome_groups):
+                outcomes[i::n_parallel_stages] = outcome_group
+
+            for next_stage, (is_progressed, is_failed) in zip(state.next_stages, outcomes):
+                if not is_progressed:
+                    state.finished_stage_path_indexes.add(next_stage.stage_path_index)
+                if is_failed:
+                    state.failed_stage_path_indexes.add(next_stage.stage_path_index)
                 else:
-                    assert False, next_stage
-
-                # 実行前の進捗の状況と実行後の進捗の状況を比較してこのステージパスの実行を終了するかどうかを決定
-                finish_states_before_run = stage_path_result.stage_statuses
-                finish_states_after_run = (
-                    self._student_stage_path_result_get_service.execute(
-                        student_id,
-                        stage_path,
-                    ).stage_statuses
-                )
-                if finish_states_before_run == finish_states_after_run:
-                    finished_stage_path_indexes.add(stage_path_index)
-                else:
-                    result_updated = True
+                    state.failed_stage_path_indexes.discard(next_stage.stage_path_index)
 
-            # どのステージパスも進捗が無ければ終了
-            if not result_updated:
-                break
+        state.next_stages = self.__find_next_stages(
+            student_id=student_id,
+            state=state,
+        )
+        state.is_planned = True
+        return state
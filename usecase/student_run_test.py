@@ -93,8 +93,8 @@ class StudentRunTestStageUseCase:  # TODO: ロジックからStudentTestService
                     # 実行結果とテストケースの両方に含まれているファイル
                     #  -> テストを行う
                     try:
-                        match_result = self._match_get_best_service.execute(
-                            content_string=actual_output_file.content_string,
+                        match_result = self._match_get_best_service.execute_for_output_file(
+                            output_file=actual_output_file,
                             test_config_options=test_config.options,
                             patterns=expected_output_file.patterns,
                         )
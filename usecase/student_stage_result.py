@@ -2,7 +2,8 @@ from typing import Callable
 
 from domain.error import StopTask
 from domain.model.value import StudentID
-from service.student_stage_path_result import StudentStageResultClearService
+from service.student_stage_path_result import StudentStageResultClearService, \
+    StudentStageResultFlushService
 
 
 class StudentStageResultClearUseCase:
@@ -16,11 +17,27 @@ class StudentStageResultClearUseCase:
     def execute(
             self,
             *,
-            student_id: StudentID,
+            student_ids: list[StudentID],
             stop_producer: Callable[[], bool],  # 停止するときTrueを受け取る
+            progress_callback: Callable[[int, int], None],  # (削除し終えた生徒の数, 生徒の数)
     ) -> None:
-        if stop_producer():
-            raise StopTask()
-        self._student_stage_result_clear_service.execute(
-            student_id=student_id,
+        # 停止したときは削除し終えた生徒の結果だけが消えた状態でStopTaskを送出する
+        n_cleared = self._student_stage_result_clear_service.execute(
+            student_ids=student_ids,
+            stop_producer=stop_producer,
+            progress_callback=progress_callback,
         )
+        if n_cleared < len(student_ids):
+            raise StopTask()
+
+
+class StudentStageResultFlushUseCase:
+    def __init__(
+            self,
+            *,
+            student_stage_result_flush_service: StudentStageResultFlushService,
+    ):
+        self._student_stage_result_flush_service = student_stage_result_flush_service
+
+    def execute(self) -> None:
+        self._student_stage_result_flush_service.execute()
@@ -1,75 +1,49 @@
+from domain.model.stage import AbstractStage, BuildStage, CompileStage, ExecuteStage, TestStage
 from domain.model.stage_path import StagePath
-from domain.model.stage import AbstractStage
+from domain.model.student_stage_path_result import StudentStagePathResultSummary
 from domain.model.value import StudentID
-from service.stage_path import StagePathListSubService
 from service.student import StudentGetService
-from service.student_stage_path_result import StudentStagePathResultGetService
+from service.student_mark import StudentMarkGetAllService
+from service.student_stage_path_result import StudentStagePathResultGetAllSummaryService
 from service.student_submission import StudentSubmissionExistService
 from usecase.dto.student_table_cell_data import StudentIDCellData, StudentNameCellData, \
     StudentStageStateCellData, StudentStageStateCellDataStageState, StudentErrorCellData, \
-    StudentErrorCellDataTextEntry
+    StudentErrorCellDataTextEntry, StudentTableRowSnapshot
 
 
-class StudentTableGetStudentIDCellDataUseCase:
-    def __init__(
-            self,
-            *,
-            student_submission_exist_service: StudentSubmissionExistService,
-    ):
-        self._student_submission_exist_service = student_submission_exist_service
-
-    def execute(self, student_id: StudentID) -> StudentIDCellData:
-        student_number = str(student_id)
-        does_submission_exist = self._student_submission_exist_service.execute(student_id)
-        return StudentIDCellData(
-            student_id=student_id,
-            student_number=student_number,
-            is_submission_folder_link_alive=does_submission_exist,
-        )
+class StudentTableGetRowSnapshotsUseCase:
+    # テーブル表示におけるHOTSPOT
+    # 複数の行のすべての列のデータをまとめて作る
+    # 結果の要約と採点データはそれぞれ行の数によらず1回のクエリで取得する（出力ファイルは読まない）
 
+    _STAGE_TYPES: tuple[type[AbstractStage], ...] = (BuildStage, CompileStage, ExecuteStage, TestStage)
 
-class StudentTableGetStudentNameCellDataUseCase:
     def __init__(
             self,
             *,
             student_get_service: StudentGetService,
+            student_submission_exist_service: StudentSubmissionExistService,
+            student_stage_path_result_get_all_summary_service: StudentStagePathResultGetAllSummaryService,
+            student_mark_get_all_service: StudentMarkGetAllService,
     ):
         self._student_get_service = student_get_service
+        self._student_submission_exist_service = student_submission_exist_service
+        self._student_stage_path_result_get_all_summary_service \
+            = student_stage_path_result_get_all_summary_service
+        self._student_mark_get_all_service = student_mark_get_all_service
 
-    def execute(self, student_id: StudentID) -> StudentNameCellData:
-        student = self._student_get_service.execute(student_id)
-        return StudentNameCellData(
-            student_id=student_id,
-            student_name=student.name,
-        )
-
-
-class StudentTableGetStudentStageStateCellDataUseCase:
-    # テーブル表示におけるHOTSPOT
-
-    def __init__(
-            self,
-            *,
-            stage_path_list_sub_service: StagePathListSubService,
-            student_stage_path_result_get_service: StudentStagePathResultGetService,
-
-    ):
-        self._stage_path_list_sub_service = stage_path_list_sub_service
-        self._student_stage_path_result_get_service = student_stage_path_result_get_service
-
-    def execute(self, student_id: StudentID, stage_type: type[AbstractStage]) \
-            -> StudentStageStateCellData:
-        stage_paths = self._stage_path_list_sub_service.execute()
+    @staticmethod
+    def _create_stage_state_cell_data(
+            student_id: StudentID,
+            stage_type: type[AbstractStage],
+            stage_path_summaries: dict[StagePath, StudentStagePathResultSummary],
+    ) -> StudentStageStateCellData:
         states: dict[StagePath, StudentStageStateCellDataStageState] = {}
-        for stage_path in stage_paths:
-            stage_path_result = self._student_stage_path_result_get_service.execute(
-                student_id=student_id,
-                stage_path=stage_path,
-            )
-            stage_result = stage_path_result.get_result_by_stage_type(stage_type)
-            if stage_result is None:
+        for stage_path, stage_path_summary in stage_path_summaries.items():
+            stage_summary = stage_path_summary.get_summary_by_stage_type(stage_type)
+            if stage_summary is None:
                 state = StudentStageStateCellDataStageState.UNFINISHED
-            elif stage_result.is_success:
+            elif stage_summary.is_success:
                 state = StudentStageStateCellDataStageState.FINISHED_SUCCESS
             else:
                 state = StudentStageStateCellDataStageState.FINISHED_FAILURE
@@ -80,27 +54,15 @@ class StudentTableGetStudentStageStateCellDataUseCase:
             states=states,
         )
 
-
-class StudentTableGetStudentErrorCellDataUseCase:
-    def __init__(
-            self,
-            *,
-            stage_path_list_sub_service: StagePathListSubService,
-            student_stage_path_result_get_service: StudentStagePathResultGetService,
-    ):
-        self._stage_path_list_sub_service = stage_path_list_sub_service
-        self._student_stage_path_result_get_service = student_stage_path_result_get_service
-
-    def execute(self, student_id: StudentID) -> StudentErrorCellData:
-        stage_paths = self._stage_path_list_sub_service.execute()
+    @staticmethod
+    def _create_error_cell_data(
+            student_id: StudentID,
+            stage_path_summaries: dict[StagePath, StudentStagePathResultSummary],
+    ) -> StudentErrorCellData:
         text_entries = []
-        for stage_path in stage_paths:
-            stage_path_result = self._student_stage_path_result_get_service.execute(
-                student_id=student_id,
-                stage_path=stage_path,
-            )
-            summary_text = stage_path_result.last_stage_main_reason or ""
-            detailed_text = stage_path_result.last_stage_detailed_reason or ""
+        for stage_path_summary in stage_path_summaries.values():
+            summary_text = stage_path_summary.last_stage_main_reason or ""
+            detailed_text = stage_path_summary.last_stage_detailed_reason or ""
             if summary_text or detailed_text:
                 text_entries.append(
                     StudentErrorCellDataTextEntry(
@@ -112,3 +74,31 @@ class StudentTableGetStudentErrorCellDataUseCase:
             student_id=student_id,
             text_entries=text_entries,
         )
+
+    def execute(self, student_ids: list[StudentID]) -> dict[StudentID, StudentTableRowSnapshot]:
+        summaries = self._student_stage_path_result_get_all_summary_service.execute(student_ids)
+        marks = self._student_mark_get_all_service.execute(student_ids)
+
+        row_snapshots = {}
+        for student_id in student_ids:
+            student = self._student_get_service.execute(student_id)
+            stage_path_summaries = summaries[student_id]
+            row_snapshots[student_id] = StudentTableRowSnapshot(
+                student_id=student_id,
+                student_id_cell=StudentIDCellData(
+                    student_id=student_id,
+                    student_number=str(student_id),
+                    is_submission_folder_link_alive=self._student_submission_exist_service.execute(student_id),
+                ),
+                student_name_cell=StudentNameCellData(
+                    student_id=student_id,
+                    student_name=student.name,
+                ),
+                stage_state_cells={
+                    stage_type: self._create_stage_state_cell_data(student_id, stage_type, stage_path_summaries)
+                    for stage_type in self._STAGE_TYPES
+                },
+                error_cell=self._create_error_cell_data(student_id, stage_path_summaries),
+                mark=marks[student_id],
+            )
+        return row_snapshots
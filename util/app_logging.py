@@ -4,7 +4,7 @@ import re
 from logging import NOTSET, DEBUG, INFO, WARNING, ERROR, CRITICAL
 from typing import NamedTuple
 
-__all__ = 'create_logger', 'set_level', 'NOTSET', 'DEBUG', 'INFO', 'WARNING', 'ERROR', 'CRITICAL'
+__all__ = 'create_logger', 'set_level', 'get_level', 'NOTSET', 'DEBUG', 'INFO', 'WARNING', 'ERROR', 'CRITICAL'
 
 # ANALYZER_ENABLED = True
 
@@ -137,6 +137,10 @@ def set_level(level):
         logger.setLevel(level)
 
 
+def get_level() -> int | None:
+    return _global_level
+
+
 # FIXME: creating logger in a function creates duplicate log messages
 def create_logger(name=None, cls: type = None) -> logging.Logger:
     module_name, class_name, function_name = None, None, None
@@ -1,4 +1,5 @@
 from functools import lru_cache
+from typing import Iterable, Iterator
 
 import unicodedata
 
@@ -15,3 +16,9 @@ def _zen_to_han_char(ch: str):
 def zen_to_han(text: str):
     # 全角を半角にノーマライズする
     return "".join(_zen_to_han_char(ch) for ch in text)
+
+
+def iter_zen_to_han(chunks: Iterable[str]) -> Iterator[str]:
+    # 1文字ずつ変換して文字数は変わらないので，チャンクに分けて変換しても位置はずれない
+    for chunk in chunks:
+        yield zen_to_han(chunk)